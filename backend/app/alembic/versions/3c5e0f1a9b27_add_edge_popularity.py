@@ -0,0 +1,33 @@
+"""Add edge popularity
+
+Revision ID: 3c5e0f1a9b27
+Revises: 07b6daf36c8d
+Create Date: 2024-12-20 10:12:31.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c5e0f1a9b27'
+down_revision: Union[str, None] = '07b6daf36c8d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('edge', sa.Column('popularity', sa.Integer(), server_default='0', nullable=False, comment='Number of circuits through the edge'))
+    # Backfill from the circuits matched so far
+    op.execute(
+        'UPDATE edge JOIN ('
+        'SELECT edge_id, COUNT(*) AS n FROM circuit_edge GROUP BY edge_id'
+        ') AS counts ON counts.edge_id = edge.id '
+        'SET edge.popularity = counts.n'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('edge', 'popularity')
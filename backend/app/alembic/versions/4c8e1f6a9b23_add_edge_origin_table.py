@@ -0,0 +1,39 @@
+"""Add edge origin table
+
+Revision ID: 4c8e1f6a9b23
+Revises: e3a9c5d27f14
+Create Date: 2025-01-26 15:41:09.218437
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c8e1f6a9b23'
+down_revision: Union[str, None] = 'e3a9c5d27f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('edge_origin',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('edge_id', sa.Integer(), nullable=False),
+    sa.Column('original_id', sa.Integer(), nullable=False, comment='Not a foreign key, the original graph may be deleted'),
+    sa.Column('position', sa.Integer(), nullable=False, comment='Rank of the original edge along the edge'),
+    sa.Column('offset', sa.Integer(), nullable=False, comment='Length of the edge before the original edge, in meter'),
+    sa.ForeignKeyConstraint(['edge_id'], ['edge.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    mysql_engine='InnoDB'
+    )
+    op.create_index(op.f('ix_edge_origin_edge_id'), 'edge_origin', ['edge_id'], unique=False)
+    op.create_index(op.f('ix_edge_origin_original_id'), 'edge_origin', ['original_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_edge_origin_original_id'), table_name='edge_origin')
+    op.drop_index(op.f('ix_edge_origin_edge_id'), table_name='edge_origin')
+    op.drop_table('edge_origin')
@@ -0,0 +1,26 @@
+"""Add edge elevation profile
+
+Revision ID: 7d2b5e8c4a16
+Revises: 4c8e1f6a9b23
+Create Date: 2025-02-02 09:27:51.604183
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2b5e8c4a16'
+down_revision: Union[str, None] = '4c8e1f6a9b23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('edge', sa.Column('elevation_profile', sa.LargeBinary(), nullable=True, comment='Packed (distance, elevation) in decimeter, see app.graph.elevation'))
+
+
+def downgrade() -> None:
+    op.drop_column('edge', 'elevation_profile')
@@ -0,0 +1,44 @@
+"""Add node and edge tiles
+
+Revision ID: 8d41b6e2c0f3
+Revises: 3c5e0f1a9b27
+Create Date: 2024-12-22 16:40:08.731905
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b6e2c0f3'
+down_revision: Union[str, None] = '3c5e0f1a9b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same tiling as app.graph.tiles, which may change after this revision
+TILE_SIZE = 0.25
+COLUMNS = 1440
+
+
+def upgrade() -> None:
+    op.add_column('node', sa.Column('tile', sa.Integer(), nullable=False, comment='Geographic tile of the location, see app.graph.tiles'))
+    op.add_column('edge', sa.Column('tile', sa.Integer(), nullable=False, comment='Geographic tile of the source node'))
+    op.execute(
+        f'UPDATE node SET tile = '
+        f'FLOOR((ST_Latitude(location) + 90) / {TILE_SIZE}) * {COLUMNS} '
+        f'+ FLOOR((ST_Longitude(location) + 180) / {TILE_SIZE})'
+    )
+    op.execute(
+        'UPDATE edge JOIN node ON node.id = edge.source_id SET edge.tile = node.tile'
+    )
+    op.create_index('node_tile_index', 'node', ['graph_id', 'tile'], unique=False)
+    op.create_index('edge_tile_index', 'edge', ['graph_id', 'tile'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('edge_tile_index', table_name='edge')
+    op.drop_index('node_tile_index', table_name='node')
+    op.drop_column('edge', 'tile')
+    op.drop_column('node', 'tile')
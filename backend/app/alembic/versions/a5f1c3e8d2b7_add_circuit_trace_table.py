@@ -0,0 +1,35 @@
+"""Add circuit trace table
+
+Revision ID: a5f1c3e8d2b7
+Revises: f4d1b8a6c3e9
+Create Date: 2025-02-09 10:12:44.581203
+
+"""
+from typing import Sequence, Union
+
+import geoalchemy2
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5f1c3e8d2b7'
+down_revision: Union[str, None] = 'f4d1b8a6c3e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('circuit_trace',
+    sa.Column('circuit_id', sa.Integer(), nullable=False),
+    sa.Column('zoom', sa.SmallInteger(), nullable=False, comment='Zoom level the trace is simplified for'),
+    sa.Column('n_points', sa.Integer(), nullable=False),
+    sa.Column('trace', geoalchemy2.types.Geometry(geometry_type='LINESTRING', srid=4326, spatial_index=False, from_text='ST_GeomFromEWKT', name='geometry', nullable=False), nullable=False),
+    sa.ForeignKeyConstraint(['circuit_id'], ['circuit.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('circuit_id', 'zoom'),
+    mysql_engine='InnoDB'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('circuit_trace')
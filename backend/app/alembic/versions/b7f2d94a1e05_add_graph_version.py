@@ -0,0 +1,26 @@
+"""Add graph version
+
+Revision ID: b7f2d94a1e05
+Revises: 8d41b6e2c0f3
+Create Date: 2025-01-08 18:41:09.532217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7f2d94a1e05'
+down_revision: Union[str, None] = '8d41b6e2c0f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('graph', sa.Column('version', sa.Integer(), server_default='1', nullable=False, comment='Incremented on each change of the nodes or edges'))
+
+
+def downgrade() -> None:
+    op.drop_column('graph', 'version')
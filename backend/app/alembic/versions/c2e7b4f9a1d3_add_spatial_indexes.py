@@ -0,0 +1,44 @@
+"""Add spatial indexes
+
+Revision ID: c2e7b4f9a1d3
+Revises: a5f1c3e8d2b7
+Create Date: 2025-02-16 09:41:27.306518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2e7b4f9a1d3'
+down_revision: Union[str, None] = 'a5f1c3e8d2b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRACE_COMMENT = 'A LINESTRING built from the GPS measured track, in WGS 84 lat/long (4326)'
+
+# (table, column, geometry type, column definition suffix)
+SPATIAL_COLUMNS = [
+    ('circuit', 'start_point', 'POINT', ''),
+    ('circuit', 'trace', 'LINESTRING', f" COMMENT '{TRACE_COMMENT}'"),
+    ('node', 'location', 'POINT', ''),
+    ('edge', 'geometry', 'LINESTRING', ''),
+]
+
+
+def upgrade() -> None:
+    # The indexes of 589c785f6608 are B-tree ones on MySQL, postgresql_using
+    # being ignored. The optimizer only uses SPATIAL indexes on NOT NULL
+    # columns restricted to a SRID
+    for table, column, geometry_type, suffix in SPATIAL_COLUMNS:
+        op.drop_index(f'idx_{table}_{column}', table_name=table)
+        op.execute(f'ALTER TABLE {table} MODIFY {column} {geometry_type} NOT NULL SRID 4326{suffix}')
+        op.create_index(f'idx_{table}_{column}', table, [column], unique=False, mysql_prefix='SPATIAL')
+
+
+def downgrade() -> None:
+    for table, column, geometry_type, suffix in reversed(SPATIAL_COLUMNS):
+        op.drop_index(f'idx_{table}_{column}', table_name=table)
+        op.execute(f'ALTER TABLE {table} MODIFY {column} {geometry_type} NOT NULL{suffix}')
+        op.create_index(f'idx_{table}_{column}', table, [column], unique=False, postgresql_using='gist')
@@ -0,0 +1,37 @@
+"""Add edge change table
+
+Revision ID: e3a9c5d27f14
+Revises: b7f2d94a1e05
+Create Date: 2025-01-19 10:12:47.305861
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a9c5d27f14'
+down_revision: Union[str, None] = 'b7f2d94a1e05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('edge_change',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('graph_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False, comment='The graph version introducing the change'),
+    sa.Column('edge_id', sa.Integer(), nullable=False, comment='Not a foreign key, deleted edges are logged too'),
+    sa.Column('operation', sa.Enum('insert', 'update', 'delete', name='edgeoperation'), nullable=False),
+    sa.ForeignKeyConstraint(['graph_id'], ['graph.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    mysql_engine='InnoDB'
+    )
+    op.create_index('edge_change_version_index', 'edge_change', ['graph_id', 'version'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('edge_change_version_index', table_name='edge_change')
+    op.drop_table('edge_change')
@@ -0,0 +1,27 @@
+"""Allow many circuits per user
+
+Revision ID: f4d1b8a6c3e9
+Revises: 7d2b5e8c4a16
+Create Date: 2025-02-05 18:22:09.417326
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4d1b8a6c3e9'
+down_revision: Union[str, None] = '7d2b5e8c4a16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Circuits are uploaded one activity at a time. The foreign key needs an
+    # index on user_id at any time, hence a single statement
+    op.execute('ALTER TABLE circuit DROP INDEX ix_circuit_user_id, ADD INDEX ix_circuit_user_id (user_id)')
+
+
+def downgrade() -> None:
+    op.execute('ALTER TABLE circuit DROP INDEX ix_circuit_user_id, ADD UNIQUE INDEX ix_circuit_user_id (user_id)')
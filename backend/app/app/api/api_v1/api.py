@@ -1,10 +1,15 @@
 from fastapi import APIRouter
 
-from app.api.api_v1.endpoints import login, users, strava
+from app.api.api_v1.endpoints import (
+    circuits, login, users, strava, routes, tiles
+)
 
 api_router = APIRouter()
 api_router.include_router(login.router, tags=["login"])
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(strava.router, prefix="/strava", tags=["strava"])
+api_router.include_router(routes.router, prefix="/routes", tags=["routes"])
+api_router.include_router(circuits.router, prefix="/circuits", tags=["circuits"])
+api_router.include_router(tiles.router, prefix="/tiles", tags=["tiles"])
 # api_router.include_router(utils.router, prefix="/utils", tags=["utils"])
 # api_router.include_router(items.router, prefix="/items", tags=["items"])
@@ -0,0 +1,283 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from typing import Annotated
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.api import deps
+from app.config import settings
+from app.graph.matching import MatchingError, match_trace
+from app.graph.store import get_node_index
+from app.graph.tiles import BBox, corridor
+from app.tracks import ActivityError, read_activity
+from app.tracks.levels import trace_level
+
+router = APIRouter()
+
+# Margin of the graph region loaded around a trace, in meter
+MATCHING_MARGIN = 1_000
+
+
+async def _get_circuit(
+    db: Session, circuit_id: int, current_user: models.User
+) -> models.Circuit:
+    try:
+        circuit = await crud.circuit.get(db, circuit_id)
+    except crud.CrudError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occur, please retry.",
+        )
+    if circuit is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown circuit.",
+        )
+    if circuit.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to access this resource.",
+        )
+    return circuit
+
+
+def _trace_zoom(
+    zoom: Annotated[int | None, Query(ge=0, le=22)] = None,
+    tolerance: Annotated[
+        float | None, Query(gt=0, description="in meter")
+    ] = None,
+) -> int | None:
+    """ The zoom level of the stored trace to return, None for the full one. """
+    return trace_level(zoom, tolerance)
+
+
+def _search_bbox(
+    bbox: Annotated[
+        str | None, Query(description="min_lon,min_lat,max_lon,max_lat")
+    ] = None,
+) -> BBox | None:
+    """ The bounding box the circuit traces shall intersect, if any. """
+    if bbox is None:
+        return None
+    try:
+        min_lon, min_lat, max_lon, max_lat = map(float, bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="The bbox shall be min_lon,min_lat,max_lon,max_lat.",
+        )
+    if not (
+        -180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="The bbox is out of bounds.",
+        )
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def _circuit_with_trace(
+    circuit: models.Circuit,
+    start: np.ndarray,
+    trace: np.ndarray,
+    precision: int | None,
+) -> schemas.CircuitWithTrace:
+    return schemas.CircuitWithTrace(
+        id=circuit.id,
+        name=circuit.name,
+        distance=circuit.distance,
+        start_time=circuit.start_time,
+        end_time=circuit.end_time,
+        elevation_gain=circuit.elevation_gain,
+        elevation_loss=circuit.elevation_loss,
+        average_speed=circuit.average_speed,
+        start_point=schemas.Point(coordinates=start.tolist()),
+        trace=deps.get_trace(trace, precision),
+    )
+
+
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.CircuitWithTrace],
+)
+async def read_circuits(
+    db: Annotated[Session, Depends(deps.get_db)],
+    current_user: Annotated[models.User, Depends(deps.get_current_active_user)],
+    zoom: Annotated[int | None, Depends(_trace_zoom)],
+    precision: Annotated[int | None, Depends(deps.get_trace_precision)],
+    bbox: Annotated[BBox | None, Depends(_search_bbox)],
+    skip: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=100)] = 50,
+) -> list[schemas.CircuitWithTrace]:
+    """
+    Get the circuits of the current user, latest first, only those crossing a
+    bounding box if given.
+
+    Traces are simplified for a map zoom level or a tolerance in meter, if
+    given, and encoded as polylines on request.
+    """
+    try:
+        circuits = await crud.circuit.get_multi_by_user(
+            db,
+            user_id=current_user.id,
+            zoom=zoom,
+            bbox=bbox,
+            skip=skip,
+            limit=limit,
+        )
+    except crud.CrudError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occur, please retry.",
+        )
+    return [_circuit_with_trace(*row, precision) for row in circuits]
+
+
+@router.get(
+    "/{circuit_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.CircuitWithTrace,
+)
+async def read_circuit(
+    circuit_id: int,
+    db: Annotated[Session, Depends(deps.get_db)],
+    current_user: Annotated[models.User, Depends(deps.get_current_active_user)],
+    zoom: Annotated[int | None, Depends(_trace_zoom)],
+    precision: Annotated[int | None, Depends(deps.get_trace_precision)],
+) -> schemas.CircuitWithTrace:
+    """
+    Get a circuit, its trace simplified for a map zoom level or a tolerance in
+    meter if given, else at full resolution, and encoded as a polyline on
+    request.
+    """
+    try:
+        row = await crud.circuit.get_with_trace(db, circuit_id, zoom=zoom)
+    except crud.CrudError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occur, please retry.",
+        )
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown circuit.",
+        )
+    if row[0].user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to access this resource.",
+        )
+    return _circuit_with_trace(*row, precision)
+
+
+@router.post(
+    "/upload",
+    status_code=status.HTTP_201_CREATED,
+    response_model=schemas.Circuit,
+)
+async def upload_circuit(
+    file: UploadFile,
+    db: Annotated[Session, Depends(deps.get_db)],
+    current_user: Annotated[models.User, Depends(deps.get_current_active_user)],
+) -> schemas.Circuit:
+    """
+    Create a circuit from a recorded GPX, TCX or FIT activity file.
+    """
+    if file.size is not None and file.size > settings.ACTIVITY_UPLOAD_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="The activity file is too large.",
+        )
+    # The file is spooled to disk by the upload, and parsed incrementally
+    # from there, which is CPU bound
+    try:
+        activity = await run_in_threadpool(
+            read_activity, file.file, file.filename or ""
+        )
+    except ActivityError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid activity file: {exc}.",
+        )
+    try:
+        circuit = await crud.circuit.create_from_activity(
+            db, activity=activity, user_id=current_user.id
+        )
+    except crud.CrudError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occur, please retry.",
+        )
+    return schemas.Circuit(
+        id=circuit.id,
+        name=activity.name,
+        distance=activity.distance,
+        start_time=activity.start_time,
+        end_time=activity.end_time,
+        elevation_gain=activity.elevation_gain,
+        elevation_loss=activity.elevation_loss,
+        average_speed=activity.average_speed,
+        start_point=schemas.Point(
+            coordinates=(float(activity.lon[0]), float(activity.lat[0]))
+        ),
+    )
+
+
+@router.post(
+    "/{circuit_id}/match",
+    status_code=status.HTTP_200_OK,
+    response_model=list[int],
+)
+async def match_circuit(
+    circuit_id: int,
+    graph_id: int,
+    db: Annotated[Session, Depends(deps.get_db)],
+    current_user: Annotated[models.User, Depends(deps.get_current_active_user)],
+) -> list[int]:
+    """
+    Map-match the circuit trace onto a graph and store the matched edges.
+
+    Returns the matched edge IDs, in travel order.
+    """
+    circuit = await _get_circuit(db, circuit_id, current_user)
+    try:
+        lon, lat = await crud.circuit.get_trace(db, db_obj=circuit)
+    except crud.CrudError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occur, please retry.",
+        )
+    snapshot = await run_in_threadpool(
+        deps.get_graph_region, db, graph_id, corridor(lon, lat, MATCHING_MARGIN)
+    )
+    geometries = await run_in_threadpool(deps.get_graph_geometries, db, graph_id)
+    # The matching and the node index build on a cold cache are CPU bound
+    # and shall not block the event loop
+    try:
+        edges = await run_in_threadpool(
+            lambda: match_trace(
+                snapshot, get_node_index(snapshot), lon, lat, geometries
+            )
+        )
+    except MatchingError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="The circuit trace is too far from the graph.",
+        )
+    edge_ids = snapshot.edge_ids[edges].tolist()
+    try:
+        await crud.circuit.set_edges(db, db_obj=circuit, edge_ids=edge_ids)
+    except crud.CrudError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occur, please retry.",
+        )
+    return edge_ids
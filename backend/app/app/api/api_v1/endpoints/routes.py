@@ -0,0 +1,329 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import asdict
+from typing import Annotated
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.api import deps
+from app.graph import ch, routing
+from app.graph.alternatives import alternative_routes
+from app.graph.elevation import route_elevation
+from app.graph.geometry import EdgeGeometries
+from app.graph.isochrone import FLAT_SPEED, concave_hull
+from app.graph.loops import generate_loops
+from app.graph.matrix import distance_matrix
+from app.graph.geo import haversine
+from app.graph.profiles import PROFILES
+from app.graph.snapshot import GraphSnapshot
+from app.graph.store import (
+    get_cost_matrix, get_hierarchy, get_node_index, get_reachability, get_route,
+    get_weights, has_hierarchy, route_cache_stats,
+)
+from app.graph.tiles import corridor
+
+router = APIRouter()
+
+# Routes are searched within the tiles covering the start and end points,
+# with a margin in meter, plus a fraction of their distance
+CORRIDOR_MARGIN = 5_000
+CORRIDOR_DETOUR = 0.25
+
+
+def _circuit_preview(
+    snapshot: GraphSnapshot,
+    geometries: EdgeGeometries,
+    route: routing.Route,
+    name: str,
+    precision: int | None,
+) -> schemas.CircuitPreview:
+    coordinates = geometries.path(
+        geometries.indices(snapshot.edge_ids[route.edges]),
+        snapshot.reversed[route.edges],
+    )
+    return schemas.CircuitPreview(
+        name=name,
+        distance=route.length,
+        elevation_gain=route.elevation_gain,
+        elevation_loss=route.elevation_loss,
+        start_point=schemas.Point(coordinates=coordinates[0].tolist()),
+        trace=deps.get_trace(coordinates, precision),
+        edges=snapshot.edge_ids[route.edges].tolist(),
+    )
+
+
+# Not a coroutine: the search is CPU bound and shall run in the threadpool
+@router.post(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.Route,
+)
+def compute_route(
+    route_in: schemas.RouteRequest,
+    db: Annotated[Session, Depends(deps.get_db)],
+) -> schemas.Route:
+    """
+    Compute the cheapest route between two coordinates for a cost profile.
+    """
+    start, end = route_in.start, route_in.end
+    hierarchy = None
+    if has_hierarchy(route_in.graph_id, route_in.profile):
+        # Contraction hierarchies are preprocessed on the whole graph
+        snapshot = deps.get_graph_snapshot(db, route_in.graph_id)
+        try:
+            hierarchy = get_hierarchy(snapshot, route_in.profile)
+        except ch.HierarchyError:
+            # An outdated hierarchy file shall not prevent routing
+            pass
+    if hierarchy is None:
+        margin = CORRIDOR_MARGIN + CORRIDOR_DETOUR * float(
+            haversine(start.lon, start.lat, end.lon, end.lat)
+        )
+        snapshot = deps.get_graph_region(db, route_in.graph_id, corridor(
+            [start.lon, end.lon], [start.lat, end.lat], margin
+        ))
+    index = get_node_index(snapshot)
+    source = index.nearest(start.lon, start.lat)
+    target = index.nearest(end.lon, end.lat)
+
+    def search() -> routing.Route | None:
+        if hierarchy is not None:
+            return ch.shortest_path(hierarchy, snapshot, source, target)
+        weights = get_weights(snapshot, route_in.profile)
+        return routing.shortest_path(snapshot, source, target, weights)
+
+    # Popular start points make many identical queries
+    route = get_route(snapshot, route_in.profile, source, target, search)
+    if route is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No route found between these points.",
+        )
+    return schemas.Route(
+        edges=route.edge_ids.tolist(),
+        length=route.length,
+        elevation_gain=route.elevation_gain,
+        elevation_loss=route.elevation_loss,
+    )
+
+
+@router.get(
+    "/cache",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.RouteCacheStats,
+)
+def read_route_cache() -> schemas.RouteCacheStats:
+    """
+    Get the hit and miss counts of the route cache of this worker.
+    """
+    return schemas.RouteCacheStats(**asdict(route_cache_stats()))
+
+
+@router.post(
+    "/alternatives",
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.Route],
+)
+def compute_alternatives(
+    route_in: schemas.AlternativesRequest,
+    db: Annotated[Session, Depends(deps.get_db)],
+) -> list[schemas.Route]:
+    """
+    Compute the cheapest route between two coordinates for a cost profile,
+    and meaningfully different alternatives, cheapest first.
+    """
+    start, end = route_in.start, route_in.end
+    # The corridor detour covers the stretch of alternatives
+    margin = CORRIDOR_MARGIN + CORRIDOR_DETOUR * float(
+        haversine(start.lon, start.lat, end.lon, end.lat)
+    )
+    snapshot = deps.get_graph_region(db, route_in.graph_id, corridor(
+        [start.lon, end.lon], [start.lat, end.lat], margin
+    ))
+    index = get_node_index(snapshot)
+    routes = alternative_routes(
+        snapshot,
+        get_cost_matrix(snapshot, route_in.profile),
+        get_weights(snapshot, route_in.profile).cost,
+        index.nearest(start.lon, start.lat),
+        index.nearest(end.lon, end.lat),
+        count=route_in.count,
+    )
+    if not routes:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No route found between these points.",
+        )
+    return [
+        schemas.Route(
+            edges=snapshot.edge_ids[route.edges].tolist(),
+            length=route.length,
+            elevation_gain=route.elevation_gain,
+            elevation_loss=route.elevation_loss,
+        )
+        for route in routes
+    ]
+
+
+@router.post(
+    "/elevation",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.ElevationProfile,
+)
+def compute_elevation(
+    elevation_in: schemas.ElevationRequest,
+    db: Annotated[Session, Depends(deps.get_db)],
+) -> schemas.ElevationProfile:
+    """
+    Compute the elevation profile along the edges of a route, from the
+    profiles precomputed for each edge.
+    """
+    snapshot = deps.get_graph_snapshot(db, elevation_in.graph_id)
+    elevations = deps.get_graph_elevations(db, elevation_in.graph_id)
+    try:
+        distance, elevation = route_elevation(
+            snapshot, elevations, snapshot.edge_indices(elevation_in.edges)
+        )
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown edges.",
+        )
+    return schemas.ElevationProfile(
+        distance=distance.tolist(), elevation=elevation.tolist()
+    )
+
+
+@router.post(
+    "/matrix",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.DistanceMatrix,
+)
+def compute_matrix(
+    matrix_in: schemas.MatrixRequest,
+    db: Annotated[Session, Depends(deps.get_db)],
+) -> schemas.DistanceMatrix:
+    """
+    Compute the lengths and elevations of the cheapest routes from each source
+    to each destination for a cost profile.
+    """
+    lon = np.array([p.lon for p in matrix_in.sources + matrix_in.destinations])
+    lat = np.array([p.lat for p in matrix_in.sources + matrix_in.destinations])
+    # All routes are searched within the corridor of all the points
+    margin = CORRIDOR_MARGIN + CORRIDOR_DETOUR * float(
+        haversine(lon.min(), lat.min(), lon.max(), lat.max())
+    )
+    snapshot = deps.get_graph_region(
+        db, matrix_in.graph_id, corridor(lon, lat, margin)
+    )
+    _, nodes = get_node_index(snapshot).query(lon, lat)
+    n_sources = len(matrix_in.sources)
+    result = distance_matrix(
+        snapshot,
+        get_cost_matrix(snapshot, matrix_in.profile),
+        get_weights(snapshot, matrix_in.profile).cost,
+        nodes[:n_sources],
+        nodes[n_sources:],
+    )
+
+    def rows(values: np.ndarray) -> list[list[int | None]]:
+        return [
+            [value if value >= 0 else None for value in row]
+            for row in values.tolist()
+        ]
+
+    return schemas.DistanceMatrix(
+        length=rows(result.length),
+        elevation_gain=rows(result.elevation_gain),
+        elevation_loss=rows(result.elevation_loss),
+    )
+
+
+@router.post(
+    "/loops",
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.CircuitPreview],
+)
+def compute_loops(
+    loop_in: schemas.LoopRequest,
+    db: Annotated[Session, Depends(deps.get_db)],
+    precision: Annotated[int | None, Depends(deps.get_trace_precision)],
+) -> list[schemas.CircuitPreview]:
+    """
+    Propose round trips from a start point, close to a distance and climbing,
+    their traces encoded as polylines on request.
+    """
+    # A round trip stays within half of its distance from the start point
+    start = loop_in.start
+    snapshot = deps.get_graph_region(db, loop_in.graph_id, corridor(
+        [start.lon], [start.lat], loop_in.distance / 2
+    ))
+    geometries = deps.get_graph_geometries(db, loop_in.graph_id)
+    index = get_node_index(snapshot)
+    home = index.nearest(loop_in.start.lon, loop_in.start.lat)
+    weights = {
+        profile: get_weights(snapshot, profile) for profile in schemas.ProfileEnum
+    }
+    loops = generate_loops(
+        snapshot,
+        weights,
+        index,
+        home,
+        loop_in.distance,
+        loop_in.elevation_gain,
+        count=loop_in.count,
+    )
+    return [
+        _circuit_preview(
+            snapshot,
+            geometries,
+            loop,
+            f"Loop {i} - {loop.length / 1000:.0f} km",
+            precision,
+        )
+        for i, loop in enumerate(loops, start=1)
+    ]
+
+
+@router.post(
+    "/isochrone",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.Isochrone,
+)
+def compute_isochrone(
+    isochrone_in: schemas.IsochroneRequest,
+    db: Annotated[Session, Depends(deps.get_db)],
+) -> schemas.Isochrone:
+    """
+    Compute the area reachable from a start point within a distance or a
+    duration, the latter on the fastest profile at a flat cruising speed.
+    """
+    start = isochrone_in.start
+    if isochrone_in.distance is not None:
+        profile, budget = schemas.ProfileEnum.shortest, isochrone_in.distance
+    else:
+        profile = schemas.ProfileEnum.fastest
+        budget = round(isochrone_in.duration * FLAT_SPEED)
+    # Costs are at least floor times the length of edges
+    snapshot = deps.get_graph_region(db, isochrone_in.graph_id, corridor(
+        [start.lon], [start.lat], budget / PROFILES[profile].floor
+    ))
+    origin = get_node_index(snapshot).nearest(start.lon, start.lat)
+    reach = get_reachability(snapshot, profile, origin, budget)
+    polygon = concave_hull(snapshot, reach)
+    return schemas.Isochrone(
+        polygon=schemas.Polygon(coordinates=[
+            list(polygon.exterior.coords),
+            *(list(ring.coords) for ring in polygon.interiors),
+        ]),
+        edges=(
+            snapshot.edge_ids[reach.edges].tolist()
+            if isochrone_in.with_edges else None
+        ),
+    )
@@ -0,0 +1,54 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Response, status
+from sqlalchemy.orm import Session
+
+from app.api import deps
+from app.graph import store
+from app.graph.mvt import MAX_ZOOM, MIN_ZOOM
+
+router = APIRouter()
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+# Not a coroutine: rendering is CPU bound and shall run in the threadpool
+@router.get(
+    "/{z}/{x}/{y}.mvt",
+    response_class=Response,
+    responses={
+        200: {"content": {MVT_MEDIA_TYPE: {}}},
+        204: {"description": "No edge below MIN_ZOOM"},
+    },
+)
+def get_tile(
+    z: Annotated[int, Path(ge=0, le=MAX_ZOOM)],
+    x: Annotated[int, Path(ge=0)],
+    y: Annotated[int, Path(ge=0)],
+    graph_id: Annotated[int, Query(gt=0)],
+    db: Annotated[Session, Depends(deps.get_db)],
+) -> Response:
+    """
+    Get a Mapbox vector tile of the edge network of a graph.
+    """
+    if x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown tile.",
+        )
+    if z < MIN_ZOOM:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    tile = deps.load_graph_data(store.get_vector_tile, db, graph_id, z, x, y)
+    return Response(
+        content=tile,
+        media_type=MVT_MEDIA_TYPE,
+        # Until the edge popularity is refreshed
+        headers={
+            "Cache-Control": f"public, max-age={store.vector_tile_max_age()}"
+        },
+    )
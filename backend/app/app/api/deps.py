@@ -3,10 +3,11 @@
 # 
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
-from typing import Annotated, Generator
+from typing import Annotated, Callable, Generator, Literal, TypeVar
 
+import numpy as np
 from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Query, Response, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from pydantic import ValidationError
@@ -15,9 +16,20 @@
 from app.config import settings
 from app import crud, models, schemas
 from app.core import security
+from app.graph import store
+from app.graph.elevation import ElevationProfiles
+from app.graph.geometry import EdgeGeometries
+from app.graph.snapshot import GraphSnapshot, SnapshotError
+from app.graph.tiles import BBox
+from app.tracks.polyline import DEFAULT_PRECISION, MAX_PRECISION, encode_polyline
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login/access-token")
 
+T = TypeVar("T")
+
+# Accepting this media type asks for traces as encoded polylines
+POLYLINE_MEDIA_TYPE = "application/vnd.polyline+json"
+
 
 def get_db() -> Generator:
     try:
@@ -27,6 +39,88 @@ def get_db() -> Generator:
         db.close()
 
 
+def load_graph_data(
+    load: Callable[..., T | None], db: Session, graph_id: int, *args
+) -> T:
+    """ The data of a graph read by a store function, load(db, graph_id, *args).
+
+    Raises a 500 HTTPException if it cannot be read, a 404 one if the graph
+    does not exist.
+    """
+    try:
+        data = load(db, graph_id, *args)
+    except SnapshotError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occur, please retry.",
+        )
+    if data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown graph.",
+        )
+    return data
+
+
+def get_graph_snapshot(db: Session, graph_id: int) -> GraphSnapshot:
+    return load_graph_data(store.get_snapshot, db, graph_id)
+
+
+def get_graph_geometries(db: Session, graph_id: int) -> EdgeGeometries:
+    return load_graph_data(store.get_geometries, db, graph_id)
+
+
+def get_graph_elevations(db: Session, graph_id: int) -> ElevationProfiles:
+    return load_graph_data(store.get_elevations, db, graph_id)
+
+
+def get_graph_region(db: Session, graph_id: int, bbox: BBox) -> GraphSnapshot:
+    """ The snapshot of the graph tiles covering a bounding box. """
+    region = load_graph_data(store.get_region, db, graph_id, bbox)
+    if region.n_nodes == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No road in this area.",
+        )
+    return region
+
+
+def get_trace_precision(
+    response: Response,
+    trace_format: Annotated[
+        Literal["geojson", "polyline"] | None, Query(alias="format")
+    ] = None,
+    precision: Annotated[
+        int, Query(ge=0, le=MAX_PRECISION)
+    ] = DEFAULT_PRECISION,
+    accept: Annotated[str | None, Header()] = None,
+) -> int | None:
+    """ The precision of the encoded polylines of the traces to return, None
+    for GeoJSON LineStrings.
+
+    Encoded polylines are asked for by format=polyline, or else by accepting
+    POLYLINE_MEDIA_TYPE.
+    """
+    response.headers["Vary"] = "Accept"
+    if trace_format is None:
+        encoded = accept is not None and POLYLINE_MEDIA_TYPE in accept
+    else:
+        encoded = trace_format == "polyline"
+    return precision if encoded else None
+
+
+def get_trace(
+    coordinates: np.ndarray, precision: int | None
+) -> schemas.LineString | schemas.EncodedLineString:
+    """ The trace of (lon, lat) coordinates, encoded if precision is given. """
+    if precision is None:
+        return schemas.LineString(coordinates=coordinates.tolist())
+    return schemas.EncodedLineString(
+        polyline=encode_polyline(coordinates[:, 0], coordinates[:, 1], precision),
+        precision=precision,
+    )
+
+
 async def get_current_user(
         db: Annotated[Session, Depends(get_db)],
         token: Annotated[str, Depends(oauth2_scheme)]
@@ -38,6 +38,27 @@ class Settings(BaseSettings):
 
     FRONTEND_HOST: AnyHttpUrl
 
+    # Preprocessed graph data (contraction hierarchies, ...)
+    GRAPH_DATA_DIR: Path = Path(__file__).parent / "data"
+    # Memory budget of the graph tiles loaded by each worker, in bytes
+    GRAPH_TILE_CACHE_SIZE: int = 512 * 1024 * 1024
+    # Memory budget of the vector tiles cached by each worker, in bytes, on
+    # top of those cached under GRAPH_DATA_DIR
+    VECTOR_TILE_CACHE_SIZE: int = 64 * 1024 * 1024
+    # Vector tiles carry the edge popularity, which changes without a new
+    # graph version: they are rendered again every period of this many
+    # seconds, and clients may keep them until the end of the period
+    VECTOR_TILE_TTL: float = 3600.0
+    # Seconds between checks of the versions of the mapped graphs
+    GRAPH_REFRESH_INTERVAL: float = 30.0
+    # Memory budget of the routes cached by each worker, in bytes, and their
+    # lifetime in seconds
+    ROUTE_CACHE_SIZE: int = 32 * 1024 * 1024
+    ROUTE_CACHE_TTL: float = 3600.0
+    # Largest activity file accepted by an upload, in bytes. A FIT file of a
+    # 24 hour ride at 1 Hz is about 3 MB, GPX and TCX ones about 10 times more
+    ACTIVITY_UPLOAD_MAX_SIZE: int = 64 * 1024 * 1024
+
     @computed_field(return_type=str)
     @property
     def DB_URI(self):
@@ -5,6 +5,7 @@
 # LICENSE file in the root directory of this source tree.
 from .base import CrudError
 from .user import user
+from .circuit import circuit
 
 # For a new basic set of CRUD operations you could just do
 
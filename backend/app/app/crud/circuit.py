@@ -0,0 +1,325 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from collections import Counter
+from datetime import UTC, datetime
+from typing import Iterable, Mapping
+
+import numpy as np
+import shapely
+from sqlalchemy import and_, bindparam, case, delete, func, insert, select, update
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from app.crud.base import CRUDBase, CrudError, CrudIntegrityError
+from app.graph.tiles import BBox
+from app.models.circuit import Circuit, CircuitTrace, circuit_edge
+from app.models.graph import Edge
+from app.schemas.circuit import CircuitCreate, CircuitUpdate
+from app.tracks.activity import Activity
+from app.tracks.levels import trace_levels
+
+# Edges per UPDATE statement of popularity counters
+POPULARITY_BATCH_SIZE = 1_000
+
+_TRACE_INSERT = insert(CircuitTrace).values(
+    trace=func.ST_GeomFromWKB(bindparam("wkb"), 4326)
+)
+
+
+def _linestring_wkb(lon: np.ndarray, lat: np.ndarray) -> bytes:
+    # MySQL reads SRID 4326 WKB in lat/long axis order
+    return shapely.to_wkb(shapely.linestrings(np.column_stack([lat, lon])))
+
+
+def _coordinates(wkb: bytes) -> np.ndarray:
+    """ The (n, 2) (lon, lat) coordinates of a geometry read as long-lat. """
+    return shapely.get_coordinates(shapely.from_wkb(wkb))
+
+
+def _trace(zoom: int | None):
+    """ The WKB of the trace of a circuit simplified for zoom, the full one
+    if None, selected from Circuit outer joined on _trace_join(zoom).
+
+    Circuits written before their levels fall back to their full trace.
+    """
+    trace = Circuit.trace
+    if zoom is not None:
+        trace = func.coalesce(CircuitTrace.trace, Circuit.trace)
+    # MySQL stores SRID 4326 geometries in lat/long axis order
+    return func.ST_AsBinary(trace, "axis-order=long-lat")
+
+
+def _trace_join(zoom: int):
+    return and_(CircuitTrace.circuit_id == Circuit.id, CircuitTrace.zoom == zoom)
+
+
+def _intersects(bbox: BBox):
+    """ Whether the circuit trace bounding box intersects bbox.
+
+    MBRIntersects() compares bounding boxes, which the SPATIAL index on the
+    trace answers.
+    """
+    envelope = shapely.to_wkt(shapely.box(*bbox), rounding_precision=-1)
+    return func.MBRIntersects(
+        Circuit.trace, func.ST_GeomFromText(envelope, 4326, "axis-order=long-lat")
+    )
+
+
+def _update_popularity(db: Session, deltas: Mapping[int, int]) -> None:
+    """ Add deltas to edge popularities, with one UPDATE per batch of edges. """
+    items = [(edge_id, delta) for edge_id, delta in deltas.items() if delta]
+    for start in range(0, len(items), POPULARITY_BATCH_SIZE):
+        batch = dict(items[start:start + POPULARITY_BATCH_SIZE])
+        db.execute(
+            update(Edge)
+            .where(Edge.id.in_(batch))
+            .values(popularity=Edge.popularity + case(batch, value=Edge.id))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _edge_ids(db: Session, circuit_id: int) -> list[int]:
+    return list(db.scalars(
+        select(circuit_edge.c.edge_id).where(circuit_edge.c.circuit_id == circuit_id)
+    ))
+
+
+class CRUDCircuit(CRUDBase[Circuit, CircuitCreate, CircuitUpdate]):
+    async def create_from_activity(
+        self, db: Session, *, activity: Activity, user_id: int
+    ) -> Circuit:
+        """ Create the circuit of a recorded activity, and its simplified
+        traces.
+
+        The geometries are sent as WKB built from the activity arrays at once.
+        """
+        # MySQL reads SRID 4326 WKB in lat/long axis order
+        start = shapely.points(activity.lat[0], activity.lon[0])
+        db_obj = Circuit(
+            name=activity.name,
+            description=None,
+            distance=activity.distance,
+            start_time=activity.start_time.replace(tzinfo=None),
+            start_point=func.ST_GeomFromWKB(shapely.to_wkb(start), 4326),
+            end_time=activity.end_time.replace(tzinfo=None),
+            created_at=datetime.now(UTC).replace(tzinfo=None),
+            elevation_gain=activity.elevation_gain,
+            elevation_loss=activity.elevation_loss,
+            average_speed=activity.average_speed,
+            trace=func.ST_GeomFromWKB(
+                _linestring_wkb(activity.lon, activity.lat), 4326
+            ),
+            edges=[],
+        )
+        db_obj.user_id = user_id
+        db.add(db_obj)
+        try:
+            db.flush()
+            self._insert_levels(db, db_obj.id, activity.lon, activity.lat)
+            db.commit()
+        except SQLAlchemyError as exc:
+            db.rollback()
+            raise CrudError() from exc
+        db.refresh(db_obj)
+        return db_obj
+
+    @staticmethod
+    def _insert_levels(
+        db: Session, circuit_id: int, lon: np.ndarray, lat: np.ndarray
+    ) -> None:
+        db.execute(_TRACE_INSERT, [
+            {
+                "circuit_id": circuit_id,
+                "zoom": zoom,
+                "n_points": len(level_lon),
+                "wkb": _linestring_wkb(level_lon, level_lat),
+            }
+            for zoom, (level_lon, level_lat) in trace_levels(lon, lat).items()
+        ])
+
+    async def set_trace_levels(self, db: Session, *, db_obj: Circuit) -> Circuit:
+        """ Replace the simplified traces of a circuit, from its full trace. """
+        lon, lat = await self.get_trace(db, db_obj=db_obj)
+        try:
+            db.execute(
+                delete(CircuitTrace).where(CircuitTrace.circuit_id == db_obj.id)
+            )
+            self._insert_levels(db, db_obj.id, lon, lat)
+            db.commit()
+        except SQLAlchemyError as exc:
+            db.rollback()
+            raise CrudError() from exc
+        return db_obj
+
+    async def get_trace(
+        self, db: Session, *, db_obj: Circuit, zoom: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """ The (lon, lat) coordinates of the circuit trace.
+
+        The trace simplified for a zoom level of app.tracks.levels is read if
+        given, see trace_level().
+        """
+        stmt = select(_trace(zoom)).where(Circuit.id == db_obj.id)
+        if zoom is not None:
+            stmt = stmt.outerjoin(CircuitTrace, _trace_join(zoom))
+        try:
+            wkb = db.scalar(stmt)
+        except SQLAlchemyError as exc:
+            raise CrudError from exc
+        coordinates = _coordinates(wkb)
+        return coordinates[:, 0], coordinates[:, 1]
+
+    @staticmethod
+    def _select_with_trace(zoom: int | None):
+        """ Circuits with their start point and trace WKB, without loading
+        their full resolution geometries.
+        """
+        stmt = select(
+            Circuit,
+            func.ST_AsBinary(Circuit.start_point, "axis-order=long-lat"),
+            _trace(zoom),
+        ).options(defer(Circuit.trace), defer(Circuit.start_point))
+        if zoom is not None:
+            stmt = stmt.outerjoin(CircuitTrace, _trace_join(zoom))
+        return stmt
+
+    async def get_with_trace(
+        self, db: Session, circuit_id: int, *, zoom: int | None = None
+    ) -> tuple[Circuit, np.ndarray, np.ndarray] | None:
+        """ A circuit, its start point and its trace simplified for zoom, as
+        (lon, lat) coordinates. None if the circuit does not exist.
+        """
+        stmt = self._select_with_trace(zoom).where(Circuit.id == circuit_id)
+        try:
+            row = db.execute(stmt).first()
+        except SQLAlchemyError as exc:
+            raise CrudError from exc
+        if row is None:
+            return None
+        circuit, start, trace = row
+        return circuit, _coordinates(start)[0], _coordinates(trace)
+
+    @classmethod
+    def _select_by_user(
+        cls,
+        user_id: int,
+        *,
+        zoom: int | None = None,
+        bbox: BBox | None = None,
+        skip: int = 0,
+        limit: int = 100,
+    ):
+        stmt = cls._select_with_trace(zoom).where(Circuit.user_id == user_id)
+        if bbox is not None:
+            stmt = stmt.where(_intersects(bbox))
+        return (
+            stmt.order_by(Circuit.start_time.desc(), Circuit.id.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+
+    async def get_multi_by_user(
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        zoom: int | None = None,
+        bbox: BBox | None = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> list[tuple[Circuit, np.ndarray, np.ndarray]]:
+        """ The circuits of a user, latest first, see get_with_trace().
+
+        Only the circuits with a trace intersecting bbox are returned if
+        given, as (min lon, min lat, max lon, max lat).
+        """
+        stmt = self._select_by_user(
+            user_id, zoom=zoom, bbox=bbox, skip=skip, limit=limit
+        )
+        try:
+            rows = db.execute(stmt).all()
+        except SQLAlchemyError as exc:
+            raise CrudError from exc
+        return [
+            (circuit, _coordinates(start)[0], _coordinates(trace))
+            for circuit, start, trace in rows
+        ]
+
+    async def set_edges(
+        self, db: Session, *, db_obj: Circuit, edge_ids: Iterable[int]
+    ) -> Circuit:
+        """ Replace the circuit edges, with a single bulk insert.
+
+        The association table has no order and holds an edge once per
+        circuit, so repeated edges are only stored at their first passage.
+        The popularity of the added and removed edges is updated in the same
+        transaction.
+        """
+        edge_ids = list(dict.fromkeys(edge_ids))
+        try:
+            previous = _edge_ids(db, db_obj.id)
+            deltas = Counter(edge_ids)
+            deltas.subtract(previous)
+            db.execute(
+                delete(circuit_edge).where(circuit_edge.c.circuit_id == db_obj.id)
+            )
+            if edge_ids:
+                db.execute(insert(circuit_edge), [
+                    {"circuit_id": db_obj.id, "edge_id": edge_id}
+                    for edge_id in edge_ids
+                ])
+            _update_popularity(db, deltas)
+            db.commit()
+        except SQLAlchemyError as exc:
+            db.rollback()
+            raise CrudError() from exc
+        db.expire(db_obj, ["edges"])
+        return db_obj
+
+    async def delete(self, db: Session, *, db_obj: Circuit) -> Circuit:
+        try:
+            _update_popularity(db, dict.fromkeys(_edge_ids(db, db_obj.id), -1))
+            db.delete(db_obj)
+            db.commit()
+        except IntegrityError as exc:
+            db.rollback()
+            raise CrudIntegrityError() from exc
+        except SQLAlchemyError as exc:
+            db.rollback()
+            raise CrudError() from exc
+        return db_obj
+
+    async def recompute_popularity(
+        self, db: Session, *, graph_id: int | None = None
+    ) -> None:
+        """ Recount the circuits through each edge, from scratch.
+
+        A maintenance fallback for drifted counters: it scans the whole
+        circuit_edge table, where set_edges() and delete() only touch the
+        edges of a circuit.
+        """
+        counts = (
+            select(circuit_edge.c.edge_id, func.count().label("n"))
+            .group_by(circuit_edge.c.edge_id)
+            .subquery()
+        )
+        reset = update(Edge).values(popularity=0).where(Edge.popularity != 0)
+        recount = update(Edge).where(Edge.id == counts.c.edge_id).values(
+            popularity=counts.c.n
+        )
+        if graph_id is not None:
+            reset = reset.where(Edge.graph_id == graph_id)
+            recount = recount.where(Edge.graph_id == graph_id)
+        try:
+            for stmt in (reset, recount):
+                db.execute(stmt.execution_options(synchronize_session=False))
+            db.commit()
+        except SQLAlchemyError as exc:
+            db.rollback()
+            raise CrudError() from exc
+
+
+circuit = CRUDCircuit(Circuit)
@@ -0,0 +1,89 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import argparse
+import logging
+
+from app.db.session import SessionLocal
+from app.graph.delta import EDITABLE_COLUMNS, edit_edges
+from app.graph.snapshot import SnapshotError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ("1", "true", "yes")
+FALSE_VALUES = ("0", "false", "no")
+
+
+def parse_value(column: str, value: str) -> int | bool:
+    if column == "reversed":
+        if value.lower() not in TRUE_VALUES + FALSE_VALUES:
+            raise SystemExit(f"Invalid boolean for {column}: {value}")
+        return value.lower() in TRUE_VALUES
+    try:
+        return int(value)
+    except ValueError:
+        raise SystemExit(f"Invalid integer for {column}: {value}")
+
+
+def parse_updates(
+    assignments: list[tuple[str, str]]
+) -> dict[int, dict[str, int | bool]]:
+    """ The new column values by edge id, of EDGE_ID COLUMN=VALUE pairs. """
+    updates: dict[int, dict[str, int | bool]] = {}
+    for edge_id, assignment in assignments:
+        column, sep, value = assignment.partition("=")
+        if not edge_id.isdigit() or not sep or column not in EDITABLE_COLUMNS:
+            raise SystemExit(
+                f"Invalid edit {edge_id} {assignment}, expected EDGE_ID "
+                f"COLUMN=VALUE with COLUMN one of {', '.join(EDITABLE_COLUMNS)}"
+            )
+        updates.setdefault(int(edge_id), {})[column] = parse_value(column, value)
+    return updates
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Fix or delete some edges of a graph as a new version, picked up "
+            "by the running services."
+        )
+    )
+    parser.add_argument("graph_id", type=int)
+    parser.add_argument(
+        "--set",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("EDGE_ID", "COLUMN=VALUE"),
+        help=f"Set a column of an edge, one of {', '.join(EDITABLE_COLUMNS)}",
+    )
+    parser.add_argument(
+        "--delete",
+        type=int,
+        action="append",
+        default=[],
+        metavar="EDGE_ID",
+        help="Delete an edge",
+    )
+    args = parser.parse_args()
+    updates = parse_updates(args.set)
+    if not updates and not args.delete:
+        parser.error("Nothing to edit")
+
+    db = SessionLocal()
+    try:
+        version = edit_edges(db, args.graph_id, updates=updates, deleted=args.delete)
+    except SnapshotError as exc:
+        raise SystemExit(f"Database error: {exc.__cause__}")
+    finally:
+        db.close()
+    if version is None:
+        raise SystemExit(f"Unknown graph: {args.graph_id}")
+    logger.info("Graph %s is now at version %s", args.graph_id, version)
+
+
+if __name__ == "__main__":
+    main()
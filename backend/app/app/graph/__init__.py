@@ -0,0 +1,6 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from .snapshot import GraphSnapshot, SnapshotError, build_snapshot, load_snapshot
@@ -0,0 +1,122 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from app.graph.isochrone import tree_edges
+from app.graph.routing import Route
+from app.graph.snapshot import GraphSnapshot
+
+# Alternatives cost at most this many times the cheapest route
+MAX_STRETCH = 1.25
+# They are the cheapest paths along a plateau of at least this fraction of the
+# cost of the cheapest route, so that they make no pointless detour
+MIN_PLATEAU = 0.2
+# Routes sharing more than this fraction of their length with a better one
+# are dropped
+MAX_OVERLAP = 0.6
+# Plateaus tried, by increasing route cost
+MAX_CANDIDATES = 20
+
+
+def _plateaus(
+    pred: np.ndarray, next_node: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """ The nodes reached by a plateau edge, and the first node of the plateau.
+
+    A plateau is a maximal path of edges of both the forward shortest path
+    tree, given by the predecessor of each node, and the backward one, given
+    by the next node of each node.
+    """
+    nodes = np.arange(len(pred))
+    previous = np.where(pred >= 0, pred, nodes)
+    inside = (pred >= 0) & (next_node[previous] == nodes)
+    head = np.where(inside, previous, nodes)
+    while True:
+        jump = head[head]
+        if np.array_equal(jump, head):
+            break
+        head = jump
+    members = np.flatnonzero(inside)
+    return members, head[members]
+
+
+def _path(pred: np.ndarray, start: int, end: int) -> list[int]:
+    """ The nodes from start to end following a tree of predecessors. """
+    nodes = [end]
+    while nodes[-1] != start:
+        nodes.append(int(pred[nodes[-1]]))
+    nodes.reverse()
+    return nodes
+
+
+def alternative_routes(
+    snapshot: GraphSnapshot,
+    matrix: csr_matrix,
+    cost: np.ndarray,
+    source: int,
+    target: int,
+    count: int = 3,
+) -> list[Route]:
+    """ The cheapest route between two dense node indices, and alternatives.
+
+    matrix is the cost_matrix() of the same edge costs as cost. One search
+    from source and one towards target give the cost of the cheapest route
+    through every node. Alternatives go through the plateaus shared by both
+    shortest path trees (Abraham et al., Alternative Routes in Road
+    Networks), with a bounded stretch and overlap. Returns up to count
+    routes, cheapest first, none if target cannot be reached.
+    """
+    dist, pred = dijkstra(matrix, indices=source, return_predecessors=True)
+    best = dist[target]
+    if not np.isfinite(best):
+        return []
+    limit = MAX_STRETCH * best
+    # The predecessors of the backward search are the next nodes of forward
+    # paths
+    back, next_node = dijkstra(
+        matrix.T.tocsr(), indices=target, return_predecessors=True, limit=limit
+    )
+    dist[dist > limit] = np.inf
+    via = dist + back
+
+    # The plateau of each node, its cost is the span of dist along it
+    members, heads = _plateaus(pred, next_node)
+    reached = np.isfinite(dist[members])
+    members, heads = members[reached], heads[reached]
+    order = np.lexsort((dist[members], heads))
+    members, heads = members[order], heads[order]
+    last = np.r_[heads[1:] != heads[:-1], True][:len(heads)]
+    heads, span = heads[last], dist[members[last]] - dist[heads[last]]
+    keep = (span >= MIN_PLATEAU * best) & (via[heads] <= limit)
+    heads = heads[keep][np.argsort(via[heads[keep]], kind="stable")]
+
+    def route(nodes: list[int]) -> Route:
+        nodes = np.array(nodes)
+        return Route.from_edges(
+            snapshot, tree_edges(snapshot, cost, nodes[:-1], nodes[1:])
+        )
+
+    routes = [route(_path(pred, source, target))]
+    for head in heads[:MAX_CANDIDATES].tolist():
+        if len(routes) >= count:
+            break
+        nodes = _path(pred, source, head)
+        while nodes[-1] != target:
+            nodes.append(int(next_node[nodes[-1]]))
+        # Paths of both trees may cross each other, making a loop
+        ordered = np.sort(nodes)
+        if np.any(ordered[1:] == ordered[:-1]):
+            continue
+        candidate = route(nodes)
+        if all(
+            snapshot.length[np.intersect1d(candidate.edges, other.edges)].sum()
+            <= MAX_OVERLAP * candidate.length
+            for other in routes
+        ):
+            routes.append(candidate)
+    return routes
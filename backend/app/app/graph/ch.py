@@ -0,0 +1,597 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import math
+import os
+import struct
+import zipfile
+from dataclasses import dataclass
+from heapq import heappop, heappush
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from app.graph.routing import Route
+from app.graph.snapshot import GraphSnapshot
+
+# A witness search gives up after expanding this many nodes, or following
+# this many edges: a shortcut may then be added needlessly, which is
+# harmless for correctness.
+WITNESS_SETTLE_LIMIT = 50
+WITNESS_HOPS = 5
+# Priorities only estimate the shortcuts of a contraction: shallower
+# witness searches are good enough there.
+ESTIMATE_HOPS = 2
+# The highest ranked nodes are not contracted but joined by tables of
+# their distances (12 bytes per pair), which the searches meet at instead
+# of climbing through the densest part of the hierarchy. The tables are
+# memory mapped, only the rows of the core nodes met being read.
+CORE_NODES = 2000
+
+
+class HierarchyError(Exception):
+    pass
+
+
+@dataclass(frozen=True, eq=False)
+class ContractionHierarchy:
+    """ A contraction hierarchy over the dense node indices of a snapshot.
+
+    CH edges are the original edges plus shortcuts. A shortcut ``e`` replaces
+    the two CH edges ``first[e]`` and ``second[e]``; an original CH edge has
+    ``first[e] == -1`` and maps to the snapshot edge ``original[e]``.
+    The upward graph holds, for each node, the CH edges to higher ranked
+    nodes; the downward graph holds, for each node, the CH edges coming
+    from higher ranked nodes.
+    The ``n_core`` highest ranked nodes are left uncontracted: the core node
+    of rank ``n_nodes - n_core + i`` has the core index ``i``, by which its
+    shortest distances to the others are tabulated.
+    """
+    graph_id: int
+    n_edges: int                # number of edges of the source snapshot
+    rank: np.ndarray            # int32, contraction order of each node
+    first: np.ndarray           # int64, per CH edge
+    second: np.ndarray          # int64, per CH edge
+    original: np.ndarray        # int64, per CH edge
+    up_indptr: np.ndarray
+    up_head: np.ndarray         # int32, higher ranked head node
+    up_weight: np.ndarray       # float64
+    up_edge: np.ndarray         # int64, CH edge id
+    down_indptr: np.ndarray
+    down_tail: np.ndarray       # int32, higher ranked tail node
+    down_weight: np.ndarray     # float64
+    down_edge: np.ndarray       # int64, CH edge id
+    core_dist: np.ndarray       # float64, n_core x n_core
+    core_pred: np.ndarray       # int32, previous core node, -1 if none
+    core_keys: np.ndarray       # int64, sorted tail * n_core + head
+    core_edge: np.ndarray       # int64, CH edge id of each of core_keys
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.rank)
+
+    @property
+    def n_core(self) -> int:
+        return len(self.core_dist)
+
+    @property
+    def n_shortcuts(self) -> int:
+        return int(np.count_nonzero(self.first >= 0))
+
+    def save(self, path: Path) -> None:
+        """ Write the hierarchy atomically, for readers never to see it half
+        written. """
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        # A file object, for numpy not to append .npz to the name
+        with temporary.open("wb") as f:
+            np.savez(
+                f,
+                graph_id=self.graph_id,
+                n_edges=self.n_edges,
+                **{name: getattr(self, name) for name in _ARRAYS},
+            )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: Path, snapshot: GraphSnapshot) -> "ContractionHierarchy":
+        """ Load a hierarchy, checking it was built from a matching snapshot. """
+        with np.load(path) as data, zipfile.ZipFile(path) as archive:
+            if not set(_ARRAYS) <= set(data.files):
+                raise HierarchyError(f"{path} is of an older format, rebuild it")
+            ch = cls(
+                graph_id=int(data["graph_id"]),
+                n_edges=int(data["n_edges"]),
+                **{
+                    name: _map_member(path, archive, name) if name in _MAPPED
+                    else data[name]
+                    for name in _ARRAYS
+                },
+            )
+        if (
+            ch.graph_id != snapshot.graph_id
+            or ch.n_nodes != snapshot.n_nodes
+            or ch.n_edges != snapshot.n_edges
+        ):
+            raise HierarchyError(
+                f"{path} does not match the snapshot of graph {snapshot.graph_id}"
+            )
+        return ch
+
+    def unpack(self, ch_edges: list[int]) -> list[int]:
+        """ Expand CH edges into snapshot edge indices, in travel order. """
+        edges = []
+        stack = list(reversed(ch_edges))
+        first, second, original = self.first, self.second, self.original
+        while stack:
+            e = stack.pop()
+            if first[e] < 0:
+                edges.append(int(original[e]))
+            else:
+                stack.append(int(second[e]))
+                stack.append(int(first[e]))
+        return edges
+
+
+_ARRAYS = (
+    "rank", "first", "second", "original",
+    "up_indptr", "up_head", "up_weight", "up_edge",
+    "down_indptr", "down_tail", "down_weight", "down_edge",
+    "core_dist", "core_pred", "core_keys", "core_edge",
+)
+# The core tables are memory mapped, their pages being read on first access
+# and shared with the other processes mapping the file
+_MAPPED = ("core_dist", "core_pred")
+# The fixed part of a ZIP local file header, ending with the lengths of the
+# name and extra field
+_LOCAL_HEADER = struct.Struct("<4s5HIIIHH")
+
+
+def _map_member(path: Path, archive: zipfile.ZipFile, name: str) -> np.ndarray:
+    """ Memory map an array of an uncompressed .npz file, read only. """
+    info = archive.getinfo(f"{name}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise HierarchyError(f"{path} is compressed, rebuild it")
+    with open(path, "rb") as f:
+        # The local header of the member is followed by its name and extra
+        # field, whose lengths may differ from the central directory
+        f.seek(info.header_offset)
+        local = f.read(_LOCAL_HEADER.size)
+        name_length, extra_length = _LOCAL_HEADER.unpack(local)[-2:]
+        f.seek(info.header_offset + len(local) + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        shape, fortran_order, dtype = header
+        offset = f.tell()
+    # A plain view, slicing a np.memmap being much slower
+    return np.memmap(
+        path, dtype=dtype, mode="r", offset=offset, shape=shape,
+        order="F" if fortran_order else "C",
+    ).view(np.ndarray)
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """ The indices of the ranges [start, start + count), concatenated. """
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(int(counts.sum()))
+
+
+def _heads(*keys: np.ndarray) -> np.ndarray:
+    """ True at the first of each run of equal keys, in sorted arrays. """
+    first = np.ones(len(keys[0]), dtype=bool)
+    if len(first):
+        first[1:] = np.any([k[1:] != k[:-1] for k in keys], axis=0)
+    return first
+
+
+def _csr(rows: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """ The order of rows grouping them by value, and their CSR indptr. """
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return np.argsort(rows, kind="stable"), indptr
+
+
+class _Remaining:
+    """ The edges between the nodes left to contract, indexed both ways. """
+
+    def __init__(self, n: int, tail, head, weight, edge):
+        self.n = n
+        self.tail, self.head, self.weight, self.edge = tail, head, weight, edge
+        self.out_order, self.out_indptr = _csr(tail, n)
+        self.in_order, self.in_indptr = _csr(head, n)
+
+    def degree(self, nodes: np.ndarray) -> np.ndarray:
+        return (
+            self.out_indptr[nodes + 1] - self.out_indptr[nodes]
+            + self.in_indptr[nodes + 1] - self.in_indptr[nodes]
+        )
+
+    def out_edges(self, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """ The remaining edges leaving nodes, and their count per node. """
+        counts = self.out_indptr[nodes + 1] - self.out_indptr[nodes]
+        return self.out_order[_ranges(self.out_indptr[nodes], counts)], counts
+
+    def in_edges(self, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """ The remaining edges entering nodes, and their count per node. """
+        counts = self.in_indptr[nodes + 1] - self.in_indptr[nodes]
+        return self.in_order[_ranges(self.in_indptr[nodes], counts)], counts
+
+
+def _witnessed(
+    graph: _Remaining, sources, query, target, limit, hops: int
+) -> np.ndarray:
+    """ Whether a path strictly shorter than limit leads from the source of
+    each query to its target.
+
+    All the queries are searched together, hop by hop, each one expanding
+    its nearest reached nodes up to WITNESS_SETTLE_LIMIT of them.
+    """
+    n, n_sources = graph.n, len(sources)
+    witnessed = np.zeros(len(query), dtype=bool)
+    wanted = query * n + target
+    # The reached (source index * n + node) keys, sorted, and distances
+    best_keys = np.arange(n_sources, dtype=np.int64) * n + sources
+    best_dist = np.zeros(n_sources)
+    budget = np.full(n_sources, WITNESS_SETTLE_LIMIT)
+    q, node, dist = np.arange(n_sources), sources, np.zeros(n_sources)
+    for _ in range(hops):
+        # Searches stop once all their targets are witnessed
+        bound = np.full(n_sources, -1.0)
+        np.maximum.at(bound, query[~witnessed], limit[~witnessed])
+        keep = bound[q] >= 0
+        q, node, dist = q[keep], node[keep], dist[keep]
+        counts = np.bincount(q, minlength=n_sources)
+        if (counts > budget).any():
+            order = np.argsort(dist)
+            order = order[np.argsort(q[order], kind="stable")]
+            q, node, dist = q[order], node[order], dist[order]
+            nearest = np.arange(len(q)) - (np.cumsum(counts) - counts)[q]
+            keep = nearest < budget[q]
+            q, node, dist = q[keep], node[keep], dist[keep]
+        budget -= np.bincount(q, minlength=n_sources)
+
+        edges, counts = graph.out_edges(node)
+        q = np.repeat(q, counts)
+        dist = np.repeat(dist, counts) + graph.weight[edges]
+        keep = dist < bound[q]
+        q, node, dist = q[keep], graph.head[edges[keep]], dist[keep]
+        if not len(q):
+            break
+
+        # The shortest distance to each reached node, if an improvement
+        keys = q * n + node
+        order = np.argsort(keys, kind="stable")
+        keys, dist = keys[order], dist[order]
+        first = np.flatnonzero(_heads(keys))
+        keys, dist = keys[first], np.minimum.reduceat(dist, first)
+        i = np.minimum(np.searchsorted(best_keys, keys), len(best_keys) - 1)
+        better = (best_keys[i] != keys) | (dist < best_dist[i])
+        keys, dist = keys[better], dist[better]
+        if not len(keys):
+            break
+        merged_keys = np.concatenate([keys, best_keys])
+        order = np.argsort(merged_keys, kind="stable")
+        merged_keys = merged_keys[order]
+        kept = _heads(merged_keys)
+        best_keys = merged_keys[kept]
+        best_dist = np.concatenate([dist, best_dist])[order][kept]
+
+        i = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+        witnessed |= (keys[i] == wanted) & (dist[i] < limit)
+        q, node = keys // n, keys % n
+    return witnessed
+
+
+def _shortcuts(
+    graph: _Remaining, nodes: np.ndarray, hops: int = WITNESS_HOPS
+):
+    """ The shortcuts (node, tail, head, weight, first, second) replacing
+    the contracted nodes, with ``first`` and ``second`` the CH edges.
+
+    A shortcut is needed unless a strictly shorter path exists, whichever
+    node it goes through: the nodes of an independent set can thus be
+    contracted together.
+    """
+    ins, counts = graph.in_edges(nodes)
+    node = np.repeat(nodes, counts)
+    outs, counts = graph.out_edges(node)
+    ins, node = np.repeat(ins, counts), np.repeat(node, counts)
+    tail, head = graph.tail[ins], graph.head[outs]
+    keep = tail != head
+    ins, outs, node, tail, head = (
+        ins[keep], outs[keep], node[keep], tail[keep], head[keep]
+    )
+    weight = graph.weight[ins] + graph.weight[outs]
+    sources, query = np.unique(tail, return_inverse=True)
+    need = ~_witnessed(graph, sources, query, head, weight, hops)
+    return (
+        node[need], tail[need], head[need], weight[need],
+        graph.edge[ins[need]], graph.edge[outs[need]],
+    )
+
+
+def _adjacency(parts: list[tuple], n: int):
+    """ CSR (indptr, node, weight, edge) arrays from (row, node, weight, edge)
+    array parts. """
+    row, node, weight, edge = (np.concatenate(column) for column in zip(*parts))
+    order, indptr = _csr(row, n)
+    return (
+        indptr,
+        node[order].astype(np.int32),
+        weight[order],
+        edge[order],
+    )
+
+
+def _core_table(graph: _Remaining, core: np.ndarray):
+    """ The shortest distances and predecessors between the core nodes, and
+    their (sorted keys, CH edges) between adjacent ones. """
+    n_core = len(core)
+    local = np.full(graph.n, -1, dtype=np.int64)
+    local[core] = np.arange(n_core)
+    tail, head = local[graph.tail], local[graph.head]
+    if n_core:
+        dist, pred = dijkstra(
+            csr_matrix((graph.weight, (tail, head)), shape=(n_core, n_core)),
+            return_predecessors=True,
+        )
+    else:
+        dist, pred = np.zeros((0, 0)), np.zeros((0, 0), dtype=np.int32)
+    keys = tail * n_core + head
+    order = np.argsort(keys)
+    return (
+        dist,
+        np.where(pred < 0, -1, pred).astype(np.int32),
+        keys[order],
+        graph.edge[order],
+    )
+
+
+def build_hierarchy(
+    snapshot: GraphSnapshot,
+    weights: np.ndarray | None = None,
+    *,
+    core_nodes: int = CORE_NODES,
+) -> ContractionHierarchy:
+    """ Contract the nodes of a snapshot, by default weighted by length.
+
+    Nodes are contracted in rounds, each one of all the nodes of lower
+    priority than their neighbors, until core_nodes are left.
+    """
+    n = snapshot.n_nodes
+    weights = np.asarray(
+        snapshot.length if weights is None else weights, dtype=np.float64
+    )
+
+    # Only the lightest of parallel edges matters, and loops never do
+    source, target = snapshot.source, snapshot.target
+    keep = np.flatnonzero(source != target)
+    keep = keep[np.lexsort((weights[keep], target[keep], source[keep]))]
+    pairs = source[keep].astype(np.int64) * n + target[keep]
+    keep = keep[np.diff(pairs, prepend=-1) != 0]
+
+    graph = _Remaining(
+        n,
+        source[keep].astype(np.int64),
+        target[keep].astype(np.int64),
+        weights[keep],
+        np.arange(len(keep), dtype=np.int64),
+    )
+    firsts = [np.full(len(keep), -1, dtype=np.int64)]
+    seconds = [np.full(len(keep), -1, dtype=np.int64)]
+    n_ch_edges = len(keep)
+
+    empty = np.zeros(0, dtype=np.int64)
+    up = [(empty, empty, np.zeros(0), empty)]
+    down = [(empty, empty, np.zeros(0), empty)]
+    rank = np.empty(n, dtype=np.int32)
+    alive = np.ones(n, dtype=bool)
+    deleted = np.zeros(n, dtype=np.int64)
+    depth = np.zeros(n, dtype=np.int64)
+    priority = np.zeros(n, dtype=np.int64)
+    # Ties are broken at random, not to contract along the node order
+    tiebreak = np.random.default_rng(0).permutation(n)
+    dirty = np.arange(n)
+    level = 0
+    while n - level > core_nodes:
+        # Weigh the edge difference with the number of contracted neighbors
+        # and the hierarchy depth, to spread contractions evenly
+        if len(dirty):
+            added = np.bincount(
+                _shortcuts(graph, dirty, ESTIMATE_HOPS)[0], minlength=n
+            )
+            priority[dirty] = (
+                2 * (added[dirty] - graph.degree(dirty))
+                + deleted[dirty] + depth[dirty]
+            )
+        key = priority * n + tiebreak
+        lower = key[graph.tail] < key[graph.head]
+        contracted = alive.copy()
+        contracted[graph.tail[~lower]] = False
+        contracted[graph.head[lower]] = False
+        batch = np.flatnonzero(contracted)
+        _, tail, head, weight, first, second = _shortcuts(graph, batch)
+
+        out = contracted[graph.tail]
+        into = contracted[graph.head]
+        up.append((
+            graph.tail[out], graph.head[out], graph.weight[out], graph.edge[out]
+        ))
+        down.append((
+            graph.head[into], graph.tail[into], graph.weight[into],
+            graph.edge[into],
+        ))
+        rank[batch] = level + np.arange(len(batch))
+        level += len(batch)
+        alive[batch] = False
+
+        touching = out | into
+        contracted_node = np.where(out, graph.tail, graph.head)[touching]
+        neighbor = np.where(out, graph.head, graph.tail)[touching]
+        pairs = np.unique(contracted_node * n + neighbor)
+        contracted_node, neighbor = pairs // n, pairs % n
+        np.add.at(deleted, neighbor, 1)
+        np.maximum.at(depth, neighbor, depth[contracted_node] + 1)
+        dirty = np.unique(neighbor)
+
+        # Shortcuts only replace heavier edges, or each other
+        rest = ~touching
+        n_rest = int(np.count_nonzero(rest))
+        tail = np.concatenate([graph.tail[rest], tail])
+        head = np.concatenate([graph.head[rest], head])
+        weight = np.concatenate([graph.weight[rest], weight])
+        edge = np.concatenate([graph.edge[rest], np.full(len(first), -1)])
+        shortcut = np.concatenate([np.full(n_rest, -1), np.arange(len(first))])
+        order = np.lexsort((weight, head, tail))
+        order = order[_heads(tail[order], head[order])]
+        tail, head, weight, edge, shortcut = (
+            tail[order], head[order], weight[order], edge[order], shortcut[order]
+        )
+        new = shortcut >= 0
+        edge[new] = n_ch_edges + np.arange(np.count_nonzero(new))
+        n_ch_edges += int(np.count_nonzero(new))
+        firsts.append(first[shortcut[new]])
+        seconds.append(second[shortcut[new]])
+        graph = _Remaining(n, tail, head, weight, edge)
+
+    core = np.flatnonzero(alive)
+    rank[core] = level + np.arange(len(core))
+    core_dist, core_pred, core_keys, core_edge = _core_table(graph, core)
+    first = np.concatenate(firsts)
+    original = np.full(len(first), -1, dtype=np.int64)
+    original[:len(keep)] = keep
+    up_indptr, up_head, up_weight, up_edge = _adjacency(up, n)
+    down_indptr, down_tail, down_weight, down_edge = _adjacency(down, n)
+    return ContractionHierarchy(
+        graph_id=snapshot.graph_id,
+        n_edges=snapshot.n_edges,
+        rank=rank,
+        first=first,
+        second=np.concatenate(seconds),
+        original=original,
+        up_indptr=up_indptr,
+        up_head=up_head,
+        up_weight=up_weight,
+        up_edge=up_edge,
+        down_indptr=down_indptr,
+        down_tail=down_tail,
+        down_weight=down_weight,
+        down_edge=down_edge,
+        core_dist=core_dist,
+        core_pred=core_pred,
+        core_keys=core_keys,
+        core_edge=core_edge,
+    )
+
+
+def _search(origin: int, first_core: int, rank, graph, stall_graph):
+    """ Upward Dijkstra search from origin, stopping at the core nodes.
+
+    Nodes reached sub-optimally through a higher node are stalled, that is
+    not expanded. Returns the distances of the reached nodes and the
+    (CH edge, previous node) each one was reached by.
+    """
+    indptr, nodes, weights, edges = graph
+    s_indptr, s_nodes, s_weights = stall_graph
+    dist = {origin: 0.0}
+    pred: dict[int, tuple[int, int]] = {}
+    heap = [(0.0, origin)]
+    while heap:
+        d, u = heappop(heap)
+        if d > dist[u] or rank[u] >= first_core:
+            continue
+        start, end = s_indptr[u], s_indptr[u + 1]
+        for x, w in zip(s_nodes[start:end], s_weights[start:end]):
+            if dist.get(x, math.inf) + w < d:
+                break
+        else:
+            start, end = indptr[u], indptr[u + 1]
+            for v, w, e in zip(
+                nodes[start:end], weights[start:end], edges[start:end]
+            ):
+                nd = d + w
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    pred[v] = (e, u)
+                    heappush(heap, (nd, v))
+    return dist, pred
+
+
+def _core_path(ch: ContractionHierarchy, start: int, end: int) -> list[int]:
+    """ The CH edges of the shortest path between core indices. """
+    nodes = [end]
+    while nodes[-1] != start:
+        nodes.append(int(ch.core_pred[start, nodes[-1]]))
+    nodes.reverse()
+    keys = np.array(nodes[:-1], dtype=np.int64) * ch.n_core + nodes[1:]
+    return ch.core_edge[np.searchsorted(ch.core_keys, keys)].tolist()
+
+
+def _unwind(pred: dict, node: int, origin: int) -> list[int]:
+    """ The CH edges from node back to the origin of a search. """
+    edges = []
+    while node != origin:
+        e, node = pred[node]
+        edges.append(e)
+    return edges
+
+
+def shortest_path(
+    ch: ContractionHierarchy, snapshot: GraphSnapshot, source: int, target: int
+) -> Route | None:
+    """ Bidirectional upward search of the hierarchy between dense node indices.
+
+    Both searches stop at the core, joined there by its distance table.
+    Returns None if target cannot be reached from source.
+    """
+    # Forward search climbs the upward graph, backward search climbs the
+    # downward graph; each stalls on the other graph. Memoryviews index
+    # into plain Python numbers, much faster than numpy scalars.
+    up = [memoryview(a) for a in (ch.up_indptr, ch.up_head, ch.up_weight)]
+    down = [memoryview(a) for a in (ch.down_indptr, ch.down_tail, ch.down_weight)]
+    rank = memoryview(ch.rank)
+    first_core = ch.n_nodes - ch.n_core
+    forward, forward_pred = _search(
+        source, first_core, rank, (*up, memoryview(ch.up_edge)), down
+    )
+    backward, backward_pred = _search(
+        target, first_core, rank, (*down, memoryview(ch.down_edge)), up
+    )
+
+    best, meeting = math.inf, None
+    smaller, larger = sorted((forward, backward), key=len)
+    for node, d in smaller.items():
+        other = larger.get(node)
+        if other is not None and d + other < best:
+            best, meeting = d + other, (node, node)
+    starts = [node for node in forward if rank[node] >= first_core]
+    ends = [node for node in backward if rank[node] >= first_core]
+    if starts and ends:
+        table = ch.core_dist[np.ix_(
+            ch.rank[starts] - first_core, ch.rank[ends] - first_core
+        )]
+        total = (
+            np.array([forward[node] for node in starts])[:, None] + table
+            + np.array([backward[node] for node in ends])
+        )
+        i, j = np.unravel_index(np.argmin(total), total.shape)
+        if total[i, j] < best:
+            best, meeting = total[i, j], (starts[i], ends[j])
+    if meeting is None:
+        return None
+
+    start, end = meeting
+    edges = _unwind(forward_pred, start, source)
+    edges.reverse()
+    if start != end:
+        edges += _core_path(
+            ch, int(ch.rank[start]) - first_core, int(ch.rank[end]) - first_core
+        )
+    edges += _unwind(backward_pred, end, target)
+    return Route.from_edges(snapshot, ch.unpack(edges))
@@ -0,0 +1,256 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import dataclass
+from typing import Collection, Iterable, Mapping
+
+import numpy as np
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.graph.elevation import ElevationProfiles, load_elevations
+from app.graph.geometry import EdgeGeometries, load_geometries
+from app.graph.profiles import compile_profiles
+from app.graph.snapshot import (
+    EDGE_DTYPE, NODE_DTYPE, SnapshotError, build_snapshot, load_edges
+)
+from app.graph.snapshot_file import SnapshotFile
+from app.models.circuit import circuit_edge
+from app.models.graph import Edge, EdgeChange, EdgeOperation, EdgeOrigin, Graph
+
+# The columns of an edge that edit_edges() may fix
+EDITABLE_COLUMNS = (
+    "length", "positive_elevation", "negative_elevation", "reversed"
+)
+
+
+@dataclass(frozen=True, eq=False)
+class GraphDelta:
+    """ The changes of the edges of a Graph from a version to a later one.
+
+    Updated edges are removed then added again.
+    """
+    graph_id: int
+    version: int
+    removed: np.ndarray            # int64, ids of the deleted and updated edges
+    nodes: np.ndarray              # NODE_DTYPE, the end nodes of the added edges
+    edges: np.ndarray              # EDGE_DTYPE, the inserted and updated edges
+    geometries: EdgeGeometries     # of the added edges
+    elevations: ElevationProfiles  # of the added edges
+
+
+def record_changes(
+    db: Session,
+    graph_id: int,
+    *,
+    inserted: Iterable[int] = (),
+    updated: Iterable[int] = (),
+    deleted: Iterable[int] = (),
+) -> int | None:
+    """ Log changes of the edges of a Graph as a new version.
+
+    Shall be called in the transaction writing the edges, once flushed, so
+    that the version of the graph and its edges change together. Returns
+    the new version, or None if the graph does not exist.
+    """
+    changes = [
+        *((edge_id, EdgeOperation.insert) for edge_id in inserted),
+        *((edge_id, EdgeOperation.update) for edge_id in updated),
+        *((edge_id, EdgeOperation.delete) for edge_id in deleted),
+    ]
+    try:
+        # Concurrent changes are serialized by the lock of the graph row
+        version = db.scalar(
+            select(Graph.version).where(Graph.id == graph_id).with_for_update()
+        )
+        if version is None or not changes:
+            return version
+        version += 1
+        db.execute(update(Graph).where(Graph.id == graph_id).values(version=version))
+        db.execute(insert(EdgeChange), [
+            {
+                "graph_id": graph_id,
+                "version": version,
+                "edge_id": edge_id,
+                "operation": operation,
+            }
+            for edge_id, operation in changes
+        ])
+    except SQLAlchemyError as exc:
+        raise SnapshotError from exc
+    return version
+
+
+def edit_edges(
+    db: Session,
+    graph_id: int,
+    *,
+    updates: Mapping[int, Mapping[str, int | bool]] | None = None,
+    deleted: Collection[int] = (),
+) -> int | None:
+    """ Fix or delete some edges of a Graph, as a new version.
+
+    updates maps edge ids to new values of EDITABLE_COLUMNS. The edges and
+    their change log are written in one transaction, committed here, so
+    that refresh() sees both or none. Edges of other graphs are ignored.
+    Returns the new version, or None if the graph does not exist.
+    """
+    updates = updates or {}
+    unknown = {name for columns in updates.values() for name in columns}
+    unknown -= set(EDITABLE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Not editable edge columns: {', '.join(sorted(unknown))}")
+    try:
+        # Locked first, so that concurrent edits get versions in commit order
+        if db.scalar(
+            select(Graph.id).where(Graph.id == graph_id).with_for_update()
+        ) is None:
+            return None
+        existing = set(db.scalars(
+            select(Edge.id).where(
+                Edge.graph_id == graph_id, Edge.id.in_([*updates, *deleted])
+            )
+        ))
+        updated = [edge_id for edge_id in updates if edge_id in existing]
+        deleted = [edge_id for edge_id in deleted if edge_id in existing]
+        for edge_id in updated:
+            db.execute(
+                update(Edge).where(Edge.id == edge_id).values(**updates[edge_id])
+            )
+        if deleted:
+            db.execute(delete(circuit_edge).where(circuit_edge.c.edge_id.in_(deleted)))
+            db.execute(delete(EdgeOrigin).where(EdgeOrigin.edge_id.in_(deleted)))
+            db.execute(delete(Edge).where(Edge.id.in_(deleted)))
+        version = record_changes(db, graph_id, updated=updated, deleted=deleted)
+        db.commit()
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise SnapshotError from exc
+    except SnapshotError:
+        db.rollback()
+        raise
+    return version
+
+
+def load_delta(
+    db: Session, graph_id: int, since: int, version: int
+) -> GraphDelta | None:
+    """ Read the changes of a Graph after version since, up to version.
+
+    The added edges are read as they are now, a later delta reading them
+    again if they changed since version. Returns None if some versions in
+    between were not logged.
+    """
+    try:
+        rows = db.execute(
+            select(EdgeChange.version, EdgeChange.edge_id, EdgeChange.operation)
+            .where(
+                EdgeChange.graph_id == graph_id,
+                EdgeChange.version > since,
+                EdgeChange.version <= version,
+            )
+            .order_by(EdgeChange.version, EdgeChange.id)
+        ).all()
+    except SQLAlchemyError as exc:
+        raise SnapshotError from exc
+    if len({row.version for row in rows}) != version - since:
+        return None
+
+    # The last operation on an edge tells whether it still exists
+    operations = {row.edge_id: row.operation for row in rows}
+    added = [
+        edge_id for edge_id, operation in operations.items()
+        if operation != EdgeOperation.delete
+    ]
+    nodes, edges = load_edges(db, graph_id, added)
+    return GraphDelta(
+        graph_id,
+        version,
+        np.array(list(operations), dtype=np.int64),
+        nodes,
+        edges,
+        load_geometries(db, graph_id, edges["id"].tolist()),
+        load_elevations(db, graph_id, edges["id"].tolist()),
+    )
+
+
+def _merge_packed(
+    edge_ids: np.ndarray,
+    offsets: np.ndarray,
+    rows: np.ndarray,
+    removed: np.ndarray,
+    added_ids: np.ndarray,
+    added_offsets: np.ndarray,
+    added_rows: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Merge the packed rows of the edges, as in EdgeGeometries, without the
+    removed edges.
+    """
+    all_ids = np.concatenate([edge_ids, added_ids])
+    all_offsets = np.concatenate([offsets[:-1], added_offsets + offsets[-1]])
+    all_rows = np.concatenate([rows, added_rows])
+    keep = np.flatnonzero(np.r_[
+        ~np.isin(edge_ids, removed), np.ones(len(added_ids), dtype=bool)
+    ])
+    order = keep[np.argsort(all_ids[keep], kind="stable")]
+
+    # The rows of the edges, in id order
+    starts = all_offsets[order]
+    counts = all_offsets[order + 1] - starts
+    merged = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(counts, out=merged[1:])
+    taken = np.repeat(starts - merged[:-1], counts) + np.arange(merged[-1])
+    return all_ids[order], merged, all_rows[taken]
+
+
+def apply_delta(data: SnapshotFile, delta: GraphDelta) -> SnapshotFile:
+    """ A snapshot file with the changes of a delta, built in memory. """
+    snapshot = data.snapshot
+    keep = ~np.isin(snapshot.edge_ids, delta.removed)
+    edges = np.empty(int(keep.sum()), dtype=EDGE_DTYPE)
+    edges["id"] = snapshot.edge_ids[keep]
+    edges["source_id"] = snapshot.node_ids[snapshot.source[keep]]
+    edges["target_id"] = snapshot.node_ids[snapshot.target[keep]]
+    for name in (
+        "key", "length", "positive_elevation", "negative_elevation", "reversed"
+    ):
+        edges[name] = getattr(snapshot, name)[keep]
+    # Nodes are kept, even without edges left
+    nodes = np.empty(snapshot.n_nodes, dtype=NODE_DTYPE)
+    nodes["id"] = snapshot.node_ids
+    nodes["lon"] = snapshot.lon
+    nodes["lat"] = snapshot.lat
+    new_nodes = delta.nodes[~np.isin(delta.nodes["id"], snapshot.node_ids)]
+
+    updated = build_snapshot(
+        data.graph_id,
+        np.concatenate([nodes, new_nodes]),
+        np.concatenate([edges, delta.edges]),
+    )
+    return SnapshotFile(
+        data.graph_id,
+        delta.version,
+        updated,
+        compile_profiles(updated),
+        EdgeGeometries(data.graph_id, *_merge_packed(
+            data.geometries.edge_ids,
+            data.geometries.offsets,
+            data.geometries.coordinates,
+            delta.removed,
+            delta.geometries.edge_ids,
+            delta.geometries.offsets,
+            delta.geometries.coordinates,
+        )),
+        ElevationProfiles(data.graph_id, *_merge_packed(
+            data.elevations.edge_ids,
+            data.elevations.offsets,
+            data.elevations.values,
+            delta.removed,
+            delta.elevations.edge_ids,
+            delta.elevations.offsets,
+            delta.elevations.values,
+        )),
+    )
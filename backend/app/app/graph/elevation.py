@@ -0,0 +1,171 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import dataclass
+from typing import Collection
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.graph.geo import haversine
+from app.graph.snapshot import FETCH_SIZE, GraphSnapshot, SnapshotError
+from app.models.graph import Edge
+
+# Distances and elevations are stored as int32 in decimeter
+ELEVATION_SCALE = 10
+# Packed little endian (distance, elevation) pairs, see pack_elevations()
+_PACKED_DTYPE = np.dtype("<i4")
+
+
+@dataclass(frozen=True, eq=False)
+class ElevationProfiles:
+    """ The elevation profiles of the edges of a Graph, packed.
+
+    The (distance, elevation) points of the edge of index ``i`` are the rows
+    ``values[offsets[i]:offsets[i + 1]]``, distances from the start of its
+    geometry in the digitized direction. Edges without a profile have no
+    points. ``edge_ids`` is sorted so that the edge id -> index mapping is a
+    binary search.
+    """
+    graph_id: int
+    edge_ids: np.ndarray  # int64, sorted
+    offsets: np.ndarray   # int64, n_edges + 1
+    values: np.ndarray    # int32, (n_points, 2), times ELEVATION_SCALE
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edge_ids)
+
+    def indices(self, edge_ids: np.ndarray) -> np.ndarray:
+        """ The profile indices of some edge ids.
+
+        Raises:
+            KeyError: if some edges are unknown.
+        """
+        edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        if self.n_edges == 0:
+            if len(edge_ids):
+                raise KeyError(edge_ids.tolist())
+            return np.zeros(0, dtype=np.intp)
+        idx = np.searchsorted(self.edge_ids, edge_ids)
+        np.minimum(idx, self.n_edges - 1, out=idx)
+        missing = self.edge_ids[idx] != edge_ids
+        if missing.any():
+            raise KeyError(edge_ids[missing].tolist())
+        return idx
+
+    def packed(self, index: int) -> bytes | None:
+        """ The Edge.elevation_profile of an edge, None without points. """
+        values = self.values[self.offsets[index]:self.offsets[index + 1]]
+        return values.astype(_PACKED_DTYPE).tobytes() if len(values) else None
+
+
+def pack_elevations(lon: np.ndarray, lat: np.ndarray, z: np.ndarray) -> bytes:
+    """ The Edge.elevation_profile of a geometry of (lon, lat, z) points. """
+    distance = np.concatenate(
+        [[0.0], np.cumsum(haversine(lon[:-1], lat[:-1], lon[1:], lat[1:]))]
+    )
+    values = np.rint(np.column_stack([distance, z]) * ELEVATION_SCALE)
+    return values.astype(_PACKED_DTYPE).tobytes()
+
+
+def load_elevations(
+    db: Session, graph_id: int, edge_ids: Collection[int] | None = None
+) -> ElevationProfiles:
+    """ Bulk read the edge elevation profiles of a Graph, by chunks of
+    FETCH_SIZE.
+
+    Only the profiles of edge_ids are read if given.
+    """
+    stmt = select(Edge.id, Edge.elevation_profile).where(Edge.graph_id == graph_id)
+    if edge_ids is not None:
+        stmt = stmt.where(Edge.id.in_(edge_ids))
+    ids, blobs = [], []
+    try:
+        result = db.execute(
+            stmt.order_by(Edge.id).execution_options(yield_per=FETCH_SIZE)
+        )
+        for rows in result.partitions():
+            chunk, packed = zip(*rows)
+            ids.append(np.array(chunk, dtype=np.int64))
+            blobs.extend(blob or b"" for blob in packed)
+    except SQLAlchemyError as exc:
+        raise SnapshotError from exc
+    counts = np.array([len(blob) for blob in blobs], dtype=np.int64)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts // (2 * _PACKED_DTYPE.itemsize), out=offsets[1:])
+    return ElevationProfiles(
+        graph_id,
+        np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64),
+        offsets,
+        np.frombuffer(b"".join(blobs), dtype=_PACKED_DTYPE)
+        .astype(np.int32).reshape(-1, 2),
+    )
+
+
+def concatenate(
+    elevations: ElevationProfiles,
+    edge_ids: np.ndarray,
+    reverse: np.ndarray,
+    lengths: np.ndarray,
+    first: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ The profiles of sequences of consecutive edges, times ELEVATION_SCALE.
+
+    Edges are given in travel order, a sequence starting where first is
+    True. Their profiles are reversed where reverse is True, and start at
+    the sum of the lengths, in meter, of the previous edges of their
+    sequence. The shared end points of consecutive edges are only kept
+    once, and edges without a profile have no points. Returns the distances,
+    the elevations and the position of their edge in edge_ids.
+
+    Raises:
+        KeyError: if some edges are unknown.
+    """
+    indices = elevations.indices(edge_ids)
+    starts = elevations.offsets[indices]
+    counts = elevations.offsets[indices + 1] - starts
+    owner = np.repeat(np.arange(len(indices)), counts)
+    local = np.arange(len(owner)) - (np.cumsum(counts) - counts)[owner]
+    reverse = np.asarray(reverse)[owner]
+    rows = starts[owner] + np.where(reverse, counts[owner] - 1 - local, local)
+    distance = elevations.values[rows, 0].astype(np.int64)
+    # Reversed profiles are measured from the end of their geometry
+    ends = elevations.values[starts[owner] + counts[owner] - 1, 0]
+    distance = np.where(reverse, ends - distance, distance)
+
+    first = np.asarray(first, dtype=bool)
+    lengths = np.asarray(lengths, dtype=np.int64) * ELEVATION_SCALE
+    before = np.cumsum(lengths) - lengths
+    sequence = np.cumsum(first) - 1
+    before -= before[np.flatnonzero(first)][sequence]
+    distance += before[owner]
+    previous = np.r_[0, counts[:-1]]
+    keep = ~((local == 0) & ~first[owner] & (previous[owner] > 0))
+    return distance[keep], elevations.values[rows[keep], 1], owner[keep]
+
+
+def route_elevation(
+    snapshot: GraphSnapshot, elevations: ElevationProfiles, edges: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """ The (distance, elevation) profile along consecutive edges, in meter.
+
+    The edge profiles are concatenated in travel order, honoring
+    GraphSnapshot.reversed, see concatenate().
+
+    Raises:
+        KeyError: if some edges are unknown.
+    """
+    edges = np.asarray(edges, dtype=np.int64)
+    distance, elevation, _ = concatenate(
+        elevations,
+        snapshot.edge_ids[edges],
+        snapshot.reversed[edges],
+        snapshot.length[edges],
+        np.arange(len(edges)) == 0,
+    )
+    return distance / ELEVATION_SCALE, elevation / ELEVATION_SCALE
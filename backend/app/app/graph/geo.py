@@ -0,0 +1,22 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+
+# Mean Earth radius (IUGG), in meter
+EARTH_RADIUS = 6_371_008.8
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """ Great-circle distance in meter between WGS 84 points, in degrees.
+
+    Arguments may be scalars or broadcastable NumPy arrays.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
@@ -0,0 +1,135 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import dataclass
+from typing import Collection
+
+import numpy as np
+import shapely
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.graph.snapshot import FETCH_SIZE, SnapshotError
+from app.models.graph import Edge
+
+# Coordinates are stored as int32 in 1e-7 degree units, about 1 cm
+COORDINATE_SCALE = 1e7
+
+
+@dataclass(frozen=True, eq=False)
+class EdgeGeometries:
+    """ The LINESTRING geometries of the edges of a Graph, packed.
+
+    The (lon, lat) points of the edge of index ``i`` are the rows
+    ``coordinates[offsets[i]:offsets[i + 1]]``, in the digitized direction
+    of the geometry. ``edge_ids`` is sorted so that the edge id -> index
+    mapping is a binary search.
+    """
+    graph_id: int
+    edge_ids: np.ndarray     # int64, sorted
+    offsets: np.ndarray      # int64, n_edges + 1
+    coordinates: np.ndarray  # int32, (n_points, 2), times COORDINATE_SCALE
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edge_ids)
+
+    def indices(self, edge_ids: np.ndarray) -> np.ndarray:
+        """ The geometry indices of some edge ids.
+
+        Raises:
+            KeyError: if some edges are unknown.
+        """
+        edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        if self.n_edges == 0:
+            if len(edge_ids):
+                raise KeyError(edge_ids.tolist())
+            return np.zeros(0, dtype=np.intp)
+        idx = np.searchsorted(self.edge_ids, edge_ids)
+        np.minimum(idx, self.n_edges - 1, out=idx)
+        missing = self.edge_ids[idx] != edge_ids
+        if missing.any():
+            raise KeyError(edge_ids[missing].tolist())
+        return idx
+
+    def points(self, index: int) -> np.ndarray:
+        """ The scaled points of an edge geometry, a view of the buffer. """
+        return self.coordinates[self.offsets[index]:self.offsets[index + 1]]
+
+    def gather(
+        self, indices: np.ndarray, reverse: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """ The (lon, lat) points of some edges, and their position in indices.
+
+        Geometries are reversed where reverse is True.
+        """
+        indices = np.asarray(indices)
+        starts = self.offsets[indices]
+        counts = self.offsets[indices + 1] - starts
+        owner = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(len(owner)) - (np.cumsum(counts) - counts)[owner]
+        if reverse is not None:
+            local = np.where(
+                np.asarray(reverse)[owner], counts[owner] - 1 - local, local
+            )
+        points = self.coordinates[starts[owner] + local] / COORDINATE_SCALE
+        return points, owner
+
+    def path(self, indices: np.ndarray, reverse: np.ndarray) -> np.ndarray:
+        """ The (lon, lat) points along consecutive edges in travel order.
+
+        reverse tells the edges traversed against their geometry, that is
+        GraphSnapshot.reversed. The shared end points of consecutive edges
+        are only kept once.
+        """
+        points, owner = self.gather(indices, reverse)
+        return points[np.r_[True, owner[1:] == owner[:-1]][:len(owner)]]
+
+    def lines(self, indices: np.ndarray) -> np.ndarray:
+        """ Shapely LineStrings of some edges, in their digitized direction. """
+        points, owner = self.gather(indices)
+        return shapely.linestrings(points, indices=owner)
+
+
+def load_geometries(
+    db: Session, graph_id: int, edge_ids: Collection[int] | None = None
+) -> EdgeGeometries:
+    """ Bulk read the edge geometries of a Graph, by chunks of FETCH_SIZE.
+
+    Only the geometries of edge_ids are read if given.
+    """
+    stmt = select(
+        Edge.id, func.ST_AsBinary(Edge.geometry, "axis-order=long-lat")
+    ).where(Edge.graph_id == graph_id)
+    if edge_ids is not None:
+        stmt = stmt.where(Edge.id.in_(edge_ids))
+    ids, counts, coordinates = [], [], []
+    try:
+        result = db.execute(
+            stmt.order_by(Edge.id).execution_options(yield_per=FETCH_SIZE)
+        )
+        for rows in result.partitions():
+            chunk, wkbs = zip(*rows)
+            lines = shapely.from_wkb(list(wkbs))
+            ids.append(np.array(chunk, dtype=np.int64))
+            counts.append(shapely.get_num_coordinates(lines))
+            coordinates.append(np.rint(
+                shapely.get_coordinates(lines) * COORDINATE_SCALE
+            ).astype(np.int32))
+    except SQLAlchemyError as exc:
+        raise SnapshotError from exc
+    counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return EdgeGeometries(
+        graph_id,
+        np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64),
+        offsets,
+        (
+            np.concatenate(coordinates) if coordinates
+            else np.zeros((0, 2), dtype=np.int32)
+        ),
+    )
@@ -0,0 +1,418 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import json
+import logging
+import sqlite3
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Mapping
+
+import numpy as np
+import shapely
+from sqlalchemy import bindparam, func, insert, select, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.graph.elevation import pack_elevations
+from app.graph.geo import haversine
+from app.graph.tiles import tile_of
+from app.models.graph import Edge, Node
+
+logger = logging.getLogger(__name__)
+
+# Rows per executemany, also the bound of the pending rows in memory
+BATCH_SIZE = 10_000
+# Seconds between two progress reports
+PROGRESS_INTERVAL = 5.0
+# Coordinates closer than 1e-7 degree (about 1 cm) are the same node
+COORDINATE_SCALE = 10_000_000
+# Node IDs kept in memory by coordinates, least recently used out first;
+# the IDs of the others are read back from the database
+NODE_CACHE_SIZE = 200_000
+# Positions per lookup of the node IDs spilled out of the cache, below the
+# SQLite bound parameter limit
+SPILL_QUERY_SIZE = 900
+# File-backed osmium index of the node locations, for the memory not to
+# grow with the size of the OSM file
+LOCATION_INDEX = "sparse_file_array"
+
+WGS84_WKT = (
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],'
+    'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]'
+)
+
+# OSM highways open to bicycles
+CYCLABLE_HIGHWAYS = frozenset({
+    "primary", "primary_link", "secondary", "secondary_link",
+    "tertiary", "tertiary_link", "unclassified", "residential",
+    "living_street", "service", "road", "track", "cycleway", "path",
+})
+
+# (coordinates, oneway) consumer, coordinates being a (n, 2) array of
+# (lon, lat) or a (n, 3) array of (lon, lat, altitude)
+WaySink = Callable[[np.ndarray, int], None]
+
+
+class GraphImportError(Exception):
+    pass
+
+
+def is_cyclable(tags: Mapping[str, str]) -> bool:
+    return (
+        tags.get("highway") in CYCLABLE_HIGHWAYS
+        and tags.get("bicycle") not in ("no", "dismount")
+        and tags.get("access") not in ("no", "private")
+    )
+
+
+def oneway(tags: Mapping[str, str]) -> int:
+    """ 1 if only open forward to bicycles, -1 if only backward, 0 if both. """
+    if tags.get("oneway:bicycle") == "no":
+        return 0
+    value = tags.get("oneway")
+    if value in ("yes", "true", "1"):
+        return 1
+    if value in ("-1", "reverse"):
+        return -1
+    if value is None and tags.get("junction") in ("roundabout", "circular"):
+        return 1
+    return 0
+
+
+def read_geojson_seq(path: Path, sink: WaySink) -> None:
+    """ Stream the LineString features of a newline-delimited GeoJSON file.
+
+    Each feature is an edge, so the network shall be split at intersections,
+    like ``osmium export -f geojsonseq`` or ``ogr2ogr -f GeoJSONSeq`` outputs.
+    Feature properties are read as OSM tags.
+    """
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            # GeoJSON text sequences prefix records with a RS character
+            line = line.strip().lstrip("\x1e")
+            if not line:
+                continue
+            try:
+                feature = json.loads(line)
+                geometry = feature["geometry"]
+            except (ValueError, KeyError) as exc:
+                raise GraphImportError(f"Invalid feature at line {number}") from exc
+            tags = feature.get("properties") or {}
+            if "highway" in tags and not is_cyclable(tags):
+                continue
+            if geometry["type"] == "LineString":
+                lines = [geometry["coordinates"]]
+            elif geometry["type"] == "MultiLineString":
+                lines = geometry["coordinates"]
+            else:
+                continue
+            for coordinates in lines:
+                sink(np.array(coordinates, dtype=np.float64), oneway(tags))
+
+
+def read_osm_pbf(path: Path, sink: WaySink) -> None:
+    """ Stream the cyclable ways of an OSM file, split at intersections.
+
+    A first pass flags the way nodes shared by several ways or ending a way,
+    a second one cuts the ways at these nodes. Requires pyosmium.
+    """
+    try:
+        import osmium
+    except ImportError as exc:
+        raise GraphImportError("Reading OSM files requires pyosmium") from exc
+
+    class NodeUsage(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.seen = osmium.index.IdSet()
+            self.junctions = osmium.index.IdSet()
+
+        def way(self, w):
+            if not is_cyclable(w.tags):
+                return
+            refs = [n.ref for n in w.nodes]
+            for ref in (refs[0], refs[-1]):
+                self.junctions.set(ref)
+            for ref in refs:
+                if self.seen.get(ref):
+                    self.junctions.set(ref)
+                self.seen.set(ref)
+
+    class WaySplitter(osmium.SimpleHandler):
+        def __init__(self, junctions):
+            super().__init__()
+            self.junctions = junctions
+
+        def way(self, w):
+            if not is_cyclable(w.tags):
+                return
+            direction = oneway(w.tags)
+            try:
+                points = [(n.ref, n.lon, n.lat) for n in w.nodes]
+            except osmium.InvalidLocationError:
+                logger.warning("Way %s has nodes without location, skipped", w.id)
+                return
+            start = 0
+            for i in range(1, len(points)):
+                if self.junctions.get(points[i][0]) or i == len(points) - 1:
+                    coordinates = np.array(points[start:i + 1])[:, 1:]
+                    sink(coordinates, direction)
+                    start = i
+
+    usage = NodeUsage()
+    usage.apply_file(str(path))
+    with tempfile.TemporaryDirectory() as directory:
+        WaySplitter(usage.junctions).apply_file(
+            str(path),
+            locations=True,
+            idx=f"{LOCATION_INDEX},{Path(directory) / 'locations'}",
+        )
+
+
+# MySQL reads SRID 4326 WKB in lat/long axis order, hence the swapped
+# coordinates of the WKB built below
+NODE_INSERT = insert(Node.__table__).values(
+    location=func.ST_GeomFromWKB(bindparam("wkb"), 4326)
+)
+EDGE_INSERT = insert(Edge.__table__).values(
+    geometry=func.ST_GeomFromWKB(bindparam("wkb"), 4326)
+)
+
+
+def next_ids(db: Session) -> tuple[int, int]:
+    """ The first free node and edge IDs, the importer being the only writer. """
+    try:
+        return tuple(
+            db.scalar(select(func.coalesce(func.max(model.id), 0))) + 1
+            for model in (Node, Edge)
+        )
+    except SQLAlchemyError as exc:
+        raise GraphImportError from exc
+
+
+# (lon, lat) coordinates, scaled and rounded to integers
+Position = tuple[int, int]
+
+
+def _position_key(position: Position) -> int:
+    """ A position packed into a non-negative 64-bit integer. """
+    lon, lat = position
+    return (
+        (lon + 180 * COORDINATE_SCALE) * (180 * COORDINATE_SCALE + 1)
+        + lat + 90 * COORDINATE_SCALE
+    )
+
+
+class GraphWriter:
+    """ Batched writer of the nodes and edges of a graph.
+
+    Node and edge IDs are assigned here, so that edges may reference their
+    nodes without reading back the inserted rows. Pending rows are inserted
+    with one executemany per table every ``batch_size`` edges.
+    Memory is bounded: the edge endpoints are resolved to node IDs once per
+    batch, from an LRU cache of ``node_cache_size`` IDs, which spills into
+    a temporary file, and parallel edges are keyed after those already
+    written.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        graph_id: int,
+        first_node_id: int,
+        first_edge_id: int,
+        *,
+        batch_size: int = BATCH_SIZE,
+        node_cache_size: int = NODE_CACHE_SIZE,
+    ):
+        self.db = db
+        self.graph_id = graph_id
+        self.batch_size = batch_size
+        self.node_cache_size = node_cache_size
+        self.n_nodes = 0
+        self.n_edges = 0
+        self._next_node_id = first_node_id
+        self._next_edge_id = first_edge_id
+        self._node_ids: OrderedDict[Position, int] = OrderedDict()
+        # The node IDs evicted from the cache, in a temporary file database
+        # deleted once closed
+        self._spill = sqlite3.connect("")
+        self._spill.execute(
+            "CREATE TABLE node (position INTEGER PRIMARY KEY, id INTEGER)"
+        )
+        # (lon, lat) of the endpoints of the pending edges, and these
+        # endpoints per pending edge
+        self._endpoints: dict[Position, tuple[float, float]] = {}
+        self._ends: list[tuple[Position, Position]] = []
+        self._nodes: list[dict] = []
+        self._edges: list[dict] = []
+        self._start = self._reported = time.perf_counter()
+
+    def _node(self, lon: float, lat: float) -> Position:
+        position = (round(lon * COORDINATE_SCALE), round(lat * COORDINATE_SCALE))
+        self._endpoints.setdefault(position, (lon, lat))
+        return position
+
+    def _edge(self, source: Position, target: Position, **columns) -> None:
+        self._ends.append((source, target))
+        self._edges.append({
+            "id": self._next_edge_id,
+            "graph_id": self.graph_id,
+            **columns,
+        })
+        self._next_edge_id += 1
+        if len(self._edges) >= self.batch_size:
+            self.flush()
+
+    def _stored_nodes(self, positions: list[Position]) -> dict[Position, int]:
+        """ The IDs of the nodes at some of positions, evicted from the cache. """
+        keys = {_position_key(position): position for position in positions}
+        found = {}
+        chunk = list(keys)
+        for i in range(0, len(chunk), SPILL_QUERY_SIZE):
+            part = chunk[i:i + SPILL_QUERY_SIZE]
+            rows = self._spill.execute(
+                "SELECT position, id FROM node WHERE position IN "
+                f"({', '.join('?' * len(part))})",
+                part,
+            )
+            for key, node_id in rows:
+                found[keys[key]] = node_id
+        return found
+
+    def _resolve_nodes(self) -> tuple[dict[Position, int], set[int]]:
+        """ The node IDs of the pending endpoints, and those of new nodes. """
+        node_ids = {}
+        unknown = []
+        for position in self._endpoints:
+            node_id = self._node_ids.get(position)
+            if node_id is None:
+                unknown.append(position)
+            else:
+                node_ids[position] = node_id
+        if unknown:
+            node_ids.update(self._stored_nodes(unknown))
+        created = set()
+        for position, (lon, lat) in self._endpoints.items():
+            if position in node_ids:
+                continue
+            node_id = node_ids[position] = self._next_node_id
+            self._next_node_id += 1
+            created.add(node_id)
+            self._nodes.append({
+                "id": node_id,
+                "graph_id": self.graph_id,
+                "tile": tile_of(lon, lat),
+                "wkb": struct.pack("<BIdd", 1, 1, lat, lon),
+            })
+        for position, node_id in node_ids.items():
+            self._node_ids[position] = node_id
+            self._node_ids.move_to_end(position)
+        evicted = []
+        while len(self._node_ids) > self.node_cache_size:
+            position, node_id = self._node_ids.popitem(last=False)
+            evicted.append((_position_key(position), node_id))
+        self._spill.executemany(
+            "INSERT OR REPLACE INTO node (position, id) VALUES (?, ?)", evicted
+        )
+        return node_ids, created
+
+    def _resolve_edges(
+        self, node_ids: dict[Position, int], created: set[int]
+    ) -> None:
+        """ Set the nodes and keys of the pending edges. """
+        pairs = [(node_ids[u], node_ids[v]) for u, v in self._ends]
+        # Only edges between nodes written before may have been written
+        written = {
+            pair for pair in pairs
+            if pair[0] not in created and pair[1] not in created
+        }
+        next_keys = {}
+        if written:
+            next_keys = {
+                (source, target): key + 1
+                for source, target, key in self.db.execute(
+                    select(Edge.source_id, Edge.target_id, func.max(Edge.key))
+                    .where(
+                        Edge.graph_id == self.graph_id,
+                        tuple_(Edge.source_id, Edge.target_id).in_(
+                            sorted(written)
+                        ),
+                    )
+                    .group_by(Edge.source_id, Edge.target_id)
+                )
+            }
+        for edge, (source, target) in zip(self._edges, pairs):
+            # Parallel edges are told apart by their key, as in networkx
+            key = next_keys.get((source, target), 0)
+            next_keys[(source, target)] = key + 1
+            edge.update(source_id=source, target_id=target, key=key)
+
+    def add_way(self, coordinates: np.ndarray, direction: int = 0) -> None:
+        """ Add the edges of a way, in its open directions (see oneway()). """
+        if len(coordinates) < 2:
+            return
+        lon, lat = coordinates[:, 0], coordinates[:, 1]
+        u = self._node(float(lon[0]), float(lat[0]))
+        v = self._node(float(lon[-1]), float(lat[-1]))
+        length = int(round(haversine(lon[:-1], lat[:-1], lon[1:], lat[1:]).sum()))
+        gain = loss = 0
+        profile = None
+        if coordinates.shape[1] > 2:
+            climb = np.diff(coordinates[:, 2])
+            gain = int(round(climb[climb > 0].sum()))
+            loss = int(round(-climb[climb < 0].sum()))
+            profile = pack_elevations(lon, lat, coordinates[:, 2])
+        # The geometry and profile are stored in their digitized direction
+        wkb = shapely.to_wkb(shapely.linestrings(coordinates[:, 1::-1]))
+        if direction >= 0:
+            self._edge(
+                u, v, wkb=wkb, elevation_profile=profile, reversed=False,
+                length=length, positive_elevation=gain, negative_elevation=loss,
+                tile=tile_of(lon[0], lat[0]),
+            )
+        if direction <= 0:
+            self._edge(
+                v, u, wkb=wkb, elevation_profile=profile, reversed=True,
+                length=length, positive_elevation=loss, negative_elevation=gain,
+                tile=tile_of(lon[-1], lat[-1]),
+            )
+
+    def flush(self) -> None:
+        """ Insert and commit the pending nodes, then the pending edges. """
+        try:
+            self._resolve_edges(*self._resolve_nodes())
+            if self._nodes:
+                self.db.execute(NODE_INSERT, self._nodes)
+            if self._edges:
+                self.db.execute(EDGE_INSERT, self._edges)
+            self.db.commit()
+        except SQLAlchemyError as exc:
+            self.db.rollback()
+            raise GraphImportError from exc
+        self.n_nodes += len(self._nodes)
+        self.n_edges += len(self._edges)
+        self._nodes, self._edges = [], []
+        self._endpoints, self._ends = {}, []
+        now = time.perf_counter()
+        if now - self._reported >= PROGRESS_INTERVAL:
+            self._reported = now
+            self.report()
+
+    def close(self) -> None:
+        """ Delete the node IDs spilled out of the cache. """
+        self._spill.close()
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self._start
+        logger.info(
+            "%s nodes, %s edges written in %.0f s (%.0f rows/s)",
+            self.n_nodes, self.n_edges, elapsed,
+            (self.n_nodes + self.n_edges) / max(elapsed, 1e-9),
+        )
@@ -0,0 +1,123 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import dataclass
+
+import numpy as np
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from app.graph.geo import EARTH_RADIUS
+from app.graph.snapshot import GraphSnapshot
+
+# Cruising speed on the flat, in m/s, which turns a duration into a cost of
+# the fastest profile (in equivalent meters of flat road)
+FLAT_SPEED = 25 / 3.6
+# Reached nodes are thinned to one per cell of at least this size, and to
+# about HULL_POINTS points, before the concave hull
+HULL_CELL = 100.0
+HULL_POINTS = 2_000
+# Concave hull ratio, from 0 (most concave) to 1 (convex hull)
+HULL_RATIO = 0.2
+
+
+@dataclass(frozen=True, eq=False)
+class Reachability:
+    """ The nodes and edges reachable from an origin within a cost budget. """
+    origin: int
+    budget: float
+    # Dense indices of the reached nodes, and their cost from the origin
+    nodes: np.ndarray
+    cost: np.ndarray
+    # Dense indices of the edges that can be ridden end to end
+    edges: np.ndarray
+
+
+def lightest_edges(snapshot: GraphSnapshot, cost: np.ndarray) -> np.ndarray:
+    """ The lightest edge of each (source, target) pair, in pair order. """
+    order = np.lexsort((cost, snapshot.target, snapshot.source))
+    source, target = snapshot.source[order], snapshot.target[order]
+    return order[np.r_[
+        True, (source[1:] != source[:-1]) | (target[1:] != target[:-1])
+    ][:len(order)]]
+
+
+def tree_edges(
+    snapshot: GraphSnapshot, cost: np.ndarray, u: np.ndarray, v: np.ndarray
+) -> np.ndarray:
+    """ The cheapest edges from nodes u to nodes v, which shall exist.
+
+    These are the edges kept by cost_matrix(), and thus those of the paths
+    found on it. The outgoing edges of u are scanned in CSR order, all
+    pairs at once, as nodes have few edges.
+    """
+    edges, end = snapshot.indptr[u], snapshot.indptr[u + 1]
+    found = np.full(len(u), -1, dtype=np.int64)
+    best = np.full(len(u), np.inf)
+    pending = np.arange(len(u))
+    while len(pending):
+        e = edges[pending]
+        better = (snapshot.target[e] == v[pending]) & (cost[e] < best[pending])
+        found[pending[better]] = e[better]
+        best[pending[better]] = cost[e[better]]
+        edges[pending] += 1
+        pending = pending[edges[pending] < end[pending]]
+    return found
+
+
+def cost_matrix(snapshot: GraphSnapshot, cost: np.ndarray) -> csr_matrix:
+    """ The sparse adjacency matrix of a snapshot, for scipy.sparse.csgraph.
+
+    Parallel edges are merged into the lightest one, as a CSR matrix holds a
+    single value per (source, target).
+    """
+    edges = lightest_edges(snapshot, cost)
+    return csr_matrix(
+        (
+            cost[edges].astype(np.float64),
+            (snapshot.source[edges], snapshot.target[edges]),
+        ),
+        shape=(snapshot.n_nodes, snapshot.n_nodes),
+    )
+
+
+def reachable(
+    snapshot: GraphSnapshot,
+    matrix: csr_matrix,
+    cost: np.ndarray,
+    origin: int,
+    budget: float,
+) -> Reachability:
+    """ Bounded one-to-all Dijkstra search from a dense node index.
+
+    matrix is the cost_matrix() of the same edge costs as cost.
+    """
+    dist = dijkstra(matrix, indices=origin, limit=budget)
+    nodes = np.flatnonzero(np.isfinite(dist))
+    edges = np.flatnonzero(dist[snapshot.source] + cost <= budget)
+    return Reachability(origin, budget, nodes, dist[nodes], edges)
+
+
+def concave_hull(snapshot: GraphSnapshot, reach: Reachability) -> shapely.Polygon:
+    """ A concave hull of the reached nodes, in WGS 84 (lon, lat). """
+    lon, lat = snapshot.lon[reach.nodes], snapshot.lat[reach.nodes]
+    # Thin the nodes on a regular grid, the concave hull computation growing
+    # much faster than linearly with the number of points
+    x = lon * np.cos(np.radians(lat.mean()))
+    area = np.ptp(x) * np.ptp(lat) * np.radians(1) ** 2 * EARTH_RADIUS ** 2
+    size = max(HULL_CELL, np.sqrt(area / HULL_POINTS))
+    cell = np.degrees(size / EARTH_RADIUS)
+    x = np.floor(x / cell).astype(np.int64)
+    y = np.floor(lat / cell).astype(np.int64)
+    cells = (x - x.min()) * (y.max() - y.min() + 1) + (y - y.min())
+    order = np.argsort(cells)
+    keep = order[np.r_[True, cells[order][1:] != cells[order][:-1]]]
+    points = shapely.multipoints(np.column_stack([lon[keep], lat[keep]]))
+    hull = shapely.concave_hull(points, ratio=HULL_RATIO)
+    if not isinstance(hull, shapely.Polygon):
+        # Less than 3 distinct points, or all aligned
+        hull = hull.buffer(cell / 2)
+    return hull
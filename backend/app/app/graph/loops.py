@@ -0,0 +1,141 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import math
+import time
+
+import numpy as np
+
+from app.graph import routing
+from app.graph.geo import EARTH_RADIUS
+from app.graph.profiles import Weights
+from app.graph.routing import Route
+from app.graph.snapshot import GraphSnapshot
+from app.graph.spatial import NodeIndex
+from app.schemas.route import ProfileEnum
+
+# Wall clock budget of a loop generation, in seconds
+TIME_BUDGET = 0.3
+# Road distance over straight line distance, before any observation
+DETOUR_FACTOR = 1.3
+# Cost multiplier of edges reaching an already visited node, which
+# discourages out-and-back sections
+REVISIT_PENALTY = 4.0
+# Nodes settled at most by the search of a leg, so that the last candidate
+# does not run far past the time budget
+LEG_SETTLE_LIMIT = 10_000
+# Candidates generated whatever the time budget, for a short budget to
+# still return loops
+MIN_ATTEMPTS = 3
+# Candidates sharing more edges than this with a better one are dropped
+MAX_OVERLAP = 0.5
+
+
+def _destination(lon: float, lat: float, bearing: float, distance: float):
+    """ The (lon, lat) reached from a point along a bearing (radians). """
+    delta = distance / EARTH_RADIUS
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2 = math.asin(
+        math.sin(lat1) * math.cos(delta)
+        + math.cos(lat1) * math.sin(delta) * math.cos(bearing)
+    )
+    lon2 = lon1 + math.atan2(
+        math.sin(bearing) * math.sin(delta) * math.cos(lat1),
+        math.cos(delta) - math.sin(lat1) * math.sin(lat2),
+    )
+    return math.degrees(lon2), math.degrees(lat2)
+
+
+def _profiles(
+    snapshot: GraphSnapshot, distance: float, elevation_gain: float
+) -> list[ProfileEnum]:
+    """ Profiles to alternate, given the requested and average climbing rate. """
+    average = snapshot.positive_elevation.sum() / max(snapshot.length.sum(), 1)
+    requested = elevation_gain / distance
+    if requested > 1.2 * average:
+        return [ProfileEnum.climber, ProfileEnum.shortest]
+    if requested < 0.8 * average:
+        return [ProfileEnum.flat, ProfileEnum.shortest]
+    return [ProfileEnum.fastest, ProfileEnum.shortest]
+
+
+def _loop(
+    snapshot: GraphSnapshot, weights: Weights, nodes: list[int]
+) -> Route | None:
+    """ Chain the cheapest paths through nodes, penalizing visited nodes. """
+    penalties: dict[int, float] = {}
+    edges: list[np.ndarray] = []
+    for source, target in zip(nodes, nodes[1:]):
+        leg = routing.shortest_path(
+            snapshot, source, target, weights,
+            penalties=penalties, max_settled=LEG_SETTLE_LIMIT,
+        )
+        if leg is None:
+            return None
+        edges.append(leg.edges)
+        penalties.update(
+            dict.fromkeys(snapshot.target[leg.edges].tolist(), REVISIT_PENALTY)
+        )
+    return Route.from_edges(snapshot, np.concatenate(edges))
+
+
+def generate_loops(
+    snapshot: GraphSnapshot,
+    weights: dict[ProfileEnum, Weights],
+    index: NodeIndex,
+    home: int,
+    distance: float,
+    elevation_gain: float = 0.0,
+    *,
+    count: int = 3,
+    budget: float = TIME_BUDGET,
+    seed: int | None = None,
+) -> list[Route]:
+    """ Round trips from home close to a distance and an elevation gain.
+
+    Candidates are triangles home -> A -> B -> home, with random bearings and
+    a size adapted to the road detour observed on previous candidates, each
+    leg being a profile-weighted A* search. Candidates are generated until
+    the time budget (in seconds) is spent, and at least MIN_ATTEMPTS of
+    them, then the best ``count`` distinct loops are returned, best first.
+    """
+    deadline = time.perf_counter() + budget
+    rng = np.random.default_rng(seed)
+    profiles = _profiles(snapshot, distance, elevation_gain)
+    lon, lat = float(snapshot.lon[home]), float(snapshot.lat[home])
+    detour = DETOUR_FACTOR
+    candidates: list[tuple[float, Route]] = []
+    attempt = 0
+    while time.perf_counter() < deadline or attempt < MIN_ATTEMPTS:
+        profile = profiles[attempt % len(profiles)]
+        attempt += 1
+        side = distance / (3 * detour)
+        bearing = rng.uniform(0, 2 * math.pi)
+        turn = math.radians(rng.uniform(45, 75)) * rng.choice([-1, 1])
+        waypoints = [
+            index.nearest(*_destination(lon, lat, b, side))
+            for b in (bearing, bearing + turn)
+        ]
+        route = _loop(snapshot, weights[profile], [home, *waypoints, home])
+        if route is None or route.length == 0:
+            continue
+        # Running mean of the observed detour, to size the next triangles
+        detour += (route.length / (3 * side) - detour) / (len(candidates) + 2)
+        score = abs(route.length - distance) / distance + abs(
+            route.elevation_gain - elevation_gain
+        ) / max(elevation_gain, 100.0)
+        candidates.append((score, route))
+
+    loops: list[Route] = []
+    for _, route in sorted(candidates, key=lambda c: c[0]):
+        edges = set(route.edges.tolist())
+        if all(
+            len(edges.intersection(other.edges.tolist())) <= MAX_OVERLAP * len(edges)
+            for other in loops
+        ):
+            loops.append(route)
+            if len(loops) == count:
+                break
+    return loops
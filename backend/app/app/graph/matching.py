@@ -0,0 +1,303 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+
+from app.graph import routing
+from app.graph.geo import EARTH_RADIUS, haversine
+from app.graph.geometry import EdgeGeometries
+from app.graph.snapshot import GraphSnapshot
+from app.graph.spatial import NodeIndex
+
+# GPS noise standard deviation, in meter
+SIGMA = 10.0
+# Scale of the difference between route and great-circle distances between
+# consecutive fixes, in meter
+BETA = 5.0
+# Candidate edges are the edges incident to the nodes nearest to a fix
+NEAREST_NODES = 8
+MAX_CANDIDATES = 8
+SEARCH_RADIUS = 60.0
+# Fixes closer than this to the previous kept fix are skipped, in meter
+MIN_SPACING = 5.0
+# Transition costs (negative log-likelihoods) of unlikely moves
+GAP_PENALTY = 5.0
+U_TURN_PENALTY = 10.0
+HEADING_PENALTY = 2.0
+# Gaps between matched edges are bridged by routes no longer than this many
+# times their great-circle distance, plus a margin in meter
+GAP_DETOUR = 3.0
+GAP_MARGIN = 200.0
+
+
+class MatchingError(Exception):
+    pass
+
+
+def _project(lon, lat, lon0: float, lat0: float) -> np.ndarray:
+    """ Local equirectangular projection, in meter around (lon0, lat0). """
+    x = EARTH_RADIUS * np.cos(np.radians(lat0)) * np.radians(np.asarray(lon) - lon0)
+    y = EARTH_RADIUS * np.radians(np.asarray(lat) - lat0)
+    return np.stack([x, y], axis=-1)
+
+
+def _downsample(xy: np.ndarray) -> np.ndarray:
+    """ Indices of the fixes to keep, about MIN_SPACING apart along the trace. """
+    steps = np.linalg.norm(np.diff(xy, axis=0), axis=1)
+    travelled = np.concatenate([[0.0], np.cumsum(steps)])
+    bucket = np.floor(travelled / MIN_SPACING)
+    return np.flatnonzero(np.diff(bucket, prepend=-1) > 0)
+
+
+def _incident_edges(snapshot: GraphSnapshot, nodes: np.ndarray):
+    """ (row, edge) pairs of the edges incident to a (T, k) array of nodes. """
+    rows = np.repeat(np.arange(len(nodes)), nodes.shape[1])
+    nodes = nodes.ravel()
+    pairs = []
+    for indptr, edges in (
+        (snapshot.indptr, None),
+        snapshot.incoming,
+    ):
+        counts = indptr[nodes + 1] - indptr[nodes]
+        starts = np.repeat(indptr[nodes] - np.cumsum(counts) + counts, counts)
+        positions = starts + np.arange(counts.sum())
+        pairs.append((
+            np.repeat(rows, counts),
+            positions if edges is None else edges[positions],
+        ))
+    return (
+        np.concatenate([r for r, _ in pairs]),
+        np.concatenate([e for _, e in pairs]),
+    )
+
+
+def _segment_projection(a: np.ndarray, b: np.ndarray, xy: np.ndarray):
+    """ The distance from points to segments, and their projection fraction. """
+    ab = b - a
+    length2 = np.maximum((ab ** 2).sum(axis=1), 1e-9)
+    fraction = np.clip(((xy - a) * ab).sum(axis=1) / length2, 0.0, 1.0)
+    distance = np.linalg.norm(a + fraction[:, None] * ab - xy, axis=1)
+    return distance, fraction
+
+
+def _polyline_projection(
+    snapshot: GraphSnapshot,
+    geometries: EdgeGeometries,
+    edges: np.ndarray,
+    xy: np.ndarray,
+    origin,
+):
+    """ The distance from points to edge geometries, their projection
+    fraction along the edges, in travel direction, and the length of the
+    edge geometries.
+    """
+    points, owner = geometries.gather(
+        geometries.indices(snapshot.edge_ids[edges]), snapshot.reversed[edges]
+    )
+    points = _project(points[:, 0], points[:, 1], *origin)
+    inner = np.flatnonzero(owner[1:] == owner[:-1])
+    a, b, segment_owner = points[inner], points[inner + 1], owner[inner]
+    distance, fraction = _segment_projection(a, b, xy[segment_owner])
+
+    # The length along the edge geometry before each segment
+    length = np.linalg.norm(b - a, axis=1)
+    before = np.cumsum(length) - length
+    first = np.searchsorted(segment_owner, np.arange(len(edges)))
+    total = np.bincount(segment_owner, weights=length, minlength=len(edges))
+    before -= before[first[segment_owner]]
+
+    # The nearest segment of each edge
+    order = np.lexsort((distance, segment_owner))
+    nearest = order[np.r_[True, segment_owner[order][1:] != segment_owner[order][:-1]]]
+    out_distance = np.full(len(edges), np.inf)
+    out_fraction = np.zeros(len(edges))
+    out_distance[segment_owner[nearest]] = distance[nearest]
+    out_fraction[segment_owner[nearest]] = (
+        before[nearest] + fraction[nearest] * length[nearest]
+    ) / np.maximum(total[segment_owner[nearest]], 1e-9)
+    return out_distance, out_fraction, total
+
+
+def _candidates(
+    snapshot: GraphSnapshot,
+    index: NodeIndex,
+    lon,
+    lat,
+    xy,
+    origin,
+    geometries: EdgeGeometries | None = None,
+):
+    """ The nearest candidate edges of each fix, padded with -1.
+
+    Returns (edges, distance, fraction, length) (T, MAX_CANDIDATES) arrays,
+    where fraction is the position of the fix projection along the edge, and
+    length that of the edge geometry (or of the segment between its nodes).
+    """
+    n = len(xy)
+    _, nodes = index.query(lon, lat, k=NEAREST_NODES)
+    rows, edges = _incident_edges(snapshot, nodes)
+    # An edge is incident to several of the nearest nodes
+    pairs = np.sort(rows * snapshot.n_edges + edges)
+    pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+    rows, edges = np.divmod(pairs, snapshot.n_edges)
+
+    if geometries is None:
+        a = _project(snapshot.lon[snapshot.source[edges]],
+                     snapshot.lat[snapshot.source[edges]], *origin)
+        b = _project(snapshot.lon[snapshot.target[edges]],
+                     snapshot.lat[snapshot.target[edges]], *origin)
+        distance, fraction = _segment_projection(a, b, xy[rows])
+        length = np.linalg.norm(b - a, axis=1)
+    else:
+        distance, fraction, length = _polyline_projection(
+            snapshot, geometries, edges, xy[rows], origin
+        )
+    near = distance <= SEARCH_RADIUS
+    rows, edges, distance, fraction, length = (
+        rows[near], edges[near], distance[near], fraction[near], length[near]
+    )
+
+    # The nearest MAX_CANDIDATES of each row, sorting on a single integer key
+    # made of the row and the distance in centimeters
+    order = np.argsort(
+        rows * (1 << 32) + np.round(distance * 100).astype(np.int64)
+    )
+    rows, edges, distance, fraction, length = (
+        rows[order], edges[order], distance[order], fraction[order],
+        length[order],
+    )
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    keep = rank < MAX_CANDIDATES
+    rows, rank = rows[keep], rank[keep]
+
+    shape = (n, MAX_CANDIDATES)
+    out_edges = np.full(shape, -1, dtype=np.int64)
+    out_distance = np.full(shape, np.inf)
+    out_fraction = np.zeros(shape)
+    out_length = np.zeros(shape)
+    out_edges[rows, rank] = edges[keep]
+    out_distance[rows, rank] = distance[keep]
+    out_fraction[rows, rank] = fraction[keep]
+    out_length[rows, rank] = length[keep]
+    return out_edges, out_distance, out_fraction, out_length
+
+
+def _viterbi(emission: np.ndarray, transition: np.ndarray) -> np.ndarray:
+    """ The cheapest state of each step, given (T, K) and (T-1, K, K) costs.
+
+    When no state of a step can be reached, the chain restarts there.
+    """
+    n, k = emission.shape
+    columns = np.arange(k)
+    back = np.zeros((n, k), dtype=np.int64)
+    score = emission[0]
+    for t in range(1, n):
+        total = score[:, None] + transition[t - 1]
+        best = total.argmin(axis=0)
+        score = total[best, columns] + emission[t]
+        if score[score.argmin()] == np.inf:
+            best[:] = -1
+            score = emission[t]
+        back[t] = best
+    states = np.empty(n, dtype=np.int64)
+    states[-1] = np.argmin(score)
+    for t in range(n - 1, 0, -1):
+        previous = back[t, states[t]]
+        states[t - 1] = previous if previous >= 0 else np.argmin(emission[t - 1])
+    return states
+
+
+def match_trace(
+    snapshot: GraphSnapshot,
+    index: NodeIndex,
+    lon: np.ndarray,
+    lat: np.ndarray,
+    geometries: EdgeGeometries | None = None,
+) -> np.ndarray:
+    """ Map-match a GPS trace onto the graph with a hidden Markov model.
+
+    The hidden states are candidate edges near each fix, the emission cost
+    grows with the distance from the fix to the edge geometry (or to the
+    straight segment between its nodes without geometries), and the
+    transition cost with the difference between the route and great-circle
+    distances from a fix to the next. The Viterbi path is made connected by
+    routing over the gaps.
+
+    Returns the matched dense edge indices, in travel order.
+    Raises:
+        MatchingError: if no fix of the trace is close to the graph.
+    """
+    lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    origin = (float(lon.mean()), float(lat.mean()))
+    xy = _project(lon, lat, *origin)
+    kept = _downsample(xy)
+    lon, lat, xy = lon[kept], lat[kept], xy[kept]
+
+    edges, distance, fraction, length = _candidates(
+        snapshot, index, lon, lat, xy, origin, geometries
+    )
+    matched = np.isfinite(distance[:, 0])
+    if not matched.any():
+        raise MatchingError("The trace is too far from the graph")
+    edges, distance, fraction, length, xy = (
+        edges[matched], distance[matched], fraction[matched], length[matched],
+        xy[matched],
+    )
+    emission = 0.5 * (distance / SIGMA) ** 2
+
+    # Penalize candidates heading against the direction of travel
+    valid = edges >= 0
+    safe = np.where(valid, edges, 0)
+    source_xy = _project(snapshot.lon[snapshot.source[safe]],
+                         snapshot.lat[snapshot.source[safe]], *origin)
+    target_xy = _project(snapshot.lon[snapshot.target[safe]],
+                         snapshot.lat[snapshot.target[safe]], *origin)
+    edge_vector = target_xy - source_xy
+    edge_length = np.linalg.norm(edge_vector, axis=-1)
+    motion = np.gradient(xy, axis=0) if len(xy) > 1 else np.zeros_like(xy)
+    cosine = (edge_vector * motion[:, None, :]).sum(axis=-1) / np.maximum(
+        edge_length * np.linalg.norm(motion, axis=-1)[:, None], 1e-9
+    )
+    emission += HEADING_PENALTY * (1.0 - cosine) / 2
+
+    # Transition costs between the candidates of consecutive fixes, the
+    # fractions applying to the length along the edge geometries
+    step = np.linalg.norm(np.diff(xy, axis=0), axis=1)[:, None, None]
+    a, b = safe[:-1, :, None], safe[1:, None, :]
+    f_a, f_b = fraction[:-1, :, None], fraction[1:, None, :]
+    l_a, l_b = length[:-1, :, None], length[1:, None, :]
+    gap = np.linalg.norm(
+        target_xy[:-1, :, None, :] - source_xy[1:, None, :, :], axis=-1
+    )
+    same = a == b
+    adjacent = snapshot.target[a] == snapshot.source[b]
+    u_turn = adjacent & (snapshot.source[a] == snapshot.target[b])
+    route = np.where(same, (f_b - f_a) * l_a, (1 - f_a) * l_a + gap + f_b * l_b)
+    transition = np.abs(route - step) / BETA
+    transition += np.where(same | adjacent, 0.0, GAP_PENALTY)
+    transition += np.where(u_turn & ~same, U_TURN_PENALTY, 0.0)
+    transition += np.where(same & (route < -SIGMA), U_TURN_PENALTY, 0.0)
+    transition[~(valid[:-1, :, None] & valid[1:, None, :])] = np.inf
+
+    states = _viterbi(emission, transition)
+    path = edges[np.arange(len(states)), states]
+    path = path[np.r_[True, path[1:] != path[:-1]]]
+
+    # Connect consecutive edges that do not share a node, by their shortest
+    # route unless it detours too far: the gap is then left unbridged
+    result: list[int] = [int(path[0])]
+    for e in path[1:].tolist():
+        u, v = int(snapshot.target[result[-1]]), int(snapshot.source[e])
+        if u != v:
+            direct = float(haversine(
+                snapshot.lon[u], snapshot.lat[u], snapshot.lon[v], snapshot.lat[v]
+            ))
+            gap_route = routing.shortest_path(
+                snapshot, u, v, max_cost=GAP_DETOUR * direct + GAP_MARGIN
+            )
+            if gap_route is not None:
+                result.extend(gap_route.edges.tolist())
+        result.append(e)
+    return np.array(result, dtype=np.int64)
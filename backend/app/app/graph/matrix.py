@@ -0,0 +1,70 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from app.graph.isochrone import tree_edges
+from app.graph.snapshot import GraphSnapshot
+
+
+@dataclass(frozen=True, eq=False)
+class DistanceMatrix:
+    """ The cheapest routes from sources to targets, by (source, target).
+
+    Lengths and elevations are -1 where the target cannot be reached.
+    """
+    cost: np.ndarray            # float64, inf where unreachable
+    length: np.ndarray          # int64, in meter
+    elevation_gain: np.ndarray  # int64, in meter
+    elevation_loss: np.ndarray  # int64, in meter
+
+
+def distance_matrix(
+    snapshot: GraphSnapshot,
+    matrix: csr_matrix,
+    cost: np.ndarray,
+    sources: np.ndarray,
+    targets: np.ndarray,
+) -> DistanceMatrix:
+    """ The cheapest routes between dense node indices.
+
+    matrix is the cost_matrix() of the same edge costs as cost. There is a
+    single one-to-all search per distinct source, then the routes are all
+    walked back at once from their targets along the shortest path trees.
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    origins, row = np.unique(sources, return_inverse=True)
+    dist, pred = dijkstra(matrix, indices=origins, return_predecessors=True)
+    costs = dist[row[:, None], targets[None, :]]
+
+    attributes = np.column_stack([
+        snapshot.length, snapshot.positive_elevation, snapshot.negative_elevation
+    ]).astype(np.int64)
+
+    row = np.repeat(row, len(targets))
+    node = np.tile(targets, len(sources))
+    reached = np.isfinite(costs.ravel())
+    totals = np.zeros((len(node), 3), dtype=np.int64)
+    active = np.flatnonzero(reached & (node != origins[row]))
+    while len(active):
+        v = node[active]
+        u = pred[row[active], v]
+        totals[active] += attributes[tree_edges(snapshot, cost, u, v)]
+        node[active] = u
+        active = active[u != origins[row[active]]]
+    totals[~reached] = -1
+
+    shape = (len(sources), len(targets))
+    return DistanceMatrix(
+        costs,
+        totals[:, 0].reshape(shape),
+        totals[:, 1].reshape(shape),
+        totals[:, 2].reshape(shape),
+    )
@@ -0,0 +1,291 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import math
+
+import numpy as np
+import shapely
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.graph.geometry import EdgeGeometries
+from app.graph.snapshot import SnapshotError
+from app.graph.tiles import BBox, corridor, tiles_covering
+from app.models.graph import Edge
+
+# Mapbox Vector Tile 2.1 encoding of the edge network, see
+# https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+LAYER = "edges"
+EXTENT = 4096
+# Geometries are clipped this many units outside of the tile, so that line
+# joins do not show at tile boundaries
+BUFFER = 64
+# Douglas-Peucker tolerance in tile units, that is a constant fraction of a
+# pixel at any zoom level
+SIMPLIFY = 4.0
+# Lower zoom levels would need too many graph tiles, see app.graph.tiles
+MIN_ZOOM = 12
+MAX_ZOOM = 22
+# Edges are read from the graph tiles of their source node, which shall be at
+# most this many meters outside of a vector tile to be drawn in it
+EDGE_MARGIN = 2_000
+
+_MOVE_TO = 1 | 1 << 3
+_LINE_TO = 2
+_LINESTRING = 2
+
+
+def tile_bounds(z: int, x: int, y: int) -> BBox:
+    """ The (lon, lat) bounding box of a Web Mercator XYZ tile. """
+    n = 2 ** z
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y))
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _varints(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ The concatenated varints of non-negative integers, and their sizes. """
+    values = values.astype(np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        sizes += values >= np.uint64(1 << 7 * k)
+    start = np.cumsum(sizes) - sizes
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max(initial=0))):
+        more = sizes > k
+        byte = (values[more] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        byte |= (sizes[more] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[start[more] + k] = byte
+    return out, sizes
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return (values << 1) ^ (values >> 63)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """ A length delimited protobuf field. """
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _value(value: int) -> bytes:
+    """ A Value message, holding an integer as sint_value. """
+    return b"\x30" + _varint(int(_zigzag(np.int64(value))))
+
+
+def _constant(data: bytes, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """ The same bytes for n features, as _interleave() cells. """
+    return (
+        np.tile(np.frombuffer(data, dtype=np.uint8), n),
+        np.full(n, len(data), dtype=np.int64),
+    )
+
+
+def _interleave(cells: list[tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    """ Concatenate the bytes of each feature, feature by feature.
+
+    Each cell holds the concatenated bytes of all features, and their sizes.
+    """
+    sizes = np.column_stack([size for _, size in cells])
+    offsets = (np.cumsum(sizes) - sizes.ravel()).reshape(sizes.shape)
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for column, (data, size) in enumerate(cells):
+        shift = np.repeat(offsets[:, column] - (np.cumsum(size) - size), size)
+        out[shift + np.arange(len(data))] = data
+    return out
+
+
+def _geometry_commands(
+    parts: np.ndarray, owners: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """ The command integers of integer linestrings, and their owner feature.
+
+    The cursor is reset at the first part of each feature.
+    """
+    coordinates, row = shapely.get_coordinates(parts, return_index=True)
+    coordinates = np.rint(coordinates).astype(np.int64)
+    # Repeated points would make zero length segments
+    keep = np.r_[True, (row[1:] != row[:-1]) | np.any(
+        coordinates[1:] != coordinates[:-1], axis=1
+    )]
+    coordinates, row = coordinates[keep], row[keep]
+    counts = np.bincount(row, minlength=len(parts))
+    valid = counts[row] >= 2
+    coordinates, row = coordinates[valid], row[valid]
+    counts = np.where(counts >= 2, counts, 0)
+    if len(row) == 0:
+        return np.zeros(0, dtype=np.int64), owners[:0]
+
+    first_point = np.cumsum(counts) - counts
+    j = np.arange(len(row)) - first_point[row]
+    feature_start = np.r_[True, owners[row][1:] != owners[row][:-1]]
+    deltas = coordinates - np.where(
+        feature_start[:, None], 0, np.roll(coordinates, 1, axis=0)
+    )
+
+    size = np.where(counts > 0, 2 * counts + 2, 0)
+    start = np.cumsum(size) - size
+    commands = np.zeros(int(size.sum()), dtype=np.int64)
+    used = counts > 0
+    commands[start[used]] = _MOVE_TO
+    commands[start[used] + 3] = _LINE_TO | (counts[used] - 1) << 3
+    position = start[row] + 2 * j + np.where(j == 0, 1, 2)
+    commands[position] = _zigzag(deltas[:, 0])
+    commands[position + 1] = _zigzag(deltas[:, 1])
+    return commands, np.repeat(owners, size)
+
+
+def encode_layer(
+    geometries: np.ndarray,
+    ids: np.ndarray,
+    properties: dict[str, np.ndarray],
+    z: int,
+    x: int,
+    y: int,
+) -> bytes:
+    """ A vector tile of one layer of (lon, lat) linestrings.
+
+    Lines are projected to tile units, clipped and simplified. Properties are
+    integer arrays aligned with the geometries. Returns an empty tile if no
+    line intersects it.
+    """
+    n = 2 ** z
+
+    def project(coordinates: np.ndarray) -> np.ndarray:
+        lon, lat = coordinates[:, 0], np.radians(coordinates[:, 1])
+        column = (lon + 180) / 360 * n - x
+        row = (1 - np.arcsinh(np.tan(lat)) / np.pi) / 2 * n - y
+        return np.column_stack([column, row]) * EXTENT
+
+    lines = shapely.transform(geometries, project)
+    lines = shapely.clip_by_rect(
+        lines, -BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER
+    )
+    lines = shapely.simplify(lines, SIMPLIFY, preserve_topology=False)
+    parts, owners = shapely.get_parts(lines, return_index=True)
+    # Clipping may leave points where a line touches the buffer
+    linear = shapely.get_type_id(parts) == shapely.GeometryType.LINESTRING
+    parts, owners = parts[linear], owners[linear]
+    if len(parts) == 0:
+        return b""
+    commands, command_owners = _geometry_commands(parts, owners)
+    if len(commands) == 0:
+        return b""
+    first = np.flatnonzero(np.r_[True, command_owners[1:] != command_owners[:-1]])
+    features = command_owners[first]
+    geometry, sizes = _varints(commands)
+    geometry_sizes = np.add.reduceat(sizes, first)
+
+    # Property values are shared by all keys, tags are pairs of key and value
+    # indices
+    columns = [np.asarray(column)[features] for column in properties.values()]
+    flat = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+    values = np.sort(flat)
+    values = values[np.r_[True, values[1:] != values[:-1]]] if len(values) else values
+    tags = np.zeros((len(features), 2 * len(columns)), dtype=np.int64)
+    for key, column in enumerate(columns):
+        tags[:, 2 * key] = key
+        tags[:, 2 * key + 1] = np.searchsorted(values, column)
+    tags, tag_sizes = _varints(tags.ravel())
+    tag_sizes = tag_sizes.reshape(len(features), -1).sum(axis=1)
+
+    cells = [
+        _constant(b"\x08", len(features)),
+        _varints(ids[features]),
+        *([
+            _constant(b"\x12", len(features)),
+            _varints(tag_sizes),
+            (tags, tag_sizes),
+        ] if columns else []),
+        _constant(b"\x18" + _varint(_LINESTRING) + b"\x22", len(features)),
+        _varints(geometry_sizes),
+        (geometry, geometry_sizes),
+    ]
+    feature_sizes = sum(size for _, size in cells)
+    layer = [
+        _field(1, LAYER.encode()),
+        _interleave([
+            _constant(b"\x12", len(features)), _varints(feature_sizes), *cells
+        ]).tobytes(),
+        *(_field(3, key.encode()) for key in properties),
+        *(_field(4, _value(int(value))) for value in values),
+        b"\x28" + _varint(EXTENT),
+        b"\x78" + _varint(2),
+    ]
+    return _field(3, b"".join(layer))
+
+
+def render_tile(
+    db: Session, geometries: EdgeGeometries, z: int, x: int, y: int
+) -> bytes:
+    """ The vector tile of the edge network of a Graph.
+
+    Both directions of a road share a single feature, identified by its
+    forward edge if any. Its oneway property is 0 if the road can be ridden
+    both ways, 1 in the direction of the geometry only, and -1 in the
+    opposite direction only. Its popularity is the sum of both directions.
+    Edges inserted after the version of the geometries are not drawn.
+    """
+    bbox = tile_bounds(z, x, y)
+    tiles = tiles_covering(corridor(bbox[::2], bbox[1::2], EDGE_MARGIN))
+    try:
+        rows = db.execute(
+            select(Edge.id, Edge.reversed, Edge.popularity).where(
+                Edge.graph_id == geometries.graph_id, Edge.tile.in_(tiles)
+            )
+        ).all()
+    except SQLAlchemyError as exc:
+        raise SnapshotError from exc
+    if not rows:
+        return b""
+    edge_ids, reverse, popularity = (np.array(column) for column in zip(*rows))
+    known = np.isin(edge_ids, geometries.edge_ids)
+    if not known.any():
+        return b""
+    edge_ids, reverse, popularity = (
+        edge_ids[known], reverse[known].astype(bool), popularity[known]
+    )
+    indices = geometries.indices(edge_ids)
+
+    # Twin edges share their geometry, told apart from the geometries of
+    # parallel edges by its number of points, first point and sum of points
+    points, owner = geometries.gather(indices)
+    counts = np.bincount(owner, minlength=len(indices))
+    starts = np.cumsum(counts) - counts
+    digest = np.column_stack(
+        [counts, points[starts], np.add.reduceat(points, starts)]
+    )
+    _, first, road = np.unique(
+        digest, axis=0, return_index=True, return_inverse=True
+    )
+    # Features in the order of the rows
+    order = np.argsort(first)
+    first, road = first[order], np.argsort(order)[road.ravel()]
+    forward = np.zeros(len(first), dtype=np.int64)
+    backward = np.zeros(len(first), dtype=np.int64)
+    forward[road[~reverse]] = edge_ids[~reverse]
+    backward[road[reverse]] = edge_ids[reverse]
+    popularity = np.bincount(road, weights=popularity, minlength=len(first))
+    indices = indices[first]
+    ids = np.where(forward > 0, forward, backward)
+    oneway = np.where(backward == 0, 1, np.where(forward == 0, -1, 0))
+    return encode_layer(
+        geometries.lines(indices),
+        ids,
+        {"oneway": oneway, "popularity": popularity.astype(np.int64)},
+        z, x, y,
+    )
@@ -0,0 +1,62 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.graph.snapshot import GraphSnapshot
+from app.schemas.route import ProfileEnum
+
+
+@dataclass(frozen=True)
+class CostProfile:
+    """ A linear edge cost model, in equivalent meters of flat road.
+
+    cost = length + climb * positive_elevation + descent * negative_elevation,
+    bounded below by ``floor * length`` so that costs stay positive and the
+    haversine distance, scaled by ``floor``, remains an A* lower bound.
+    """
+    climb: float = 0.0
+    descent: float = 0.0
+    floor: float = 1.0
+
+
+@dataclass(frozen=True, eq=False)
+class Weights:
+    """ The compiled costs of a profile, one float32 per snapshot edge. """
+    profile: ProfileEnum
+    cost: np.ndarray
+    # Lower bound of cost / length, to scale the A* heuristic
+    scale: float
+
+
+PROFILES: dict[ProfileEnum, CostProfile] = {
+    ProfileEnum.shortest: CostProfile(),
+    # 1 m of climbing takes about as long as 10 m on the flat, descents pay
+    # back a little but are not more than twice as fast as the flat
+    ProfileEnum.fastest: CostProfile(climb=10.0, descent=-2.0, floor=0.5),
+    # Avoid climbs, and steep descents to a lesser extent
+    ProfileEnum.flat: CostProfile(climb=30.0, descent=2.0),
+    # Seek climbs: a meter of climbing is worth 3 m less of riding
+    ProfileEnum.climber: CostProfile(climb=-3.0, floor=0.25),
+}
+
+
+def compile_profile(
+    snapshot: GraphSnapshot, profile: ProfileEnum
+) -> Weights:
+    params = PROFILES[profile]
+    length = snapshot.length.astype(np.float32)
+    climb = snapshot.positive_elevation.astype(np.float32)
+    descent = snapshot.negative_elevation.astype(np.float32)
+    cost = length + np.float32(params.climb) * climb
+    cost += np.float32(params.descent) * descent
+    np.maximum(cost, np.float32(params.floor) * length, out=cost)
+    return Weights(profile=profile, cost=cost, scale=params.floor)
+
+
+def compile_profiles(snapshot: GraphSnapshot) -> dict[ProfileEnum, Weights]:
+    return {profile: compile_profile(snapshot, profile) for profile in PROFILES}
@@ -0,0 +1,138 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable
+
+import numpy as np
+
+from app.graph.routing import Route
+from app.graph.snapshot import GraphSnapshot
+
+# The approximate size in bytes of an entry besides its edge ids: key, value
+# and bookkeeping
+ENTRY_OVERHEAD = 400
+
+
+@dataclass(frozen=True, eq=False)
+class CachedRoute:
+    """ A route by edge ids, which outlives the snapshot it was found in. """
+    edge_ids: np.ndarray
+    length: int
+    elevation_gain: int
+    elevation_loss: int
+
+    @classmethod
+    def from_route(cls, snapshot: GraphSnapshot, route: Route) -> "CachedRoute":
+        return cls(
+            snapshot.edge_ids[route.edges],
+            route.length,
+            route.elevation_gain,
+            route.elevation_loss,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.edge_ids.nbytes + ENTRY_OVERHEAD
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    entries: int
+    size: int
+
+
+class RouteCache:
+    """ Routes by keys starting with the graph and its version.
+
+    Entries are evicted least recently used first beyond max_size bytes, and
+    expire ttl seconds after they were computed. Unreachable targets are
+    cached too, as None. Routes of a previous graph version are never hit
+    since the version is part of the key, and are dropped by invalidate().
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: OrderedDict[tuple, tuple[float, CachedRoute | None]] = (
+            OrderedDict()
+        )
+        self._size = 0
+        self._lock = Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    @staticmethod
+    def _nbytes(route: CachedRoute | None) -> int:
+        return route.nbytes if route is not None else ENTRY_OVERHEAD
+
+    def _pop(self, key: tuple) -> None:
+        _, route = self._entries.pop(key)
+        self._size -= self._nbytes(route)
+
+    def get(self, key: tuple) -> tuple[bool, CachedRoute | None]:
+        """ Whether a route is cached, and the route, None if unreachable. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                self._pop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key: tuple, route: CachedRoute | None) -> None:
+        size = self._nbytes(route)
+        if size > self.max_size:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (self.clock() + self.ttl, route)
+            self._size += size
+            while self._size > self.max_size:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, graph_id: int, version: int | None = None) -> None:
+        """ Drop the routes of a graph, but those of version if given. """
+        with self._lock:
+            for key in [
+                key for key in self._entries
+                if key[0] == graph_id and (version is None or key[1] != version)
+            ]:
+                self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                self.hits,
+                self.misses,
+                self.evictions,
+                self.expirations,
+                len(self._entries),
+                self._size,
+            )
@@ -0,0 +1,124 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import math
+from dataclasses import dataclass
+from heapq import heappop, heappush
+from typing import Mapping
+
+import numpy as np
+
+from app.graph.geo import EARTH_RADIUS
+from app.graph.profiles import Weights
+from app.graph.snapshot import GraphSnapshot
+
+
+@dataclass(frozen=True, eq=False)
+class Route:
+    """ A path through a snapshot, as dense edge indices in travel order. """
+    edges: np.ndarray
+    length: int
+    elevation_gain: int
+    elevation_loss: int
+
+    @classmethod
+    def from_edges(cls, snapshot: GraphSnapshot, edges: np.ndarray) -> "Route":
+        edges = np.asarray(edges, dtype=np.int64)
+        return cls(
+            edges=edges,
+            length=int(snapshot.length[edges].sum()),
+            elevation_gain=int(snapshot.positive_elevation[edges].sum()),
+            elevation_loss=int(snapshot.negative_elevation[edges].sum()),
+        )
+
+
+def _heuristic(snapshot: GraphSnapshot, target: int, scale: float = 1.0):
+    """ Haversine distance to the target node, a lower bound of edge lengths.
+
+    The distance is multiplied by scale, a lower bound of cost / length.
+    """
+    lon, lat = snapshot.lon, snapshot.lat
+    t_lon, t_lat = math.radians(lon[target]), math.radians(lat[target])
+    cos_t_lat = math.cos(t_lat)
+    diameter = 2 * EARTH_RADIUS * scale
+
+    def h(v: int) -> float:
+        v_lon, v_lat = math.radians(lon[v]), math.radians(lat[v])
+        a = (
+            math.sin((t_lat - v_lat) / 2) ** 2
+            + math.cos(v_lat) * cos_t_lat * math.sin((t_lon - v_lon) / 2) ** 2
+        )
+        return diameter * math.asin(math.sqrt(a))
+
+    return h
+
+
+def _unwind(pred: dict[int, int], sources: np.ndarray, node: int) -> list[int]:
+    """ Edge indices from the search origin to node, following pred edges. """
+    edges = []
+    while node in pred:
+        edge = pred[node]
+        edges.append(edge)
+        node = int(sources[edge])
+    edges.reverse()
+    return edges
+
+
+def shortest_path(
+    snapshot: GraphSnapshot,
+    source: int,
+    target: int,
+    weights: Weights | None = None,
+    *,
+    penalties: Mapping[int, float] | None = None,
+    max_settled: int | None = None,
+    max_cost: float | None = None,
+) -> Route | None:
+    """ A* search of the cheapest path between two dense node indices.
+
+    The cost of edges is given by compiled profile weights, by default
+    their length, multiplied by ``penalties[v]`` for the edges entering a
+    node v of penalties; multipliers shall not be lower than 1.
+    Returns None if target cannot be reached from source, or not before
+    settling max_settled nodes, or not for at most max_cost.
+    """
+    indptr, targets = snapshot.indptr, snapshot.target
+    if weights is None:
+        costs, h = snapshot.length, _heuristic(snapshot, target)
+    else:
+        costs, h = weights.cost, _heuristic(snapshot, target, weights.scale)
+    dist = {source: 0}
+    pred: dict[int, int] = {}
+    heap = [(h(source), 0, source)]
+    settled = 0
+    while heap:
+        f, g, u = heappop(heap)
+        if max_cost is not None and f > max_cost:
+            # The heuristic never overestimates, nothing left is cheaper
+            return None
+        if u == target:
+            break
+        if g > dist[u]:
+            # Stale heap entry, u has been reached by a shorter path since
+            continue
+        settled += 1
+        if max_settled is not None and settled > max_settled:
+            return None
+        start, end = indptr[u:u + 2].tolist()
+        for k, v, w in zip(
+            range(start, end),
+            targets[start:end].tolist(),
+            costs[start:end].tolist(),
+        ):
+            if penalties is not None:
+                w *= penalties.get(v, 1.0)
+            d = g + w
+            if d < dist.get(v, math.inf):
+                dist[v] = d
+                pred[v] = k
+                heappush(heap, (d + h(v), d, v))
+    else:
+        return None
+    return Route.from_edges(snapshot, _unwind(pred, snapshot.source, target))
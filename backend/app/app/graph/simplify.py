@@ -0,0 +1,355 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+import shapely
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.graph.elevation import ElevationProfiles, concatenate
+from app.graph.geometry import COORDINATE_SCALE, EdgeGeometries
+from app.graph.importer import BATCH_SIZE, EDGE_INSERT, NODE_INSERT, next_ids
+from app.graph.snapshot import (
+    EDGE_DTYPE, NODE_DTYPE, GraphSnapshot, SnapshotError, build_snapshot,
+)
+from app.graph.tiles import tile_of
+from app.models.graph import EdgeOrigin
+
+
+@dataclass(frozen=True, eq=False)
+class SimplifiedGraph:
+    """ A graph without its shape nodes, and the origin of its edges.
+
+    The edge of id ``geometries.edge_ids[i]`` merges the original edges
+    ``original_ids[offsets[i]:offsets[i + 1]]`` in travel order, which start
+    ``starts`` meters after its source. Kept nodes and edges keep their id,
+    merged edges take the id of their first original edge.
+    """
+    snapshot: GraphSnapshot
+    geometries: EdgeGeometries
+    elevations: ElevationProfiles | None
+    offsets: np.ndarray       # int64, n_edges + 1, in edge id order
+    original_ids: np.ndarray  # int64
+    starts: np.ndarray        # int64, in meter
+
+    def original_edges(self, edge_ids: np.ndarray) -> np.ndarray:
+        """ The original edge ids along some edges, in travel order.
+
+        Raises:
+            KeyError: if some edges are unknown.
+        """
+        indices = self.geometries.indices(edge_ids)
+        starts = self.offsets[indices]
+        counts = self.offsets[indices + 1] - starts
+        rows = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return self.original_ids[rows + np.arange(len(rows))]
+
+
+def _next_edges(snapshot: GraphSnapshot) -> tuple[np.ndarray, np.ndarray]:
+    """ The edge following each edge through a shape node, and the two way
+    shape nodes.
+
+    A one way shape node has a single edge in and a single edge out, a two
+    way one has two edges in from two other nodes, and two edges out back to
+    them. The next edge is -1 after other nodes.
+    """
+    source, target, indptr = snapshot.source, snapshot.target, snapshot.indptr
+    in_indptr, in_edges = snapshot.incoming
+    in_degree, out_degree = np.diff(in_indptr), np.diff(indptr)
+    next_edge = np.full(snapshot.n_edges, -1, dtype=np.int64)
+
+    v = np.flatnonzero((in_degree == 1) & (out_degree == 1))
+    a, b = in_edges[in_indptr[v]], indptr[v]
+    ok = (source[a] != target[b]) & (source[a] != v) & (target[b] != v)
+    next_edge[a[ok]] = b[ok]
+
+    v = np.flatnonzero((in_degree == 2) & (out_degree == 2))
+    a = in_edges[in_indptr[v][:, None] + [0, 1]]
+    b = indptr[v][:, None] + [0, 1]
+    a = np.take_along_axis(a, np.argsort(source[a], axis=1), axis=1)
+    b = np.take_along_axis(b, np.argsort(target[b], axis=1), axis=1)
+    ok = (
+        (source[a] == target[b]).all(axis=1)
+        & (source[a[:, 0]] != source[a[:, 1]])
+        & (source[a] != v[:, None]).all(axis=1)
+    )
+    # Edges go on towards the other neighbor
+    next_edge[a[ok, 0]] = b[ok, 1]
+    next_edge[a[ok, 1]] = b[ok, 0]
+    two_way = np.zeros(snapshot.n_nodes, dtype=bool)
+    two_way[v[ok]] = True
+    return next_edge, two_way
+
+
+def _chains(next_edge: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ The chain of each edge and its rank along it, chains numbered by
+    their first edge.
+    """
+    has_previous = np.zeros(len(next_edge), dtype=bool)
+    has_previous[next_edge[next_edge >= 0]] = True
+    heads = np.flatnonzero(~has_previous)
+    chain = np.full(len(next_edge), -1, dtype=np.int64)
+    rank = np.zeros(len(next_edge), dtype=np.int64)
+    current, ids, step = heads, np.arange(len(heads)), 0
+    while len(current):
+        chain[current], rank[current] = ids, step
+        current = next_edge[current]
+        ids, current = ids[current >= 0], current[current >= 0]
+        step += 1
+    # Loops of shape nodes have no first edge, their edges are kept as is
+    alone = np.flatnonzero(chain < 0)
+    chain[alone] = len(heads) + np.arange(len(alone))
+    return chain, rank
+
+
+def _keys(
+    source: np.ndarray, target: np.ndarray, key: np.ndarray, merged: np.ndarray
+) -> np.ndarray:
+    """ Keys of the merged edges after those of the kept parallel edges. """
+    order = np.lexsort((merged, target, source))
+    s, t, m = source[order], target[order], merged[order]
+    group = np.cumsum(np.r_[True, (s[1:] != s[:-1]) | (t[1:] != t[:-1])]) - 1
+    last_key = np.full(len(order), -1, dtype=np.int64)
+    np.maximum.at(last_key, group[~m], key[order][~m])
+    first = np.full(len(order), len(order), dtype=np.int64)
+    position = np.arange(len(order))
+    np.minimum.at(first, group[m], position[m])
+    keys = key.astype(np.int64)
+    keys[order[m]] = (last_key[group] + 1 + position - first[group])[m]
+    return keys
+
+
+def _merge_elevations(
+    elevations: ElevationProfiles,
+    snapshot: GraphSnapshot,
+    order: np.ndarray,
+    chain_of: np.ndarray,
+    reverse: np.ndarray,
+    flipped: np.ndarray,
+    n_chains: int,
+) -> ElevationProfiles:
+    """ The profiles of the chains of the edges in order, along their merged
+    geometries.
+    """
+    first = np.r_[True, chain_of[1:] != chain_of[:-1]][:len(order)]
+    distance, elevation, owner = concatenate(
+        elevations,
+        snapshot.edge_ids[order],
+        reverse,
+        snapshot.length[order],
+        first,
+    )
+    point_chain = chain_of[owner]
+    offsets = np.zeros(n_chains + 1, dtype=np.int64)
+    np.cumsum(np.bincount(point_chain, minlength=n_chains), out=offsets[1:])
+    # Flipped chains are measured from their end
+    rows = np.arange(len(distance))
+    flip = flipped[point_chain]
+    c = point_chain[flip]
+    rows[flip] = offsets[c] + offsets[c + 1] - 1 - rows[flip]
+    distance = distance[rows]
+    distance[flip] = distance[offsets[c]] - distance[flip]
+    return ElevationProfiles(
+        snapshot.graph_id,
+        snapshot.edge_ids[order[first]],
+        offsets,
+        np.column_stack([distance, elevation[rows]]).astype(np.int32),
+    )
+
+
+def simplify(
+    snapshot: GraphSnapshot,
+    geometries: EdgeGeometries,
+    elevations: ElevationProfiles | None = None,
+) -> SimplifiedGraph:
+    """ Merge the chains of edges through shape nodes into single edges.
+
+    Lengths and elevations are summed, and geometries and elevation
+    profiles concatenated in travel order. Both directions of a two way
+    chain share a geometry, the direction of the larger first edge id
+    traversing it reversed. Routing costs are unchanged except where a
+    profile floor applies to some of the merged edges.
+    """
+    next_edge, two_way = _next_edges(snapshot)
+    chain, rank = _chains(next_edge)
+    n_chains = int(chain.max()) + 1 if snapshot.n_edges else 0
+    first_rank = rank == 0
+    head_ids = np.zeros(n_chains, dtype=np.int64)
+    head_ids[chain[first_rank]] = snapshot.edge_ids[first_rank]
+    # Chains in edge id order
+    renumber = np.empty(n_chains, dtype=np.int64)
+    renumber[np.argsort(head_ids)] = np.arange(n_chains)
+    chain = renumber[chain]
+    head_ids = np.sort(head_ids)
+
+    order = np.lexsort((rank, chain))
+    counts = np.bincount(chain, minlength=n_chains)
+    offsets = np.zeros(n_chains + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    first, last = order[offsets[:-1]], order[offsets[1:] - 1]
+    merged = counts > 1
+
+    # The two directions of a two way chain meet at its first shape node
+    inner = snapshot.target[first]
+    in_indptr, in_edges = snapshot.incoming
+    flipped = np.zeros(n_chains, dtype=bool)
+    candidates = np.flatnonzero(merged & two_way[inner])
+    pair = in_edges[in_indptr[inner[candidates]][:, None] + [0, 1]]
+    twin = np.where(
+        chain[pair[:, 0]] == candidates, chain[pair[:, 1]], chain[pair[:, 0]]
+    )
+    flipped[candidates] = head_ids[twin] < head_ids[candidates]
+
+    # Travel order points of the merged edges, without repeated junctions
+    chain_of = chain[order]
+    reverse = snapshot.reversed[order] & merged[chain_of]
+    points, owner = geometries.gather(
+        geometries.indices(snapshot.edge_ids[order]), reverse
+    )
+    junction = np.r_[True, owner[1:] != owner[:-1]][:len(owner)]
+    keep = ~(junction & (rank[order][owner] > 0))
+    points, point_chain = points[keep], chain_of[owner[keep]]
+    point_offsets = np.zeros(n_chains + 1, dtype=np.int64)
+    np.cumsum(np.bincount(point_chain, minlength=n_chains), out=point_offsets[1:])
+    rows = np.arange(len(points))
+    reversed_rows = flipped[point_chain]
+    c = point_chain[reversed_rows]
+    rows[reversed_rows] = (
+        point_offsets[c] + point_offsets[c + 1] - 1 - rows[reversed_rows]
+    )
+    coordinates = np.rint(points[rows] * COORDINATE_SCALE).astype(np.int32)
+
+    if elevations is not None:
+        elevations = _merge_elevations(
+            elevations, snapshot, order, chain_of, reverse, flipped, n_chains
+        )
+
+    edges = np.zeros(n_chains, dtype=EDGE_DTYPE)
+    edges["id"] = head_ids
+    edges["source_id"] = snapshot.node_ids[snapshot.source[first]]
+    edges["target_id"] = snapshot.node_ids[snapshot.target[last]]
+    edges["key"] = _keys(
+        edges["source_id"], edges["target_id"], snapshot.key[first], merged
+    )
+    for name in ("length", "positive_elevation", "negative_elevation"):
+        edges[name] = np.bincount(
+            chain, weights=getattr(snapshot, name), minlength=n_chains
+        ).astype(np.int64)
+    edges["reversed"] = np.where(merged, flipped, snapshot.reversed[first])
+
+    # Shape nodes are the inner nodes of merged edges
+    shape = np.zeros(snapshot.n_nodes, dtype=bool)
+    inside = rank[order] < counts[chain_of] - 1
+    shape[snapshot.target[order[inside]]] = True
+    nodes = np.zeros(int((~shape).sum()), dtype=NODE_DTYPE)
+    nodes["id"] = snapshot.node_ids[~shape]
+    nodes["lon"] = snapshot.lon[~shape]
+    nodes["lat"] = snapshot.lat[~shape]
+
+    lengths = snapshot.length[order].astype(np.int64)
+    before = np.cumsum(lengths) - lengths
+    return SimplifiedGraph(
+        build_snapshot(snapshot.graph_id, nodes, edges),
+        EdgeGeometries(snapshot.graph_id, head_ids, point_offsets, coordinates),
+        elevations,
+        offsets,
+        snapshot.edge_ids[order],
+        before - before[offsets[:-1]][chain_of],
+    )
+
+
+def write_simplified(
+    db: Session,
+    graph_id: int,
+    simplified: SimplifiedGraph,
+    *,
+    batch_size: int = BATCH_SIZE,
+) -> None:
+    """ Store a simplified graph into an empty Graph, and the origin of its
+    edges.
+
+    Nodes and edges get new ids. Rows are inserted and committed by batches,
+    so the caller shall delete the partial graph on error.
+    """
+    snapshot, geometries = simplified.snapshot, simplified.geometries
+    elevations = simplified.elevations
+    try:
+        first_node_id, first_edge_id = next_ids(db)
+
+        tiles = tile_of(snapshot.lon, snapshot.lat)
+        for start in range(0, snapshot.n_nodes, batch_size):
+            db.execute(NODE_INSERT, [
+                {
+                    "id": first_node_id + i,
+                    "graph_id": graph_id,
+                    "tile": int(tiles[i]),
+                    "wkb": struct.pack(
+                        "<BIdd", 1, 1, snapshot.lat[i], snapshot.lon[i]
+                    ),
+                }
+                for i in range(start, min(start + batch_size, snapshot.n_nodes))
+            ])
+            db.commit()
+
+        # Edges in id order, as their geometries
+        csr = snapshot.edge_indices(geometries.edge_ids)
+        for start in range(0, geometries.n_edges, batch_size):
+            batch = np.arange(start, min(start + batch_size, geometries.n_edges))
+            points, owner = geometries.gather(batch)
+            # MySQL reads SRID 4326 WKB in lat/long axis order
+            wkbs = shapely.to_wkb(
+                shapely.linestrings(points[:, ::-1], indices=owner)
+            )
+            profiles = [
+                elevations.packed(i) if elevations is not None else None
+                for i in batch.tolist()
+            ]
+            db.execute(EDGE_INSERT, [
+                {
+                    "id": first_edge_id + i,
+                    "graph_id": graph_id,
+                    "source_id": first_node_id + int(snapshot.source[e]),
+                    "target_id": first_node_id + int(snapshot.target[e]),
+                    "key": int(snapshot.key[e]),
+                    "wkb": wkb,
+                    "elevation_profile": profile,
+                    "tile": int(tiles[snapshot.source[e]]),
+                    "reversed": bool(snapshot.reversed[e]),
+                    "length": int(snapshot.length[e]),
+                    "positive_elevation": int(snapshot.positive_elevation[e]),
+                    "negative_elevation": int(snapshot.negative_elevation[e]),
+                }
+                for i, e, wkb, profile in zip(
+                    batch.tolist(), csr[batch].tolist(), wkbs, profiles
+                )
+            ])
+            rows = np.arange(
+                simplified.offsets[batch[0]], simplified.offsets[batch[-1] + 1]
+            )
+            edges = np.repeat(
+                batch, np.diff(simplified.offsets[batch[0]:batch[-1] + 2])
+            )
+            db.execute(insert(EdgeOrigin), [
+                {
+                    "edge_id": first_edge_id + i,
+                    "original_id": original_id,
+                    "position": position,
+                    "offset": offset,
+                }
+                for i, original_id, position, offset in zip(
+                    edges.tolist(),
+                    simplified.original_ids[rows].tolist(),
+                    (rows - simplified.offsets[edges]).tolist(),
+                    simplified.starts[rows].tolist(),
+                )
+            ])
+            db.commit()
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise SnapshotError from exc
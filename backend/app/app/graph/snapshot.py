@@ -0,0 +1,304 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Collection, Iterable, Sequence
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models.graph import Edge, Graph, Node
+
+# Rows are streamed from the database by chunks of this size
+FETCH_SIZE = 50_000
+
+NODE_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("lon", np.float64),
+    ("lat", np.float64),
+])
+EDGE_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("source_id", np.int64),
+    ("target_id", np.int64),
+    ("key", np.int32),
+    ("length", np.int32),
+    ("positive_elevation", np.int32),
+    ("negative_elevation", np.int32),
+    ("reversed", np.bool_),
+])
+
+
+# Rows of tiled loads carry their tile, see app.graph.tiles
+TILED_NODE_DTYPE = np.dtype(NODE_DTYPE.descr + [("tile", np.int64)])
+TILED_EDGE_DTYPE = np.dtype(EDGE_DTYPE.descr + [("tile", np.int64)])
+
+
+class SnapshotError(Exception):
+    pass
+
+
+@dataclass(frozen=True, eq=False)
+class GraphSnapshot:
+    """ An immutable compressed-sparse-row view of a Graph.
+
+    Nodes are identified by a dense index in [0, n_nodes): ``node_ids`` is
+    sorted so that the node id -> index mapping is a binary search.
+    Edges are stored in CSR order: the outgoing edges of node ``u`` are the
+    edge indices in ``range(indptr[u], indptr[u + 1])``.
+    """
+    graph_id: int
+    node_ids: np.ndarray            # int64, sorted, dense index -> Node.id
+    lon: np.ndarray                 # float64
+    lat: np.ndarray                 # float64
+    indptr: np.ndarray              # int64, n_nodes + 1
+    edge_ids: np.ndarray            # int64, dense edge index -> Edge.id
+    source: np.ndarray              # int32, dense source node index
+    target: np.ndarray              # int32, dense target node index
+    key: np.ndarray                 # int32
+    length: np.ndarray              # int32, in meter
+    positive_elevation: np.ndarray  # int32, in meter
+    negative_elevation: np.ndarray  # int32, in meter
+    reversed: np.ndarray            # bool
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edge_ids)
+
+    def node_index(self, node_id: int) -> int:
+        return int(self.node_indices(np.array([node_id]))[0])
+
+    def node_indices(self, node_ids: np.ndarray) -> np.ndarray:
+        """ Map an array of Node.id to dense node indices.
+
+        Raises:
+            KeyError: if a node id does not belong to the graph.
+        """
+        return _lookup(self.node_ids, np.asarray(node_ids, dtype=np.int64))
+
+    def edge_index(self, edge_id: int) -> int:
+        return int(self.edge_indices(np.array([edge_id]))[0])
+
+    def edge_indices(self, edge_ids: np.ndarray) -> np.ndarray:
+        """ Map an array of Edge.id to dense edge indices (CSR order).
+
+        Raises:
+            KeyError: if an edge id does not belong to the graph.
+        """
+        order, sorted_ids = self._edge_order
+        return order[_lookup(sorted_ids, np.asarray(edge_ids, dtype=np.int64))]
+
+    def out_edges(self, u: int) -> range:
+        return range(self.indptr[u], self.indptr[u + 1])
+
+    @cached_property
+    def incoming(self) -> tuple[np.ndarray, np.ndarray]:
+        """ The reverse adjacency as (indptr, edge indices), built on first use.
+
+        The incoming edges of node ``v`` are
+        ``edges[indptr[v]:indptr[v + 1]]``, given as indices in CSR order.
+        """
+        edges = np.argsort(self.target, kind="stable")
+        indptr = _indptr(self.target, self.n_nodes)
+        return indptr, edges
+
+    @cached_property
+    def _edge_order(self) -> tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(self.edge_ids, kind="stable")
+        return order, self.edge_ids[order]
+
+
+def _lookup(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    if len(sorted_ids) == 0:
+        if len(ids):
+            raise KeyError(ids.tolist())
+        return np.zeros(0, dtype=np.intp)
+    idx = np.searchsorted(sorted_ids, ids)
+    np.minimum(idx, len(sorted_ids) - 1, out=idx)
+    missing = sorted_ids[idx] != ids
+    if missing.any():
+        raise KeyError(ids[missing].tolist())
+    return idx
+
+
+def _indptr(rows: np.ndarray, n: int) -> np.ndarray:
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr
+
+
+def build_snapshot(
+    graph_id: int, nodes: np.ndarray, edges: np.ndarray
+) -> GraphSnapshot:
+    """ Build a snapshot from NODE_DTYPE and EDGE_DTYPE structured arrays. """
+    nodes = np.sort(nodes, order="id")
+    node_ids = np.ascontiguousarray(nodes["id"])
+    try:
+        source = _lookup(node_ids, edges["source_id"])
+        target = _lookup(node_ids, edges["target_id"])
+    except KeyError as exc:
+        raise SnapshotError(
+            f"Edges of graph {graph_id} reference unknown nodes: {exc}"
+        ) from exc
+
+    # Group edges by source node, keeping edge id order inside a group
+    order = np.lexsort((edges["id"], source))
+    edges = edges[order]
+    source = source[order].astype(np.int32)
+    target = target[order].astype(np.int32)
+
+    return GraphSnapshot(
+        graph_id=graph_id,
+        node_ids=node_ids,
+        lon=np.ascontiguousarray(nodes["lon"]),
+        lat=np.ascontiguousarray(nodes["lat"]),
+        indptr=_indptr(source, len(node_ids)),
+        edge_ids=np.ascontiguousarray(edges["id"]),
+        source=source,
+        target=target,
+        key=np.ascontiguousarray(edges["key"]),
+        length=np.ascontiguousarray(edges["length"]),
+        positive_elevation=np.ascontiguousarray(edges["positive_elevation"]),
+        negative_elevation=np.ascontiguousarray(edges["negative_elevation"]),
+        reversed=np.ascontiguousarray(edges["reversed"]),
+    )
+
+
+def _fetch(db: Session, stmt, dtype: np.dtype) -> np.ndarray:
+    result = db.execute(stmt.execution_options(yield_per=FETCH_SIZE))
+    return np.fromiter(result.tuples(), dtype=dtype)
+
+
+_NODE_COLUMNS = (
+    Node.id,
+    func.ST_Longitude(Node.location),
+    func.ST_Latitude(Node.location),
+)
+_EDGE_COLUMNS = (
+    Edge.id,
+    Edge.source_id,
+    Edge.target_id,
+    Edge.key,
+    Edge.length,
+    Edge.positive_elevation,
+    Edge.negative_elevation,
+    Edge.reversed,
+)
+
+
+def load_snapshot(db: Session, graph_id: int) -> GraphSnapshot | None:
+    """ Bulk read a Graph from the node and edge tables, bypassing the ORM.
+
+    Returns None if the graph does not exist.
+    """
+    try:
+        if db.get(Graph, graph_id) is None:
+            return None
+        nodes = _fetch(
+            db,
+            select(*_NODE_COLUMNS).where(Node.graph_id == graph_id),
+            NODE_DTYPE,
+        )
+        edges = _fetch(
+            db,
+            select(*_EDGE_COLUMNS).where(Edge.graph_id == graph_id),
+            EDGE_DTYPE,
+        )
+    except SQLAlchemyError as exc:
+        raise SnapshotError from exc
+    return build_snapshot(graph_id, nodes, edges)
+
+
+def load_edges(
+    db: Session, graph_id: int, edge_ids: Collection[int]
+) -> tuple[np.ndarray, np.ndarray]:
+    """ Bulk read some edges of a Graph, and their end nodes.
+
+    Returns NODE_DTYPE and EDGE_DTYPE arrays, without the unknown edges.
+    """
+    try:
+        edges = _fetch(
+            db,
+            select(*_EDGE_COLUMNS).where(
+                Edge.graph_id == graph_id, Edge.id.in_(edge_ids)
+            ),
+            EDGE_DTYPE,
+        )
+        node_ids = set(edges["source_id"].tolist()) | set(edges["target_id"].tolist())
+        nodes = _fetch(
+            db,
+            select(*_NODE_COLUMNS).where(Node.id.in_(node_ids)),
+            NODE_DTYPE,
+        )
+    except SQLAlchemyError as exc:
+        raise SnapshotError from exc
+    return nodes, edges
+
+
+def load_version(db: Session, graph_id: int) -> int | None:
+    """ The current version of a Graph, or None if it does not exist. """
+    try:
+        return db.scalar(select(Graph.version).where(Graph.id == graph_id))
+    except SQLAlchemyError as exc:
+        raise SnapshotError from exc
+
+
+def load_tiles(
+    db: Session, graph_id: int, tiles: Sequence[int]
+) -> dict[int, tuple[np.ndarray, np.ndarray]] | None:
+    """ Bulk read the nodes and edges of some tiles of a Graph.
+
+    Returns TILED_NODE_DTYPE and TILED_EDGE_DTYPE arrays by tile, or None
+    if the graph does not exist. Edges belong to the tile of their source.
+    """
+    try:
+        if db.get(Graph, graph_id) is None:
+            return None
+        nodes = _fetch(
+            db,
+            select(*_NODE_COLUMNS, Node.tile).where(
+                Node.graph_id == graph_id, Node.tile.in_(tiles)
+            ),
+            TILED_NODE_DTYPE,
+        )
+        edges = _fetch(
+            db,
+            select(*_EDGE_COLUMNS, Edge.tile).where(
+                Edge.graph_id == graph_id, Edge.tile.in_(tiles)
+            ),
+            TILED_EDGE_DTYPE,
+        )
+    except SQLAlchemyError as exc:
+        raise SnapshotError from exc
+    return {
+        tile: (nodes[nodes["tile"] == tile], edges[edges["tile"] == tile])
+        for tile in tiles
+    }
+
+
+def build_region(
+    graph_id: int, parts: Iterable[tuple[np.ndarray, np.ndarray]]
+) -> GraphSnapshot:
+    """ Build the snapshot of some tiles, given their (nodes, edges) arrays.
+
+    Edges leaving the tiles are dropped, so that a region is a subgraph.
+    """
+    nodes, edges = (np.concatenate(arrays) for arrays in zip(*parts))
+    node_ids = np.sort(nodes["id"])
+    if len(node_ids) == 0:
+        return build_snapshot(graph_id, nodes, edges[:0])
+    position = np.minimum(
+        np.searchsorted(node_ids, edges["target_id"]), len(node_ids) - 1
+    )
+    return build_snapshot(
+        graph_id, nodes, edges[node_ids[position] == edges["target_id"]]
+    )
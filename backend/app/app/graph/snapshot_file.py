@@ -0,0 +1,154 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import json
+import os
+import struct
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+import numpy as np
+
+from app.graph.elevation import ElevationProfiles
+from app.graph.geometry import EdgeGeometries
+from app.graph.profiles import Weights
+from app.graph.snapshot import GraphSnapshot, SnapshotError
+from app.schemas.route import ProfileEnum
+
+# A snapshot file starts with MAGIC, the format version and the size of a
+# JSON header describing the arrays, which follow aligned on memory pages
+MAGIC = b"CYCLITI\0"
+FORMAT_VERSION = 2
+_PREFIX = struct.Struct("<8sII")
+ALIGNMENT = 4096
+
+_SNAPSHOT_ARRAYS = tuple(
+    field.name for field in fields(GraphSnapshot) if field.name != "graph_id"
+)
+_GEOMETRY_ARRAYS = ("edge_ids", "offsets", "coordinates")
+_ELEVATION_ARRAYS = ("edge_ids", "offsets", "values")
+
+
+class SnapshotFileError(SnapshotError):
+    pass
+
+
+@dataclass(frozen=True, eq=False)
+class SnapshotFile:
+    """ A graph snapshot with its weights, geometries and elevation profiles,
+    for a version.
+    """
+    graph_id: int
+    version: int
+    snapshot: GraphSnapshot
+    weights: dict[ProfileEnum, Weights]
+    geometries: EdgeGeometries
+    elevations: ElevationProfiles
+
+
+def _arrays(data: SnapshotFile) -> dict[str, np.ndarray]:
+    snapshot = data.snapshot
+    indptr, edges = snapshot.incoming
+    return {
+        **{f"snapshot.{name}": getattr(snapshot, name) for name in _SNAPSHOT_ARRAYS},
+        "snapshot.incoming.indptr": indptr,
+        "snapshot.incoming.edges": edges,
+        **{
+            f"weights.{profile}.cost": weights.cost
+            for profile, weights in data.weights.items()
+        },
+        **{
+            f"geometries.{name}": getattr(data.geometries, name)
+            for name in _GEOMETRY_ARRAYS
+        },
+        **{
+            f"elevations.{name}": getattr(data.elevations, name)
+            for name in _ELEVATION_ARRAYS
+        },
+    }
+
+
+def write_snapshot_file(path: Path, data: SnapshotFile) -> None:
+    """ Write a snapshot file, replacing any previous one atomically. """
+    arrays = {
+        name: np.ascontiguousarray(array) for name, array in _arrays(data).items()
+    }
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, list(array.shape), offset]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({
+        "graph_id": data.graph_id,
+        "version": data.version,
+        "scales": {str(p): weights.scale for p, weights in data.weights.items()},
+        "arrays": layout,
+    }).encode()
+    start = -(-(_PREFIX.size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(temporary, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(start + layout[name][2])
+            f.write(array.tobytes())
+        f.truncate(start + offset)
+    os.replace(temporary, path)
+
+
+def read_snapshot_file(path: Path) -> SnapshotFile:
+    """ Memory map a snapshot file, read only.
+
+    Arrays are views of a single mapping, their pages being read on first
+    access and shared with the other processes mapping the file.
+    Raises:
+        OSError: if the file cannot be read.
+        SnapshotFileError: if it is not a snapshot file of this format.
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise SnapshotFileError(f"{path} is truncated")
+        magic, format_version, size = _PREFIX.unpack(prefix)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise SnapshotFileError(f"{path} is not a snapshot file of this format")
+        header = json.loads(f.read(size))
+    start = -(-(_PREFIX.size + size) // ALIGNMENT) * ALIGNMENT
+
+    # Plain views, slicing a np.memmap being much slower
+    buffer = np.memmap(path, dtype=np.uint8, mode="r").view(np.ndarray)
+    arrays = {}
+    for name, (dtype, shape, offset) in header["arrays"].items():
+        dtype = np.dtype(dtype)
+        begin = start + offset
+        end = begin + dtype.itemsize * int(np.prod(shape))
+        if end > len(buffer):
+            raise SnapshotFileError(f"{path} is truncated")
+        arrays[name] = buffer[begin:end].view(dtype).reshape(shape)
+
+    graph_id = header["graph_id"]
+    snapshot = GraphSnapshot(
+        graph_id, **{name: arrays[f"snapshot.{name}"] for name in _SNAPSHOT_ARRAYS}
+    )
+    # Fill the cached property, rather than sorting the targets again
+    snapshot.__dict__["incoming"] = (
+        arrays["snapshot.incoming.indptr"], arrays["snapshot.incoming.edges"]
+    )
+    weights = {
+        ProfileEnum(profile): Weights(
+            ProfileEnum(profile), arrays[f"weights.{profile}.cost"], scale
+        )
+        for profile, scale in header["scales"].items()
+    }
+    geometries = EdgeGeometries(
+        graph_id, *(arrays[f"geometries.{name}"] for name in _GEOMETRY_ARRAYS)
+    )
+    elevations = ElevationProfiles(
+        graph_id, *(arrays[f"elevations.{name}"] for name in _ELEVATION_ARRAYS)
+    )
+    return SnapshotFile(
+        graph_id, header["version"], snapshot, weights, geometries, elevations
+    )
@@ -0,0 +1,49 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.graph.geo import EARTH_RADIUS
+from app.graph.snapshot import GraphSnapshot
+
+
+def to_unit_vectors(lon, lat) -> np.ndarray:
+    """ WGS 84 (lon, lat) in degrees to (n, 3) points on the unit sphere.
+
+    The euclidean distance between such points (chord) grows with the
+    great-circle distance, so that a KD-tree on them answers geodesic
+    nearest neighbor queries exactly, without any projection.
+    """
+    lon, lat = np.radians(lon), np.radians(lat)
+    cos_lat = np.cos(lat)
+    return np.column_stack(
+        [cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)]
+    )
+
+
+def chord_to_meters(chord: np.ndarray) -> np.ndarray:
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+class NodeIndex:
+    """ A KD-tree over the nodes of a snapshot, for nearest-node snapping. """
+
+    def __init__(self, snapshot: GraphSnapshot):
+        self.tree = cKDTree(to_unit_vectors(snapshot.lon, snapshot.lat))
+
+    def query(
+        self, lon: np.ndarray, lat: np.ndarray, k: int = 1
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """ The k nearest nodes of each (lon, lat) point.
+
+        Returns (distances in meter, dense node indices), of shape (n,) if
+        k is 1, else (n, k) with nearest nodes first.
+        """
+        chord, nodes = self.tree.query(to_unit_vectors(lon, lat), k=k, workers=-1)
+        return chord_to_meters(chord), nodes
+
+    def nearest(self, lon: float, lat: float) -> int:
+        return int(self.query(np.array([lon]), np.array([lat]))[1][0])
@@ -0,0 +1,617 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Callable, TypeVar
+from weakref import WeakKeyDictionary
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.graph.ch import ContractionHierarchy
+from app.graph.delta import apply_delta, load_delta
+from app.graph.elevation import ElevationProfiles, load_elevations
+from app.graph.geometry import EdgeGeometries, load_geometries
+from app.graph.isochrone import Reachability, cost_matrix, reachable
+from app.graph.mvt import render_tile
+from app.graph.profiles import Weights, compile_profiles
+from app.graph.route_cache import CacheStats, CachedRoute, RouteCache
+from app.graph.routing import Route
+from app.graph.snapshot import (
+    GraphSnapshot, SnapshotError, build_region, load_snapshot, load_tiles,
+    load_version,
+)
+from app.graph.snapshot_file import (
+    SnapshotFile, SnapshotFileError, read_snapshot_file, write_snapshot_file
+)
+from app.graph.spatial import NodeIndex
+from app.graph.tiles import BBox, tiles_covering
+from app.schemas.route import ProfileEnum
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Whole graph snapshots are memory mapped from a file per graph version
+# under settings.GRAPH_DATA_DIR, written by the first worker to need it.
+# They are shared by all requests, and required by contraction hierarchies.
+# Later versions are swapped in by refresh()
+_files: dict[int, SnapshotFile] = {}
+_snapshots: dict[int, GraphSnapshot] = {}
+# The (nodes, edges) arrays of the loaded tiles, by (graph, tile), least
+# recently used first, evicted beyond settings.GRAPH_TILE_CACHE_SIZE bytes
+_tiles: OrderedDict[tuple[int, int], tuple[np.ndarray, np.ndarray]] = OrderedDict()
+_tiles_size = 0
+# The graph version the cached tiles and regions of each graph were read at,
+# checked by refresh() like the mapped files
+_tile_versions: dict[int, int] = {}
+# Snapshots of the most recently used regions, by (graph, tiles)
+REGION_CACHE_SIZE = 8
+_regions: OrderedDict[tuple[int, tuple[int, ...]], GraphSnapshot] = OrderedDict()
+# The most recently used reachabilities of each snapshot
+ISOCHRONE_CACHE_SIZE = 128
+# Rendered vector tiles by (graph, version, period, z, x, y), least recently
+# used first, evicted beyond settings.VECTOR_TILE_CACHE_SIZE bytes. Periods
+# of settings.VECTOR_TILE_TTL seconds bound the age of their popularity
+_vector_tiles: OrderedDict[tuple[int, ...], bytes] = OrderedDict()
+_vector_tiles_size = 0
+# Routes by (graph, version, tiles, profile, source node id, target node id),
+# tiles being those of the region searched, None for the whole graph
+_routes = RouteCache(settings.ROUTE_CACHE_SIZE, settings.ROUTE_CACHE_TTL)
+# Guards the caches above, only held to read or publish into them. Loads run
+# outside of it, each key being loaded once at a time, see _load_once()
+_lock = Lock()
+_loading: dict[tuple, Future] = {}
+
+
+@dataclass(eq=False)
+class _Derived:
+    """ Data computed from a snapshot, which lives as long as the snapshot. """
+    weights: dict[ProfileEnum, Weights]
+    # The graph version the snapshot was read at, as refresh() compares it
+    version: int | None = None
+    # The tiles of a region snapshot, None for the whole graph
+    tiles: tuple[int, ...] | None = None
+    # Built on first use
+    node_index: NodeIndex | None = None
+    hierarchies: dict[ProfileEnum, ContractionHierarchy] = field(
+        default_factory=dict
+    )
+    matrices: dict[ProfileEnum, csr_matrix] = field(default_factory=dict)
+    # By (profile, origin, budget)
+    isochrones: OrderedDict[tuple, Reachability] = field(default_factory=OrderedDict)
+
+
+_derived: WeakKeyDictionary[GraphSnapshot, _Derived] = WeakKeyDictionary()
+
+
+def _derive(
+    snapshot: GraphSnapshot,
+    weights: dict[ProfileEnum, Weights] | None = None,
+    version: int | None = None,
+) -> None:
+    _derived[snapshot] = _Derived(weights or compile_profiles(snapshot), version)
+
+
+def hierarchy_path(graph_id: int, version: int, profile: ProfileEnum) -> Path:
+    return settings.GRAPH_DATA_DIR / f"graph_{graph_id}.v{version}.{profile}.ch.npz"
+
+
+def snapshot_path(graph_id: int, version: int) -> Path:
+    return settings.GRAPH_DATA_DIR / f"graph_{graph_id}.v{version}.snapshot"
+
+
+def _map(
+    db: Session, graph_id: int, version: int, base: SnapshotFile | None = None
+) -> SnapshotFile | None:
+    """ Map the snapshot file of a graph version, writing it if missing.
+
+    A missing file is built from base and the changes logged since its
+    version if possible, else from the whole tables.
+    """
+    path = snapshot_path(graph_id, version)
+    try:
+        return read_snapshot_file(path)
+    except FileNotFoundError:
+        pass
+    except (OSError, SnapshotFileError):
+        logger.warning("Cannot read graph snapshot %s", path, exc_info=True)
+
+    delta = None
+    if base is not None and base.version < version:
+        delta = load_delta(db, graph_id, base.version, version)
+    if delta is not None:
+        data = apply_delta(base, delta)
+    else:
+        snapshot = load_snapshot(db, graph_id)
+        if snapshot is None:
+            return None
+        data = SnapshotFile(
+            graph_id,
+            version,
+            snapshot,
+            compile_profiles(snapshot),
+            load_geometries(db, graph_id),
+            load_elevations(db, graph_id),
+        )
+    try:
+        write_snapshot_file(path, data)
+        data = read_snapshot_file(path)
+    except OSError:
+        logger.warning("Cannot save graph snapshot %s", path, exc_info=True)
+    return data
+
+
+def _evict_tiles(graph_id: int) -> None:
+    # Called with _lock held
+    global _tiles_size
+    _tile_versions.pop(graph_id, None)
+    for cache in (_regions, _tiles):
+        for key in [key for key in cache if key[0] == graph_id]:
+            value = cache.pop(key)
+            if cache is _tiles:
+                _tiles_size -= sum(array.nbytes for array in value)
+
+
+def _install(data: SnapshotFile) -> None:
+    # Called with _lock held. Requests holding the previous snapshot finish
+    # on it, its mapping living as long as its arrays
+    previous = _files.get(data.graph_id)
+    _derive(data.snapshot, data.weights, data.version)
+    _files[data.graph_id] = data
+    _snapshots[data.graph_id] = data.snapshot
+    if _tile_versions.get(data.graph_id, data.version) != data.version:
+        # Cached tiles were read from the tables of a previous version
+        _evict_tiles(data.graph_id)
+    if previous is not None and previous.version != data.version:
+        _routes.invalidate(data.graph_id, data.version)
+
+
+def _load_once(key: tuple, load: Callable[[], T]) -> T:
+    """ The result of load(), shared by the concurrent calls for a key.
+
+    The first call runs load() without holding _lock, so that the requests
+    for other keys go on, and the others wait for its result.
+    """
+    with _lock:
+        future = _loading.get(key)
+        first = future is None
+        if first:
+            future = _loading[key] = Future()
+    if not first:
+        return future.result()
+    try:
+        result = load()
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    else:
+        future.set_result(result)
+    finally:
+        with _lock:
+            del _loading[key]
+    return result
+
+
+def _load_file(db: Session, graph_id: int) -> SnapshotFile | None:
+    data = _files.get(graph_id)
+    if data is not None:
+        # Installed by a previous load
+        return data
+    version = load_version(db, graph_id)
+    if version is None:
+        return None
+    data = _map(db, graph_id, version)
+    if data is not None:
+        with _lock:
+            _install(data)
+    return data
+
+
+def get_file(db: Session, graph_id: int) -> SnapshotFile | None:
+    """ The snapshot file of the current version of a graph.
+
+    It is mapped on first access, then refreshed in the background.
+    Returns None if the graph does not exist.
+    """
+    data = _files.get(graph_id)
+    if data is None:
+        data = _load_once(("file", graph_id), lambda: _load_file(db, graph_id))
+    return data
+
+
+def get_snapshot(db: Session, graph_id: int) -> GraphSnapshot | None:
+    """ The snapshot of a graph, mapped on first access. """
+    snapshot = _snapshots.get(graph_id)
+    if snapshot is None:
+        data = get_file(db, graph_id)
+        snapshot = data.snapshot if data is not None else None
+    return snapshot
+
+
+def get_geometries(db: Session, graph_id: int) -> EdgeGeometries | None:
+    """ The packed edge geometries of the current version of a graph.
+
+    Returns None if the graph does not exist.
+    """
+    data = get_file(db, graph_id)
+    return data.geometries if data is not None else None
+
+
+def get_elevations(db: Session, graph_id: int) -> ElevationProfiles | None:
+    """ The packed edge elevation profiles of the current version of a graph.
+
+    Returns None if the graph does not exist.
+    """
+    data = get_file(db, graph_id)
+    return data.elevations if data is not None else None
+
+
+def _load_region(
+    db: Session, graph_id: int, tiles: tuple[int, ...]
+) -> GraphSnapshot | None:
+    global _tiles_size
+    key = (graph_id, tiles)
+    with _lock:
+        region = _regions.get(key)
+        if region is not None:
+            # Built by a previous load
+            return region
+        # Held here, whatever is evicted meanwhile
+        parts = {
+            tile: _tiles[(graph_id, tile)]
+            for tile in tiles if (graph_id, tile) in _tiles
+        }
+        version = _tile_versions.get(graph_id)
+
+    missing = [tile for tile in tiles if tile not in parts]
+    if missing:
+        # Read before the tiles, so that a later change gets them evicted
+        current = load_version(db, graph_id)
+        if current is None:
+            return None
+        if current != version:
+            # The cached tiles are out of date
+            parts, missing, version = {}, list(tiles), current
+        loaded = load_tiles(db, graph_id, missing)
+        if loaded is None:
+            return None
+        parts.update(loaded)
+    region = build_region(graph_id, [parts[tile] for tile in tiles])
+    derived = _Derived(compile_profiles(region), version, tiles)
+
+    with _lock:
+        if _tile_versions.get(graph_id) != version:
+            _evict_tiles(graph_id)
+            _tile_versions[graph_id] = version
+        for tile in tiles:
+            if (graph_id, tile) not in _tiles:
+                _tiles[(graph_id, tile)] = parts[tile]
+                _tiles_size += sum(array.nbytes for array in parts[tile])
+            _tiles.move_to_end((graph_id, tile))
+        # The tiles of this region are the most recently used, they are only
+        # evicted if they exceed the budget on their own
+        budget = settings.GRAPH_TILE_CACHE_SIZE
+        while _tiles_size > budget and len(_tiles) > len(tiles):
+            _, arrays = _tiles.popitem(last=False)
+            _tiles_size -= sum(array.nbytes for array in arrays)
+
+        _derived[region] = derived
+        _regions[key] = region
+        while len(_regions) > REGION_CACHE_SIZE:
+            _regions.popitem(last=False)
+    return region
+
+
+def get_region(db: Session, graph_id: int, bbox: BBox) -> GraphSnapshot | None:
+    """ The snapshot of the tiles of a graph covering a bounding box.
+
+    Only the missing tiles are read from the database. Returns None if the
+    graph does not exist.
+    """
+    tiles = tiles_covering(bbox)
+    key = (graph_id, tiles)
+    with _lock:
+        region = _regions.get(key)
+        if region is not None:
+            _regions.move_to_end(key)
+            return region
+    return _load_once(
+        ("region", *key), lambda: _load_region(db, graph_id, tiles)
+    )
+
+
+def get_weights(snapshot: GraphSnapshot, profile: ProfileEnum) -> Weights:
+    return _derived[snapshot].weights[profile]
+
+
+def get_node_index(snapshot: GraphSnapshot) -> NodeIndex:
+    derived = _derived[snapshot]
+    if derived.node_index is None:
+        def load() -> NodeIndex:
+            if derived.node_index is None:
+                derived.node_index = NodeIndex(snapshot)
+            return derived.node_index
+
+        return _load_once(("node_index", id(snapshot)), load)
+    return derived.node_index
+
+
+def has_hierarchy(graph_id: int, profile: ProfileEnum) -> bool:
+    """ Whether a graph profile was preprocessed, for its mapped version if any. """
+    data = _files.get(graph_id)
+    if data is None:
+        pattern = f"graph_{graph_id}.v*.{profile}.ch.npz"
+        return any(settings.GRAPH_DATA_DIR.glob(pattern))
+    return profile in _derived[data.snapshot].hierarchies or hierarchy_path(
+        graph_id, data.version, profile
+    ).exists()
+
+
+def get_hierarchy(
+    snapshot: GraphSnapshot, profile: ProfileEnum
+) -> ContractionHierarchy | None:
+    """ The preprocessed contraction hierarchy of a graph profile, if any. """
+    derived = _derived[snapshot]
+    ch = derived.hierarchies.get(profile)
+    if ch is None:
+        if derived.tiles is not None or derived.version is None:
+            return None
+        path = hierarchy_path(snapshot.graph_id, derived.version, profile)
+        if not path.exists():
+            return None
+
+        def load() -> ContractionHierarchy:
+            ch = derived.hierarchies.get(profile)
+            if ch is None:
+                ch = ContractionHierarchy.load(path, snapshot)
+                with _lock:
+                    derived.hierarchies[profile] = ch
+            return ch
+
+        ch = _load_once(("hierarchy", id(snapshot), profile), load)
+    return ch
+
+
+def get_cost_matrix(snapshot: GraphSnapshot, profile: ProfileEnum) -> csr_matrix:
+    """ The cost_matrix() of a snapshot profile, built on first use. """
+    derived = _derived[snapshot]
+    matrix = derived.matrices.get(profile)
+    if matrix is None:
+        # Built outside of the lock, a concurrent duplicate being harmless
+        matrix = cost_matrix(snapshot, derived.weights[profile].cost)
+        with _lock:
+            matrix = derived.matrices.setdefault(profile, matrix)
+    return matrix
+
+
+def get_reachability(
+    snapshot: GraphSnapshot, profile: ProfileEnum, origin: int, budget: float
+) -> Reachability:
+    """ The nodes and edges reachable within a profile cost budget, cached. """
+    derived = _derived[snapshot]
+    key = (profile, origin, budget)
+    with _lock:
+        reach = derived.isochrones.get(key)
+        if reach is not None:
+            derived.isochrones.move_to_end(key)
+            return reach
+    matrix = get_cost_matrix(snapshot, profile)
+    # Searches run outside of the lock, a concurrent duplicate being harmless
+    reach = reachable(snapshot, matrix, derived.weights[profile].cost, origin, budget)
+    with _lock:
+        derived.isochrones[key] = reach
+        while len(derived.isochrones) > ISOCHRONE_CACHE_SIZE:
+            derived.isochrones.popitem(last=False)
+    return reach
+
+
+def get_route(
+    snapshot: GraphSnapshot,
+    profile: ProfileEnum,
+    source: int,
+    target: int,
+    search: Callable[[], Route | None],
+) -> CachedRoute | None:
+    """ The cheapest route between two dense node indices, cached.
+
+    The route is found by search() on a miss. It is cached by node ids, by
+    the graph version the snapshot was read at, and by the tiles of region
+    snapshots: a region may miss the best route, or any route, so that its
+    routes are not shared with whole graph searches, and a target it does
+    not reach is not cached. Routes are dropped by refresh() once the graph
+    changes. Returns None if target cannot be reached.
+    """
+    derived = _derived[snapshot]
+    key = (
+        snapshot.graph_id,
+        derived.version,
+        derived.tiles,
+        profile,
+        int(snapshot.node_ids[source]),
+        int(snapshot.node_ids[target]),
+    )
+    found, route = _routes.get(key)
+    if not found:
+        # Searches run outside of the lock, a concurrent duplicate being harmless
+        result = search()
+        if result is not None:
+            route = CachedRoute.from_route(snapshot, result)
+        if route is not None or derived.tiles is None:
+            _routes.put(key, route)
+    return route
+
+
+def route_cache_stats() -> CacheStats:
+    return _routes.stats()
+
+
+def vector_tile_path(graph_id: int, version: int, z: int, x: int, y: int) -> Path:
+    return (
+        settings.GRAPH_DATA_DIR / "tiles" / f"graph_{graph_id}" / f"v{version}"
+        / str(z) / str(x) / f"{y}.mvt"
+    )
+
+
+def _save_vector_tile(path: Path, tile: bytes) -> None:
+    # Written aside then renamed, so that other workers never read a partial
+    # file
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary.write_bytes(tile)
+        os.replace(temporary, path)
+    except OSError:
+        logger.warning("Cannot save vector tile %s", path, exc_info=True)
+
+
+def vector_tile_max_age() -> int:
+    """ The seconds left before the vector tiles are rendered again. """
+    ttl = settings.VECTOR_TILE_TTL
+    return max(int(ttl - time.time() % ttl), 0)
+
+
+def get_vector_tile(
+    db: Session, graph_id: int, z: int, x: int, y: int
+) -> bytes | None:
+    """ The vector tile of the edges of a graph, rendered on first access.
+
+    Tiles are cached in memory and on disk by graph version, so that a new
+    version is rendered again, and by period of settings.VECTOR_TILE_TTL
+    seconds, so that their edge popularity is refreshed. Returns None if the
+    graph does not exist.
+    """
+    global _vector_tiles_size
+    data = get_file(db, graph_id)
+    if data is None:
+        return None
+    period = int(time.time() // settings.VECTOR_TILE_TTL)
+    key = (graph_id, data.version, period, z, x, y)
+    with _lock:
+        tile = _vector_tiles.get(key)
+        if tile is not None:
+            _vector_tiles.move_to_end(key)
+            return tile
+
+    # Rendering runs outside of the lock, a concurrent duplicate being
+    # harmless. Files are overwritten by the first worker of a new period
+    path = vector_tile_path(graph_id, data.version, z, x, y)
+    try:
+        if path.stat().st_mtime < period * settings.VECTOR_TILE_TTL:
+            raise FileNotFoundError(path)
+        tile = path.read_bytes()
+    except OSError:
+        tile = render_tile(db, data.geometries, z, x, y)
+        _save_vector_tile(path, tile)
+
+    with _lock:
+        if key not in _vector_tiles:
+            _vector_tiles[key] = tile
+            _vector_tiles_size += len(tile)
+        while _vector_tiles_size > settings.VECTOR_TILE_CACHE_SIZE:
+            _, evicted = _vector_tiles.popitem(last=False)
+            _vector_tiles_size -= len(evicted)
+    return tile
+
+
+def evict_snapshot(graph_id: int) -> None:
+    with _lock:
+        _snapshots.pop(graph_id, None)
+        _files.pop(graph_id, None)
+        _evict_tiles(graph_id)
+    _routes.invalidate(graph_id)
+
+
+def _refresh_tiles(db: Session, graph_id: int) -> bool:
+    """ Evict the cached tiles and regions of a graph, if it changed. """
+    cached = _tile_versions.get(graph_id)
+    if cached is None:
+        return False
+    version = load_version(db, graph_id)
+    if version == cached:
+        return False
+    with _lock:
+        # Unless evicted meanwhile
+        if _tile_versions.get(graph_id) == cached:
+            _evict_tiles(graph_id)
+    _routes.invalidate(graph_id, version)
+    logger.info("Graph %s tiles evicted for version %s", graph_id, version)
+    return True
+
+
+def refresh(db: Session, graph_id: int) -> bool:
+    """ Swap in the current version of a mapped graph, if it changed.
+
+    Graphs only served by regions have their tiles evicted instead.
+
+    The new snapshot file is built aside, applying the logged changes to
+    the current one, then installed at once: requests holding the previous
+    snapshot finish on it. Returns True if the graph changed.
+    """
+    current = _files.get(graph_id)
+    if current is None:
+        return _refresh_tiles(db, graph_id)
+    version = load_version(db, graph_id)
+    if version == current.version:
+        return False
+    data = _map(db, graph_id, version, current) if version is not None else None
+    if data is None:
+        evict_snapshot(graph_id)
+        return True
+    with _lock:
+        # Unless evicted meanwhile
+        if _files.get(graph_id) is current:
+            _install(data)
+    logger.info("Graph %s swapped to version %s", graph_id, version)
+    # Processes still on the previous version keep their mapping of the file
+    path = snapshot_path(graph_id, current.version)
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        logger.warning("Cannot remove graph snapshot %s", path, exc_info=True)
+    return True
+
+
+def refresh_all(session_factory: Callable[[], Session]) -> None:
+    """ Refresh all the mapped or tiled graphs, see refresh(). """
+    with session_factory() as db:
+        for graph_id in sorted({*_files, *_tile_versions}):
+            try:
+                refresh(db, graph_id)
+            except SnapshotError:
+                logger.warning("Cannot refresh graph %s", graph_id, exc_info=True)
+
+
+class Refresher(Thread):
+    """ Refresh the mapped or tiled graphs every interval seconds, in the
+    background.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], interval: float):
+        super().__init__(name="graph-refresher", daemon=True)
+        self.session_factory = session_factory
+        self.interval = interval
+        self.stopped = Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                refresh_all(self.session_factory)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # The next round shall run anyway
+                logger.exception("Graph refresh failed")
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,49 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import math
+
+import numpy as np
+
+from app.graph.geo import EARTH_RADIUS
+
+# Fixed geographic tiles of TILE_SIZE degrees (about 28 x 18 km in France),
+# numbered row by row from (-180, -90)
+TILE_SIZE = 0.25
+COLUMNS = round(360 / TILE_SIZE)
+ROWS = round(180 / TILE_SIZE)
+
+BBox = tuple[float, float, float, float]
+
+
+def tile_of(lon, lat):
+    """ The tile ID of WGS 84 points, scalars or NumPy arrays. """
+    column = np.clip(np.floor((np.asarray(lon) + 180) / TILE_SIZE), 0, COLUMNS - 1)
+    row = np.clip(np.floor((np.asarray(lat) + 90) / TILE_SIZE), 0, ROWS - 1)
+    tile = (row * COLUMNS + column).astype(np.int64)
+    return int(tile) if tile.ndim == 0 else tile
+
+
+def tiles_covering(bbox: BBox) -> tuple[int, ...]:
+    """ The sorted IDs of the tiles intersecting a (lon, lat) bounding box. """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    first, last = tile_of(min_lon, min_lat), tile_of(max_lon, max_lat)
+    rows = range(first // COLUMNS, last // COLUMNS + 1)
+    columns = range(first % COLUMNS, last % COLUMNS + 1)
+    return tuple(row * COLUMNS + column for row in rows for column in columns)
+
+
+def corridor(lon, lat, margin: float) -> BBox:
+    """ The bounding box of points, extended by a margin in meter. """
+    d_lat = math.degrees(margin / EARTH_RADIUS)
+    max_lat = min(float(np.max(lat)) + d_lat, 90.0)
+    min_lat = max(float(np.min(lat)) - d_lat, -90.0)
+    d_lon = d_lat / max(math.cos(math.radians(max(abs(min_lat), abs(max_lat)))), 1e-6)
+    return (
+        max(float(np.min(lon)) - d_lon, -180.0),
+        min_lat,
+        min(float(np.max(lon)) + d_lon, 180.0),
+        max_lat,
+    )
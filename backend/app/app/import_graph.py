@@ -0,0 +1,97 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import argparse
+import logging
+from pathlib import Path
+
+from sqlalchemy import delete
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.db.session import SessionLocal
+from app.graph.importer import (
+    BATCH_SIZE, NODE_CACHE_SIZE, WGS84_WKT, GraphImportError, GraphWriter,
+    next_ids, read_geojson_seq, read_osm_pbf,
+)
+from app.models.graph import Edge, Graph, Node
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+READERS = {
+    ".pbf": read_osm_pbf,
+    ".osm": read_osm_pbf,
+    ".geojsonl": read_geojson_seq,
+    ".geojsons": read_geojson_seq,
+    ".geojsonseq": read_geojson_seq,
+}
+
+
+def import_graph(
+    path: Path,
+    batch_size: int = BATCH_SIZE,
+    node_cache_size: int = NODE_CACHE_SIZE,
+) -> int:
+    reader = READERS.get(path.suffix.lower())
+    if reader is None:
+        raise SystemExit(
+            f"Unsupported file type {path.suffix}, expected one of "
+            f"{', '.join(READERS)}"
+        )
+    db = SessionLocal()
+    try:
+        graph = Graph(crs=WGS84_WKT)
+        db.add(graph)
+        db.commit()
+        logger.info("Importing %s as graph %s", path, graph.id)
+        writer = GraphWriter(
+            db, graph.id, *next_ids(db),
+            batch_size=batch_size, node_cache_size=node_cache_size,
+        )
+        try:
+            reader(path, writer.add_way)
+            writer.flush()
+        except GraphImportError:
+            logger.exception("Import failed, removing graph %s", graph.id)
+            db.execute(delete(Edge).where(Edge.graph_id == graph.id))
+            db.execute(delete(Node).where(Node.graph_id == graph.id))
+            db.execute(delete(Graph).where(Graph.id == graph.id))
+            db.commit()
+            raise SystemExit(1)
+        finally:
+            writer.close()
+        writer.report()
+        return graph.id
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise SystemExit(f"Database error: {exc}")
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Import a road network from an OSM or GeoJSONSeq file."
+    )
+    parser.add_argument("path", type=Path)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help=f"Rows per insert statement (default: {BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--node-cache-size",
+        type=int,
+        default=NODE_CACHE_SIZE,
+        help=f"Node IDs kept in memory (default: {NODE_CACHE_SIZE})",
+    )
+    args = parser.parse_args()
+    graph_id = import_graph(args.path, args.batch_size, args.node_cache_size)
+    logger.info("Graph %s imported", graph_id)
+
+
+if __name__ == "__main__":
+    main()
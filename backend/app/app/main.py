@@ -1,12 +1,26 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from app.api.api_v1.endpoints import strava
 from app.api.api_v1.api import api_router
+from app.db.session import SessionLocal
+from app.graph.store import Refresher
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import settings
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # New graph versions are swapped in while serving
+    refresher = Refresher(SessionLocal, settings.GRAPH_REFRESH_INTERVAL)
+    refresher.start()
+    yield
+    refresher.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 #     title="Cycliti",
 #     openapi_url="/openapi.json",
 #     # title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json"
@@ -4,5 +4,5 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
 from app.models.user import User
-from app.models.graph import Edge, Graph, Node
-from app.models.circuit import Circuit
+from app.models.graph import Edge, EdgeChange, EdgeOrigin, Graph, Node
+from app.models.circuit import Circuit, CircuitTrace
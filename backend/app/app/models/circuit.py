@@ -10,7 +10,7 @@
 from geoalchemy2 import WKBElement, Geometry
 from sqlalchemy import (
     String, Integer, ForeignKey, Text, DECIMAL,
-    DateTime, Table, Column
+    DateTime, Table, Column, SmallInteger
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -39,7 +39,6 @@ class Circuit(Base):
         ForeignKey("user.id", ondelete="CASCADE"),
         init=False,
         nullable=False,
-        unique=True,
         index=True,
         comment="User ID the circuit belongs to"
     )
@@ -89,3 +88,29 @@ class Circuit(Base):
         secondary=circuit_edge,
         back_populates="circuits"
     )
+
+
+class CircuitTrace(Base):
+    """ The trace of a circuit simplified for a zoom level.
+
+    See app.tracks.levels, a few levels are stored per circuit so that maps
+    do not ship every GPS fix.
+    """
+    # pylint: disable=too-few-public-methods
+    __tablename__ = "circuit_trace"
+    __table_args__ = {"mysql_engine": "InnoDB"}
+
+    circuit_id: Mapped[int] = mapped_column(
+        ForeignKey("circuit.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    zoom: Mapped[int] = mapped_column(
+        SmallInteger,
+        primary_key=True,
+        comment="Zoom level the trace is simplified for",
+    )
+    n_points: Mapped[int] = mapped_column(Integer, nullable=False)
+    trace: Mapped[WKBElement] = mapped_column(
+        Geometry(geometry_type="LINESTRING", srid=4326, spatial_index=False),
+        nullable=False,
+    )
@@ -3,10 +3,11 @@
 # 
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
+from enum import StrEnum
 from typing import TYPE_CHECKING
 
 from geoalchemy2 import WKBElement, Geometry
-from sqlalchemy import Integer, ForeignKey, Text, Boolean, Index
+from sqlalchemy import Integer, ForeignKey, LargeBinary, Text, Boolean, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base_class import Base, intpk
@@ -29,6 +30,14 @@ class Graph(Base):
         nullable=False,
         comment="A shapely CRS in WKT format"
     )
+    version: Mapped[int] = mapped_column(
+        Integer,
+        init=False,
+        default=1,
+        server_default="1",
+        nullable=False,
+        comment="Incremented on each change of the nodes or edges",
+    )
 
     nodes: Mapped[list["Node"]] = relationship(
         init=False,
@@ -40,12 +49,20 @@ class Graph(Base):
         back_populates="graph",
         cascade="all, delete, delete-orphan"
     )
+    changes: Mapped[list["EdgeChange"]] = relationship(
+        init=False,
+        back_populates="graph",
+        cascade="all, delete, delete-orphan"
+    )
 
 
 class Node(Base):
     # pylint: disable=too-few-public-methods
     __tablename__ = "node"
-    __table_args__ = {"mysql_engine": "InnoDB"}
+    __table_args__ = (
+        Index("node_tile_index", "graph_id", "tile"),
+        {"mysql_engine": "InnoDB"},
+    )
 
     id: Mapped[intpk] = mapped_column(init=False)
     graph_id: Mapped[int] = mapped_column(
@@ -56,6 +73,12 @@ class Node(Base):
     location: Mapped[WKBElement] = mapped_column(Geometry(
         geometry_type="POINT", srid=4326)
     )
+    tile: Mapped[int] = mapped_column(
+        Integer,
+        init=True,
+        nullable=False,
+        comment="Geographic tile of the location, see app.graph.tiles",
+    )
 
     # location: Mapped[str] = mapped_column(
     #     Text,
@@ -76,6 +99,7 @@ class Edge(Base):
     # __table_args__ = {"mysql_engine": "InnoDB"}
     __table_args__ = (
         Index('edge_index', "source_id", "target_id", "key"),
+        Index("edge_tile_index", "graph_id", "tile"),
         {"mysql_engine": "InnoDB"},
     )
 
@@ -110,6 +134,12 @@ class Edge(Base):
     #     nullable=False,
     #     comment="A shapely LINESTRING in WKT format"
     # )
+    tile: Mapped[int] = mapped_column(
+        Integer,
+        init=True,
+        nullable=False,
+        comment="Geographic tile of the source node",
+    )
     reversed: Mapped[bool] = mapped_column(
         Boolean,
         init=True,
@@ -134,12 +164,21 @@ class Edge(Base):
         nullable=False,
         comment="in meter"
     )
-    # popularity: Mapped[int] = mapped_column(
-    #     Integer,
-    #     init=False,
-    #     default=0,
-    #     nullable=False,
-    # )
+    elevation_profile: Mapped[bytes | None] = mapped_column(
+        LargeBinary,
+        init=False,
+        default=None,
+        nullable=True,
+        comment="Packed (distance, elevation) in decimeter, see app.graph.elevation",
+    )
+    popularity: Mapped[int] = mapped_column(
+        Integer,
+        init=False,
+        default=0,
+        server_default="0",
+        nullable=False,
+        comment="Number of circuits through the edge",
+    )
 
     graph: Mapped["Graph"] = relationship(
         init=False,
@@ -150,3 +189,80 @@ class Edge(Base):
         secondary=circuit_edge,
         back_populates="edges"
     )
+
+
+class EdgeOperation(StrEnum):
+    insert = "insert"
+    update = "update"
+    delete = "delete"
+
+
+class EdgeChange(Base):
+    """ A logged change of an edge, see app.graph.delta """
+    # pylint: disable=too-few-public-methods
+    __tablename__ = "edge_change"
+    __table_args__ = (
+        Index("edge_change_version_index", "graph_id", "version"),
+        {"mysql_engine": "InnoDB"},
+    )
+
+    id: Mapped[intpk] = mapped_column(init=False)
+    graph_id: Mapped[int] = mapped_column(
+        ForeignKey("graph.id"),
+        nullable=False,
+    )
+    version: Mapped[int] = mapped_column(
+        Integer,
+        init=True,
+        nullable=False,
+        comment="The graph version introducing the change",
+    )
+    edge_id: Mapped[int] = mapped_column(
+        Integer,
+        init=True,
+        nullable=False,
+        comment="Not a foreign key, deleted edges are logged too",
+    )
+    operation: Mapped[EdgeOperation] = mapped_column(nullable=False)
+
+    graph: Mapped["Graph"] = relationship(
+        init=False,
+        back_populates="changes",
+    )
+
+
+class EdgeOrigin(Base):
+    """ An edge of a graph merged into an edge of its simplified copy.
+
+    See app.graph.simplify, the edges of the simplified graph are chains of
+    the original edges, at increasing positions.
+    """
+    # pylint: disable=too-few-public-methods
+    __tablename__ = "edge_origin"
+    __table_args__ = {"mysql_engine": "InnoDB"}
+
+    id: Mapped[intpk] = mapped_column(init=False)
+    edge_id: Mapped[int] = mapped_column(
+        ForeignKey("edge.id"),
+        nullable=False,
+        index=True,
+    )
+    original_id: Mapped[int] = mapped_column(
+        Integer,
+        init=True,
+        nullable=False,
+        index=True,
+        comment="Not a foreign key, the original graph may be deleted",
+    )
+    position: Mapped[int] = mapped_column(
+        Integer,
+        init=True,
+        nullable=False,
+        comment="Rank of the original edge along the edge",
+    )
+    offset: Mapped[int] = mapped_column(
+        Integer,
+        init=True,
+        nullable=False,
+        comment="Length of the edge before the original edge, in meter",
+    )
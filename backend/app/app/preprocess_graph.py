@@ -0,0 +1,68 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import argparse
+import logging
+import time
+
+from app.db.session import SessionLocal
+from app.graph.ch import build_hierarchy
+from app.graph.store import get_file, hierarchy_path
+from app.schemas.route import ProfileEnum
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def preprocess(graph_id: int, profiles: list[ProfileEnum]) -> None:
+    # Hierarchies are built on the snapshot file served for the current
+    # version, which is written if missing
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        data = get_file(db, graph_id)
+    finally:
+        db.close()
+    if data is None:
+        raise SystemExit(f"Unknown graph: {graph_id}")
+    snapshot = data.snapshot
+    logger.info(
+        "Graph %s version %s loaded in %.1f s: %s nodes, %s edges",
+        graph_id, data.version, time.perf_counter() - start,
+        snapshot.n_nodes, snapshot.n_edges,
+    )
+
+    for profile in profiles:
+        start = time.perf_counter()
+        ch = build_hierarchy(snapshot, data.weights[profile].cost)
+        logger.info(
+            "Contraction hierarchy of profile %s built in %.1f s: %s shortcuts",
+            profile, time.perf_counter() - start, ch.n_shortcuts,
+        )
+
+        path = hierarchy_path(graph_id, data.version, profile)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        ch.save(path)
+        logger.info("Contraction hierarchy saved to %s", path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build the contraction hierarchy of a graph for fast routing."
+    )
+    parser.add_argument("graph_id", type=int)
+    parser.add_argument(
+        "--profile",
+        type=ProfileEnum,
+        action="append",
+        choices=list(ProfileEnum),
+        help="Cost profile to preprocess (repeatable, default: all)",
+    )
+    args = parser.parse_args()
+    preprocess(args.graph_id, args.profile or list(ProfileEnum))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import argparse
+import asyncio
+import logging
+import time
+
+from app import crud
+from app.db.session import SessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def recompute(graph_id: int | None) -> None:
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        await crud.circuit.recompute_popularity(db, graph_id=graph_id)
+    finally:
+        db.close()
+    logger.info("Edge popularity recomputed in %.1f s", time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Recount the circuits through each edge, from scratch."
+    )
+    parser.add_argument(
+        "--graph-id", type=int, help="Graph to recompute (default: all)"
+    )
+    args = parser.parse_args()
+    asyncio.run(recompute(args.graph_id))
+
+
+if __name__ == "__main__":
+    main()
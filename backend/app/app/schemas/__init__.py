@@ -6,3 +6,12 @@
 from .user import User, UserCreate, UserInDB, UserUpdate
 from .token import Token, TokenPayload, UserToken
 from .msg import Msg
+from .route import (
+    AlternativesRequest, Coordinates, DistanceMatrix, ElevationProfile,
+    ElevationRequest, Isochrone, IsochroneRequest, LoopRequest, MatrixRequest,
+    ProfileEnum, Route, RouteCacheStats, RouteRequest,
+)
+from .circuit import (
+    Circuit, CircuitCreate, CircuitPreview, CircuitUpdate, CircuitWithTrace,
+    EncodedLineString, LineString, Point, Polygon,
+)
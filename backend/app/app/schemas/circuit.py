@@ -0,0 +1,85 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from datetime import datetime
+from decimal import Decimal
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field
+
+
+# GeoJSON geometries, in WGS 84 (lon, lat)
+class Point(BaseModel):
+    type: Literal["Point"] = "Point"
+    coordinates: tuple[float, float]
+
+
+class LineString(BaseModel):
+    type: Literal["LineString"] = "LineString"
+    coordinates: list[tuple[float, float]]
+
+
+class Polygon(BaseModel):
+    type: Literal["Polygon"] = "Polygon"
+    coordinates: list[list[tuple[float, float]]]
+
+
+# A LineString as a Google encoded polyline of its (lat, lon) coordinates,
+# see app.tracks.polyline
+class EncodedLineString(BaseModel):
+    type: Literal["EncodedLineString"] = "EncodedLineString"
+    polyline: str
+    precision: int = Field(description="Decimal digits of the coordinates")
+
+
+# A trace to return, encoded on request
+Trace = Annotated[LineString | EncodedLineString, Field(discriminator="type")]
+
+
+# Shared properties
+class CircuitBase(BaseModel):
+    name: str | None = Field(max_length=250, default=None)
+    description: str | None = Field(default=None)
+    distance: int = Field(description="Distance in meters")
+    elevation_gain: int = Field(description="Elevation gain in meters")
+    elevation_loss: int = Field(description="Elevation loss in meters")
+    start_point: Point
+    trace: LineString
+
+
+# A planned circuit, not ridden yet
+class CircuitPreview(CircuitBase):
+    trace: Trace
+    edges: list[int] = Field(description="Edge IDs in travel order")
+
+
+# Properties to receive via API on creation
+class CircuitCreate(CircuitBase):
+    start_time: datetime
+    end_time: datetime
+    average_speed: Decimal = Field(description="Average speed in m/s")
+
+
+# Properties to return via API, the trace being fetched apart
+class Circuit(BaseModel):
+    id: int
+    name: str | None
+    distance: int = Field(description="Distance in meters")
+    start_time: datetime
+    end_time: datetime
+    elevation_gain: int = Field(description="Elevation gain in meters")
+    elevation_loss: int = Field(description="Elevation loss in meters")
+    average_speed: Decimal = Field(description="Average speed in m/s")
+    start_point: Point
+
+
+class CircuitWithTrace(Circuit):
+    trace: Trace
+
+
+# Properties to receive via API on update
+class CircuitUpdate(BaseModel):
+    name: str | None = Field(max_length=250, default=None)
+    description: str | None = Field(default=None)
@@ -0,0 +1,119 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from enum import StrEnum
+
+from pydantic import BaseModel, Field, NonNegativeInt, PositiveInt, model_validator
+
+from .circuit import Polygon
+
+
+# Maximum number of sources, and of destinations, of a distance matrix
+MATRIX_SIZE = 100
+# Maximum number of edges of an elevation profile, thousands of kilometers
+ELEVATION_EDGES = 50_000
+
+
+class ProfileEnum(StrEnum):
+    shortest = "shortest"
+    fastest = "fastest"
+    flat = "flat"
+    climber = "climber"
+
+
+class Coordinates(BaseModel):
+    lon: float = Field(ge=-180, le=180)
+    lat: float = Field(ge=-90, le=90)
+
+
+class RouteRequest(BaseModel):
+    graph_id: PositiveInt
+    start: Coordinates
+    end: Coordinates
+    profile: ProfileEnum = Field(default=ProfileEnum.shortest)
+
+
+class AlternativesRequest(RouteRequest):
+    count: int = Field(default=3, ge=1, le=3, description="Routes to propose")
+
+
+class Route(BaseModel):
+    edges: list[int] = Field(description="Edge IDs in travel order")
+    length: int = Field(description="in meter")
+    elevation_gain: int = Field(description="in meter")
+    elevation_loss: int = Field(description="in meter")
+
+
+class RouteCacheStats(BaseModel):
+    hits: int
+    misses: int
+    evictions: int = Field(description="Routes evicted for lack of memory")
+    expirations: int = Field(description="Routes expired when hit")
+    entries: int
+    size: int = Field(description="in byte")
+
+
+class ElevationRequest(BaseModel):
+    graph_id: PositiveInt
+    edges: list[int] = Field(
+        min_length=1,
+        max_length=ELEVATION_EDGES,
+        description="Edge IDs in travel order, as in a route",
+    )
+
+
+class ElevationProfile(BaseModel):
+    distance: list[float] = Field(description="in meter from the start")
+    elevation: list[float] = Field(description="in meter, 0.1 m precision")
+
+
+class MatrixRequest(BaseModel):
+    graph_id: PositiveInt
+    sources: list[Coordinates] = Field(min_length=1, max_length=MATRIX_SIZE)
+    destinations: list[Coordinates] = Field(min_length=1, max_length=MATRIX_SIZE)
+    profile: ProfileEnum = Field(default=ProfileEnum.shortest)
+
+
+class DistanceMatrix(BaseModel):
+    length: list[list[int | None]] = Field(
+        description="in meter, by source then destination, null if unreachable"
+    )
+    elevation_gain: list[list[int | None]] = Field(description="in meter")
+    elevation_loss: list[list[int | None]] = Field(description="in meter")
+
+
+class LoopRequest(BaseModel):
+    graph_id: PositiveInt
+    start: Coordinates
+    distance: PositiveInt = Field(le=300_000, description="in meter")
+    elevation_gain: NonNegativeInt = Field(default=0, description="in meter")
+    count: int = Field(default=3, ge=1, le=10)
+
+
+class IsochroneRequest(BaseModel):
+    graph_id: PositiveInt
+    start: Coordinates
+    distance: PositiveInt | None = Field(
+        default=None, le=300_000, description="in meter"
+    )
+    duration: PositiveInt | None = Field(
+        default=None, le=12 * 3600, description="in second"
+    )
+    with_edges: bool = Field(
+        default=False, description="Also return the reachable edge IDs"
+    )
+
+    @model_validator(mode="after")
+    def check_budget(self) -> "IsochroneRequest":
+        if (self.distance is None) == (self.duration is None):
+            raise ValueError("Exactly one of distance and duration is required")
+        return self
+
+
+class Isochrone(BaseModel):
+    polygon: Polygon
+    edges: list[int] | None = Field(
+        default=None, description="Edge IDs that can be ridden end to end"
+    )
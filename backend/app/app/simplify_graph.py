@@ -0,0 +1,133 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import argparse
+import logging
+import time
+
+import numpy as np
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.db.session import SessionLocal
+from app.graph import routing
+from app.graph.profiles import compile_profile
+from app.graph.simplify import SimplifiedGraph, simplify, write_simplified
+from app.graph.snapshot import GraphSnapshot, SnapshotError
+from app.graph.store import get_file
+from app.models.graph import Edge, EdgeOrigin, Graph, Node
+from app.schemas.route import ProfileEnum
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def routing_time(
+    snapshot: GraphSnapshot, node_ids: np.ndarray, profile: ProfileEnum
+) -> float:
+    """ The mean time of the routes between consecutive pairs of nodes, in s. """
+    weights = compile_profile(snapshot, profile)
+    nodes = snapshot.node_indices(node_ids)
+    start = time.perf_counter()
+    for source, target in zip(nodes[::2].tolist(), nodes[1::2].tolist()):
+        routing.shortest_path(snapshot, source, target, weights)
+    return (time.perf_counter() - start) / max(len(nodes) // 2, 1)
+
+
+def report(
+    snapshot: GraphSnapshot, simplified: SimplifiedGraph, routes: int
+) -> None:
+    result = simplified.snapshot
+    logger.info(
+        "%s nodes -> %s (-%.0f %%), %s edges -> %s (-%.0f %%)",
+        snapshot.n_nodes, result.n_nodes,
+        100 * (1 - result.n_nodes / max(snapshot.n_nodes, 1)),
+        snapshot.n_edges, result.n_edges,
+        100 * (1 - result.n_edges / max(snapshot.n_edges, 1)),
+    )
+    if not routes or result.n_nodes < 2:
+        return
+    # Routes between nodes of both graphs
+    rng = np.random.default_rng(0)
+    node_ids = rng.choice(result.node_ids, 2 * routes)
+    before = routing_time(snapshot, node_ids, ProfileEnum.fastest)
+    after = routing_time(result, node_ids, ProfileEnum.fastest)
+    logger.info(
+        "Route in %.1f ms -> %.1f ms (%.1fx faster)",
+        before * 1000, after * 1000, before / max(after, 1e-9),
+    )
+
+
+def simplify_graph(graph_id: int, routes: int, dry_run: bool) -> int | None:
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        data = get_file(db, graph_id)
+        if data is None:
+            raise SystemExit(f"Unknown graph: {graph_id}")
+        simplified = simplify(data.snapshot, data.geometries, data.elevations)
+        logger.info(
+            "Graph %s version %s simplified in %.1f s",
+            graph_id, data.version, time.perf_counter() - start,
+        )
+        report(data.snapshot, simplified, routes)
+        if dry_run:
+            return None
+
+        start = time.perf_counter()
+        graph = Graph(crs=db.get(Graph, graph_id).crs)
+        db.add(graph)
+        db.commit()
+        logger.info("Writing simplified graph %s", graph.id)
+        try:
+            write_simplified(db, graph.id, simplified)
+        except SnapshotError:
+            logger.exception("Write failed, removing graph %s", graph.id)
+            db.execute(delete(EdgeOrigin).where(
+                EdgeOrigin.edge_id.in_(
+                    select(Edge.id).where(Edge.graph_id == graph.id)
+                )
+            ))
+            db.execute(delete(Edge).where(Edge.graph_id == graph.id))
+            db.execute(delete(Node).where(Node.graph_id == graph.id))
+            db.execute(delete(Graph).where(Graph.id == graph.id))
+            db.commit()
+            raise SystemExit(1)
+        logger.info(
+            "Graph %s written in %.0f s", graph.id, time.perf_counter() - start
+        )
+        return graph.id
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise SystemExit(f"Database error: {exc}")
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Merge the edges through shape nodes of a graph into a new graph, "
+            "keeping the origin of its edges."
+        )
+    )
+    parser.add_argument("graph_id", type=int)
+    parser.add_argument(
+        "--routes",
+        type=int,
+        default=100,
+        help="Random routes timed on both graphs (default: 100)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report the reduction and the routing speedup",
+    )
+    args = parser.parse_args()
+    simplify_graph(args.graph_id, args.routes, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
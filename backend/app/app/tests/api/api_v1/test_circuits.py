@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from app.core.security import create_access_token
+from app.graph import store
+from app.graph.importer import WGS84_WKT, GraphWriter, next_ids
+from app.models.graph import Graph
+from app.tests.utils.activity import LAT, LON, fit_file, gpx_file, tcx_file
+
+URL = f"{settings.API_V1_STR}/circuits"
+
+
+def _upload(client, headers, filename, content):
+    return client.post(
+        f"{URL}/upload", headers=headers, files={"file": (filename, content)}
+    )
+
+
+@pytest.fixture
+def graph(session: Session, monkeypatch, tmp_path) -> Graph:
+    """ A graph of the roads along the activity track of the test files. """
+    monkeypatch.setattr(store, "_files", {})
+    monkeypatch.setattr(store, "_snapshots", {})
+    monkeypatch.setattr(store, "_regions", store.OrderedDict())
+    monkeypatch.setattr(store, "_tile_versions", {})
+    monkeypatch.setattr(store.settings, "GRAPH_DATA_DIR", tmp_path)
+    graph = Graph(crs=WGS84_WKT)
+    session.add(graph)
+    session.commit()
+    writer = GraphWriter(session, graph.id, *next_ids(session))
+    track = np.column_stack([LON, LAT])
+    for i in range(len(track) - 1):
+        writer.add_way(track[i:i + 2])
+    # A parallel road, 200 m north
+    writer.add_way(track + [0, 0.0018])
+    writer.flush()
+    writer.close()
+    return graph
+
+
+@pytest.mark.parametrize("filename, content", [
+    ("ride.gpx", gpx_file()),
+    ("ride.tcx", tcx_file()),
+    ("ride.fit", fit_file()),
+])
+def test_upload_circuit(
+    client: TestClient,
+    first_user_token_headers: dict[str, str],
+    filename,
+    content,
+):
+    response = _upload(client, first_user_token_headers, filename, content)
+    assert response.status_code == status.HTTP_201_CREATED
+    circuit = response.json()
+    assert circuit["name"] == ("Morning ride" if filename.endswith("gpx") else "ride")
+    assert circuit["distance"] > 0
+    assert circuit["start_point"]["coordinates"] == pytest.approx([LON[0], LAT[0]])
+
+    response = client.get(f"{URL}/{circuit['id']}", headers=first_user_token_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["trace"]["coordinates"]) == len(LON)
+
+
+def test_upload_circuit_invalid(
+    client: TestClient, first_user_token_headers: dict[str, str], monkeypatch
+):
+    response = _upload(client, first_user_token_headers, "ride.kml", gpx_file())
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert "Unsupported file format" in response.json()["detail"]
+
+    response = _upload(client, first_user_token_headers, "ride.gpx", gpx_file()[:-30])
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    monkeypatch.setattr(settings, "ACTIVITY_UPLOAD_MAX_SIZE", 100)
+    response = _upload(client, first_user_token_headers, "ride.gpx", gpx_file())
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    response = _upload(client, {}, "ride.gpx", gpx_file())
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_match_circuit(
+    client: TestClient,
+    first_user_token_headers: dict[str, str],
+    random_active_user: models.User,
+    session: Session,
+    graph: Graph,
+):
+    response = _upload(client, first_user_token_headers, "ride.gpx", gpx_file())
+    circuit_id = response.json()["id"]
+
+    response = client.post(
+        f"{URL}/{circuit_id}/match",
+        headers=first_user_token_headers,
+        params={"graph_id": graph.id},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    edges = response.json()
+    snapshot = store.get_snapshot(session, graph.id)
+    assert edges and set(edges) <= set(snapshot.edge_ids.tolist())
+    circuit = session.get(models.Circuit, circuit_id)
+    assert sorted(edge.id for edge in circuit.edges) == sorted(edges)
+
+    # Only the owner matches a circuit
+    other = {
+        "Authorization": f"Bearer {create_access_token(random_active_user.email)}"
+    }
+    response = client.post(
+        f"{URL}/{circuit_id}/match", headers=other, params={"graph_id": graph.id}
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    response = client.post(
+        f"{URL}/{circuit_id + 1000}/match",
+        headers=first_user_token_headers,
+        params={"graph_id": graph.id},
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = client.post(
+        f"{URL}/{circuit_id}/match",
+        headers=first_user_token_headers,
+        params={"graph_id": graph.id + 1000},
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,213 @@
+import dataclasses
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_db
+from app.graph.profiles import compile_profiles
+from app.graph.snapshot_file import SnapshotFile
+from app.main import app
+from app.tests.utils.graph import serve_graph
+from app.tests.utils.synthetic import grid_elevations, grid_geometries, grid_graph
+from app.tracks.polyline import decode_polyline
+from config import settings
+
+URL = f"{settings.API_V1_STR}/routes"
+# Far from the grid, no road around
+NOWHERE = {"lon": -60.0, "lat": -45.0}
+
+
+@pytest.fixture(name="snapshot")
+def snapshot_fixture(monkeypatch, tmp_path):
+    snapshot = dataclasses.replace(grid_graph(12, 12), graph_id=1)
+    geometries = dataclasses.replace(grid_geometries(snapshot), graph_id=1)
+    serve_graph(monkeypatch, tmp_path, SnapshotFile(
+        1, 1, snapshot, compile_profiles(snapshot), geometries,
+        grid_elevations(geometries),
+    ))
+    return snapshot
+
+
+@pytest.fixture(name="graph_client")
+def graph_client_fixture(snapshot):
+    """ A client of the graph endpoints, served from memory without a database. """
+    app.dependency_overrides[get_db] = lambda: None
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def _point(snapshot, node):
+    return {"lon": float(snapshot.lon[node]), "lat": float(snapshot.lat[node])}
+
+
+def test_route(graph_client: TestClient, snapshot):
+    body = {
+        "graph_id": 1,
+        "start": _point(snapshot, 0),
+        "end": _point(snapshot, snapshot.n_nodes - 1),
+        "profile": "flat",
+    }
+    response = graph_client.post(f"{URL}/", json=body)
+    assert response.status_code == status.HTTP_200_OK
+    route = response.json()
+    assert route["edges"] and set(route["edges"]) <= set(snapshot.edge_ids.tolist())
+    assert route["length"] > 0
+
+    # The same search is a hit of the route cache
+    stats = graph_client.get(f"{URL}/cache").json()
+    assert graph_client.post(f"{URL}/", json=body).json() == route
+    response = graph_client.get(f"{URL}/cache")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["hits"] == stats["hits"] + 1
+
+
+def test_route_not_found(graph_client: TestClient, snapshot):
+    body = {"graph_id": 2, "start": _point(snapshot, 0), "end": _point(snapshot, 1)}
+    response = graph_client.post(f"{URL}/", json=body)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"] == "Unknown graph."
+
+    body = {"graph_id": 1, "start": NOWHERE, "end": NOWHERE}
+    response = graph_client.post(f"{URL}/", json=body)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"] == "No road in this area."
+
+
+def test_route_invalid(graph_client: TestClient, snapshot):
+    body = {"graph_id": 1, "start": _point(snapshot, 0), "end": _point(snapshot, 1)}
+    for invalid in (
+        {"graph_id": 0},
+        {"profile": "downhill"},
+        {"end": {"lon": 200.0, "lat": 0.0}},
+    ):
+        response = graph_client.post(f"{URL}/", json={**body, **invalid})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_alternatives(graph_client: TestClient, snapshot):
+    body = {
+        "graph_id": 1,
+        "start": _point(snapshot, 13),
+        "end": _point(snapshot, snapshot.n_nodes - 14),
+        "profile": "fastest",
+    }
+    response = graph_client.post(f"{URL}/alternatives", json=body)
+    assert response.status_code == status.HTTP_200_OK
+    routes = response.json()
+    assert 1 <= len(routes) <= 3
+    assert len({tuple(route["edges"]) for route in routes}) == len(routes)
+
+    response = graph_client.post(
+        f"{URL}/alternatives", json={**body, "start": NOWHERE, "end": NOWHERE}
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = graph_client.post(f"{URL}/alternatives", json={**body, "count": 4})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_elevation(graph_client: TestClient, snapshot):
+    edges = snapshot.edge_ids[:2].tolist()
+    response = graph_client.post(
+        f"{URL}/elevation", json={"graph_id": 1, "edges": edges}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    profile = response.json()
+    assert len(profile["distance"]) == len(profile["elevation"]) > 1
+    assert profile["distance"][0] == 0
+
+    response = graph_client.post(
+        f"{URL}/elevation", json={"graph_id": 1, "edges": [*edges, 999_999]}
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"] == "Unknown edges."
+
+    response = graph_client.post(
+        f"{URL}/elevation", json={"graph_id": 2, "edges": edges}
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = graph_client.post(
+        f"{URL}/elevation", json={"graph_id": 1, "edges": "all"}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_matrix(graph_client: TestClient, snapshot):
+    last = snapshot.n_nodes - 1
+    body = {
+        "graph_id": 1,
+        "sources": [_point(snapshot, 0), _point(snapshot, 50)],
+        "destinations": [_point(snapshot, last), _point(snapshot, 0)],
+        "profile": "flat",
+    }
+    response = graph_client.post(f"{URL}/matrix", json=body)
+    assert response.status_code == status.HTTP_200_OK
+    matrix = response.json()
+    assert len(matrix["length"]) == 2
+    assert all(len(row) == 2 for row in matrix["length"])
+    assert matrix["length"][0][1] == 0
+    assert matrix["length"][0][0] > matrix["length"][1][0] > 0
+
+    response = graph_client.post(f"{URL}/matrix", json={**body, "graph_id": 2})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = graph_client.post(f"{URL}/matrix", json={**body, "sources": []})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_loops(graph_client: TestClient, snapshot):
+    body = {
+        "graph_id": 1,
+        "start": _point(snapshot, 66),
+        "distance": 2000,
+        "count": 2,
+    }
+    response = graph_client.post(f"{URL}/loops", json=body)
+    assert response.status_code == status.HTTP_200_OK
+    loops = response.json()
+    assert 1 <= len(loops) <= 2
+    assert all(loop["edges"] and loop["distance"] > 0 for loop in loops)
+
+    # Traces are encoded as polylines on request
+    response = graph_client.post(
+        f"{URL}/loops", json=body, params={"format": "polyline", "precision": 6}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    trace = response.json()[0]["trace"]
+    lon, lat = decode_polyline(trace["polyline"], trace["precision"])
+    assert len(lon) == len(lat) > 1
+
+    response = graph_client.post(f"{URL}/loops", json={**body, "start": NOWHERE})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = graph_client.post(f"{URL}/loops", json={**body, "distance": 0})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = graph_client.post(f"{URL}/loops", json=body, params={"precision": 9})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_isochrone(graph_client: TestClient, snapshot):
+    body = {"graph_id": 1, "start": _point(snapshot, 66), "distance": 300}
+    response = graph_client.post(
+        f"{URL}/isochrone", json={**body, "with_edges": True}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    isochrone = response.json()
+    ring = isochrone["polygon"]["coordinates"][0]
+    assert len(ring) >= 4 and ring[0] == ring[-1]
+    assert isochrone["edges"]
+
+    response = graph_client.post(
+        f"{URL}/isochrone", json={"graph_id": 1, "start": body["start"], "duration": 60}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["edges"] is None
+
+    response = graph_client.post(f"{URL}/isochrone", json={**body, "graph_id": 2})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    # Either a distance or a duration
+    response = graph_client.post(f"{URL}/isochrone", json={**body, "duration": 60})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,103 @@
+import dataclasses
+import math
+
+import numpy as np
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_db
+from app.graph.mvt import MAX_ZOOM, MIN_ZOOM
+from app.graph.profiles import compile_profiles
+from app.graph.snapshot_file import SnapshotFile
+from app.main import app
+from app.tests.utils.graph import serve_graph
+from app.tests.utils.mvt import TileSession, tile_features
+from app.tests.utils.synthetic import grid_elevations, grid_geometries, grid_graph
+from config import settings
+
+URL = f"{settings.API_V1_STR}/tiles"
+
+
+def _tile_of(lon: float, lat: float, z: int) -> tuple[int, int]:
+    """ The x and y of the Web Mercator tile of a point. """
+    n = 2 ** z
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2
+    return int((lon + 180) / 360 * n), int(y * n)
+
+
+@pytest.fixture(name="snapshot")
+def snapshot_fixture(monkeypatch, tmp_path):
+    snapshot = dataclasses.replace(grid_graph(12, 12), graph_id=1)
+    geometries = dataclasses.replace(grid_geometries(snapshot), graph_id=1)
+    serve_graph(monkeypatch, tmp_path, SnapshotFile(
+        1, 1, snapshot, compile_profiles(snapshot), geometries,
+        grid_elevations(geometries),
+    ))
+    return snapshot
+
+
+@pytest.fixture(name="graph_client")
+def graph_client_fixture(snapshot):
+    """ A client of the tiles endpoint, the edges of the graph being read from
+    memory. """
+    rows = list(zip(
+        snapshot.edge_ids.tolist(),
+        snapshot.reversed.tolist(),
+        np.ones(snapshot.n_edges, dtype=np.int64).tolist(),
+    ))
+    app.dependency_overrides[get_db] = lambda: TileSession(rows)
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_get_tile(graph_client: TestClient, snapshot):
+    z = 15
+    x, y = _tile_of(float(snapshot.lon.mean()), float(snapshot.lat.mean()), z)
+    response = graph_client.get(f"{URL}/{z}/{x}/{y}.mvt", params={"graph_id": 1})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/vnd.mapbox-vector-tile"
+    assert "max-age" in response.headers["cache-control"]
+    layer, features = tile_features(response.content)
+    assert layer[1] == [b"edges"]
+    # The synthetic edges have their own geometry in travel order, they are
+    # drawn one way each
+    assert 0 < len(features) < snapshot.n_edges
+    assert {f["id"] for f in features} <= set(snapshot.edge_ids.tolist())
+    assert all(f["oneway"] == 1 and f["popularity"] == 1 for f in features)
+    assert all(f["type"] == 2 and f["lines"] for f in features)
+
+
+def test_get_tile_empty(graph_client: TestClient, snapshot):
+    z = 15
+    x, y = _tile_of(float(snapshot.lon.mean()), float(snapshot.lat.mean()), z)
+    # Far from the graph
+    response = graph_client.get(
+        f"{URL}/{z}/{x + 100}/{y}.mvt", params={"graph_id": 1}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == b""
+
+
+def test_get_tile_invalid(graph_client: TestClient, snapshot):
+    x, y = _tile_of(float(snapshot.lon[0]), float(snapshot.lat[0]), MIN_ZOOM - 1)
+    response = graph_client.get(
+        f"{URL}/{MIN_ZOOM - 1}/{x}/{y}.mvt", params={"graph_id": 1}
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert response.content == b""
+
+    response = graph_client.get(
+        f"{URL}/{MIN_ZOOM}/{2 ** MIN_ZOOM}/0.mvt", params={"graph_id": 1}
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    x, y = _tile_of(float(snapshot.lon[0]), float(snapshot.lat[0]), MIN_ZOOM)
+    response = graph_client.get(
+        f"{URL}/{MIN_ZOOM}/{x}/{y}.mvt", params={"graph_id": 2}
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = graph_client.get(f"{URL}/{MAX_ZOOM + 1}/0/0.mvt", params={"graph_id": 1})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = graph_client.get(f"{URL}/{MIN_ZOOM}/0/0.mvt")
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
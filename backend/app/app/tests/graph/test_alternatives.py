@@ -0,0 +1,57 @@
+import numpy as np
+
+from app.graph import routing
+from app.graph.alternatives import MAX_OVERLAP, MAX_STRETCH, alternative_routes
+from app.graph.isochrone import cost_matrix
+from app.graph.profiles import compile_profile
+from app.graph.snapshot import EDGE_DTYPE, NODE_DTYPE, build_snapshot
+from app.schemas.route import ProfileEnum
+from app.tests.utils.synthetic import grid_graph
+
+
+def test_alternative_routes():
+    snapshot = grid_graph(30, 30, seed=1)
+    weights = compile_profile(snapshot, ProfileEnum.fastest)
+    source, target = 63, 805
+    routes = alternative_routes(
+        snapshot, cost_matrix(snapshot, weights.cost), weights.cost, source, target
+    )
+    assert len(routes) == 3
+
+    best = routing.shortest_path(snapshot, source, target, weights)
+    costs = [weights.cost[route.edges].astype(np.float64).sum() for route in routes]
+    assert np.isclose(costs[0], weights.cost[best.edges].astype(np.float64).sum())
+    assert costs == sorted(costs) and costs[-1] <= MAX_STRETCH * costs[0]
+    for i, route in enumerate(routes):
+        # Simple paths from source to target
+        assert snapshot.source[route.edges[0]] == source
+        assert snapshot.target[route.edges[-1]] == target
+        assert np.array_equal(
+            snapshot.target[route.edges[:-1]], snapshot.source[route.edges[1:]]
+        )
+        nodes = snapshot.target[route.edges]
+        assert len(np.unique(nodes)) == len(nodes)
+        for other in routes[:i]:
+            shared = np.intersect1d(route.edges, other.edges)
+            assert snapshot.length[shared].sum() <= MAX_OVERLAP * route.length
+
+    assert len(alternative_routes(
+        snapshot, cost_matrix(snapshot, weights.cost), weights.cost,
+        source, target, count=1,
+    )) == 1
+
+
+def test_alternative_routes_single_path():
+    nodes = np.zeros(3, dtype=NODE_DTYPE)
+    nodes["id"] = [1, 2, 3]
+    edges = np.zeros(2, dtype=EDGE_DTYPE)
+    edges["id"] = [1, 2]
+    edges["source_id"] = [1, 2]
+    edges["target_id"] = [2, 3]
+    edges["length"] = [10, 20]
+    snapshot = build_snapshot(1, nodes, edges)
+    cost = snapshot.length.astype(np.float32)
+    matrix = cost_matrix(snapshot, cost)
+    (route,) = alternative_routes(snapshot, matrix, cost, 0, 2)
+    assert route.edges.tolist() == [0, 1] and route.length == 30
+    assert alternative_routes(snapshot, matrix, cost, 2, 0) == []
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from app.graph import ch, routing
+from app.tests.utils.synthetic import grid_graph
+
+
+# Fully contracted, partly contracted and all core hierarchies
+@pytest.mark.parametrize("core_nodes", [0, 40, ch.CORE_NODES])
+def test_hierarchy_matches_astar(core_nodes):
+    snapshot = grid_graph(12, 12, seed=3)
+    hierarchy = ch.build_hierarchy(snapshot, core_nodes=core_nodes)
+    assert sorted(hierarchy.rank.tolist()) == list(range(snapshot.n_nodes))
+    assert hierarchy.n_core <= core_nodes
+    rng = np.random.default_rng(3)
+    for source, target in rng.integers(0, snapshot.n_nodes, (40, 2)).tolist():
+        expected = routing.shortest_path(snapshot, source, target)
+        route = ch.shortest_path(hierarchy, snapshot, source, target)
+        assert route.length == expected.length
+        if source != target:
+            assert snapshot.source[route.edges[0]] == source
+            assert snapshot.target[route.edges[-1]] == target
+            assert np.array_equal(
+                snapshot.target[route.edges[:-1]], snapshot.source[route.edges[1:]]
+            )
+
+
+def test_hierarchy_save_load(tmp_path):
+    snapshot = grid_graph(5, 5)
+    hierarchy = ch.build_hierarchy(snapshot, core_nodes=5)
+    path = tmp_path / "graph.ch.npz"
+    hierarchy.save(path)
+    assert list(tmp_path.iterdir()) == [path]
+    loaded = ch.ContractionHierarchy.load(path, snapshot)
+    assert np.array_equal(loaded.up_edge, hierarchy.up_edge)
+    assert np.array_equal(loaded.core_dist, hierarchy.core_dist)
+    assert np.array_equal(loaded.core_pred, hierarchy.core_pred)
+    # The core tables are mapped rather than read
+    assert isinstance(loaded.core_dist.base, np.memmap)
+    assert ch.shortest_path(loaded, snapshot, 0, 24).length == (
+        routing.shortest_path(snapshot, 0, 24).length
+    )
+
+
+def test_hierarchy_load_mismatch(tmp_path):
+    path = tmp_path / "graph.ch.npz"
+    ch.build_hierarchy(grid_graph(5, 5)).save(path)
+    with pytest.raises(ch.HierarchyError):
+        ch.ContractionHierarchy.load(path, grid_graph(4, 4))
+
+
+def test_hierarchy_load_older_format(tmp_path):
+    snapshot = grid_graph(5, 5)
+    hierarchy = ch.build_hierarchy(snapshot)
+    path = tmp_path / "graph.ch.npz"
+    np.savez(path, graph_id=snapshot.graph_id, n_edges=snapshot.n_edges,
+             rank=hierarchy.rank, up_edge=hierarchy.up_edge)
+    with pytest.raises(ch.HierarchyError):
+        ch.ContractionHierarchy.load(path, snapshot)
+
+
+def test_hierarchy_load_compressed(tmp_path):
+    snapshot = grid_graph(5, 5)
+    hierarchy = ch.build_hierarchy(snapshot, core_nodes=5)
+    path = tmp_path / "graph.ch.npz"
+    np.savez_compressed(
+        path, graph_id=snapshot.graph_id, n_edges=snapshot.n_edges,
+        **{name: getattr(hierarchy, name) for name in ch._ARRAYS},
+    )
+    with pytest.raises(ch.HierarchyError):
+        ch.ContractionHierarchy.load(path, snapshot)
@@ -0,0 +1,220 @@
+import dataclasses
+
+import numpy as np
+
+from app.graph import routing, store
+from app.graph.ch import build_hierarchy
+from app.graph.delta import GraphDelta, apply_delta, edit_edges, load_delta
+from app.graph.elevation import ElevationProfiles
+from app.graph.geometry import EdgeGeometries
+from app.graph.importer import WGS84_WKT, GraphWriter, next_ids
+from app.graph.profiles import compile_profiles
+from app.graph.snapshot import EDGE_DTYPE, NODE_DTYPE
+from app.graph.snapshot_file import SnapshotFile, write_snapshot_file
+from app.models.graph import EdgeChange, EdgeOperation, Graph
+from app.schemas.route import ProfileEnum
+from app.tests.utils.synthetic import grid_elevations, grid_geometries, grid_graph
+
+
+def _snapshot_file():
+    snapshot = dataclasses.replace(grid_graph(5, 5, seed=2), graph_id=1)
+    geometries = dataclasses.replace(grid_geometries(snapshot), graph_id=1)
+    return SnapshotFile(
+        1,
+        1,
+        snapshot,
+        compile_profiles(snapshot),
+        geometries,
+        grid_elevations(geometries),
+    )
+
+
+def _delta(data: SnapshotFile) -> GraphDelta:
+    """ Delete edge 1, make edge 2 longer and insert edge 1000 to node 100. """
+    snapshot = data.snapshot
+    i = snapshot.edge_index(2)
+    edges = np.zeros(2, dtype=EDGE_DTYPE)
+    edges[0] = (
+        2,
+        snapshot.node_ids[snapshot.source[i]],
+        snapshot.node_ids[snapshot.target[i]],
+        0, 999, 0, 0, False,
+    )
+    edges[1] = (1000, 1, 100, 0, 50, 1, 0, False)
+    nodes = np.zeros(2, dtype=NODE_DTYPE)
+    nodes[0] = (1, snapshot.lon[0], snapshot.lat[0])
+    nodes[1] = (100, 2.3, 48.8)
+    geometries = EdgeGeometries(
+        1,
+        np.array([2, 1000]),
+        np.array([0, 2, 4]),
+        np.array([[1, 2], [3, 4], [5, 6], [7, 8]], dtype=np.int32),
+    )
+    # Edge 1000 has no elevation profile
+    elevations = ElevationProfiles(
+        1,
+        np.array([2, 1000]),
+        np.array([0, 2, 2]),
+        np.array([[0, 1000], [9990, 1020]], dtype=np.int32),
+    )
+    return GraphDelta(
+        1, 2, np.array([1, 2, 1000]), nodes, edges, geometries, elevations
+    )
+
+
+def test_apply_delta():
+    data = _snapshot_file()
+    before = data.snapshot.n_edges
+    result = apply_delta(data, _delta(data))
+    snapshot = result.snapshot
+
+    assert (result.graph_id, result.version) == (1, 2)
+    assert snapshot.n_edges == before
+    assert snapshot.n_nodes == data.snapshot.n_nodes + 1
+    assert 1 not in snapshot.edge_ids
+    assert snapshot.length[snapshot.edge_index(2)] == 999
+    e = snapshot.edge_index(1000)
+    assert snapshot.node_ids[snapshot.source[e]] == 1
+    assert snapshot.node_ids[snapshot.target[e]] == 100
+    assert result.weights[ProfileEnum.shortest].cost[e] == 50
+    # Unchanged edges keep their attributes
+    for edge_id in (3, 40):
+        old, new = data.snapshot.edge_index(edge_id), snapshot.edge_index(edge_id)
+        assert snapshot.length[new] == data.snapshot.length[old]
+        assert snapshot.node_ids[snapshot.source[new]] == data.snapshot.node_ids[
+            data.snapshot.source[old]
+        ]
+    # The previous snapshot is left as is
+    assert data.snapshot.n_edges == before and 1 in data.snapshot.edge_ids
+
+    geometries = result.geometries
+    assert geometries.edge_ids.tolist() == sorted(snapshot.edge_ids.tolist())
+    assert geometries.points(geometries.indices([2])[0]).tolist() == [[1, 2], [3, 4]]
+    assert geometries.points(geometries.indices([1000])[0]).tolist() == [
+        [5, 6], [7, 8]
+    ]
+    old = data.geometries
+    assert np.array_equal(
+        geometries.points(geometries.indices([40])[0]),
+        old.points(old.indices([40])[0]),
+    )
+
+    elevations, old = result.elevations, data.elevations
+    assert elevations.edge_ids.tolist() == geometries.edge_ids.tolist()
+    i, j = elevations.indices([2, 1000])
+    profile = elevations.values[elevations.offsets[i]:elevations.offsets[i + 1]]
+    assert profile.tolist() == [[0, 1000], [9990, 1020]]
+    assert elevations.offsets[j] == elevations.offsets[j + 1]
+    i, j = elevations.indices([40])[0], old.indices([40])[0]
+    assert np.array_equal(
+        elevations.values[elevations.offsets[i]:elevations.offsets[i + 1]],
+        old.values[old.offsets[j]:old.offsets[j + 1]],
+    )
+
+
+def test_refresh_swaps_versions(monkeypatch, tmp_path):
+    data = _snapshot_file()
+    version, deltas = {1: 1}, []
+
+    def load_delta(db, graph_id, since, until):
+        deltas.append((since, until))
+        return _delta(data)
+
+    def load_snapshot(db, graph_id):
+        raise AssertionError("the tables shall not be read again")
+
+    monkeypatch.setattr(store, "load_version", lambda db, id: version.get(id))
+    monkeypatch.setattr(store, "load_delta", load_delta)
+    monkeypatch.setattr(store, "load_snapshot", load_snapshot)
+    monkeypatch.setattr(store, "_files", {})
+    monkeypatch.setattr(store, "_snapshots", {})
+    monkeypatch.setattr(store, "_regions", store.OrderedDict())
+    monkeypatch.setattr(store, "_tile_versions", {})
+    monkeypatch.setattr(store.settings, "GRAPH_DATA_DIR", tmp_path)
+    write_snapshot_file(store.snapshot_path(1, 1), data)
+    weights = data.weights[ProfileEnum.flat]
+    build_hierarchy(data.snapshot, weights.cost).save(
+        store.hierarchy_path(1, 1, ProfileEnum.flat)
+    )
+
+    assert not store.refresh(None, 1)
+    old = store.get_snapshot(None, 1)
+    assert store.get_hierarchy(old, ProfileEnum.flat) is not None
+    store._regions[(1, (0,))] = old
+    store._tile_versions[1] = 1
+    assert not store.refresh(None, 1)
+    assert deltas == []
+
+    version[1] = 2
+    assert store.refresh(None, 1)
+    assert deltas == [(1, 2)]
+    new = store.get_snapshot(None, 1)
+    assert new is not old and 1000 in new.edge_ids
+    assert store.get_geometries(None, 1).n_edges == new.n_edges
+    assert store.snapshot_path(1, 2).exists()
+    assert not store.snapshot_path(1, 1).exists()
+    assert not store._regions
+    # The hierarchy of the previous version does not apply
+    assert not store.has_hierarchy(1, ProfileEnum.flat)
+    assert store.get_hierarchy(new, ProfileEnum.flat) is None
+
+    # Requests holding the previous version finish on it
+    assert store.get_hierarchy(old, ProfileEnum.flat) is not None
+    route = routing.shortest_path(
+        old, 0, old.n_nodes - 1, store.get_weights(old, ProfileEnum.flat)
+    )
+    assert route is not None and 1 in old.edge_ids
+
+    assert not store.refresh(None, 1)
+    # A deleted graph is evicted
+    del version[1]
+    assert store.refresh(None, 1)
+    assert 1 not in store._files and 1 not in store._snapshots
+
+
+def test_edit_edges_swaps_versions(session, monkeypatch, tmp_path):
+    monkeypatch.setattr(store, "_files", {})
+    monkeypatch.setattr(store, "_snapshots", {})
+    monkeypatch.setattr(store, "_regions", store.OrderedDict())
+    monkeypatch.setattr(store, "_tile_versions", {})
+    monkeypatch.setattr(store.settings, "GRAPH_DATA_DIR", tmp_path)
+    graph = Graph(crs=WGS84_WKT)
+    session.add(graph)
+    session.commit()
+    writer = GraphWriter(session, graph.id, *next_ids(session))
+    a, b, c = (2.0, 48.0), (2.001, 48.0), (2.001, 48.001)
+    writer.add_way(np.array([a, b]), 1)
+    writer.add_way(np.array([b, c]), 1)
+    writer.add_way(np.array([c, a]), 1)
+    writer.flush()
+
+    old = store.get_snapshot(session, graph.id)
+    assert store.get_file(session, graph.id).version == 1
+    first, second, third = sorted(old.edge_ids.tolist())
+    assert edit_edges(session, graph.id) == 1
+    assert edit_edges(session, graph.id, deleted=[first + 1000]) == 1
+
+    version = edit_edges(
+        session, graph.id, updates={second: {"length": 999}}, deleted=[third]
+    )
+    assert version == 2
+    assert session.get(Graph, graph.id).version == 2
+    changes = session.query(EdgeChange).filter_by(graph_id=graph.id).all()
+    assert [(c.version, c.edge_id, c.operation) for c in changes] == [
+        (2, second, EdgeOperation.update), (2, third, EdgeOperation.delete),
+    ]
+    delta = load_delta(session, graph.id, 1, 2)
+    assert delta.version == 2
+    assert sorted(delta.removed.tolist()) == [second, third]
+    assert delta.edges["id"].tolist() == [second]
+    assert delta.edges["length"].tolist() == [999]
+    assert load_delta(session, graph.id, 0, 2) is None
+
+    assert store.refresh(session, graph.id)
+    new = store.get_snapshot(session, graph.id)
+    assert new is not old
+    assert sorted(new.edge_ids.tolist()) == [first, second]
+    assert new.length[new.edge_index(second)] == 999
+    # Requests holding the previous version finish on it
+    assert sorted(old.edge_ids.tolist()) == [first, second, third]
+    assert old.length[old.edge_index(second)] != 999
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from app.graph.elevation import load_elevations, pack_elevations, route_elevation
+from app.graph.isochrone import tree_edges
+from app.graph.snapshot import EDGE_DTYPE, NODE_DTYPE, build_snapshot
+from app.tests.utils.synthetic import grid_elevations, grid_graph, subdivided_graph
+
+
+class ElevationSession:
+    """ Serve (id, packed profile) rows by partitions instead of a database. """
+
+    def __init__(self, rows, size):
+        self.rows, self.size = rows, size
+
+    def execute(self, stmt):
+        return self
+
+    def partitions(self):
+        for i in range(0, len(self.rows), self.size):
+            yield self.rows[i:i + self.size]
+
+
+def test_route_elevation():
+    # A way 1 -> 2 climbing, a way 2 -> 3 digitized from 3 going down, and an
+    # edge 3 -> 4 without a profile
+    lon = np.array([2.0, 2.0005, 2.001, 2.0015, 2.002])
+    lat = np.full(5, 48.0)
+    nodes = np.zeros(4, dtype=NODE_DTYPE)
+    nodes["id"] = [1, 2, 3, 4]
+    nodes["lon"], nodes["lat"] = [2.0, 2.001, 2.002, 2.003], 48.0
+    edges = np.zeros(3, dtype=EDGE_DTYPE)
+    edges["id"] = [10, 11, 12]
+    edges["source_id"] = [1, 2, 3]
+    edges["target_id"] = [2, 3, 4]
+    edges["length"] = [74, 74, 74]
+    edges["reversed"] = [False, True, False]
+    snapshot = build_snapshot(1, nodes, edges)
+    rows = [
+        (10, pack_elevations(lon[:3], lat[:3], np.array([100.0, 101.26, 103.0]))),
+        (11, pack_elevations(
+            lon[:1:-1], lat[:1:-1], np.array([99.95, 102.5, 103.0])
+        )),
+        (12, None),
+    ]
+    elevations = load_elevations(ElevationSession(rows, 2), 1)
+    assert elevations.edge_ids.tolist() == [10, 11, 12]
+    assert elevations.offsets.tolist() == [0, 3, 6, 6]
+    assert elevations.values.dtype == np.int32
+    assert elevations.values[:3].tolist() == [[0, 1000], [372, 1013], [744, 1030]]
+
+    distance, elevation = route_elevation(
+        snapshot, elevations, snapshot.edge_indices([10, 11, 12])
+    )
+    assert distance.tolist() == [0.0, 37.2, 74.4, 111.2, 148.4]
+    assert elevation.tolist() == [100.0, 101.3, 103.0, 102.5, 100.0]
+
+    empty = load_elevations(ElevationSession([], 2), 1)
+    assert empty.n_edges == 0 and empty.values.shape == (0, 2)
+    with pytest.raises(KeyError):
+        elevations.indices([13])
+
+
+def test_route_elevation_reversed():
+    snapshot, geometries = subdivided_graph(grid_graph(3, 3, seed=4), 5)
+    elevations = grid_elevations(geometries)
+    # Along a road cut into 5 edges, then back
+    nodes = np.array([snapshot.node_index(1)])
+    while len(nodes) < 6:
+        out = snapshot.out_edges(nodes[-1])
+        targets = snapshot.target[out]
+        nodes = np.append(nodes, targets[~np.isin(targets, nodes)][0])
+    forward = tree_edges(snapshot, snapshot.length, nodes[:-1], nodes[1:])
+    backward = tree_edges(snapshot, snapshot.length, nodes[:0:-1], nodes[-2::-1])
+    assert not snapshot.reversed[forward].any() and snapshot.reversed[backward].all()
+
+    distance, elevation = route_elevation(snapshot, elevations, forward)
+    back_distance, back_elevation = route_elevation(snapshot, elevations, backward)
+    # The shared end points of consecutive edges are kept once
+    assert len(distance) == 6
+    assert np.array_equal(back_elevation, elevation[::-1])
+    assert np.all(np.diff(distance) > 0) and np.all(np.diff(back_distance) > 0)
+    # Up to the rounding of edge lengths
+    assert np.allclose(back_distance, distance[-1] - distance[::-1], atol=2)
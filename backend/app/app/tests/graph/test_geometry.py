@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import shapely
+
+from app.graph.geometry import load_geometries
+from app.tests.utils.synthetic import grid_geometries, grid_graph
+
+
+class GeometrySession:
+    """ Serve (id, WKB) rows by partitions instead of a database. """
+
+    def __init__(self, rows, size):
+        self.rows, self.size = rows, size
+
+    def execute(self, stmt):
+        return self
+
+    def partitions(self):
+        for i in range(0, len(self.rows), self.size):
+            yield self.rows[i:i + self.size]
+
+
+def test_load_geometries():
+    lines = [
+        [(2.0, 48.0), (2.001, 48.0)],
+        [(2.001, 48.0), (2.001, 48.001), (2.002, 48.002)],
+        [(2.002, 48.002), (2.0, 48.0)],
+    ]
+    rows = [
+        (i, shapely.to_wkb(shapely.LineString(line)))
+        for i, line in zip([3, 5, 9], lines)
+    ]
+    geometries = load_geometries(GeometrySession(rows, 2), 1)
+    assert geometries.edge_ids.tolist() == [3, 5, 9]
+    assert geometries.offsets.tolist() == [0, 2, 5, 7]
+    assert geometries.coordinates.dtype == np.int32
+    assert geometries.points(1).tolist() == [
+        [20_010_000, 480_000_000], [20_010_000, 480_010_000], [20_020_000, 480_020_000]
+    ]
+    # The points of an edge are a view of the buffer
+    assert geometries.points(1).base is not None
+
+    empty = load_geometries(GeometrySession([], 2), 1)
+    assert empty.n_edges == 0 and empty.offsets.tolist() == [0]
+
+
+def test_path():
+    snapshot = grid_graph(3, 3)
+    geometries = grid_geometries(snapshot)
+    # Along the bottom row, then back
+    edges = np.array([
+        np.flatnonzero((snapshot.source == u) & (snapshot.target == v))[0]
+        for u, v in [(0, 1), (1, 2), (2, 1)]
+    ])
+    indices = geometries.indices(snapshot.edge_ids[edges])
+    points = geometries.path(indices, np.zeros(3, dtype=bool))
+    assert len(points) == 3 * 3 - 2
+    assert np.allclose(points[[0, 2, 4, 6]][:, 0], snapshot.lon[[0, 1, 2, 1]])
+    # Twin edges share their points, in opposite order
+    assert np.allclose(points[3], points[5])
+    # A geometry digitized against the travel direction is reversed
+    backward = geometries.path(indices[2:], np.array([True]))
+    assert np.allclose(backward, points[4:][::-1])
+
+    lines = geometries.lines(indices)
+    assert np.allclose(shapely.get_coordinates(lines[0]), points[:3])
+
+    with pytest.raises(KeyError):
+        geometries.indices(np.array([snapshot.edge_ids.max() + 1]))
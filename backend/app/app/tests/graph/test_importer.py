@@ -0,0 +1,119 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.graph.importer import (
+    GraphImportError, GraphWriter, is_cyclable, oneway, read_geojson_seq
+)
+
+
+class RecordingSession:
+    """ Collect the executemany rows instead of writing to a database.
+
+    Key lookups are answered with the last key of all the (source, target)
+    pairs written so far.
+    """
+
+    def __init__(self):
+        self.rows = {"node": [], "edge": []}
+        self.commits = 0
+        self.lookups = 0
+
+    def execute(self, stmt, rows=None):
+        if rows is not None:
+            self.rows[stmt.table.name].extend(rows)
+            return
+        self.lookups += 1
+        keys = {}
+        for e in self.rows["edge"]:
+            pair = (e["source_id"], e["target_id"])
+            keys[pair] = max(keys.get(pair, -1), e["key"])
+        return [(*pair, key) for pair, key in keys.items()]
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def test_oneway_tags():
+    assert oneway({"highway": "residential"}) == 0
+    assert oneway({"oneway": "yes"}) == 1
+    assert oneway({"oneway": "-1"}) == -1
+    assert oneway({"junction": "roundabout"}) == 1
+    assert oneway({"oneway": "yes", "oneway:bicycle": "no"}) == 0
+    assert is_cyclable({"highway": "cycleway"})
+    assert not is_cyclable({"highway": "motorway"})
+    assert not is_cyclable({"highway": "path", "bicycle": "no"})
+
+
+def test_graph_writer_batches():
+    db = RecordingSession()
+    writer = GraphWriter(db, 7, 100, 1000, batch_size=3)
+    a, b, c = (2.0, 48.0, 100.0), (2.001, 48.0, 110.0), (2.001, 48.001, 105.0)
+    writer.add_way(np.array([a, b]))
+    writer.add_way(np.array([a, c, b]), 1)
+    writer.add_way(np.array([b, c]), -1)
+    writer.flush()
+
+    assert db.commits == 2
+    assert [n["id"] for n in db.rows["node"]] == [100, 101, 102]
+    edges = db.rows["edge"]
+    assert [e["id"] for e in edges] == [1000, 1001, 1002, 1003]
+    assert [(e["source_id"], e["target_id"], e["key"]) for e in edges] == [
+        (100, 101, 0), (101, 100, 0), (100, 101, 1), (102, 101, 0),
+    ]
+    assert [e["reversed"] for e in edges] == [False, True, False, True]
+    assert edges[0]["length"] == edges[1]["length"] == 74
+    assert edges[2]["length"] == 245
+    assert (edges[0]["positive_elevation"], edges[0]["negative_elevation"]) == (10, 0)
+    assert (edges[1]["positive_elevation"], edges[1]["negative_elevation"]) == (0, 10)
+    assert (edges[2]["positive_elevation"], edges[2]["negative_elevation"]) == (10, 0)
+    assert writer.n_nodes == 3 and writer.n_edges == 4
+
+
+def test_graph_writer_spills_evicted_nodes():
+    db = RecordingSession()
+    writer = GraphWriter(db, 7, 100, 1000, batch_size=2, node_cache_size=1)
+    a, b, c = (2.0, 48.0), (2.001, 48.0), (2.001, 48.001)
+    writer.add_way(np.array([a, b]))
+    writer.add_way(np.array([b, c]), 1)
+    writer.add_way(np.array([a, b]), 1)
+    writer.flush()
+
+    assert [n["id"] for n in db.rows["node"]] == [100, 101, 102]
+    assert [(e["source_id"], e["target_id"], e["key"]) for e in db.rows["edge"]] == [
+        (100, 101, 0), (101, 100, 0), (101, 102, 0), (100, 101, 1),
+    ]
+    assert len(writer._node_ids) == 1
+    assert db.lookups == 1
+    writer.close()
+
+
+def test_read_geojson_seq(tmp_path):
+    features = [
+        {"type": "Feature", "properties": {"highway": "residential"},
+         "geometry": {"type": "LineString", "coordinates": [[2, 48], [2.1, 48]]}},
+        {"type": "Feature", "properties": {"highway": "motorway"},
+         "geometry": {"type": "LineString", "coordinates": [[2, 48], [2, 48.1]]}},
+        {"type": "Feature", "properties": {"oneway": "yes"},
+         "geometry": {"type": "MultiLineString",
+                      "coordinates": [[[2, 48], [2, 49]], [[3, 48], [3, 49]]]}},
+    ]
+    path = tmp_path / "roads.geojsonl"
+    path.write_text("\n".join(json.dumps(f) for f in features) + "\n\n")
+    ways = []
+    read_geojson_seq(path, lambda coordinates, direction: ways.append(
+        (coordinates.tolist(), direction)
+    ))
+    assert ways == [
+        ([[2, 48], [2.1, 48]], 0),
+        ([[2, 48], [2, 49]], 1),
+        ([[3, 48], [3, 49]], 1),
+    ]
+
+    path.write_text("not json\n")
+    with pytest.raises(GraphImportError):
+        read_geojson_seq(path, lambda coordinates, direction: None)
@@ -0,0 +1,45 @@
+import numpy as np
+import shapely
+from scipy.sparse.csgraph import dijkstra
+
+from app.graph.isochrone import concave_hull, cost_matrix, reachable
+from app.tests.utils.synthetic import grid_graph
+
+
+def test_reachable():
+    snapshot = grid_graph(30, 30, seed=2)
+    cost = snapshot.length.astype(np.float32)
+    matrix = cost_matrix(snapshot, cost)
+    origin, budget = 15 * 30 + 15, 800.0
+    reach = reachable(snapshot, matrix, cost, origin, budget)
+
+    dist = dijkstra(matrix, indices=origin)
+    assert reach.nodes.tolist() == np.flatnonzero(dist <= budget).tolist()
+    assert np.allclose(reach.cost, dist[reach.nodes])
+    ridden = dist[snapshot.source[reach.edges]] + cost[reach.edges]
+    assert np.all(ridden <= budget)
+    assert len(reach.edges) == np.count_nonzero(dist[snapshot.source] + cost <= budget)
+
+
+def test_cost_matrix_parallel_edges():
+    snapshot = grid_graph(3, 3)
+    cost = np.ones(snapshot.n_edges, dtype=np.float32)
+    matrix = cost_matrix(snapshot, cost)
+    assert matrix.nnz == snapshot.n_edges
+
+
+def test_concave_hull():
+    snapshot = grid_graph(30, 30, seed=2)
+    cost = snapshot.length.astype(np.float32)
+    origin = 15 * 30 + 15
+    reach = reachable(snapshot, cost_matrix(snapshot, cost), cost, origin, 800.0)
+    hull = concave_hull(snapshot, reach)
+    assert hull.is_valid
+    assert hull.contains(shapely.Point(snapshot.lon[origin], snapshot.lat[origin]))
+    # Tighter than the bounding box of the reached nodes, a diamond on a grid
+    lon, lat = snapshot.lon[reach.nodes], snapshot.lat[reach.nodes]
+    box = shapely.box(lon.min(), lat.min(), lon.max(), lat.max())
+    assert hull.area < 0.8 * box.area
+
+    single = reachable(snapshot, cost_matrix(snapshot, cost), cost, origin, 1.0)
+    assert concave_hull(snapshot, single).is_valid
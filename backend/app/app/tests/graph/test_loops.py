@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.graph.loops import generate_loops
+from app.graph.profiles import compile_profiles
+from app.graph.spatial import NodeIndex
+from app.tests.utils.synthetic import grid_graph
+
+
+def test_generate_loops():
+    snapshot = grid_graph(60, 60, seed=5)
+    home = 30 * 60 + 30
+    loops = generate_loops(
+        snapshot,
+        compile_profiles(snapshot),
+        NodeIndex(snapshot),
+        home,
+        4000,
+        80,
+        count=3,
+        seed=5,
+    )
+    assert 1 <= len(loops) <= 3
+    for loop in loops:
+        assert snapshot.source[loop.edges[0]] == home
+        assert snapshot.target[loop.edges[-1]] == home
+        assert np.array_equal(
+            snapshot.target[loop.edges[:-1]], snapshot.source[loop.edges[1:]]
+        )
+        assert abs(loop.length - 4000) < 2000
+    assert len({tuple(loop.edges.tolist()) for loop in loops}) == len(loops)
+
+
+def test_generate_loops_time_budget():
+    snapshot = grid_graph(40, 40, seed=5)
+    loops = generate_loops(
+        snapshot,
+        compile_profiles(snapshot),
+        NodeIndex(snapshot),
+        0,
+        3000,
+        budget=0.0,
+        seed=5,
+    )
+    assert loops
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.graph import matching, routing
+from app.graph.matching import MatchingError, match_trace
+from app.graph.spatial import NodeIndex
+from app.tests.utils.synthetic import gps_trace, grid_geometries, grid_graph
+
+
+def test_match_trace():
+    snapshot = grid_graph(40, 40, seed=3)
+    index = NodeIndex(snapshot)
+    edges = np.concatenate([
+        routing.shortest_path(snapshot, 0, 40 * 40 - 1).edges,
+        routing.shortest_path(snapshot, 40 * 40 - 1, 20 * 40 + 5).edges,
+    ])
+    lon, lat = gps_trace(snapshot, edges, spacing=4.0, noise=5.0, seed=3)
+    matched = match_trace(snapshot, index, lon, lat)
+    # A connected path, recovering the ridden edges
+    assert np.array_equal(
+        snapshot.target[matched[:-1]], snapshot.source[matched[1:]]
+    )
+    found = set(matched.tolist())
+    assert found.issuperset(edges[1:-1].tolist())
+    assert len(found - set(edges.tolist())) <= 2
+
+
+def test_match_trace_geometries():
+    snapshot = grid_graph(30, 30, seed=4)
+    geometries = grid_geometries(snapshot, bend=0.4, seed=4)
+    index = NodeIndex(snapshot)
+    edges = routing.shortest_path(snapshot, 0, 30 * 30 - 1).edges
+    lon, lat = gps_trace(
+        snapshot, edges, spacing=4.0, noise=3.0, seed=4, geometries=geometries
+    )
+    matched = match_trace(snapshot, index, lon, lat, geometries)
+    assert set(matched.tolist()).issuperset(edges[1:-1].tolist())
+    assert len(set(matched.tolist()) - set(edges.tolist())) <= 2
+
+
+def test_match_trace_bridges_gaps(monkeypatch):
+    snapshot = grid_graph(20, 20, seed=5)
+    index = NodeIndex(snapshot)
+    edges = routing.shortest_path(snapshot, 0, 20 * 20 - 1).edges
+    # Fixes further apart than edges
+    lon, lat = gps_trace(snapshot, edges, spacing=150.0, noise=2.0, seed=5)
+    matched = match_trace(snapshot, index, lon, lat)
+    assert np.array_equal(
+        snapshot.target[matched[:-1]], snapshot.source[matched[1:]]
+    )
+    assert set(matched.tolist()).issuperset(edges.tolist())
+
+    # Gaps are left unbridged beyond the allowed detour
+    monkeypatch.setattr(matching, "GAP_DETOUR", 0.5)
+    monkeypatch.setattr(matching, "GAP_MARGIN", 0.0)
+    matched = match_trace(snapshot, index, lon, lat)
+    assert np.any(snapshot.target[matched[:-1]] != snapshot.source[matched[1:]])
+
+
+def test_match_trace_off_graph():
+    snapshot = grid_graph(10, 10)
+    with pytest.raises(MatchingError):
+        match_trace(
+            snapshot, NodeIndex(snapshot), np.array([3.0, 3.001]), np.array([45.0, 45.0])
+        )
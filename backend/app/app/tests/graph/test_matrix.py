@@ -0,0 +1,53 @@
+import numpy as np
+
+from app.graph import routing
+from app.graph.isochrone import cost_matrix
+from app.graph.matrix import distance_matrix
+from app.graph.profiles import compile_profile
+from app.graph.snapshot import EDGE_DTYPE, NODE_DTYPE, build_snapshot
+from app.schemas.route import ProfileEnum
+from app.tests.utils.synthetic import grid_graph
+
+
+def test_distance_matrix():
+    snapshot = grid_graph(20, 20, seed=3)
+    weights = compile_profile(snapshot, ProfileEnum.flat)
+    sources = np.array([0, 210, 399, 0])
+    targets = np.array([399, 0, 57, 210, 123])
+    result = distance_matrix(
+        snapshot,
+        cost_matrix(snapshot, weights.cost),
+        weights.cost,
+        sources,
+        targets,
+    )
+    assert result.length.shape == (4, 5)
+    for i, source in enumerate(sources):
+        for j, target in enumerate(targets):
+            route = routing.shortest_path(snapshot, source, target, weights)
+            cost = weights.cost[route.edges].astype(np.float64).sum()
+            assert np.isclose(result.cost[i, j], cost)
+            assert result.length[i, j] == route.length
+            assert result.elevation_gain[i, j] == route.elevation_gain
+            assert result.elevation_loss[i, j] == route.elevation_loss
+    assert result.length[1, 3] == 0 and result.cost[1, 3] == 0
+
+
+def test_distance_matrix_unreachable():
+    # A one way 1 -> 2 -> 3, parallel edges from 1 to 2, and an isolated node
+    nodes = np.zeros(4, dtype=NODE_DTYPE)
+    nodes["id"] = [1, 2, 3, 4]
+    edges = np.zeros(3, dtype=EDGE_DTYPE)
+    edges["id"] = [1, 2, 3]
+    edges["source_id"] = [1, 1, 2]
+    edges["target_id"] = [2, 2, 3]
+    edges["length"] = [50, 30, 20]
+    edges["positive_elevation"] = [0, 5, 1]
+    snapshot = build_snapshot(1, nodes, edges)
+    cost = snapshot.length.astype(np.float32)
+    result = distance_matrix(
+        snapshot, cost_matrix(snapshot, cost), cost, [0, 2], [2, 3, 0]
+    )
+    assert result.length.tolist() == [[50, -1, 0], [0, -1, -1]]
+    assert result.elevation_gain.tolist() == [[6, -1, 0], [0, -1, -1]]
+    assert np.isinf(result.cost[1, 1:]).all()
@@ -0,0 +1,152 @@
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import shapely
+
+from app.graph import store
+from app.graph.geometry import EdgeGeometries
+from app.graph.mvt import EXTENT, encode_layer, render_tile, tile_bounds
+from app.tests.utils.mvt import (
+    TileSession, decode_message, tile_features, unpack_varints,
+)
+
+
+def test_tile_bounds():
+    assert tile_bounds(0, 0, 0) == (-180, -85.0511287798066, 180, 85.0511287798066)
+    west, south, east, north = tile_bounds(12, 2074, 1409)
+    assert west < 2.35 < east and south < 48.85 < north
+
+
+def test_encode_layer():
+    z, x, y = 12, 2074, 1409
+    west, south, east, north = tile_bounds(z, x, y)
+    dx, dy = (east - west) / 4, (north - south) / 4
+    geometries = np.array([
+        # Inside, with a point closer than a unit to the previous one
+        shapely.LineString([
+            (west + dx, south + dy),
+            (west + dx + 1e-9, south + dy),
+            (west + 2 * dx, south + 2 * dy),
+            (west + 3 * dx, south + dy),
+        ]),
+        # Crossing the tile twice, clipped in two parts
+        shapely.LineString([
+            (west - dx, north - dy), (west + dx, north - dy),
+            (west - dx, south + dy), (west - dx, south + 2 * dy),
+            (west + dx, south + 2 * dy),
+        ]),
+        # Outside
+        shapely.LineString([(east + dx, north), (east + 2 * dx, north)]),
+    ])
+    tile = encode_layer(
+        geometries,
+        np.array([10, 20, 30]),
+        {"oneway": np.array([0, -1, 1]), "popularity": np.array([0, 7, 1])},
+        z, x, y,
+    )
+    layer, features = tile_features(tile)
+    assert layer[1] == [b"edges"] and layer[5] == [EXTENT] and layer[15] == [2]
+    assert [f["id"] for f in features] == [10, 20]
+    assert [f["type"] for f in features] == [2, 2]
+    assert (features[0]["oneway"], features[0]["popularity"]) == (0, 0)
+    assert (features[1]["oneway"], features[1]["popularity"]) == (-1, 7)
+    # Latitudes are not linear in Web Mercator
+    assert np.allclose(
+        features[0]["lines"], [[(1024, 3072), (2048, 2048), (3072, 3072)]], atol=2
+    )
+    first, second = features[1]["lines"]
+    assert first == [(-64, 1024), (1024, 1024), (-64, 2112)]
+    assert np.allclose(second, [(-64, 2048), (1024, 2048)], atol=2)
+    # Cursor is reset at each feature
+    feature = decode_message(decode_message(decode_message(tile)[3][0])[2][1])
+    assert unpack_varints(feature[4][0])[:3] == [9, 127, 2048]
+
+    empty = encode_layer(geometries[2:], np.array([30]), {}, z, x, y)
+    assert empty == b""
+
+
+def test_encode_layer_simplifies():
+    z, x, y = 14, 8298, 5636
+    west, south, east, north = tile_bounds(z, x, y)
+    lon = np.linspace(west, east, 5000)
+    lat = (south + north) / 2 + np.sin(np.linspace(0, 4, 5000)) * 1e-5
+    tile = encode_layer(
+        np.array([shapely.linestrings(lon, lat)]), np.array([1]), {}, z, x, y
+    )
+    _, (feature,) = tile_features(tile)
+    assert 2 <= len(feature["lines"][0]) < 50
+
+
+def test_render_tile_merges_twins():
+    z, x, y = 12, 2074, 1409
+    west, south, east, north = tile_bounds(z, x, y)
+    middle = ((west + east) / 2, (south + north) / 2)
+    lines = [
+        [(west, south), (east, north)],
+        [(west, south), (east, north)],
+        [(west, north), (east, south)],
+        # Parallel to the first road, between the same nodes
+        [(west, south), (middle[0], north), (east, north)],
+        [(west, south), (middle[0], north), (east, north)],
+    ]
+    geometries = EdgeGeometries(
+        1,
+        np.array([1, 2, 5, 6, 7]),
+        np.array([0, 2, 4, 6, 9, 12]),
+        np.rint(
+            np.concatenate([np.array(line) for line in lines]) * 1e7
+        ).astype(np.int32),
+    )
+    # Edge 9 was inserted after the version of the geometries
+    db = TileSession([
+        (1, False, 3), (7, True, 2), (2, True, 4), (9, False, 2), (5, True, 1),
+        (6, False, 0),
+    ])
+    _, features = tile_features(render_tile(db, geometries, z, x, y))
+    assert [(f["id"], f["oneway"], f["popularity"]) for f in features] == [
+        (1, 0, 7), (6, 0, 2), (5, -1, 1)
+    ]
+    assert render_tile(TileSession([]), geometries, z, x, y) == b""
+    assert render_tile(TileSession([(9, False, 2)]), geometries, z, x, y) == b""
+
+
+def test_vector_tile_cache(monkeypatch, tmp_path):
+    renders = []
+
+    def render(db, geometries, z, x, y):
+        renders.append((geometries, z, x, y))
+        return b"tile %d" % len(renders)
+
+    files = {1: SimpleNamespace(version=1, geometries="geometries")}
+    now = [time.time()]
+    monkeypatch.setattr(store.time, "time", lambda: now[0])
+    monkeypatch.setattr(store, "render_tile", render)
+    monkeypatch.setattr(store, "get_file", lambda db, id: files.get(id))
+    monkeypatch.setattr(store, "_vector_tiles", store.OrderedDict())
+    monkeypatch.setattr(store, "_vector_tiles_size", 0)
+    monkeypatch.setattr(store.settings, "GRAPH_DATA_DIR", tmp_path)
+
+    assert store.get_vector_tile(None, 2, 12, 0, 0) is None
+    assert store.get_vector_tile(None, 1, 12, 0, 0) == b"tile 1"
+    assert store.get_vector_tile(None, 1, 12, 0, 0) == b"tile 1"
+    assert store.vector_tile_path(1, 1, 12, 0, 0).read_bytes() == b"tile 1"
+    # Another worker reads the disk cache
+    store._vector_tiles.clear()
+    assert store.get_vector_tile(None, 1, 12, 0, 0) == b"tile 1"
+    assert len(renders) == 1
+    # A new version is rendered again
+    files[1] = SimpleNamespace(version=2, geometries="geometries")
+    assert store.get_vector_tile(None, 1, 12, 0, 0) == b"tile 2"
+    assert len(renders) == 2
+    # And so is the next period, for its edge popularity, in memory and on
+    # disk
+    now[0] += store.settings.VECTOR_TILE_TTL
+    assert 0 < store.vector_tile_max_age() <= store.settings.VECTOR_TILE_TTL
+    assert store.get_vector_tile(None, 1, 12, 0, 0) == b"tile 3"
+    path = store.vector_tile_path(1, 2, 12, 0, 0)
+    os.utime(path, (now[0], now[0]))
+    store._vector_tiles.clear()
+    assert store.get_vector_tile(None, 1, 12, 0, 0) == b"tile 3"
+    assert len(renders) == 3
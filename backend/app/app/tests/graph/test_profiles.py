@@ -0,0 +1,36 @@
+import numpy as np
+
+from app.graph import routing
+from app.graph.profiles import PROFILES, compile_profile, compile_profiles
+from app.schemas.route import ProfileEnum
+from app.tests.utils.synthetic import grid_graph
+
+
+def test_compile_profiles():
+    snapshot = grid_graph(6, 6, seed=2)
+    weights = compile_profiles(snapshot)
+    assert set(weights) == set(PROFILES)
+    for profile, w in weights.items():
+        assert w.profile is profile
+        assert w.cost.dtype == np.float32
+        assert w.cost.shape == (snapshot.n_edges,)
+        assert np.all(w.cost >= w.scale * snapshot.length - 1e-3)
+    assert np.array_equal(weights[ProfileEnum.shortest].cost, snapshot.length)
+
+
+def test_flat_profile_penalizes_climbs():
+    snapshot = grid_graph(6, 6, seed=2)
+    flat = compile_profile(snapshot, ProfileEnum.flat).cost
+    climbing = snapshot.positive_elevation > 0
+    assert np.all(flat[climbing] > snapshot.length[climbing])
+    assert np.all(flat[~climbing] >= snapshot.length[~climbing])
+
+
+def test_profile_routing():
+    snapshot = grid_graph(10, 10, seed=4)
+    shortest = routing.shortest_path(snapshot, 0, 99)
+    flat = routing.shortest_path(
+        snapshot, 0, 99, compile_profile(snapshot, ProfileEnum.flat)
+    )
+    assert flat.length >= shortest.length
+    assert flat.elevation_gain <= shortest.elevation_gain
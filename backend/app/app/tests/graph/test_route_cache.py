@@ -0,0 +1,153 @@
+import dataclasses
+
+import numpy as np
+
+from app.graph import routing, store
+from app.graph.profiles import compile_profiles
+from app.graph.route_cache import ENTRY_OVERHEAD, CachedRoute, RouteCache
+from app.graph.snapshot_file import SnapshotFile
+from app.graph.tiles import corridor
+from app.schemas.route import ProfileEnum
+from app.tests.utils.graph import tiled_arrays
+from app.tests.utils.synthetic import grid_graph
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _route(n_edges):
+    return CachedRoute(np.arange(n_edges, dtype=np.int64), 10 * n_edges, 1, 2)
+
+
+def test_route_cache_eviction():
+    clock = Clock()
+    cache = RouteCache(3 * (ENTRY_OVERHEAD + 80), ttl=60, clock=clock)
+    for i in range(3):
+        cache.put((1, 1, "shortest", i, 0), _route(10))
+    assert cache.get((1, 1, "shortest", 0, 0))[1].length == 100
+    # The least recently used route is evicted
+    cache.put((1, 1, "shortest", 3, 0), _route(10))
+    assert cache.get((1, 1, "shortest", 1, 0)) == (False, None)
+    assert cache.get((1, 1, "shortest", 0, 0))[0]
+    # Unreachable targets are cached, routes too large for the budget are not
+    cache.put((1, 1, "fastest", 0, 1), None)
+    assert cache.get((1, 1, "fastest", 0, 1)) == (True, None)
+    cache.put((1, 1, "fastest", 0, 2), _route(1000))
+    assert not cache.get((1, 1, "fastest", 0, 2))[0]
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.evictions) == (3, 2, 2)
+    assert stats.entries == 3 and stats.size <= cache.max_size
+
+
+def test_route_cache_expiration():
+    clock = Clock()
+    cache = RouteCache(10_000, ttl=60, clock=clock)
+    cache.put((1, 1, "shortest", 0, 1), _route(2))
+    cache.put((2, 1, "shortest", 0, 1), _route(2))
+    clock.now = 59
+    assert cache.get((1, 1, "shortest", 0, 1))[0]
+    # Hits do not extend the lifetime of routes
+    clock.now = 60
+    assert not cache.get((1, 1, "shortest", 0, 1))[0]
+    assert cache.stats().expirations == 1
+
+    cache.put((2, 2, "shortest", 0, 1), _route(2))
+    cache.invalidate(2, version=2)
+    assert cache.stats().entries == 1
+    cache.invalidate(2)
+    assert cache.stats().entries == 0 and cache.stats().size == 0
+
+
+def test_store_get_route(monkeypatch):
+    monkeypatch.setattr(store, "_files", {})
+    monkeypatch.setattr(store, "_snapshots", {})
+    monkeypatch.setattr(store, "_routes", RouteCache(10_000, ttl=60))
+    snapshot = dataclasses.replace(grid_graph(10, 10, seed=1), graph_id=1)
+    data = SnapshotFile(1, 1, snapshot, compile_profiles(snapshot), None, None)
+    with store._lock:
+        store._install(data)
+    searches = []
+
+    def search(snapshot, source, target):
+        def run():
+            searches.append((source, target))
+            return routing.shortest_path(snapshot, source, target)
+        return run
+
+    route = store.get_route(snapshot, ProfileEnum.shortest, 0, 99, search(
+        snapshot, 0, 99
+    ))
+    expected = routing.shortest_path(snapshot, 0, 99)
+    assert route.edge_ids.tolist() == snapshot.edge_ids[expected.edges].tolist()
+    assert route.length == expected.length
+    # Another snapshot of the same version, by node ids
+    region = dataclasses.replace(snapshot)
+    store._derive(region, version=1)
+    store.get_route(region, ProfileEnum.shortest, 0, 99, search(region, 0, 99))
+    store.get_route(snapshot, ProfileEnum.fastest, 0, 99, search(snapshot, 0, 99))
+    assert len(searches) == 2
+    assert store.route_cache_stats().hits == 1
+
+    # A new version is searched again
+    with store._lock:
+        store._install(dataclasses.replace(data, version=2))
+    assert store.route_cache_stats().entries == 0
+    store.get_route(snapshot, ProfileEnum.shortest, 0, 99, search(
+        snapshot, 0, 99
+    ))
+    assert len(searches) == 3
+
+
+def test_store_get_route_on_regions(monkeypatch):
+    snapshot = dataclasses.replace(grid_graph(10, 10, seed=1), graph_id=1)
+    versions = {1: 1}
+    monkeypatch.setattr(store, "load_version", lambda db, id: versions.get(id))
+    monkeypatch.setattr(
+        store, "load_tiles", lambda db, graph_id, tiles: {
+            tile: tiled_arrays(snapshot)[tile] for tile in tiles
+        }
+    )
+    monkeypatch.setattr(store, "_files", {})
+    monkeypatch.setattr(store, "_tiles", store.OrderedDict())
+    monkeypatch.setattr(store, "_regions", store.OrderedDict())
+    monkeypatch.setattr(store, "_tile_versions", {})
+    monkeypatch.setattr(store, "_routes", RouteCache(10_000, ttl=60))
+    bbox = corridor(snapshot.lon, snapshot.lat, 100)
+    searches = []
+
+    def route(region):
+        def search():
+            searches.append(region)
+            return routing.shortest_path(region, 0, 1)
+        return store.get_route(region, ProfileEnum.shortest, 0, 1, search)
+
+    region = store.get_region(None, 1, bbox)
+    route(region)
+    route(region)
+    assert len(searches) == 1
+    # Routes of regions are dropped with their tiles on a new version
+    versions[1] = 2
+    assert store.refresh(None, 1)
+    assert store.route_cache_stats().entries == 0
+    route(store.get_region(None, 1, bbox))
+    assert len(searches) == 2
+
+    # Routes of regions are not shared with whole graph searches
+    store._derive(snapshot, version=2)
+    store.get_route(snapshot, ProfileEnum.shortest, 0, 1, lambda: (
+        searches.append(snapshot) or routing.shortest_path(snapshot, 0, 1)
+    ))
+    assert len(searches) == 3
+    # Nor are targets a region does not reach
+    for _ in range(2):
+        assert store.get_route(
+            region, ProfileEnum.shortest, 0, 2, lambda: searches.append(region)
+        ) is None
+    assert len(searches) == 5
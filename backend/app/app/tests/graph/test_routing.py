@@ -0,0 +1,65 @@
+import numpy as np
+
+from app.graph import routing
+from app.graph.snapshot import EDGE_DTYPE, NODE_DTYPE, build_snapshot
+from app.tests.utils.synthetic import grid_graph
+
+
+def _dijkstra_length(snapshot, source, target):
+    # Reference Bellman-Ford relaxation over the whole edge arrays
+    dist = np.full(snapshot.n_nodes, np.inf)
+    dist[source] = 0
+    for _ in range(snapshot.n_nodes):
+        candidate = dist[snapshot.source] + snapshot.length
+        updated = dist.copy()
+        np.minimum.at(updated, snapshot.target, candidate)
+        if np.array_equal(updated, dist):
+            break
+        dist = updated
+    return dist[target]
+
+
+def test_shortest_path_is_optimal():
+    snapshot = grid_graph(8, 9, seed=1)
+    for source, target in [(0, 71), (5, 66), (70, 3)]:
+        route = routing.shortest_path(snapshot, source, target)
+        assert route.length == _dijkstra_length(snapshot, source, target)
+        assert snapshot.source[route.edges[0]] == source
+        assert snapshot.target[route.edges[-1]] == target
+        assert np.array_equal(
+            snapshot.target[route.edges[:-1]], snapshot.source[route.edges[1:]]
+        )
+        assert route.elevation_gain == snapshot.positive_elevation[route.edges].sum()
+        assert route.elevation_loss == snapshot.negative_elevation[route.edges].sum()
+
+
+def test_shortest_path_same_node():
+    snapshot = grid_graph(3, 3)
+    route = routing.shortest_path(snapshot, 4, 4)
+    assert len(route.edges) == 0
+    assert route.length == 0
+
+
+def test_shortest_path_unreachable():
+    nodes = np.array([(1, 2.0, 48.0), (2, 2.1, 48.0)], dtype=NODE_DTYPE)
+    edges = np.array([(1, 2, 1, 0, 8000, 0, 0, False)], dtype=EDGE_DTYPE)
+    snapshot = build_snapshot(1, nodes, edges)
+    assert routing.shortest_path(snapshot, 0, 1) is None
+    assert routing.shortest_path(snapshot, 1, 0).length == 8000
+
+
+def test_shortest_path_penalties_and_limits():
+    snapshot = grid_graph(8, 9, seed=1)
+    route = routing.shortest_path(snapshot, 0, 71)
+    avoided = int(snapshot.target[route.edges[len(route.edges) // 2]])
+    detour = routing.shortest_path(snapshot, 0, 71, penalties={avoided: 1e6})
+    assert avoided not in snapshot.target[detour.edges]
+    assert detour.length >= route.length
+    assert routing.shortest_path(snapshot, 0, 71, max_settled=5) is None
+    assert routing.shortest_path(snapshot, 0, 71, max_settled=72).length == (
+        route.length
+    )
+    assert routing.shortest_path(snapshot, 0, 71, max_cost=route.length / 2) is None
+    assert routing.shortest_path(snapshot, 0, 71, max_cost=route.length + 1).length == (
+        route.length
+    )
@@ -0,0 +1,110 @@
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from app.graph.elevation import route_elevation
+from app.graph.geometry import EdgeGeometries
+from app.graph.isochrone import cost_matrix
+from app.graph.simplify import simplify
+from app.graph.snapshot import EDGE_DTYPE, NODE_DTYPE, build_snapshot
+from app.tests.utils.synthetic import grid_elevations, grid_graph, subdivided_graph
+
+
+def test_simplify_subdivided_grid():
+    grid = grid_graph(5, 5, seed=2)
+    snapshot, geometries = subdivided_graph(grid, 4)
+    elevations = grid_elevations(geometries)
+    simplified = simplify(snapshot, geometries, elevations)
+    result = simplified.snapshot
+    # Shape nodes and the grid corners are removed
+    assert (snapshot.n_nodes, snapshot.n_edges) == (145, 320)
+    assert (result.n_nodes, result.n_edges) == (21, 72)
+
+    # Routes between kept nodes are unchanged
+    kept = snapshot.node_indices(result.node_ids)
+    before = dijkstra(cost_matrix(snapshot, snapshot.length.astype(np.float32)))
+    after = dijkstra(cost_matrix(result, result.length.astype(np.float32)))
+    assert np.array_equal(before[np.ix_(kept, kept)], after)
+
+    # Each original edge is merged once, in travel order
+    assert np.array_equal(
+        np.sort(simplified.original_ids), np.sort(snapshot.edge_ids)
+    )
+    for i, edge_id in enumerate(simplified.geometries.edge_ids):
+        e = result.edge_index(edge_id)
+        original = snapshot.edge_indices(simplified.original_edges([edge_id]))
+        assert np.array_equal(
+            snapshot.target[original[:-1]], snapshot.source[original[1:]]
+        )
+        assert result.node_ids[result.source[e]] == snapshot.node_ids[
+            snapshot.source[original[0]]
+        ]
+        assert result.length[e] == snapshot.length[original].sum()
+        assert result.positive_elevation[e] == (
+            snapshot.positive_elevation[original].sum()
+        )
+        lengths = snapshot.length[original]
+        starts = simplified.starts[simplified.offsets[i]:simplified.offsets[i + 1]]
+        assert starts.tolist() == (np.cumsum(lengths) - lengths).tolist()
+        assert np.allclose(
+            simplified.geometries.path(np.array([i]), result.reversed[[e]]),
+            geometries.path(
+                geometries.indices(snapshot.edge_ids[original]),
+                snapshot.reversed[original],
+            ),
+        )
+        for a, b in zip(
+            route_elevation(result, simplified.elevations, [e]),
+            route_elevation(snapshot, elevations, original),
+        ):
+            assert np.array_equal(a, b)
+
+    # Both directions of a road share their geometry
+    reversed_ids = result.edge_ids[result.reversed]
+    twins = result.edge_ids[~result.reversed]
+    assert len(reversed_ids) == len(twins)
+    shared = {
+        simplified.geometries.points(i).tobytes()
+        for i in simplified.geometries.indices(twins)
+    }
+    for i in simplified.geometries.indices(reversed_ids):
+        assert simplified.geometries.points(i).tobytes() in shared
+
+
+def test_simplify_one_way():
+    # A one way 1 -> 2 -> 3 along a direct edge 1 -> 3, an exit of 3 and a
+    # loop 6 -> 7 -> 8 -> 6 of shape nodes
+    nodes = np.zeros(8, dtype=NODE_DTYPE)
+    nodes["id"] = np.arange(1, 9)
+    nodes["lon"] = np.arange(8) * 0.001
+    edges = np.zeros(7, dtype=EDGE_DTYPE)
+    edges["id"] = [1, 2, 3, 4, 5, 6, 7]
+    edges["source_id"] = [1, 2, 1, 3, 6, 7, 8]
+    edges["target_id"] = [2, 3, 3, 4, 7, 8, 6]
+    edges["length"] = [10, 20, 40, 5, 1, 1, 1]
+    edges["negative_elevation"] = [1, 2, 0, 0, 0, 0, 0]
+    edges["reversed"] = [False, True, False, False, False, False, False]
+    snapshot = build_snapshot(1, nodes, edges)
+    geometries = EdgeGeometries(
+        1,
+        edges["id"],
+        np.arange(0, 15, 2, dtype=np.int64),
+        np.array([
+            [0, 0], [10_000, 0], [20_000, 0], [10_000, 0], [0, 0], [20_000, 0],
+            [20_000, 0], [30_000, 0], [50_000, 0], [60_000, 0],
+            [60_000, 0], [70_000, 0], [70_000, 0], [50_000, 0],
+        ], dtype=np.int32),
+    )
+    simplified = simplify(snapshot, geometries)
+    result = simplified.snapshot
+    # Isolated nodes are kept
+    assert result.node_ids.tolist() == [1, 3, 4, 5, 6, 7, 8]
+    assert result.edge_ids.tolist() == [1, 3, 4, 5, 6, 7]
+    e = result.edge_index(1)
+    assert result.node_ids[result.target[e]] == 3
+    assert (result.length[e], result.negative_elevation[e]) == (30, 3)
+    # After the direct edge, and travelled along its geometry
+    assert (result.key[e], result.reversed[e]) == (1, False)
+    assert simplified.geometries.points(0).tolist() == [
+        [0, 0], [10_000, 0], [20_000, 0]
+    ]
+    assert simplified.original_edges([4, 1, 5]).tolist() == [4, 1, 2, 5]
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from app.graph.snapshot import EDGE_DTYPE, NODE_DTYPE, SnapshotError, build_snapshot
+
+
+def _nodes():
+    return np.array(
+        [(30, 2.2, 48.2), (10, 2.0, 48.0), (20, 2.1, 48.1)], dtype=NODE_DTYPE
+    )
+
+
+def _edges():
+    # id, source_id, target_id, key, length, d+, d-, reversed
+    return np.array(
+        [
+            (7, 20, 30, 0, 200, 5, 0, False),
+            (5, 10, 20, 0, 100, 1, 2, False),
+            (6, 10, 20, 1, 150, 3, 4, True),
+            (8, 30, 10, 0, 300, 0, 9, False),
+        ],
+        dtype=EDGE_DTYPE,
+    )
+
+
+def test_build_snapshot_csr():
+    snapshot = build_snapshot(1, _nodes(), _edges())
+    assert snapshot.n_nodes == 3
+    assert snapshot.n_edges == 4
+    assert snapshot.node_ids.tolist() == [10, 20, 30]
+    assert snapshot.lon.tolist() == [2.0, 2.1, 2.2]
+    assert snapshot.indptr.tolist() == [0, 2, 3, 4]
+    assert snapshot.edge_ids.tolist() == [5, 6, 7, 8]
+    assert snapshot.source.tolist() == [0, 0, 1, 2]
+    assert snapshot.target.tolist() == [1, 1, 2, 0]
+    assert snapshot.key.tolist() == [0, 1, 0, 0]
+    assert snapshot.length.tolist() == [100, 150, 200, 300]
+    assert snapshot.reversed.tolist() == [False, True, False, False]
+    assert list(snapshot.out_edges(0)) == [0, 1]
+
+
+def test_snapshot_id_mapping():
+    snapshot = build_snapshot(1, _nodes(), _edges())
+    assert snapshot.node_index(30) == 2
+    assert snapshot.node_indices([20, 10]).tolist() == [1, 0]
+    assert snapshot.edge_index(8) == 3
+    with pytest.raises(KeyError):
+        snapshot.node_index(42)
+    with pytest.raises(KeyError):
+        snapshot.edge_indices([5, 42])
+
+
+def test_snapshot_incoming():
+    snapshot = build_snapshot(1, _nodes(), _edges())
+    indptr, edges = snapshot.incoming
+    assert indptr.tolist() == [0, 1, 3, 4]
+    assert edges[indptr[1]:indptr[2]].tolist() == [0, 1]
+
+
+def test_build_snapshot_unknown_node():
+    edges = _edges()
+    edges[0]["target_id"] = 42
+    with pytest.raises(SnapshotError):
+        build_snapshot(1, _nodes(), edges)
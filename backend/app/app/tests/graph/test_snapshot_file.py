@@ -0,0 +1,123 @@
+import dataclasses
+
+import numpy as np
+import pytest
+
+from app.graph import routing, store
+from app.graph.profiles import compile_profiles
+from app.graph.snapshot_file import (
+    ALIGNMENT, SnapshotFile, SnapshotFileError, read_snapshot_file,
+    write_snapshot_file,
+)
+from app.tests.utils.synthetic import grid_elevations, grid_geometries, grid_graph
+
+
+def _snapshot_file(graph_id=1, version=1):
+    snapshot = dataclasses.replace(grid_graph(10, 10, seed=1), graph_id=graph_id)
+    geometries = dataclasses.replace(grid_geometries(snapshot), graph_id=graph_id)
+    return SnapshotFile(
+        graph_id,
+        version,
+        snapshot,
+        compile_profiles(snapshot),
+        geometries,
+        grid_elevations(geometries),
+    )
+
+
+def test_write_read(tmp_path):
+    data = _snapshot_file(version=3)
+    path = tmp_path / "graph_1.v3.snapshot"
+    write_snapshot_file(path, data)
+    assert path.stat().st_size % ALIGNMENT == 0
+    assert list(tmp_path.iterdir()) == [path]
+
+    mapped = read_snapshot_file(path)
+    assert (mapped.graph_id, mapped.version) == (1, 3)
+    for field in dataclasses.fields(data.snapshot):
+        assert np.array_equal(
+            getattr(mapped.snapshot, field.name), getattr(data.snapshot, field.name)
+        )
+    assert isinstance(mapped.snapshot.lon.base.base, np.memmap)
+    assert not mapped.snapshot.lon.flags.writeable
+    for a, b in zip(mapped.snapshot.incoming, data.snapshot.incoming):
+        assert np.array_equal(a, b)
+    for profile, weights in data.weights.items():
+        assert np.array_equal(mapped.weights[profile].cost, weights.cost)
+        assert mapped.weights[profile].scale == weights.scale
+    assert np.array_equal(mapped.geometries.coordinates, data.geometries.coordinates)
+    assert np.array_equal(mapped.elevations.values, data.elevations.values)
+
+    # The mapped arrays work as the original ones
+    route = routing.shortest_path(
+        mapped.snapshot, 0, 99, mapped.weights[store.ProfileEnum.flat]
+    )
+    expected = routing.shortest_path(
+        data.snapshot, 0, 99, data.weights[store.ProfileEnum.flat]
+    )
+    assert route.edges.tolist() == expected.edges.tolist()
+
+
+def test_read_invalid(tmp_path):
+    path = tmp_path / "graph_1.v1.snapshot"
+    path.write_bytes(b"CYCL")
+    with pytest.raises(SnapshotFileError):
+        read_snapshot_file(path)
+    path.write_bytes(b"NOTASNAPSHOTFILE" * 10)
+    with pytest.raises(SnapshotFileError):
+        read_snapshot_file(path)
+    write_snapshot_file(path, _snapshot_file())
+    with open(path, "r+b") as f:
+        f.truncate(path.stat().st_size - 2 * ALIGNMENT)
+    with pytest.raises(SnapshotFileError):
+        read_snapshot_file(path)
+
+
+def test_store_maps_files(monkeypatch, tmp_path):
+    loads, version = [], {1: 1}
+    data = _snapshot_file()
+
+    def load_snapshot(db, graph_id):
+        loads.append(graph_id)
+        return data.snapshot
+
+    monkeypatch.setattr(store, "load_version", lambda db, id: version.get(id))
+    monkeypatch.setattr(store, "load_snapshot", load_snapshot)
+    monkeypatch.setattr(store, "load_geometries", lambda db, id: data.geometries)
+    monkeypatch.setattr(store, "load_elevations", lambda db, id: data.elevations)
+    monkeypatch.setattr(store, "_files", {})
+    monkeypatch.setattr(store, "_snapshots", {})
+    monkeypatch.setattr(store.settings, "GRAPH_DATA_DIR", tmp_path)
+
+    assert store.get_snapshot(None, 2) is None
+    snapshot = store.get_snapshot(None, 1)
+    assert not snapshot.node_ids.flags.writeable
+    assert store.get_snapshot(None, 1) is snapshot
+    assert store.get_geometries(None, 1).n_edges == snapshot.n_edges
+    assert store.get_node_index(snapshot).nearest(
+        float(snapshot.lon[5]), float(snapshot.lat[5])
+    ) == 5
+    assert loads == [1]
+
+    # Another worker maps the written file
+    store._files.clear()
+    store._snapshots.clear()
+    assert store.get_snapshot(None, 1).n_edges == snapshot.n_edges
+    assert loads == [1]
+
+    # A corrupted file is written again
+    store.snapshot_path(1, 1).write_bytes(b"")
+    store._files.clear()
+    store._snapshots.clear()
+    store.get_snapshot(None, 1)
+    assert loads == [1, 1]
+
+    # A new version is read again once refreshed, without a change log
+    version[1] = 2
+    monkeypatch.setattr(store, "load_delta", lambda db, id, since, version: None)
+    assert store.get_geometries(None, 1).n_edges == snapshot.n_edges
+    assert loads == [1, 1]
+    assert store.refresh(None, 1)
+    assert loads == [1, 1, 1]
+    assert store.snapshot_path(1, 2).exists()
+    assert not store.snapshot_path(1, 1).exists()
@@ -0,0 +1,30 @@
+import numpy as np
+
+from app.graph.geo import haversine
+from app.graph.spatial import NodeIndex
+from app.tests.utils.synthetic import grid_graph
+
+
+def test_node_index_nearest():
+    snapshot = grid_graph(30, 30)
+    index = NodeIndex(snapshot)
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(snapshot.lon.min() - 0.01, snapshot.lon.max() + 0.01, 200)
+    lat = rng.uniform(snapshot.lat.min() - 0.01, snapshot.lat.max() + 0.01, 200)
+    distances, nodes = index.query(lon, lat)
+    expected = haversine(
+        snapshot.lon[None, :], snapshot.lat[None, :], lon[:, None], lat[:, None]
+    )
+    assert np.array_equal(nodes, expected.argmin(axis=1))
+    assert np.allclose(distances, expected.min(axis=1), atol=1e-3)
+    assert index.nearest(lon[0], lat[0]) == nodes[0]
+
+
+def test_node_index_k_nearest():
+    snapshot = grid_graph(10, 10)
+    index = NodeIndex(snapshot)
+    distances, nodes = index.query(snapshot.lon[[0, 55]], snapshot.lat[[0, 55]], k=5)
+    assert nodes.shape == (2, 5)
+    assert nodes[0, 0] == 0 and nodes[1, 0] == 55
+    assert np.all(np.diff(distances, axis=1) >= 0)
+    assert sorted(nodes[1, 1:].tolist()) == [45, 54, 56, 65]
@@ -0,0 +1,165 @@
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.graph import store
+from app.graph.snapshot import build_region
+from app.graph.tiles import COLUMNS, TILE_SIZE, corridor, tile_of, tiles_covering
+from app.tests.utils.graph import tiled_arrays
+from app.tests.utils.synthetic import grid_graph
+
+
+def test_tile_of():
+    assert tile_of(-180, -90) == 0
+    assert tile_of(-180 + TILE_SIZE, -90) == 1
+    assert tile_of(-180, -90 + TILE_SIZE) == COLUMNS
+    assert tile_of(180, 90) == tile_of(179.99, 89.99)
+    assert tile_of(np.array([2.3, 2.3]), np.array([48.8, 48.9])).tolist() == [
+        tile_of(2.3, 48.8), tile_of(2.3, 48.9)
+    ]
+
+
+def test_tiles_covering():
+    assert tiles_covering((2.3, 48.8, 2.3, 48.8)) == (tile_of(2.3, 48.8),)
+    tiles = tiles_covering((2.1, 48.6, 2.6, 48.9))
+    assert len(tiles) == 3 * 2
+    assert tiles == tuple(sorted(tiles))
+    bbox = corridor([2.35], [48.85], 10_000)
+    assert bbox[0] < 2.35 - 0.13 and bbox[3] > 48.85 + 0.08
+
+
+def test_build_region_drops_leaving_edges():
+    # A 5 x 25 km grid across two tiles
+    snapshot = grid_graph(50, 250, spacing=100.0, origin=(2.1, 48.8))
+    parts = tiled_arrays(snapshot)
+    first, second = sorted(parts)
+    region = build_region(0, [parts[first]])
+    assert 0 < region.n_nodes < snapshot.n_nodes
+    assert np.all(tile_of(region.lon, region.lat) == first)
+    # Edges between the two tiles are dropped
+    inner = np.sum(np.isin(parts[first][1]["target_id"], parts[first][0]["id"]))
+    assert region.n_edges == inner < len(parts[first][1])
+    both = build_region(0, [parts[first], parts[second]])
+    assert both.n_nodes == snapshot.n_nodes
+    assert both.n_edges == snapshot.n_edges
+
+
+def test_get_region_tile_cache(monkeypatch):
+    snapshot = grid_graph(50, 250, spacing=100.0, origin=(2.1, 48.8))
+    parts = tiled_arrays(snapshot)
+    first, second = sorted(parts)
+    loads = []
+
+    def load_tiles(db, graph_id, tiles):
+        loads.append(list(tiles))
+        return {tile: parts[tile] for tile in tiles}
+
+    monkeypatch.setattr(store, "load_tiles", load_tiles)
+    monkeypatch.setattr(store, "load_version", lambda db, graph_id: 1)
+    monkeypatch.setattr(store, "_tiles", store.OrderedDict())
+    monkeypatch.setattr(store, "_regions", store.OrderedDict())
+    monkeypatch.setattr(store, "_tile_versions", {})
+    monkeypatch.setattr(store, "_tiles_size", 0)
+    monkeypatch.setattr(
+        store.settings,
+        "GRAPH_TILE_CACHE_SIZE",
+        sum(array.nbytes for array in parts[second]),
+    )
+
+    west = corridor([2.2], [48.82], 100)
+    region = store.get_region(None, 9, west)
+    assert store.get_region(None, 9, west) is region
+    assert region.n_nodes == len(parts[first][0])
+    assert store.get_node_index(region).nearest(2.2, 48.82) >= 0
+
+    # Both tiles, only the second one is read
+    both = store.get_region(None, 9, corridor([2.2, 2.4], [48.82, 48.82], 100))
+    assert both.n_nodes == snapshot.n_nodes
+    assert loads == [[first], [second]]
+
+    # Tiles of the current region are kept, even beyond the budget
+    assert list(store._tiles) == [(9, first), (9, second)]
+    # The first tile, least recently used, is then evicted
+    store.get_region(None, 9, corridor([2.4], [48.82], 100))
+    assert list(store._tiles) == [(9, second)]
+    store._regions.clear()
+    store.get_region(None, 9, west)
+    assert loads == [[first], [second], [first]]
+
+
+def test_get_region_loads_outside_of_the_lock(monkeypatch):
+    snapshot = grid_graph(10, 10, spacing=100.0, origin=(2.1, 48.8))
+    parts = tiled_arrays(snapshot)
+    loads, started, release = [], threading.Event(), threading.Event()
+
+    def load_tiles(db, graph_id, tiles):
+        loads.append(graph_id)
+        if graph_id == 1:
+            started.set()
+            assert release.wait(5)
+        return {tile: parts[tile] for tile in tiles}
+
+    monkeypatch.setattr(store, "load_tiles", load_tiles)
+    monkeypatch.setattr(store, "load_version", lambda db, graph_id: 1)
+    monkeypatch.setattr(store, "_tiles", store.OrderedDict())
+    monkeypatch.setattr(store, "_regions", store.OrderedDict())
+    monkeypatch.setattr(store, "_tile_versions", {})
+    monkeypatch.setattr(store, "_tiles_size", 0)
+
+    bbox = corridor([2.1], [48.8], 100)
+    with ThreadPoolExecutor(2) as executor:
+        slow = [executor.submit(store.get_region, None, 1, bbox) for _ in range(2)]
+        # Another graph is loaded meanwhile
+        assert started.wait(5)
+        assert store.get_region(None, 2, bbox).n_nodes == snapshot.n_nodes
+        release.set()
+        first, second = (future.result() for future in slow)
+    # Concurrent requests of a region wait for a single load
+    assert first is second
+    assert sorted(loads) == [1, 2]
+    assert not store._loading
+
+
+def test_refresh_evicts_tiles(monkeypatch):
+    snapshot = grid_graph(50, 250, spacing=100.0, origin=(2.1, 48.8))
+    parts = tiled_arrays(snapshot)
+    first, second = sorted(parts)
+    versions, loads = {9: 1}, []
+
+    def load_tiles(db, graph_id, tiles):
+        loads.append(list(tiles))
+        return {tile: parts[tile] for tile in tiles}
+
+    monkeypatch.setattr(store, "load_tiles", load_tiles)
+    monkeypatch.setattr(store, "load_version", lambda db, id: versions.get(id))
+    monkeypatch.setattr(store, "_files", {})
+    monkeypatch.setattr(store, "_tiles", store.OrderedDict())
+    monkeypatch.setattr(store, "_regions", store.OrderedDict())
+    monkeypatch.setattr(store, "_tile_versions", {})
+    monkeypatch.setattr(store, "_tiles_size", 0)
+    session_factory = contextlib.nullcontext
+
+    west = corridor([2.2], [48.82], 100)
+    region = store.get_region(None, 9, west)
+    store.refresh_all(session_factory)
+    assert store.get_region(None, 9, west) is region
+
+    # A graph only served by regions is refreshed too
+    versions[9] = 2
+    store.refresh_all(session_factory)
+    assert not store._regions and not store._tiles
+    assert store.get_region(None, 9, west) is not region
+    assert loads == [[first], [first]]
+
+    # Tiles read at a previous version are not mixed with newer ones
+    versions[9] = 3
+    store.get_region(None, 9, corridor([2.2, 2.4], [48.82, 48.82], 100))
+    assert loads == [[first], [first], [first, second]]
+    assert store._tile_versions == {9: 3}
+
+    del versions[9]
+    store.refresh_all(session_factory)
+    assert not store._tile_versions and not store._tiles
+    assert store.get_region(None, 9, west) is None
@@ -0,0 +1,67 @@
+import io
+from datetime import UTC, datetime
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from app.graph.geo import haversine
+from app.tests.utils.activity import (
+    ELEVATION, GPX, LAT, LON, START, TIME, fit_file, gpx_file, tcx_file,
+)
+from app.tracks import ActivityError, TrackBuffer, read_activity
+from app.tracks.metrics import elevation_changes
+
+
+@pytest.mark.parametrize("filename, content", [
+    ("ride.gpx", gpx_file()),
+    ("ride.TCX", tcx_file()),
+    ("ride.fit", fit_file()),
+])
+def test_read_activity(filename, content):
+    activity = read_activity(io.BytesIO(content), filename)
+    assert activity.n_points == 4
+    assert np.allclose(activity.lon, LON) and np.allclose(activity.lat, LAT)
+    assert np.allclose(activity.elevation, ELEVATION, atol=0.2)
+    assert np.array_equal(activity.time, TIME)
+    assert activity.name == ("Morning ride" if filename.endswith("gpx") else "ride")
+
+    distance = haversine(LON[:-1], LAT[:-1], LON[1:], LAT[1:]).sum()
+    assert activity.distance == round(distance)
+    assert activity.start_time == datetime.fromtimestamp(START, UTC)
+    assert (activity.end_time - activity.start_time).total_seconds() == 30
+    gain, loss = elevation_changes(activity.elevation)
+    assert (activity.elevation_gain, activity.elevation_loss) == (
+        round(gain), round(loss)
+    )
+    assert activity.average_speed == Decimal(distance / 30).quantize(
+        Decimal("0.01")
+    )
+
+
+def test_read_activity_invalid():
+    with pytest.raises(ActivityError):
+        read_activity(io.BytesIO(b""), "ride.kml")
+    with pytest.raises(ActivityError):
+        read_activity(io.BytesIO(gpx_file()[:-30]), "ride.gpx")
+    with pytest.raises(ActivityError):
+        read_activity(io.BytesIO(fit_file()[:-10]), "ride.fit")
+    with pytest.raises(ActivityError):
+        read_activity(io.BytesIO(gpx_file()), "ride.fit")
+    # Untimed planned routes are not activities
+    untimed = GPX.format(points="\n".join(
+        f'<trkpt lat="{lat}" lon="{lon}"/>' for lon, lat in zip(LON, LAT)
+    )).encode()
+    with pytest.raises(ActivityError):
+        read_activity(io.BytesIO(untimed), "route.gpx")
+
+
+def test_track_buffer_growth():
+    track = TrackBuffer(capacity=2)
+    for i in range(1_000):
+        track.append(2 + i * 1e-4, 48.0, np.nan, START + i)
+    assert len(track) == 1_000
+    activity = track.finish()
+    assert activity.n_points == 1_000
+    assert activity.lon[-1] == pytest.approx(2.0999)
+    assert (activity.elevation_gain, activity.elevation_loss) == (0, 0)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import shapely
+
+from app.graph.geo import EARTH_RADIUS
+from app.tracks.levels import (
+    TRACE_ZOOMS, simplify_trace, trace_level, trace_levels, zoom_tolerance,
+)
+
+
+def _ride(n=5_000, seed=0):
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.05, n))
+    step = np.degrees(8 / EARTH_RADIUS)
+    lat = 45 + np.cumsum(step * np.cos(heading))
+    lon = 6 + np.cumsum(step * np.sin(heading)) / np.cos(np.radians(45))
+    return lon, lat
+
+
+def _projected(lon, lat):
+    scale = np.radians(EARTH_RADIUS)
+    return np.column_stack([
+        (lon - lon[0]) * scale * np.cos(np.radians(lat[0])),
+        (lat - lat[0]) * scale,
+    ])
+
+
+def test_trace_level():
+    assert zoom_tolerance(0) == pytest.approx(78_271.5, abs=0.1)
+    assert zoom_tolerance(14) == pytest.approx(4.78, abs=0.01)
+    assert trace_level() is None
+    # The coarsest level at least as fine as asked
+    assert trace_level(zoom=3) == 8
+    assert trace_level(zoom=11) == 12
+    assert trace_level(zoom=14) == 14
+    assert trace_level(zoom=15) is None
+    assert trace_level(tolerance=20.0) == 12
+    assert trace_level(tolerance=1.0) is None
+
+
+def test_simplify_trace():
+    lon, lat = _ride()
+    levels = trace_levels(lon, lat)
+    assert list(levels) == list(TRACE_ZOOMS)
+    sizes = [len(levels[zoom][0]) for zoom in TRACE_ZOOMS]
+    assert sizes == sorted(sizes, reverse=True) and sizes[0] < len(lon)
+    for zoom, (level_lon, level_lat) in levels.items():
+        assert (level_lon[0], level_lat[-1]) == pytest.approx((lon[0], lat[-1]))
+        # Every fix is within the tolerance of the simplified trace
+        line = shapely.linestrings(_projected(
+            np.r_[lon[0], level_lon], np.r_[lat[0], level_lat]
+        )[1:])
+        points = shapely.points(_projected(lon, lat))
+        assert shapely.distance(line, points).max() <= zoom_tolerance(zoom) + 1e-6
+
+    # A straight line is its ends
+    straight = simplify_trace(np.linspace(6, 6.1, 100), np.full(100, 45.0), 1.0)
+    assert straight[0].tolist() == pytest.approx([6, 6.1])
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from app.tracks.metrics import (
+    elevation_changes, hysteresis, moving_time, smooth, trace_metrics,
+)
+
+
+def _hysteresis(values, width):
+    y = [values[0]]
+    for x in values[1:]:
+        y.append(min(max(y[-1], x - width), x + width))
+    return np.array(y)
+
+
+def test_smooth():
+    assert smooth(np.array([0.0, 3.0, 6.0, 0.0, 3.0]), 3).tolist() == [
+        1.5, 3.0, 3.0, 3.0, 1.5
+    ]
+    assert smooth(np.array([1.0]), 5).tolist() == [1.0]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_hysteresis(seed):
+    rng = np.random.default_rng(seed)
+    # A noisy ride: long climbs and descents, and long flats
+    steps = rng.normal(0, 0.5, 5_000) + np.repeat(rng.normal(0, 0.3, 50), 100)
+    values = 200 + np.cumsum(steps)
+    for width in (0.5, 2.0, 10.0):
+        assert np.allclose(hysteresis(values, width), _hysteresis(values, width))
+    assert hysteresis(values[:0]).shape == (0,)
+    assert hysteresis(np.full(10, 3.0)).tolist() == [3.0] * 10
+
+
+def test_elevation_changes():
+    # Noise on a flat road is not counted, a climb and a descent are
+    noise = np.tile([100.0, 101.0], 50)
+    assert elevation_changes(noise, window=1, width=1.0) == (0.0, 0.0)
+    climb = np.concatenate([np.linspace(100, 150, 51), np.linspace(149, 120, 30)])
+    gain, loss = elevation_changes(climb, window=1, width=1.0)
+    assert (gain, loss) == pytest.approx((49.0, 28.0))
+    # Unknown elevations are skipped
+    assert elevation_changes(np.array([np.nan, 100.0, np.nan, 110.0]), window=1) == (
+        pytest.approx(9.0), 0.0
+    )
+
+
+def test_trace_metrics():
+    # 100 m every 10 s, then a 5 minutes stop drifting 10 m, then 100 m in 20 s
+    lon = np.array([2.0, 2.0, 2.0, 2.0, 2.0])
+    lat = 48.0 + np.array([0, 100, 200, 210, 310]) / 111_195
+    time = np.array([0.0, 10.0, 20.0, 320.0, 340.0])
+    metrics = trace_metrics(lon, lat, np.full(5, 50.0), time)
+    assert metrics.distance == pytest.approx(310, abs=0.1)
+    assert (metrics.elevation_gain, metrics.elevation_loss) == (0.0, 0.0)
+    assert (metrics.elapsed_time, metrics.moving_time) == (340.0, 40.0)
+    assert metrics.average_speed == pytest.approx(310 / 40, abs=0.01)
+
+    lengths = np.array([100.0, 100.0])
+    assert moving_time(lengths, np.array([0.0, np.nan, 20.0])) == 0.0
+    untimed = trace_metrics(lon, lat)
+    assert (untimed.moving_time, untimed.average_speed) == (0.0, 0.0)
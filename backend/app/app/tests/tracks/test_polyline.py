@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from app.tracks.polyline import PolylineError, decode_polyline, encode_polyline
+
+
+def test_encode_polyline():
+    # The example of the Google documentation
+    lon = np.array([-120.2, -120.95, -126.453])
+    lat = np.array([38.5, 40.7, 43.252])
+    assert encode_polyline(lon, lat) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert encode_polyline(lon[:0], lat[:0]) == ""
+    # Repeated points are zero deltas, encoded on a single character
+    assert encode_polyline(np.zeros(2), np.zeros(2)) == "????"
+    with pytest.raises(PolylineError):
+        encode_polyline(lon, lat, precision=8)
+
+
+@pytest.mark.parametrize("precision", [0, 5, 6, 7])
+def test_polyline_round_trip(precision):
+    rng = np.random.default_rng(precision)
+    lon = np.r_[-180, 180, rng.uniform(-180, 180, 10_000)]
+    lat = np.r_[90, -90, rng.uniform(-90, 90, 10_000)]
+    decoded_lon, decoded_lat = decode_polyline(
+        encode_polyline(lon, lat, precision), precision
+    )
+    tolerance = 0.5 / 10**precision + 1e-9
+    assert np.abs(decoded_lon - lon).max() <= tolerance
+    assert np.abs(decoded_lat - lat).max() <= tolerance
+
+
+def test_decode_polyline():
+    lon, lat = decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+    assert lon.tolist() == pytest.approx([-120.2, -120.95, -126.453])
+    assert lat.tolist() == pytest.approx([38.5, 40.7, 43.252])
+    assert len(decode_polyline("")[0]) == 0
+    for polyline in ["_p~iF~ps|", "_p~iF", "_p~iF é", "_p~iF~ps|U\n"]:
+        with pytest.raises(PolylineError):
+            decode_polyline(polyline)
@@ -0,0 +1,85 @@
+import struct
+from datetime import UTC, datetime
+
+import numpy as np
+
+from app.tracks.fit import FIT_EPOCH, RECORD
+
+START = datetime(2024, 5, 1, 8, 0, tzinfo=UTC).timestamp()
+LON = np.array([2.0, 2.001, 2.002, 2.003])
+LAT = np.array([48.0, 48.0005, 48.001, 48.0015])
+ELEVATION = np.array([100.0, 104.0, 102.0, 103.0])
+TIME = START + np.array([0.0, 10.0, 20.0, 30.0])
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><name>Morning ride</name><trkseg>
+{points}
+  </trkseg></trk>
+</gpx>
+"""
+TCX = """<?xml version="1.0" encoding="UTF-8"?>
+<TrainingCenterDatabase
+  xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">
+  <Activities><Activity Sport="Biking"><Lap><Track>
+{points}
+  </Track></Lap></Activity></Activities>
+</TrainingCenterDatabase>
+"""
+
+
+def _iso(t):
+    return datetime.fromtimestamp(t, UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def gpx_file():
+    """ A GPX activity file of the track. """
+    return GPX.format(points="\n".join(
+        f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele>'
+        f"<time>{_iso(t)}</time><extensions><hr>120</hr></extensions></trkpt>"
+        for lon, lat, ele, t in zip(LON, LAT, ELEVATION, TIME)
+    )).encode()
+
+
+def tcx_file():
+    """ A TCX activity file of the track. """
+    return TCX.format(points="\n".join(
+        f"<Trackpoint><Time>{_iso(t)}</Time><Position>"
+        f"<LatitudeDegrees>{lat}</LatitudeDegrees>"
+        f"<LongitudeDegrees>{lon}</LongitudeDegrees></Position>"
+        f"<AltitudeMeters>{ele}</AltitudeMeters></Trackpoint>"
+        for lon, lat, ele, t in zip(LON, LAT, ELEVATION, TIME)
+    )).encode()
+
+
+def fit_file():
+    """ A FIT file of a file_id message, then records with a full timestamp
+    and a developer field, then with compressed timestamps, big endian.
+    """
+    semicircles = 2**31 / 180
+    records = b""
+    # file_id: type (enum), a skipped field
+    records += bytes([0x40, 0, 0]) + struct.pack("<HB", 0, 1) + bytes([0, 1, 0])
+    records += bytes([0x00, 4])
+    # record: timestamp, lat, lon, altitude, heart rate; and a developer field
+    records += bytes([0x61, 0, 0]) + struct.pack("<HB", RECORD, 5)
+    records += bytes([253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85, 2, 2, 0x84, 3, 1, 2])
+    records += bytes([1, 0, 2, 0])
+    for lon, lat, ele, t in zip(LON[:2], LAT[:2], ELEVATION[:2], TIME[:2]):
+        records += bytes([0x01]) + struct.pack(
+            "<IiiHB", int(t) - FIT_EPOCH, round(lat * semicircles),
+            round(lon * semicircles), round((ele + 500) * 5), 120,
+        ) + b"\x00\x00"
+    # record, big endian: lat, lon, enhanced altitude
+    records += bytes([0x42, 0, 1]) + struct.pack(">HB", RECORD, 3)
+    records += bytes([0, 4, 0x85, 1, 4, 0x85, 78, 4, 0x86])
+    for lon, lat, ele, t in zip(LON[2:], LAT[2:], ELEVATION[2:], TIME[2:]):
+        offset = (int(t) - FIT_EPOCH) & 0x1F
+        records += bytes([0x80 | (2 << 5) | offset]) + struct.pack(
+            ">iiI", round(lat * semicircles), round(lon * semicircles),
+            round((ele + 500) * 5),
+        )
+    # A record without position
+    records += bytes([0x02]) + struct.pack(">iiI", 0x7FFFFFFF, 0x7FFFFFFF, 0)
+    header = struct.pack("<BBHI4sH", 14, 0x20, 2132, len(records), b".FIT", 0)
+    return header + records + b"\x00\x00"
@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.graph import store
+from app.graph.snapshot import TILED_EDGE_DTYPE, TILED_NODE_DTYPE
+from app.graph.tiles import tile_of
+
+
+def tiled_arrays(snapshot):
+    """ The TILED_*_DTYPE arrays of a snapshot, by tile. """
+    nodes = np.zeros(snapshot.n_nodes, dtype=TILED_NODE_DTYPE)
+    nodes["id"], nodes["lon"], nodes["lat"] = (
+        snapshot.node_ids, snapshot.lon, snapshot.lat
+    )
+    nodes["tile"] = tile_of(snapshot.lon, snapshot.lat)
+    edges = np.zeros(snapshot.n_edges, dtype=TILED_EDGE_DTYPE)
+    edges["id"] = snapshot.edge_ids
+    edges["source_id"] = snapshot.node_ids[snapshot.source]
+    edges["target_id"] = snapshot.node_ids[snapshot.target]
+    edges["length"] = snapshot.length
+    edges["tile"] = nodes["tile"][snapshot.source]
+    return {
+        tile: (nodes[nodes["tile"] == tile], edges[edges["tile"] == tile])
+        for tile in np.unique(nodes["tile"]).tolist()
+    }
+
+
+def serve_graph(monkeypatch, tmp_path, data):
+    """ Serve a SnapshotFile from the store, its tiles read from memory. """
+    parts = tiled_arrays(data.snapshot)
+    nodes, edges = next(iter(parts.values()))
+
+    def load_tiles(db, graph_id, tiles):
+        if graph_id != data.graph_id:
+            return None
+        return {tile: parts.get(tile, (nodes[:0], edges[:0])) for tile in tiles}
+
+    monkeypatch.setattr(
+        store, "load_version",
+        lambda db, graph_id: data.version if graph_id == data.graph_id else None,
+    )
+    monkeypatch.setattr(store, "load_tiles", load_tiles)
+    monkeypatch.setattr(store, "_files", {})
+    monkeypatch.setattr(store, "_snapshots", {})
+    monkeypatch.setattr(store, "_tiles", store.OrderedDict())
+    monkeypatch.setattr(store, "_tiles_size", 0)
+    monkeypatch.setattr(store, "_tile_versions", {})
+    monkeypatch.setattr(store, "_regions", store.OrderedDict())
+    monkeypatch.setattr(store, "_vector_tiles", store.OrderedDict())
+    monkeypatch.setattr(store, "_vector_tiles_size", 0)
+    monkeypatch.setattr(store, "_routes", store.RouteCache(1 << 20, 60))
+    monkeypatch.setattr(store.settings, "GRAPH_DATA_DIR", tmp_path)
+    store._install(data)
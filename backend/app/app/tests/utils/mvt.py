@@ -0,0 +1,81 @@
+def read_varint(data: bytes, i: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[i]
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        i += 1
+        if byte < 0x80:
+            return value, i
+
+
+def decode_message(data: bytes) -> dict[int, list]:
+    """ The fields of a protobuf message, varints and length delimited only. """
+    fields, i = {}, 0
+    while i < len(data):
+        tag, i = read_varint(data, i)
+        if tag & 7 == 0:
+            value, i = read_varint(data, i)
+        else:
+            size, i = read_varint(data, i)
+            value, i = data[i:i + size], i + size
+        fields.setdefault(tag >> 3, []).append(value)
+    return fields
+
+
+def unpack_varints(data: bytes) -> list[int]:
+    values, i = [], 0
+    while i < len(data):
+        value, i = read_varint(data, i)
+        values.append(value)
+    return values
+
+
+def unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def tile_lines(commands: list[int]) -> list[list[tuple[int, int]]]:
+    lines, x, y, i = [], 0, 0, 0
+    while i < len(commands):
+        command, count = commands[i] & 7, commands[i] >> 3
+        i += 1
+        if command == 1:
+            lines.append([])
+        for _ in range(count):
+            x += unzigzag(commands[i])
+            y += unzigzag(commands[i + 1])
+            lines[-1].append((x, y))
+            i += 2
+    return lines
+
+
+def tile_features(tile: bytes) -> tuple[dict, list[dict]]:
+    """ The layer of a vector tile, and its features with their properties. """
+    layer = decode_message(decode_message(tile)[3][0])
+    keys = [key.decode() for key in layer.get(3, [])]
+    values = [unzigzag(decode_message(value)[6][0]) for value in layer.get(4, [])]
+    features = []
+    for feature in map(decode_message, layer[2]):
+        tags = unpack_varints(feature[2][0]) if 2 in feature else []
+        features.append({
+            "id": feature[1][0],
+            "type": feature[3][0],
+            "lines": tile_lines(unpack_varints(feature[4][0])),
+            **{keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])},
+        })
+    return layer, features
+
+
+class TileSession:
+    """ A session answering the edge query of render_tile() with rows of
+    (id, reversed, popularity). """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, stmt):
+        return self
+
+    def all(self):
+        return self.rows
@@ -0,0 +1,222 @@
+import math
+
+import numpy as np
+
+from app.graph.elevation import ELEVATION_SCALE, ElevationProfiles
+from app.graph.geo import EARTH_RADIUS, haversine
+from app.graph.geometry import COORDINATE_SCALE, EdgeGeometries
+from app.graph.isochrone import tree_edges
+from app.graph.snapshot import (
+    EDGE_DTYPE, NODE_DTYPE, GraphSnapshot, build_snapshot
+)
+
+
+def grid_graph(
+    rows: int,
+    cols: int,
+    *,
+    spacing: float = 100.0,
+    origin: tuple[float, float] = (2.35, 48.85),
+    detour: float = 0.3,
+    seed: int = 0,
+) -> GraphSnapshot:
+    """ A synthetic bidirectional grid graph, for tests and benchmarks.
+
+    Nodes are laid out every ``spacing`` meters from the (lon, lat) origin,
+    over a rolling terrain of random phase. Each edge length is the straight
+    line distance stretched by a random factor in [1, 1 + detour], so that
+    haversine remains a lower bound. A grid of R x C nodes has
+    4 * R * C - 2 * (R + C) edges.
+    """
+    rng = np.random.default_rng(seed)
+    lon0, lat0 = origin
+    d_lat = math.degrees(spacing / EARTH_RADIUS)
+    d_lon = d_lat / math.cos(math.radians(lat0))
+
+    r, c = np.divmod(np.arange(rows * cols), cols)
+    nodes = np.zeros(rows * cols, dtype=NODE_DTYPE)
+    nodes["id"] = np.arange(1, rows * cols + 1)
+    nodes["lon"] = lon0 + c * d_lon
+    nodes["lat"] = lat0 + r * d_lat
+    # Hills of a few kilometers with small scale noise, in meter
+    x, y = c * spacing, r * spacing
+    phase = rng.uniform(0, 2 * math.pi, 3)
+    altitude = (
+        200.0
+        + 120.0 * np.sin(x / 1300.0 + phase[0]) * np.cos(y / 1700.0 + phase[1])
+        + 30.0 * np.sin((x + y) / 500.0 + phase[2])
+        + rng.normal(0.0, 1.0, rows * cols)
+    )
+
+    index = np.arange(rows * cols).reshape(rows, cols)
+    horizontal = np.stack([index[:, :-1].ravel(), index[:, 1:].ravel()])
+    vertical = np.stack([index[:-1, :].ravel(), index[1:, :].ravel()])
+    forward = np.concatenate([horizontal, vertical], axis=1)
+    u, v = np.concatenate([forward, forward[::-1]], axis=1)
+
+    edges = np.zeros(len(u), dtype=EDGE_DTYPE)
+    edges["id"] = np.arange(1, len(u) + 1)
+    edges["source_id"] = nodes["id"][u]
+    edges["target_id"] = nodes["id"][v]
+    straight = haversine(
+        nodes["lon"][u], nodes["lat"][u], nodes["lon"][v], nodes["lat"][v]
+    )
+    edges["length"] = np.ceil(straight * rng.uniform(1.0, 1.0 + detour, len(u)))
+    climb = altitude[v] - altitude[u]
+    edges["positive_elevation"] = np.round(np.maximum(climb, 0.0))
+    edges["negative_elevation"] = np.round(np.maximum(-climb, 0.0))
+    return build_snapshot(0, nodes, edges)
+
+
+def grid_geometries(
+    snapshot: GraphSnapshot, *, bend: float = 0.2, seed: int = 0
+) -> EdgeGeometries:
+    """ Edge geometries of a synthetic graph, for tests and benchmarks.
+
+    Each edge is a polyline of three points, its middle point moved sideways
+    by up to ``bend`` times the edge chord. Both directions of a road share
+    the same points, in travel order as edges are not reversed.
+    """
+    u, v = snapshot.source, snapshot.target
+    low, high = np.minimum(u, v), np.maximum(u, v)
+    # A pseudo-random shift of each road, the same for both directions
+    phase = np.random.default_rng(seed).uniform(0, 2 * math.pi)
+    shift = bend * np.sin((low.astype(np.float64) * snapshot.n_nodes + high) + phase)
+    start = np.column_stack([snapshot.lon[low], snapshot.lat[low]])
+    end = np.column_stack([snapshot.lon[high], snapshot.lat[high]])
+    chord = end - start
+    middle = (start + end) / 2 + shift[:, None] * chord[:, ::-1] * [1, -1]
+    points = np.stack([start, middle, end], axis=1)
+    points = np.where((u == low)[:, None, None], points, points[:, ::-1])
+    order = np.argsort(snapshot.edge_ids)
+    return EdgeGeometries(
+        snapshot.graph_id,
+        snapshot.edge_ids[order],
+        np.arange(0, 3 * snapshot.n_edges + 1, 3, dtype=np.int64),
+        np.rint(points[order].reshape(-1, 2) * COORDINATE_SCALE).astype(np.int32),
+    )
+
+
+def grid_elevations(
+    geometries: EdgeGeometries, *, seed: int = 0
+) -> ElevationProfiles:
+    """ Elevation profiles of edge geometries, for tests and benchmarks.
+
+    Elevations of a rolling terrain of random phase are taken at each point
+    of the geometries, as an importer reads them from 3D ways.
+    """
+    phase = np.random.default_rng(seed).uniform(0, 2 * math.pi, 2)
+    lon, lat = (geometries.coordinates / COORDINATE_SCALE).T
+    owner = np.repeat(np.arange(geometries.n_edges), np.diff(geometries.offsets))
+    step = haversine(lon[:-1], lat[:-1], lon[1:], lat[1:])
+    step[owner[1:] != owner[:-1]] = 0.0
+    travelled = np.concatenate([[0.0], np.cumsum(step)])
+    distance = travelled - travelled[geometries.offsets[:-1]][owner]
+    # Hills of a few kilometers, in meter
+    x = np.radians(lon) * EARTH_RADIUS * math.cos(math.radians(lat.mean()))
+    y = np.radians(lat) * EARTH_RADIUS
+    z = 200.0 + 120.0 * np.sin(x / 1300.0 + phase[0]) * np.cos(y / 1700.0 + phase[1])
+    return ElevationProfiles(
+        geometries.graph_id,
+        geometries.edge_ids,
+        geometries.offsets,
+        np.rint(np.column_stack([distance, z]) * ELEVATION_SCALE).astype(np.int32),
+    )
+
+
+def gps_trace(
+    snapshot: GraphSnapshot,
+    edges: np.ndarray,
+    *,
+    spacing: float = 5.0,
+    noise: float = 5.0,
+    seed: int = 0,
+    geometries: EdgeGeometries | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """ A noisy GPS trace along a path, for map-matching tests and benchmarks.
+
+    Fixes are taken every ``spacing`` meters along the edge geometries, or
+    the straight segments of the edges without geometries, and moved by a
+    gaussian error of ``noise`` meters.
+    """
+    rng = np.random.default_rng(seed)
+    if geometries is None:
+        nodes = np.concatenate([snapshot.source[edges[:1]], snapshot.target[edges]])
+        lon, lat = snapshot.lon[nodes], snapshot.lat[nodes]
+    else:
+        lon, lat = geometries.path(
+            geometries.indices(snapshot.edge_ids[edges]), snapshot.reversed[edges]
+        ).T
+    travelled = np.concatenate(
+        [[0.0], np.cumsum(haversine(lon[:-1], lat[:-1], lon[1:], lat[1:]))]
+    )
+    at = np.arange(0.0, travelled[-1], spacing)
+    lon, lat = np.interp(at, travelled, lon), np.interp(at, travelled, lat)
+    d_lat = np.degrees(rng.normal(0.0, noise, len(at)) / EARTH_RADIUS)
+    d_lon = np.degrees(rng.normal(0.0, noise, len(at)) / EARTH_RADIUS) / np.cos(
+        np.radians(lat)
+    )
+    return lon + d_lon, lat + d_lat
+
+
+def subdivided_graph(
+    snapshot: GraphSnapshot, parts: int
+) -> tuple[GraphSnapshot, EdgeGeometries]:
+    """ A synthetic graph of shape nodes, for tests and benchmarks.
+
+    The roads of a bidirectional graph, such as grid_graph(), are cut into
+    parts straight edges, their lengths and elevations split evenly. As
+    imported ways, both directions share the geometry digitized from the
+    lower node index, the other one being reversed.
+    """
+    forward = np.flatnonzero(snapshot.source < snapshot.target)
+    u, v = snapshot.source[forward], snapshot.target[forward]
+    backward = tree_edges(snapshot, snapshot.length, v, u)
+    n_roads, first_id = len(forward), int(snapshot.node_ids.max()) + 1
+
+    # The nodes along each road, ends included
+    t = np.arange(parts + 1) / parts
+    lon = snapshot.lon[u][:, None] * (1 - t) + snapshot.lon[v][:, None] * t
+    lat = snapshot.lat[u][:, None] * (1 - t) + snapshot.lat[v][:, None] * t
+    ids = np.empty((n_roads, parts + 1), dtype=np.int64)
+    ids[:, 0], ids[:, -1] = snapshot.node_ids[u], snapshot.node_ids[v]
+    ids[:, 1:-1] = first_id + np.arange(n_roads * (parts - 1)).reshape(
+        n_roads, parts - 1
+    )
+    nodes = np.zeros(snapshot.n_nodes + ids[:, 1:-1].size, dtype=NODE_DTYPE)
+    nodes["id"] = np.concatenate([snapshot.node_ids, ids[:, 1:-1].ravel()])
+    nodes["lon"] = np.concatenate([snapshot.lon, lon[:, 1:-1].ravel()])
+    nodes["lat"] = np.concatenate([snapshot.lat, lat[:, 1:-1].ravel()])
+
+    def split(values: np.ndarray) -> np.ndarray:
+        # Remainders go to the first parts
+        quotient, remainder = np.divmod(values.astype(np.int64), parts)
+        return quotient[:, None] + (np.arange(parts) < remainder[:, None])
+
+    edges = np.zeros((2, n_roads, parts), dtype=EDGE_DTYPE)
+    edges["id"] = 1 + np.arange(edges.size).reshape(edges.shape)
+    edges["source_id"][0], edges["target_id"][0] = ids[:, :-1], ids[:, 1:]
+    edges["source_id"][1], edges["target_id"][1] = ids[:, 1:], ids[:, :-1]
+    edges["reversed"][1] = True
+    for side, indices in enumerate((forward, backward)):
+        for name in ("length", "positive_elevation", "negative_elevation"):
+            edges[name][side] = split(getattr(snapshot, name)[indices])
+    # Backward edges are travelled from the end of the road
+    for name in ("length", "positive_elevation", "negative_elevation"):
+        edges[name][1] = edges[name][1][:, ::-1]
+
+    points = np.stack([
+        np.stack([lon[:, :-1], lat[:, :-1]], axis=-1),
+        np.stack([lon[:, 1:], lat[:, 1:]], axis=-1),
+    ], axis=2)
+    points = np.concatenate([points, points]).reshape(-1, 2)
+    coordinates = np.rint(points * COORDINATE_SCALE).astype(np.int32)
+    return (
+        build_snapshot(snapshot.graph_id, nodes, edges.ravel()),
+        EdgeGeometries(
+            snapshot.graph_id,
+            edges["id"].ravel(),
+            np.arange(0, 2 * edges.size + 1, 2, dtype=np.int64),
+            coordinates,
+        ),
+    )
@@ -0,0 +1,97 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from decimal import Decimal
+
+import numpy as np
+
+from app.tracks.metrics import trace_metrics
+
+# Buffers start with this many points, then double when full
+INITIAL_CAPACITY = 4_096
+# Circuit.average_speed is a DECIMAL(4, 2)
+MAX_AVERAGE_SPEED = Decimal("99.99")
+
+
+class ActivityError(Exception):
+    pass
+
+
+@dataclass(frozen=True, eq=False)
+class Activity:
+    """ A recorded track and the Circuit properties derived from it. """
+    name: str | None
+    lon: np.ndarray        # float64
+    lat: np.ndarray        # float64
+    elevation: np.ndarray  # float64, in meter, NaN if unknown
+    time: np.ndarray       # float64, in POSIX seconds, NaN if unknown
+    distance: int
+    start_time: datetime
+    end_time: datetime
+    elevation_gain: int
+    elevation_loss: int
+    average_speed: Decimal
+
+    @property
+    def n_points(self) -> int:
+        return len(self.lon)
+
+
+class TrackBuffer:
+    """ Growable NumPy buffers of the points of a track, read incrementally.
+
+    Points are appended one at a time by the parsers, amortized O(1), then
+    all the Circuit properties are derived at once by finish(), see
+    trace_metrics().
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self._points = np.empty((capacity, 4), dtype=np.float64)
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    def append(self, lon: float, lat: float, elevation: float, time: float) -> None:
+        if self._n == len(self._points):
+            grown = np.empty((2 * len(self._points), 4), dtype=np.float64)
+            grown[:self._n] = self._points
+            self._points = grown
+        self._points[self._n] = (lon, lat, elevation, time)
+        self._n += 1
+
+    def finish(self, name: str | None = None) -> Activity:
+        """ The activity of the buffered points.
+
+        Points without position are dropped. Raises ActivityError if less
+        than 2 points are left, or if none is timed.
+        """
+        points = self._points[:self._n]
+        points = points[~np.isnan(points[:, :2]).any(axis=1)]
+        if len(points) < 2:
+            raise ActivityError("The track has less than 2 positions")
+        lon, lat, elevation, time = (
+            np.ascontiguousarray(points[:, i]) for i in range(4)
+        )
+        timed = time[~np.isnan(time)]
+        if not len(timed):
+            raise ActivityError("The track has no timestamps")
+        metrics = trace_metrics(lon, lat, elevation, time)
+        speed = Decimal(metrics.average_speed)
+        return Activity(
+            name=name,
+            lon=lon,
+            lat=lat,
+            elevation=elevation,
+            time=time,
+            distance=round(metrics.distance),
+            start_time=datetime.fromtimestamp(float(timed.min()), UTC),
+            end_time=datetime.fromtimestamp(float(timed.max()), UTC),
+            elevation_gain=round(metrics.elevation_gain),
+            elevation_loss=round(metrics.elevation_loss),
+            average_speed=min(speed.quantize(Decimal("0.01")), MAX_AVERAGE_SPEED),
+        )
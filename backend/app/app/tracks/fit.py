@@ -0,0 +1,174 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import math
+import struct
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from app.tracks.activity import ActivityError, TrackBuffer
+
+# Bytes read from the file at once
+CHUNK_SIZE = 1024 * 1024
+# FIT timestamps are seconds since 1989-12-31T00:00:00Z
+FIT_EPOCH = 631_065_600
+SEMICIRCLES = 180 / 2**31
+# The global number of record messages, the points of an activity
+RECORD = 20
+TIMESTAMP = 253
+# Fields of record messages by number: (name, size, struct format, invalid value)
+_FIELDS = {
+    TIMESTAMP: ("timestamp", 4, "I", 0xFFFFFFFF),
+    0: ("lat", 4, "i", 0x7FFFFFFF),
+    1: ("lon", 4, "i", 0x7FFFFFFF),
+    2: ("altitude", 2, "H", 0xFFFF),
+    78: ("enhanced_altitude", 4, "I", 0xFFFFFFFF),
+}
+_HEADER = struct.Struct("<BBHI4s")
+
+
+@dataclass(frozen=True)
+class _Definition:
+    """ How to read the data messages of a local message type. """
+    global_number: int
+    size: int
+    # Unpacks the known fields, skipping the others
+    unpack: struct.Struct | None
+    names: tuple[str, ...]
+    invalid: tuple[int, ...]
+
+
+class _Reader:
+    """ Buffered reads of a file, by chunks of CHUNK_SIZE. """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.buffer = b""
+        self.offset = 0
+        self.consumed = 0
+
+    def read(self, size: int) -> bytes:
+        end = self.offset + size
+        if end > len(self.buffer):
+            self.buffer = self.buffer[self.offset:] + self.file.read(
+                max(CHUNK_SIZE, size)
+            )
+            self.consumed += self.offset
+            self.offset, end = 0, size
+            if end > len(self.buffer):
+                raise ActivityError("Truncated FIT file")
+        data = self.buffer[self.offset:end]
+        self.offset = end
+        return data
+
+    @property
+    def position(self) -> int:
+        return self.consumed + self.offset
+
+    def at_end(self) -> bool:
+        if self.offset < len(self.buffer):
+            return False
+        self.consumed += self.offset
+        self.buffer, self.offset = self.file.read(CHUNK_SIZE), 0
+        return not self.buffer
+
+
+def _define(reader: _Reader, developer: bool) -> _Definition:
+    _, architecture, *number, n_fields = reader.read(5)
+    byteorder = "big" if architecture else "little"
+    global_number = int.from_bytes(bytes(number), byteorder)
+    fields = reader.read(3 * n_fields)
+    layout, names, invalid, size = ">" if architecture else "<", [], [], 0
+    for i in range(0, len(fields), 3):
+        number, field_size = fields[i], fields[i + 1]
+        known = _FIELDS.get(number)
+        if known is not None and known[1] == field_size and (
+            global_number == RECORD or number == TIMESTAMP
+        ):
+            layout += known[2]
+            names.append(known[0])
+            invalid.append(known[3])
+        else:
+            layout += f"{field_size}x"
+        size += field_size
+    if developer:
+        (n_developer,) = reader.read(1)
+        developer_fields = reader.read(3 * n_developer)
+        developer_size = sum(developer_fields[1::3])
+        layout += f"{developer_size}x"
+        size += developer_size
+    return _Definition(
+        global_number,
+        size,
+        struct.Struct(layout) if names else None,
+        tuple(names),
+        tuple(invalid),
+    )
+
+
+def read_fit(file: BinaryIO, track: TrackBuffer) -> str | None:
+    """ Stream the record messages of a FIT activity file into a buffer.
+
+    Only the fields of a track are decoded, all the other messages and fields
+    are skipped. Chained FIT files are read one after the other, and CRCs are
+    not checked. FIT files have no name, None is returned.
+    """
+    reader = _Reader(file)
+    timestamp = None
+    while not reader.at_end():
+        header_size = reader.read(1)[0]
+        if header_size < 12:
+            raise ActivityError("Invalid FIT header")
+        _, _, _, data_size, signature = _HEADER.unpack(
+            bytes([header_size]) + reader.read(11)
+        )
+        if signature != b".FIT":
+            raise ActivityError("Not a FIT file")
+        reader.read(header_size - 12)
+        end = reader.position + data_size
+        definitions: dict[int, _Definition] = {}
+        while reader.position < end:
+            header = reader.read(1)[0]
+            if header & 0x80:
+                # Compressed timestamp header, an offset to the last timestamp
+                local = (header >> 5) & 0x03
+                if timestamp is not None:
+                    offset = header & 0x1F
+                    timestamp = (timestamp & ~0x1F) + offset + (
+                        0x20 if offset < (timestamp & 0x1F) else 0
+                    )
+            elif header & 0x40:
+                definitions[header & 0x0F] = _define(reader, bool(header & 0x20))
+                continue
+            else:
+                local = header & 0x0F
+            definition = definitions.get(local)
+            if definition is None:
+                raise ActivityError("FIT data message without definition")
+            data = reader.read(definition.size)
+            if definition.unpack is None:
+                continue
+            values = {
+                name: value
+                for name, value, invalid in zip(
+                    definition.names, definition.unpack.unpack(data),
+                    definition.invalid,
+                )
+                if value != invalid
+            }
+            if "timestamp" in values:
+                timestamp = values["timestamp"]
+            if definition.global_number != RECORD:
+                continue
+            altitude = values.get("enhanced_altitude", values.get("altitude"))
+            track.append(
+                values["lon"] * SEMICIRCLES if "lon" in values else math.nan,
+                values["lat"] * SEMICIRCLES if "lat" in values else math.nan,
+                altitude / 5 - 500 if altitude is not None else math.nan,
+                timestamp + FIT_EPOCH if timestamp is not None else math.nan,
+            )
+        # The CRC of the file
+        reader.read(2)
+    return None
@@ -0,0 +1,116 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import math
+from datetime import UTC, datetime
+from typing import BinaryIO, Callable
+from xml.etree.ElementTree import Element, ParseError, iterparse
+
+from app.tracks.activity import ActivityError, TrackBuffer
+
+
+def _local(tag: str) -> str:
+    """ A tag without its namespace, GPX 1.0 and 1.1 being read alike. """
+    return tag.rpartition("}")[2]
+
+
+def _time(text: str | None) -> float:
+    """ POSIX seconds of an ISO 8601 time, UTC if not qualified. """
+    if not text:
+        return math.nan
+    try:
+        value = datetime.fromisoformat(text.strip())
+    except ValueError as exc:
+        raise ActivityError(f"Invalid time {text!r}") from exc
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.timestamp()
+
+
+def _float(text: str | None) -> float:
+    if not text:
+        return math.nan
+    try:
+        return float(text)
+    except ValueError as exc:
+        raise ActivityError(f"Invalid number {text!r}") from exc
+
+
+def _children(elem: Element) -> dict[str, Element]:
+    return {_local(child.tag): child for child in elem}
+
+
+def _read(
+    file: BinaryIO,
+    point: str,
+    parent: str,
+    name: str,
+    append: Callable[[Element], None],
+) -> str | None:
+    """ Stream the point elements of an XML file to append, and return the
+    text of its first name element.
+
+    Points are removed from their parent element once read, so that the
+    memory used does not grow with the file.
+    """
+    found, container = None, None
+    try:
+        for event, elem in iterparse(file, events=("start", "end")):
+            tag = _local(elem.tag)
+            if event == "start":
+                if tag == parent:
+                    container = elem
+            elif tag == point:
+                append(elem)
+                if container is not None:
+                    container.remove(elem)
+                else:
+                    elem.clear()
+            elif tag == name and found is None and elem.text:
+                found = elem.text.strip()
+    except ParseError as exc:
+        raise ActivityError(f"Invalid XML: {exc}") from exc
+    return found
+
+
+def read_gpx(file: BinaryIO, track: TrackBuffer) -> str | None:
+    """ Stream the track points of a GPX file into a buffer.
+
+    Returns the first name of the file, usually its track name.
+    """
+    def append(elem: Element) -> None:
+        children = _children(elem)
+        ele, time = children.get("ele"), children.get("time")
+        track.append(
+            _float(elem.get("lon")),
+            _float(elem.get("lat")),
+            _float(ele.text if ele is not None else None),
+            _time(time.text if time is not None else None),
+        )
+
+    return _read(file, "trkpt", "trkseg", "name", append)
+
+
+def read_tcx(file: BinaryIO, track: TrackBuffer) -> str | None:
+    """ Stream the track points of a Garmin TCX file into a buffer.
+
+    Returns the notes of its first activity, if any.
+    """
+    def append(elem: Element) -> None:
+        children = _children(elem)
+        position = children.get("Position")
+        coordinates = _children(position) if position is not None else {}
+        values = [
+            node.text if node is not None else None
+            for node in (
+                coordinates.get("LongitudeDegrees"),
+                coordinates.get("LatitudeDegrees"),
+                children.get("AltitudeMeters"),
+                children.get("Time"),
+            )
+        ]
+        track.append(*map(_float, values[:3]), _time(values[3]))
+
+    return _read(file, "Trackpoint", "Track", "Notes", append)
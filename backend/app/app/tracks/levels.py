@@ -0,0 +1,74 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+import shapely
+
+from app.graph.geo import EARTH_RADIUS
+
+# Web Mercator meters per pixel at zoom 0 on the equator, for 256 px tiles,
+# its sphere having the WGS 84 semi-major axis
+EQUATOR_RESOLUTION = 2 * np.pi * 6_378_137 / 256
+# Traces are simplified by up to this fraction of a pixel
+PIXEL_TOLERANCE = 0.5
+# The zoom levels of the simplified traces stored for each circuit, finest
+# first. Circuit.trace is the full resolution
+TRACE_ZOOMS = (14, 12, 10, 8)
+
+
+def zoom_tolerance(zoom: float) -> float:
+    """ The simplification tolerance in meter of traces drawn at a zoom.
+
+    Pixels are the largest on the equator, so traces are at most
+    PIXEL_TOLERANCE pixel off anywhere.
+    """
+    return EQUATOR_RESOLUTION / 2**zoom * PIXEL_TOLERANCE
+
+
+def trace_level(
+    zoom: float | None = None, tolerance: float | None = None
+) -> int | None:
+    """ The coarsest stored zoom level fine enough for a zoom or a tolerance.
+
+    The tolerance is in meter. Returns None for the full resolution trace,
+    when neither is given or none of the simplified traces is fine enough.
+    """
+    if zoom is not None:
+        tolerance = zoom_tolerance(zoom)
+    if tolerance is None:
+        return None
+    levels = [z for z in TRACE_ZOOMS if zoom_tolerance(z) <= tolerance]
+    return min(levels) if levels else None
+
+
+def simplify_trace(
+    lon: np.ndarray, lat: np.ndarray, tolerance: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """ Douglas-Peucker simplification of a trace, with a tolerance in meter.
+
+    The trace is simplified in a local equirectangular projection around its
+    first point, which keeps a subset of its points, both ends included.
+    """
+    lon0, lat0 = float(lon[0]), float(lat[0])
+    scale = np.radians(EARTH_RADIUS)
+    x = (np.asarray(lon) - lon0) * scale * np.cos(np.radians(lat0))
+    y = (np.asarray(lat) - lat0) * scale
+    line = shapely.simplify(
+        shapely.linestrings(x, y), tolerance, preserve_topology=False
+    )
+    kept = shapely.get_coordinates(line)
+    return (
+        kept[:, 0] / (scale * np.cos(np.radians(lat0))) + lon0,
+        kept[:, 1] / scale + lat0,
+    )
+
+
+def trace_levels(
+    lon: np.ndarray, lat: np.ndarray
+) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    """ The simplified traces to store by zoom level, see TRACE_ZOOMS. """
+    return {
+        zoom: simplify_trace(lon, lat, zoom_tolerance(zoom)) for zoom in TRACE_ZOOMS
+    }
@@ -0,0 +1,155 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.graph.geo import haversine
+
+# Elevations are averaged over this many consecutive points, centered
+SMOOTHING_WINDOW = 5
+# Elevation changes within this many meters of the last extreme are noise
+HYSTERESIS = 1.0
+# Segments slower than this are pauses, in meter per second
+MIN_MOVING_SPEED = 0.5
+# The first search window of a hysteresis phase, in points
+_PHASE_WINDOW = 128
+
+
+@dataclass(frozen=True)
+class TraceMetrics:
+    distance: float        # in meter
+    elevation_gain: float  # in meter
+    elevation_loss: float  # in meter
+    elapsed_time: float    # in second
+    moving_time: float     # in second
+    average_speed: float   # in meter per second, over the moving time
+
+
+def segment_lengths(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """ The lengths in meter of the n - 1 segments of n points. """
+    return haversine(lon[:-1], lat[:-1], lon[1:], lat[1:])
+
+
+def smooth(values: np.ndarray, window: int = SMOOTHING_WINDOW) -> np.ndarray:
+    """ The centered moving average of values, over window points.
+
+    The window is truncated at both ends, so that the ends are averaged over
+    less points rather than padded.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if window <= 1 or len(values) < 2:
+        return values.copy()
+    half = window // 2
+    sums = np.concatenate([[0.0], np.cumsum(values)])
+    i = np.arange(len(values))
+    lo = np.maximum(i - half, 0)
+    hi = np.minimum(i + half + 1, len(values))
+    return (sums[hi] - sums[lo]) / (hi - lo)
+
+
+def hysteresis(values: np.ndarray, width: float = HYSTERESIS) -> np.ndarray:
+    """ The values seen through a dead band of width around the last extreme.
+
+    The output only moves once values leave the band, then follows them at
+    width behind: y[i] = clip(y[i - 1], values[i] - width, values[i] + width),
+    starting at values[0]. The recurrence is solved a monotonic phase at a
+    time, by running maxima or minima over windows growing until the phase
+    reverses, so that the Python loop is by phase rather than by point.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    y = np.empty_like(x)
+    if len(x) == 0:
+        return y
+    outside = np.abs(x - x[0]) > width
+    if not outside.any():
+        y[:] = x[0]
+        return y
+    start = int(np.argmax(outside))
+    y[:start] = x[0]
+    up = bool(x[start] > x[0])
+    size = _PHASE_WINDOW
+    while start < len(x):
+        stop = min(start + size, len(x))
+        segment = x[start:stop]
+        if up:
+            extreme = np.maximum.accumulate(segment)
+            reversed_ = segment[1:] < extreme[:-1] - 2 * width
+        else:
+            extreme = np.minimum.accumulate(segment)
+            reversed_ = segment[1:] > extreme[:-1] + 2 * width
+        end = int(np.argmax(reversed_)) if len(reversed_) else 0
+        if len(reversed_) and reversed_[end]:
+            end += 1
+        elif stop < len(x):
+            size *= 2
+            continue
+        else:
+            end = len(segment)
+        y[start:start + end] = extreme[:end] + (-width if up else width)
+        start += end
+        up = not up
+        size = _PHASE_WINDOW
+    return y
+
+
+def elevation_changes(
+    elevation: np.ndarray,
+    window: int = SMOOTHING_WINDOW,
+    width: float = HYSTERESIS,
+) -> tuple[float, float]:
+    """ The elevation gain and loss in meter along smoothed elevations.
+
+    Unknown elevations, NaN, are skipped.
+    """
+    elevation = np.asarray(elevation, dtype=np.float64)
+    elevation = elevation[~np.isnan(elevation)]
+    climbs = np.diff(hysteresis(smooth(elevation, window), width))
+    return float(climbs[climbs > 0].sum()), float(-climbs[climbs < 0].sum())
+
+
+def moving_time(
+    lengths: np.ndarray, time: np.ndarray, min_speed: float = MIN_MOVING_SPEED
+) -> float:
+    """ The duration in second of the segments ridden at min_speed at least.
+
+    Segments with an unknown, NaN, time at either end are not counted.
+    """
+    durations = np.diff(np.asarray(time, dtype=np.float64))
+    moving = (durations > 0) & (lengths >= min_speed * durations)
+    return float(durations[moving].sum())
+
+
+def trace_metrics(
+    lon: np.ndarray,
+    lat: np.ndarray,
+    elevation: np.ndarray | None = None,
+    time: np.ndarray | None = None,
+) -> TraceMetrics:
+    """ The Circuit metrics of a trace, over whole arrays.
+
+    Elevations and times are optional, NaN where unknown.
+    """
+    lengths = segment_lengths(np.asarray(lon), np.asarray(lat))
+    distance = float(lengths.sum())
+    gain = loss = 0.0
+    if elevation is not None:
+        gain, loss = elevation_changes(elevation)
+    elapsed = moving = 0.0
+    if time is not None:
+        timed = np.asarray(time, dtype=np.float64)
+        timed = timed[~np.isnan(timed)]
+        if len(timed):
+            elapsed = float(timed.max() - timed.min())
+        moving = moving_time(lengths, time)
+    return TraceMetrics(
+        distance=distance,
+        elevation_gain=gain,
+        elevation_loss=loss,
+        elapsed_time=elapsed,
+        moving_time=moving,
+        average_speed=distance / moving if moving > 0 else 0.0,
+    )
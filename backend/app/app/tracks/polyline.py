@@ -0,0 +1,91 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+
+# Decimal digits of the coordinates, 5 for Google, 6 for OSRM "polyline6"
+DEFAULT_PRECISION = 5
+MAX_PRECISION = 7
+# Values are cut in chunks of 5 bits, least significant first, all but the
+# last flagged by 0x20, then offset by 63 to be printable
+_CHUNK_BITS = 5
+# Enough for a delta of 360 degrees at MAX_PRECISION, 33 bits once zigzag
+# encoded
+_MAX_CHUNKS = 7
+# The values over which chunks are needed beyond the first
+_CHUNK_LIMITS = 2 ** (_CHUNK_BITS * np.arange(1, _MAX_CHUNKS)) - 1
+
+
+class PolylineError(ValueError):
+    pass
+
+
+def encode_polyline(
+    lon: np.ndarray, lat: np.ndarray, precision: int = DEFAULT_PRECISION
+) -> str:
+    """ The Google encoded polyline of a trace, over whole arrays.
+
+    Points are (lat, lon) pairs of integers times 10 ** precision, each one
+    but the first given as a zigzag encoded delta to the previous one.
+    """
+    if not 0 <= precision <= MAX_PRECISION:
+        raise PolylineError(f"Precision must be between 0 and {MAX_PRECISION}")
+    scale = 10**precision
+    values = np.empty(2 * len(lon), dtype=np.int64)
+    values[0::2] = np.rint(np.asarray(lat) * scale)
+    values[1::2] = np.rint(np.asarray(lon) * scale)
+    values[2:] = values[2:] - values[:-2]
+    zigzag = (values << 1) ^ (values >> 63)
+
+    # The number of chunks of each value, at least 1 for 0, and the position
+    # of its first one. Chunks are then written rank by rank, over the values
+    # having that many, most of them being small deltas
+    n_chunks = 1 + np.searchsorted(_CHUNK_LIMITS, zigzag, side="right")
+    position = np.cumsum(n_chunks) - n_chunks
+    encoded = np.empty(int(n_chunks.sum()), dtype=np.uint8)
+    for rank in range(int(n_chunks.max(initial=0))):
+        longer = n_chunks > rank + 1
+        encoded[position] = (zigzag & 0x1F) + np.where(longer, 0x20 + 63, 63)
+        zigzag, n_chunks, position = (
+            zigzag[longer] >> _CHUNK_BITS, n_chunks[longer], position[longer] + 1
+        )
+    return encoded.tobytes().decode("ascii")
+
+
+def decode_polyline(
+    polyline: str, precision: int = DEFAULT_PRECISION
+) -> tuple[np.ndarray, np.ndarray]:
+    """ The (lon, lat) coordinates of a Google encoded polyline.
+
+    Raises:
+        PolylineError: if the polyline is not valid.
+    """
+    try:
+        data = np.frombuffer(polyline.encode("ascii"), dtype=np.uint8)
+    except UnicodeEncodeError as exc:
+        raise PolylineError("Invalid polyline characters") from exc
+    if len(data) == 0:
+        return np.zeros(0), np.zeros(0)
+    data = data.astype(np.int64) - 63
+    if (data < 0).any() or (data > 0x3F).any():
+        raise PolylineError("Invalid polyline characters")
+    last = (data & 0x20) == 0
+    if not last[-1]:
+        raise PolylineError("Truncated polyline")
+    # The index of the value of each chunk, and the rank of the chunk in it
+    value = np.cumsum(last) - last
+    starts = np.flatnonzero(np.r_[True, last[:-1]])
+    rank = np.arange(len(data)) - starts[value]
+    if rank.max() >= _MAX_CHUNKS:
+        raise PolylineError("Invalid polyline value")
+    zigzag = np.add.reduceat((data & 0x1F) << (_CHUNK_BITS * rank), starts)
+    if len(zigzag) % 2:
+        raise PolylineError("Odd number of polyline values")
+    deltas = (zigzag >> 1) ^ -(zigzag & 1)
+    scale = 10**precision
+    return (
+        np.cumsum(deltas[1::2]) / scale,
+        np.cumsum(deltas[0::2]) / scale,
+    )
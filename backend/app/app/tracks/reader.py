@@ -0,0 +1,38 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+from pathlib import PurePath
+from typing import BinaryIO, Callable
+
+from app.tracks.activity import Activity, ActivityError, TrackBuffer
+from app.tracks.fit import read_fit
+from app.tracks.gpx import read_gpx, read_tcx
+
+# Stream the points of a file into a buffer, and return its name if any
+TrackReader = Callable[[BinaryIO, TrackBuffer], str | None]
+
+READERS: dict[str, TrackReader] = {
+    ".fit": read_fit,
+    ".gpx": read_gpx,
+    ".tcx": read_tcx,
+}
+
+
+def read_activity(file: BinaryIO, filename: str) -> Activity:
+    """ Read an activity file, its format given by the extension of filename.
+
+    The file is parsed incrementally, only its points being kept. The
+    activity is named after the file if the file has no name.
+
+    Raises:
+        ActivityError: if the format is not supported, or the file is invalid.
+    """
+    path = PurePath(filename)
+    reader = READERS.get(path.suffix.lower())
+    if reader is None:
+        raise ActivityError(f"Unsupported file format {path.suffix!r}")
+    track = TrackBuffer()
+    name = reader(file, track)
+    return track.finish(name or path.stem)
@@ -0,0 +1,51 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Alternative routes by the plateau method, against a single search, on a
+regional grid.
+
+Run from backend/app: python -m benchmarks.bench_alternatives
+"""
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from app.graph import routing
+from app.graph.alternatives import alternative_routes
+from app.graph.isochrone import cost_matrix
+from app.graph.profiles import compile_profile
+from app.schemas.route import ProfileEnum
+from app.tests.utils.synthetic import grid_graph
+from benchmarks.utils import report, timer, timings
+
+
+def main(side: int = 300, queries: int = 20, seed: int = 0):
+    snapshot = grid_graph(side, side, seed=seed)
+    weights = compile_profile(snapshot, ProfileEnum.fastest)
+    print(f"{snapshot.n_nodes} nodes, {snapshot.n_edges} edges")
+    with timer("Build cost matrix"):
+        matrix = cost_matrix(snapshot, weights.cost)
+
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(0, snapshot.n_nodes, size=(queries, 2)).tolist()
+    report("One-to-all Dijkstra", timings(
+        lambda s, t: dijkstra(matrix, indices=s), pairs
+    ))
+    report("A* route", timings(
+        lambda s, t: routing.shortest_path(snapshot, s, t, weights), pairs
+    ))
+    report("Alternatives", timings(
+        lambda s, t: alternative_routes(snapshot, matrix, weights.cost, s, t),
+        pairs,
+    ))
+    found = [
+        len(alternative_routes(snapshot, matrix, weights.cost, s, t))
+        for s, t in pairs
+    ]
+    print(f"Routes per query: {np.bincount(found).tolist()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Contraction hierarchy preprocessing time and query latency against A*, and
+against the sub-millisecond query target.
+
+Grids are a worst case for contraction hierarchies: their separators, which
+end up at the top of the hierarchy, grow as the square root of their size.
+
+Run from backend/app: python -m benchmarks.bench_ch
+"""
+import time
+from functools import partial
+
+import numpy as np
+
+from app.graph import ch, routing
+from app.tests.utils.synthetic import grid_graph
+from benchmarks.utils import report, timings
+
+TARGET_MS = 1.0
+
+
+def main(sides=(50, 100, 200), queries: int = 100, seed: int = 0):
+    for side in sides:
+        snapshot = grid_graph(side, side, seed=seed)
+        print(f"--- {side}x{side} grid: {snapshot.n_nodes} nodes, "
+              f"{snapshot.n_edges} edges")
+        start = time.perf_counter()
+        hierarchy = ch.build_hierarchy(snapshot)
+        print(f"Preprocessing: {time.perf_counter() - start:.1f} s, "
+              f"{hierarchy.n_shortcuts} shortcuts, {hierarchy.n_core} core nodes")
+
+        rng = np.random.default_rng(seed)
+        pairs = rng.integers(0, snapshot.n_nodes, size=(queries, 2)).tolist()
+        report("A*", timings(partial(routing.shortest_path, snapshot), pairs))
+        durations = timings(
+            partial(ch.shortest_path, hierarchy, snapshot), pairs
+        )
+        report("CH", durations)
+        p50 = np.percentile(durations, 50)
+        print(f"CH p50 {'within' if p50 < TARGET_MS else 'over'} the "
+              f"{TARGET_MS:g} ms target")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Elevation profile of a 200 km route from the precomputed edge profiles.
+
+Run from backend/app: python -m benchmarks.bench_elevation
+"""
+import numpy as np
+
+from app.graph.elevation import route_elevation
+from app.graph.isochrone import tree_edges
+from app.tests.utils.synthetic import grid_elevations, grid_geometries, grid_graph
+from benchmarks.utils import report, timer, timings
+
+
+def main(side: int = 300, distance: int = 200_000, seed: int = 0):
+    snapshot = grid_graph(side, side, seed=seed)
+    with timer("Build edge profiles"):
+        elevations = grid_elevations(grid_geometries(snapshot), seed=seed)
+    print(f"{snapshot.n_edges} edges, {elevations.offsets[-1]} profile points")
+
+    # A route snaking along the rows of the grid
+    rows = np.arange(side).reshape(1, -1).repeat(side, axis=0)
+    rows[1::2] = rows[1::2, ::-1]
+    nodes = (rows + side * np.arange(side)[:, None]).ravel()
+    edges = tree_edges(snapshot, snapshot.length, nodes[:-1], nodes[1:])
+    edges = edges[:np.searchsorted(np.cumsum(snapshot.length[edges]), distance)]
+
+    durations = timings(
+        lambda: route_elevation(snapshot, elevations, edges), [()] * 20
+    )
+    distances, _ = route_elevation(snapshot, elevations, edges)
+    report(
+        f"{distances[-1] / 1000:.0f} km profile, {len(edges)} edges, "
+        f"{len(distances)} points",
+        durations,
+    )
+
+
+if __name__ == "__main__":
+    main()
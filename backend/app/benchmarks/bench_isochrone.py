@@ -0,0 +1,49 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Bounded one-to-all searches and concave hulls on 10k and 1M node grids.
+
+Run from backend/app: python -m benchmarks.bench_isochrone
+"""
+import numpy as np
+
+from app.graph.isochrone import concave_hull, cost_matrix, reachable
+from app.tests.utils.synthetic import grid_graph
+from benchmarks.utils import report, timer, timings
+
+
+def main(sides=(100, 1000), budgets=(5_000, 25_000), queries: int = 10, seed=0):
+    rng = np.random.default_rng(seed)
+    for side in sides:
+        snapshot = grid_graph(side, side, seed=seed)
+        cost = snapshot.length.astype(np.float32)
+        print(f"{snapshot.n_nodes} nodes, {snapshot.n_edges} edges")
+        with timer("Build cost matrix"):
+            matrix = cost_matrix(snapshot, cost)
+        origins = rng.integers(0, snapshot.n_nodes, queries).tolist()
+        for budget in budgets:
+            reaches = [
+                reachable(snapshot, matrix, cost, o, budget) for o in origins
+            ]
+            print(
+                f"Budget {budget / 1000:.0f} km: "
+                f"{np.mean([len(r.nodes) for r in reaches]):,.0f} nodes reached"
+            )
+            # The loop variables are bound as default arguments
+            report("  Search", timings(
+                lambda o, snapshot=snapshot, matrix=matrix, cost=cost, budget=budget: (
+                    reachable(snapshot, matrix, cost, o, budget)
+                ),
+                [(o,) for o in origins],
+            ))
+            report("  Concave hull", timings(
+                lambda r, snapshot=snapshot: concave_hull(snapshot, r),
+                [(r,) for r in reaches],
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Map-matching of a 4-hour ride (about 15k GPS fixes) on a synthetic grid graph.
+
+Run from backend/app: python -m benchmarks.bench_matching
+"""
+import numpy as np
+
+from app.graph import routing
+from app.graph.geo import haversine
+from app.graph.matching import match_trace
+from app.graph.spatial import NodeIndex
+from app.tests.utils.synthetic import gps_trace, grid_graph
+from benchmarks.utils import report, timer, timings
+
+
+def main(side: int = 300, fixes: int = 15_000, seed: int = 0):
+    with timer(f"Build {side}x{side} grid and node index"):
+        snapshot = grid_graph(side, side, seed=seed)
+        index = NodeIndex(snapshot)
+
+    # A ride through random waypoints, one fix about every 7 m (25 km/h)
+    rng = np.random.default_rng(seed)
+    nodes = rng.integers(0, snapshot.n_nodes, size=12).tolist()
+    edges = np.concatenate([
+        routing.shortest_path(snapshot, u, v).edges
+        for u, v in zip(nodes, nodes[1:])
+    ])
+    lon, lat = gps_trace(snapshot, edges, spacing=7.0, noise=5.0, seed=seed)
+    # Keep the edges covered by the first fixes only
+    nodes = np.r_[snapshot.source[edges[0]], snapshot.target[edges]]
+    travelled = np.cumsum(haversine(
+        snapshot.lon[nodes[:-1]], snapshot.lat[nodes[:-1]],
+        snapshot.lon[nodes[1:]], snapshot.lat[nodes[1:]],
+    ))
+    edges = edges[travelled <= 7.0 * fixes]
+    lon, lat = lon[:fixes], lat[:fixes]
+    print(f"{len(lon)} fixes, {len(edges)} edges")
+
+    matched = match_trace(snapshot, index, lon, lat)
+    truth = set(edges.tolist())
+    found = set(matched.tolist())
+    print(
+        f"Recall {len(truth & found) / len(truth):.1%}, "
+        f"precision {len(truth & found) / len(found):.1%}"
+    )
+    report("Match trace", timings(
+        lambda: match_trace(snapshot, index, lon, lat), [()] * 5
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+100 x 100 distance matrix on a regional grid, against point to point routes.
+
+Run from backend/app: python -m benchmarks.bench_matrix
+"""
+import numpy as np
+
+from app.graph import routing
+from app.graph.isochrone import cost_matrix
+from app.graph.matrix import distance_matrix
+from app.graph.profiles import compile_profile
+from app.schemas.route import ProfileEnum
+from app.tests.utils.synthetic import grid_graph
+from benchmarks.utils import report, timer, timings
+
+
+def main(side: int = 300, size: int = 100, sample: int = 20, seed=0):
+    rng = np.random.default_rng(seed)
+    snapshot = grid_graph(side, side, seed=seed)
+    weights = compile_profile(snapshot, ProfileEnum.flat)
+    print(f"{snapshot.n_nodes} nodes, {snapshot.n_edges} edges")
+    with timer("Build cost matrix"):
+        matrix = cost_matrix(snapshot, weights.cost)
+    sources = rng.integers(0, snapshot.n_nodes, size)
+    targets = rng.integers(0, snapshot.n_nodes, size)
+
+    durations = timings(
+        lambda: distance_matrix(snapshot, matrix, weights.cost, sources, targets),
+        [()] * 3,
+    )
+    report(f"{size} x {size} matrix", durations)
+
+    pairs = [
+        (int(sources[i]), int(targets[j]))
+        for i, j in rng.integers(0, size, (sample, 2))
+    ]
+    routes = timings(
+        lambda s, t: routing.shortest_path(snapshot, s, t, weights), pairs
+    )
+    report("Point to point route", routes)
+    print(
+        f"{size * size} routes would take {routes.mean() * size * size / 1000:.0f} s,"
+        f" {routes.mean() * size * size / durations.mean():.0f} times the matrix"
+    )
+
+    result = distance_matrix(snapshot, matrix, weights.cost, sources, targets)
+    for s, t in pairs[:5]:
+        route = routing.shortest_path(snapshot, s, t, weights)
+        i, j = np.flatnonzero(sources == s)[0], np.flatnonzero(targets == t)[0]
+        # Lengths may differ between routes of the same cost
+        cost = weights.cost[route.edges].astype(np.float64).sum()
+        assert np.isclose(result.cost[i, j], cost)
+
+
+if __name__ == "__main__":
+    main()
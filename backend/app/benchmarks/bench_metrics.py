@@ -0,0 +1,100 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Circuit metrics of 100k-point GPS traces, vectorized versus a naive loop
+over the points.
+
+Run from backend/app: python -m benchmarks.bench_metrics
+"""
+import math
+
+import numpy as np
+
+from app.graph.geo import EARTH_RADIUS
+from app.tracks.metrics import (
+    HYSTERESIS, MIN_MOVING_SPEED, SMOOTHING_WINDOW, trace_metrics,
+)
+from benchmarks.utils import report, timings
+
+
+def synthetic_trace(n: int, seed: int = 0):
+    """ A ride of n fixes every second at about 8 m/s, with stops, climbs and
+    GPS noise.
+    """
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.05, n))
+    speed = np.clip(8 + rng.normal(0, 1, n), 0, None)
+    speed[rng.random(n) < 0.05] = 0.1
+    step = speed / EARTH_RADIUS
+    lat = 45 + np.degrees(np.cumsum(step * np.cos(heading)))
+    lon = 6 + np.degrees(np.cumsum(step * np.sin(heading))) / np.cos(np.radians(45))
+    slope = np.repeat(rng.normal(0, 0.02, n // 500 + 1), 500)[:n]
+    elevation = 500 + np.cumsum(slope * speed) + rng.normal(0, 1.5, n)
+    time = 1.7e9 + np.arange(n, dtype=np.float64)
+    return lon, lat, elevation, time
+
+
+def naive_metrics(lon, lat, elevation, time) -> tuple[float, ...]:
+    """ The same metrics as trace_metrics(), point by point. """
+    lengths = []
+    for i in range(1, len(lon)):
+        lon1, lat1 = math.radians(lon[i - 1]), math.radians(lat[i - 1])
+        lon2, lat2 = math.radians(lon[i]), math.radians(lat[i])
+        a = (
+            math.sin((lat2 - lat1) / 2) ** 2
+            + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        )
+        lengths.append(2 * EARTH_RADIUS * math.asin(math.sqrt(a)))
+    distance = sum(lengths)
+
+    half, n = SMOOTHING_WINDOW // 2, len(elevation)
+    smoothed = []
+    for i in range(n):
+        window = elevation[max(i - half, 0):min(i + half + 1, n)]
+        smoothed.append(sum(window) / len(window))
+    gain = loss = 0.0
+    level = smoothed[0]
+    for value in smoothed[1:]:
+        new = min(max(level, value - HYSTERESIS), value + HYSTERESIS)
+        if new > level:
+            gain += new - level
+        else:
+            loss += level - new
+        level = new
+
+    moving = 0.0
+    for i in range(1, len(time)):
+        duration = time[i] - time[i - 1]
+        if duration > 0 and lengths[i - 1] >= MIN_MOVING_SPEED * duration:
+            moving += duration
+    return distance, gain, loss, moving, distance / moving if moving else 0.0
+
+
+def main(n: int = 100_000, traces: int = 5):
+    arrays = [synthetic_trace(n, seed) for seed in range(traces)]
+    for trace in arrays[:1]:
+        metrics = trace_metrics(*trace)
+        naive = naive_metrics(*(a.tolist() for a in trace))
+        vectorized = (
+            metrics.distance, metrics.elevation_gain, metrics.elevation_loss,
+            metrics.moving_time, metrics.average_speed,
+        )
+        assert np.allclose(vectorized, naive), (vectorized, naive)
+        print(
+            f"{metrics.distance / 1000:.1f} km, "
+            f"+{metrics.elevation_gain:.0f} m / -{metrics.elevation_loss:.0f} m, "
+            f"moving {metrics.moving_time / 3600:.2f} h, "
+            f"{metrics.average_speed * 3.6:.1f} km/h"
+        )
+
+    report(f"Naive loop, {n} points", timings(
+        lambda *trace: naive_metrics(*(a.tolist() for a in trace)), arrays
+    ))
+    report(f"Vectorized, {n} points", timings(trace_metrics, arrays))
+
+
+if __name__ == "__main__":
+    main()
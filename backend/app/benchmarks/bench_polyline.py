@@ -0,0 +1,70 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Size and encoding time of the traces of rides of 3 hours recorded every
+second, as GeoJSON LineStrings versus encoded polylines, vectorized or point
+by point.
+
+Run from backend/app: python -m benchmarks.bench_polyline
+"""
+import numpy as np
+
+from app import schemas
+from app.tracks.polyline import decode_polyline, encode_polyline
+from benchmarks.bench_metrics import synthetic_trace
+from benchmarks.utils import report, timings
+
+
+def naive_polyline(lon, lat, precision: int = 5) -> str:
+    """ The same polyline as encode_polyline(), point by point. """
+    chars = []
+    previous = (0, 0)
+    scale = 10**precision
+    for x, y in zip(lon, lat):
+        point = (round(y * scale), round(x * scale))
+        for value, last in zip(point, previous):
+            value -= last
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chars.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chars.append(chr(value + 63))
+        previous = point
+    return "".join(chars)
+
+
+def main(n: int = 3 * 3600, rides: int = 20):
+    traces = [synthetic_trace(n, seed)[:2] for seed in range(rides)]
+    lon, lat = traces[0]
+    assert naive_polyline(lon.tolist(), lat.tolist()) == encode_polyline(lon, lat)
+
+    geojson = schemas.LineString(
+        coordinates=np.column_stack([lon, lat]).tolist()
+    ).model_dump_json()
+    print(f"GeoJSON, {n} points: {len(geojson) / 1e3:.0f} kB")
+    for precision in (5, 6):
+        polyline = encode_polyline(lon, lat, precision)
+        print(
+            f"Polyline, precision {precision}: {len(polyline) / 1e3:.0f} kB "
+            f"({len(geojson) / len(polyline):.1f}x less)"
+        )
+
+    report(f"GeoJSON LineString, {n} points", timings(
+        lambda lon, lat: schemas.LineString(
+            coordinates=np.column_stack([lon, lat]).tolist()
+        ).model_dump_json(),
+        traces,
+    ))
+    report(f"Naive polyline, {n} points", timings(
+        lambda lon, lat: naive_polyline(lon.tolist(), lat.tolist()), traces
+    ))
+    report(f"Vectorized polyline, {n} points", timings(encode_polyline, traces))
+    polylines = [(encode_polyline(lon, lat),) for lon, lat in traces]
+    report(f"Vectorized decoding, {n} points", timings(decode_polyline, polylines))
+
+
+if __name__ == "__main__":
+    main()
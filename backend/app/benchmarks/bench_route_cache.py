@@ -0,0 +1,54 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Cached routing of repeated queries from a few popular start points, on a
+synthetic grid graph of ~250K edges.
+
+Run from backend/app: python -m benchmarks.bench_route_cache
+"""
+import numpy as np
+
+from app.graph import routing
+from app.graph.route_cache import CachedRoute, RouteCache
+from app.tests.utils.synthetic import grid_graph
+from benchmarks.utils import report, timer, timings
+
+
+def main(side: int = 250, queries: int = 200, seed: int = 0):
+    with timer(f"Build {side}x{side} grid"):
+        snapshot = grid_graph(side, side, seed=seed)
+    print(f"{snapshot.n_nodes} nodes, {snapshot.n_edges} edges")
+
+    # 5 meeting spots to 20 destinations, each pair asked 2 times on average
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, snapshot.n_nodes, size=5)
+    ends = rng.integers(0, snapshot.n_nodes, size=20)
+    pairs = np.column_stack([
+        rng.choice(starts, size=queries), rng.choice(ends, size=queries)
+    ]).tolist()
+    cache = RouteCache(32 * 1024 * 1024, ttl=3600)
+
+    def cached(s: int, t: int) -> CachedRoute | None:
+        key = (snapshot.graph_id, 1, "shortest", s, t)
+        found, route = cache.get(key)
+        if not found:
+            result = routing.shortest_path(snapshot, s, t)
+            if result is not None:
+                route = CachedRoute.from_route(snapshot, result)
+            cache.put(key, route)
+        return route
+
+    report("A* uncached", timings(
+        lambda s, t: routing.shortest_path(snapshot, s, t), pairs
+    ))
+    report("A* cached", timings(cached, pairs))
+    stats = cache.stats()
+    print(f"hits={stats.hits} misses={stats.misses} size={stats.size} B")
+    report("Cache hits", timings(cached, pairs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Point-to-point A* routing on a synthetic grid graph of ~1M edges.
+
+Run from backend/app: python -m benchmarks.bench_routing
+"""
+import numpy as np
+
+from app.graph import routing
+from app.tests.utils.synthetic import grid_graph
+from benchmarks.utils import report, timer, timings
+
+
+def main(side: int = 500, queries: int = 50, seed: int = 0):
+    with timer(f"Build {side}x{side} grid"):
+        snapshot = grid_graph(side, side, seed=seed)
+    print(f"{snapshot.n_nodes} nodes, {snapshot.n_edges} edges")
+
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(0, snapshot.n_nodes, size=(queries, 2)).tolist()
+    report("A* random pairs", timings(
+        lambda s, t: routing.shortest_path(snapshot, s, t), pairs
+    ))
+
+    # Short "regional" trips, about 5 km on a 100 m grid
+    short = [
+        (s, min(s + 30 * side + 30, snapshot.n_nodes - 1)) for s, _ in pairs
+    ]
+    report("A* ~5 km trips", timings(
+        lambda s, t: routing.shortest_path(snapshot, s, t), short
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Degree 2 node contraction of a grid of shape nodes, and routing on the result.
+
+Run from backend/app: python -m benchmarks.bench_simplify
+"""
+import numpy as np
+
+from app.graph import routing
+from app.graph.profiles import compile_profile
+from app.graph.simplify import simplify
+from app.schemas.route import ProfileEnum
+from app.tests.utils.synthetic import grid_graph, subdivided_graph
+from benchmarks.utils import report, timer, timings
+
+
+def main(side: int = 100, parts: int = 6, n_routes: int = 20, seed=0):
+    rng = np.random.default_rng(seed)
+    with timer("Build graph"):
+        grid = grid_graph(side, side, seed=seed)
+        snapshot, geometries = subdivided_graph(grid, parts)
+    with timer("Simplify"):
+        simplified = simplify(snapshot, geometries)
+    result = simplified.snapshot
+    print(
+        f"{snapshot.n_nodes} -> {result.n_nodes} nodes, "
+        f"{snapshot.n_edges} -> {result.n_edges} edges"
+    )
+
+    node_ids = rng.choice(result.node_ids, (n_routes, 2))
+    durations = []
+    for label, graph in (("Original", snapshot), ("Simplified", result)):
+        weights = compile_profile(graph, ProfileEnum.fastest)
+        pairs = [tuple(graph.node_indices(pair).tolist()) for pair in node_ids]
+        durations.append(timings(
+            lambda s, t, graph=graph, weights=weights: routing.shortest_path(
+                graph, s, t, weights
+            ),
+            pairs,
+        ))
+        report(f"{label} route", durations[-1])
+    print(f"Routing speedup: {durations[0].mean() / durations[1].mean():.1f}x")
+
+
+if __name__ == "__main__":
+    main()
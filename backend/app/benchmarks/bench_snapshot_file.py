@@ -0,0 +1,72 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Cold start of a worker: building a snapshot from rows versus mapping its
+snapshot file, on a 1M node grid.
+
+Run from backend/app: python -m benchmarks.bench_snapshot_file
+"""
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from app.graph import routing
+from app.graph.profiles import compile_profiles
+from app.graph.snapshot import EDGE_DTYPE, NODE_DTYPE, build_snapshot
+from app.graph.snapshot_file import (
+    SnapshotFile, read_snapshot_file, write_snapshot_file
+)
+from app.schemas.route import ProfileEnum
+from app.tests.utils.synthetic import grid_elevations, grid_geometries, grid_graph
+from benchmarks.utils import timer
+
+
+def main(side: int = 1000, seed: int = 0):
+    snapshot = grid_graph(side, side, seed=seed)
+    geometries = grid_geometries(snapshot)
+    elevations = grid_elevations(geometries)
+    print(f"{snapshot.n_nodes} nodes, {snapshot.n_edges} edges")
+
+    # The structured arrays load_snapshot() fetches from the database
+    nodes = np.zeros(snapshot.n_nodes, dtype=NODE_DTYPE)
+    nodes["id"], nodes["lon"], nodes["lat"] = (
+        snapshot.node_ids, snapshot.lon, snapshot.lat
+    )
+    edges = np.zeros(snapshot.n_edges, dtype=EDGE_DTYPE)
+    edges["id"] = snapshot.edge_ids
+    edges["source_id"] = snapshot.node_ids[snapshot.source]
+    edges["target_id"] = snapshot.node_ids[snapshot.target]
+    for name in ("key", "length", "positive_elevation", "negative_elevation"):
+        edges[name] = getattr(snapshot, name)
+
+    with timer("Build from rows (without database reads)"):
+        built = build_snapshot(0, nodes, edges)
+        weights = compile_profiles(built)
+        # Warm the cached property, written to the file with the arrays
+        _ = built.incoming
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "graph_0.v1.snapshot"
+        data = SnapshotFile(0, 1, built, weights, geometries, elevations)
+        with timer("Write snapshot file"):
+            write_snapshot_file(path, data)
+        print(f"File size: {path.stat().st_size / 2 ** 20:.0f} MiB")
+        with timer("Map snapshot file"):
+            mapped = read_snapshot_file(path)
+        # A 10 km route, touching the pages of the nodes it explores only
+        target = 50 * side + 50
+        with timer("First route on the mapped file"):
+            routing.shortest_path(
+                mapped.snapshot, 0, target, mapped.weights[ProfileEnum.shortest]
+            )
+        with timer("Same route on the built snapshot"):
+            routing.shortest_path(built, 0, target, weights[ProfileEnum.shortest])
+        del mapped
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Node index build time and nearest-node query throughput.
+
+Run from backend/app: python -m benchmarks.bench_spatial
+"""
+import time
+
+import numpy as np
+
+from app.graph.geo import haversine
+from app.graph.spatial import NodeIndex
+from app.tests.utils.synthetic import grid_graph
+from benchmarks.utils import timer
+
+
+def main(side: int = 1000, batch: int = 100_000, seed: int = 0):
+    snapshot = grid_graph(side, side, seed=seed)
+    print(f"{snapshot.n_nodes} nodes")
+    with timer("Build KD-tree"):
+        index = NodeIndex(snapshot)
+
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(snapshot.lon.min(), snapshot.lon.max(), batch)
+    lat = rng.uniform(snapshot.lat.min(), snapshot.lat.max(), batch)
+    for k in (1, 8):
+        start = time.perf_counter()
+        index.query(lon, lat, k=k)
+        elapsed = time.perf_counter() - start
+        print(f"Batch k={k}: {batch / elapsed:,.0f} points/s")
+
+    start = time.perf_counter()
+    for i in range(100):
+        index.nearest(lon[i], lat[i])
+    print(f"Single point: {(time.perf_counter() - start) * 10:.3f} ms/query")
+
+    start = time.perf_counter()
+    for i in range(10):
+        np.argmin(haversine(snapshot.lon, snapshot.lat, lon[i], lat[i]))
+    print(f"Linear scan: {(time.perf_counter() - start) * 100:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
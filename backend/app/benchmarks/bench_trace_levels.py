@@ -0,0 +1,75 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Payload size and serialization time of a dashboard of 50 rides of 3 hours
+recorded every second, by stored trace level.
+
+Run from backend/app: python -m benchmarks.bench_trace_levels
+"""
+import time
+
+import numpy as np
+from pydantic import TypeAdapter
+
+from app import schemas
+from app.tracks.levels import TRACE_ZOOMS, trace_levels, zoom_tolerance
+from benchmarks.bench_metrics import synthetic_trace
+from benchmarks.utils import report, timings
+
+_RIDES = TypeAdapter(list[schemas.CircuitWithTrace])
+
+
+def _ride(i: int, lon: np.ndarray, lat: np.ndarray) -> schemas.CircuitWithTrace:
+    return schemas.CircuitWithTrace(
+        id=i,
+        name=f"Ride {i}",
+        distance=80_000,
+        start_time="2024-05-01T08:00:00",
+        end_time="2024-05-01T11:00:00",
+        elevation_gain=800,
+        elevation_loss=800,
+        average_speed="7.41",
+        start_point=schemas.Point(coordinates=(lon[0], lat[0])),
+        trace=schemas.LineString(
+            coordinates=np.column_stack([lon, lat]).tolist()
+        ),
+    )
+
+
+def main(rides: int = 50, n: int = 3 * 3600, seed: int = 0):
+    traces = [synthetic_trace(n, seed + i)[:2] for i in range(rides)]
+    report(f"Simplify {n} points to {len(TRACE_ZOOMS)} levels", timings(
+        trace_levels, traces
+    ))
+    levels = [trace_levels(lon, lat) for lon, lat in traces]
+
+    def payload(zoom: int | None) -> tuple[int, int, float]:
+        start = time.perf_counter()
+        rides_out = [
+            _ride(i, *(trace if zoom is None else level[zoom]))
+            for i, (trace, level) in enumerate(zip(traces, levels))
+        ]
+        body = _RIDES.dump_json(rides_out)
+        duration = (time.perf_counter() - start) * 1000
+        points = sum(len(ride.trace.coordinates) for ride in rides_out)
+        return points, len(body), duration
+
+    full_points, full_size, full_time = payload(None)
+    print(
+        f"full: {full_points} points, {full_size / 1e6:.2f} MB, "
+        f"{full_time:.0f} ms"
+    )
+    for zoom in TRACE_ZOOMS:
+        points, size, duration = payload(zoom)
+        print(
+            f"zoom {zoom} (tolerance {zoom_tolerance(zoom):.0f} m): "
+            f"{points} points, {size / 1e3:.0f} kB ({full_size / size:.0f}x less), "
+            f"{duration:.1f} ms ({full_time / duration:.0f}x faster)"
+        )
+
+
+if __name__ == "__main__":
+    main()
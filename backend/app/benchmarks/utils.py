@@ -0,0 +1,35 @@
+# Copyright (c) 2024, Eric Lemoine
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+@contextmanager
+def timer(label: str):
+    start = time.perf_counter()
+    yield
+    print(f"{label}: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def timings(func, args_list) -> np.ndarray:
+    """ Run func on each args tuple and return the durations in ms. """
+    durations = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        durations.append((time.perf_counter() - start) * 1000)
+    return np.array(durations)
+
+
+def report(label: str, durations: np.ndarray) -> None:
+    print(
+        f"{label}: n={len(durations)} "
+        f"mean={durations.mean():.2f} ms "
+        f"p50={np.percentile(durations, 50):.2f} ms "
+        f"p95={np.percentile(durations, 95):.2f} ms"
+    )